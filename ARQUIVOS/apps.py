@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ArquivosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ARQUIVOS'
+
+    def ready(self):
+        # Regista os receivers de invalidação de cache
+        from ARQUIVOS import signals  # noqa: F401
+        # Regista as tarefas executadas pelo worker (manage.py sga_worker)
+        from ARQUIVOS import tarefas  # noqa: F401
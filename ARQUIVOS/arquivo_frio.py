@@ -0,0 +1,301 @@
+# ARQUIVOS/arquivo_frio.py
+"""
+Arquivo frio: os ficheiros do arquivo morto em pacotes comprimidos.
+
+Os documentos finalizados (ESTADOS_FINAIS: despacho, aprovado, reprovado,
+arquivado) quase nunca voltam a ser abertos, mas os seus ficheiros
+ficavam para sempre soltos no storage de media. Periodicamente (cron):
+
+    python manage.py arquivar_frio [--dias 365] [--simular]
+
+os conteúdos dos documentos concluídos há mais de SGA_ARQUIVO_FRIO_DIAS
+são juntados num pacote ZIP por administração e mês de conclusão, em
+SGA_ARQUIVO_FRIO_PASTA/<administracao>/<AAAA>/<MM>/<id>.zip. Só vai para
+o pacote um conteúdo (ARQUIVOS/conteudo.py) cujos nomes pertençam todos a
+documentos nestas condições.
+
+Cada membro é comprimido à parte (deflate; JPEG, PNG, DOCX... ficam como
+estão) e a posição dos seus dados no pacote fica em ConteudoArquivado: ler
+um ficheiro é um seek e a descompressão em streaming só desses bytes, sem
+ler o diretório do ZIP nem o resto do pacote. Como é um ZIP normal, os
+pacotes também abrem com qualquer ferramenta.
+
+Depois de o pacote ser escrito, verificado (SHA-256 de cada membro, lido
+pelo índice) e registado, os ficheiros soltos são apagados. Os FileFields
+não mudam: o storage (ArmazenamentoConteudo._open) e a entrega
+(downloads.responder_ficheiro) leem do pacote quando o ficheiro já não
+está no disco.
+"""
+
+import hashlib
+import io
+import os
+import struct
+import uuid
+import zipfile
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import DateField, DateTimeField
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from .conteudo import TAMANHO_BLOCO, nome_conteudo
+from .extracao import _extensao
+
+
+DIAS_PADRAO = 365
+PASTA = 'arquivo_frio'
+
+# Formatos já comprimidos: deflate só gastaria CPU
+EXTENSOES_COMPRIMIDAS = {'jpg', 'jpeg', 'png', 'gif', 'webp', 'zip', 'docx', 'xlsx', 'pptx', 'odt', 'ods', 'gz'}
+
+# Cabeçalho local de um membro ZIP (assinatura ... tamanho do nome, do extra)
+_CABECALHO_LOCAL = struct.Struct('<4sHHHHHIIIHH')
+_ASSINATURA_LOCAL = b'PK\x03\x04'
+
+
+class ErroArquivo(Exception):
+    """Pacote inválido (escrita interrompida, membro que não corresponde ao índice...)."""
+
+
+def dias():
+    return getattr(settings, 'SGA_ARQUIVO_FRIO_DIAS', DIAS_PADRAO)
+
+
+def pasta():
+    """Pasta dos pacotes (por omissão dentro de MEDIA_ROOT, pode ser outro disco)."""
+    return getattr(settings, 'SGA_ARQUIVO_FRIO_PASTA', None) or default_storage.path(PASTA)
+
+
+# ---------------------------------------------------------------------------
+# Leitura
+# ---------------------------------------------------------------------------
+
+class _LeitorMembro(io.RawIOBase):
+    """Os dados de um membro, lidos a partir do offset do índice e descomprimidos em streaming."""
+
+    def __init__(self, caminho, inicio, tamanho_comprimido, comprimido):
+        super().__init__()
+        self._ficheiro = open(caminho, 'rb')
+        self._ficheiro.seek(inicio)
+        self._restante = tamanho_comprimido
+        self._descompressor = zlib.decompressobj(-zlib.MAX_WBITS) if comprimido else None
+        self._pendente = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, destino):
+        while not self._pendente:
+            if self._restante <= 0:
+                if self._descompressor is None:
+                    return 0
+                self._pendente = self._descompressor.flush()
+                self._descompressor = None
+                continue
+            dados = self._ficheiro.read(min(TAMANHO_BLOCO, self._restante))
+            if not dados:
+                raise ErroArquivo('Pacote truncado')
+            self._restante -= len(dados)
+            self._pendente = self._descompressor.decompress(dados) if self._descompressor else dados
+        quantidade = min(len(destino), len(self._pendente))
+        destino[:quantidade] = self._pendente[:quantidade]
+        self._pendente = self._pendente[quantidade:]
+        return quantidade
+
+    def close(self):
+        self._ficheiro.close()
+        super().close()
+
+
+def abrir(arquivado):
+    """Ficheiro (só leitura, sequencial) com o conteúdo arquivado."""
+    caminho = os.path.join(pasta(), arquivado.pacote.nome)
+    leitor = _LeitorMembro(caminho, arquivado.inicio, arquivado.tamanho_comprimido, arquivado.comprimido)
+    return io.BufferedReader(leitor, TAMANHO_BLOCO)
+
+
+def membro(nome):
+    """ConteudoArquivado do ficheiro `nome` do storage, ou None se não estiver num pacote."""
+    from .models import ConteudoArquivado
+
+    return (
+        ConteudoArquivado.objects.select_related('pacote', 'conteudo')
+        .filter(conteudo__nomes__nome=nome).first()
+    )
+
+
+# ---------------------------------------------------------------------------
+# Escrita dos pacotes
+# ---------------------------------------------------------------------------
+
+def _inicio_dados(ficheiro, info):
+    """Offset dos dados de um membro (depois do cabeçalho local, que pode ter extra ZIP64)."""
+    ficheiro.seek(info.header_offset)
+    cabecalho = ficheiro.read(_CABECALHO_LOCAL.size)
+    campos = _CABECALHO_LOCAL.unpack(cabecalho)
+    if campos[0] != _ASSINATURA_LOCAL:
+        raise ErroArquivo(f'Cabeçalho inválido em {info.filename}')
+    return info.header_offset + _CABECALHO_LOCAL.size + campos[-2] + campos[-1]
+
+
+def escrever_pacote(administracao_id, mes, conteudos):
+    """
+    Escreve e verifica o pacote com `conteudos` [(Conteudo, extensão)].
+    Devolve (nome relativo, tamanho, índice {hash: (inicio, tamanho_comprimido, comprimido)}).
+    """
+    nome = f'{administracao_id}/{mes:%Y/%m}/{uuid.uuid4().hex}.zip'
+    destino = os.path.join(pasta(), nome)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    temporario = f'{destino}.tmp'
+    try:
+        with zipfile.ZipFile(temporario, 'w', allowZip64=True, strict_timestamps=False) as pacote:
+            for conteudo, extensao in conteudos:
+                compressao = zipfile.ZIP_STORED if extensao in EXTENSOES_COMPRIMIDAS else zipfile.ZIP_DEFLATED
+                pacote.write(
+                    default_storage.path(nome_conteudo(conteudo.hash)), arcname=conteudo.hash,
+                    compress_type=compressao, compresslevel=6,
+                )
+            membros = {info.filename: info for info in pacote.infolist()}
+
+        indice = {}
+        with open(temporario, 'rb') as ficheiro:
+            for conteudo, _ in conteudos:
+                info = membros[conteudo.hash]
+                indice[conteudo.hash] = (
+                    _inicio_dados(ficheiro, info), info.compress_size, info.compress_type == zipfile.ZIP_DEFLATED
+                )
+            os.fsync(ficheiro.fileno())
+
+        # Cada membro relido pelo índice tem de dar o mesmo SHA-256
+        for conteudo, _ in conteudos:
+            inicio, tamanho_comprimido, comprimido = indice[conteudo.hash]
+            sha = hashlib.sha256()
+            leitor = io.BufferedReader(_LeitorMembro(temporario, inicio, tamanho_comprimido, comprimido))
+            with leitor:
+                for bloco in iter(lambda: leitor.read(TAMANHO_BLOCO), b''):
+                    sha.update(bloco)
+            if sha.hexdigest() != conteudo.hash:
+                raise ErroArquivo(f'Membro {conteudo.hash} não corresponde ao conteúdo')
+
+        os.replace(temporario, destino)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.unlink(temporario)
+        raise
+    return nome, os.path.getsize(destino), indice
+
+
+def _apagar_soltos(conteudos):
+    """Remove do storage quente os nomes e o ficheiro de cada conteúdo (já estão num pacote)."""
+    for conteudo in conteudos:
+        for nome in [*conteudo.nomes.values_list('nome', flat=True), nome_conteudo(conteudo.hash)]:
+            caminho = default_storage.path(nome)
+            if os.path.exists(caminho):
+                os.unlink(caminho)
+
+
+# ---------------------------------------------------------------------------
+# Seleção
+# ---------------------------------------------------------------------------
+
+def nomes_elegiveis(limite):
+    """
+    {nome no storage: (administracao_id, mês)} dos ficheiros dos documentos
+    finalizados antes de `limite` (data de conclusão ou, sem ela, da última
+    movimentação).
+    """
+    from .models import Anexo, Documento
+    from .models.indices import ESTADOS_FINAIS
+
+    documentos = Documento.objects.filter(status__in=ESTADOS_FINAIS).annotate(
+        data_referencia=Coalesce('data_conclusao', 'data_ultima_movimentacao', output_field=DateTimeField())
+    ).filter(data_referencia__lt=limite).annotate(mes=TruncMonth('data_referencia', output_field=DateField()))
+
+    nomes = {}
+    meses = {}
+    for documento_id, administracao_id, mes, arquivo, digitalizado in documentos.values_list(
+        'pk', 'administracao_id', 'mes', 'arquivo', 'arquivo_digitalizado'
+    ).iterator():
+        chave = (administracao_id, mes)
+        meses[documento_id] = chave
+        for nome in (arquivo, digitalizado):
+            if nome:
+                nomes[nome] = chave
+    for documento_id, nome in Anexo.objects.filter(documento__in=documentos.values('pk')).values_list(
+        'documento_id', 'arquivo'
+    ).iterator():
+        if nome:
+            nomes[nome] = meses[documento_id]
+    return nomes
+
+
+def conteudos_elegiveis(nomes, lote=500):
+    """
+    ({(administracao_id, mês): [(Conteudo, extensão)]} por arquivar, [Conteudo]
+    já arquivados mas ainda com ficheiros soltos) entre os conteúdos cujos
+    nomes são todos elegíveis. Um conteúdo partilhado com um documento em
+    tramitação fica no storage quente.
+    """
+    from .models import Conteudo
+
+    grupos = {}
+    soltos = []
+    vistos = set()
+    lista = list(nomes)
+    for posicao in range(0, len(lista), lote):
+        candidatos = (
+            Conteudo.objects.filter(nomes__nome__in=lista[posicao:posicao + lote])
+            .exclude(pk__in=vistos).distinct().select_related('arquivado').prefetch_related('nomes')
+        )
+        for conteudo in candidatos:
+            vistos.add(conteudo.pk)
+            nomes_conteudo = sorted(referencia.nome for referencia in conteudo.nomes.all())
+            if not all(nome in nomes for nome in nomes_conteudo):
+                continue
+            no_disco = os.path.exists(default_storage.path(nome_conteudo(conteudo.hash)))
+            if hasattr(conteudo, 'arquivado'):
+                if no_disco:
+                    # Pacote gravado, mas a limpeza não chegou a correr
+                    soltos.append(conteudo)
+            elif no_disco:
+                grupos.setdefault(nomes[nomes_conteudo[0]], []).append((conteudo, _extensao(nomes_conteudo[0])))
+    return grupos, soltos
+
+
+def arquivar(idade_dias=None, simular=False):
+    """
+    Empacota os conteúdos elegíveis. Devolve a lista de PacoteArquivo
+    criados (com `simular`, os grupos que seriam empacotados, sem escrever).
+    """
+    from .models import ConteudoArquivado, PacoteArquivo
+
+    limite = timezone.now() - timedelta(days=dias() if idade_dias is None else idade_dias)
+    grupos, soltos = conteudos_elegiveis(nomes_elegiveis(limite))
+    if simular:
+        return grupos
+
+    _apagar_soltos(soltos)
+    pacotes = []
+    for (administracao_id, mes), conteudos in sorted(grupos.items()):
+        nome, tamanho, indice = escrever_pacote(administracao_id, mes, conteudos)
+        with transaction.atomic():
+            pacote = PacoteArquivo.objects.create(
+                administracao_id=administracao_id, mes=mes, nome=nome, ficheiros=len(conteudos),
+                tamanho=tamanho, tamanho_original=sum(conteudo.tamanho for conteudo, _ in conteudos),
+            )
+            ConteudoArquivado.objects.bulk_create([
+                ConteudoArquivado(
+                    conteudo=conteudo, pacote=pacote, inicio=indice[conteudo.hash][0],
+                    tamanho_comprimido=indice[conteudo.hash][1], comprimido=indice[conteudo.hash][2],
+                )
+                for conteudo, _ in conteudos
+            ])
+            # Só depois de o índice estar gravado
+            transaction.on_commit(lambda conteudos=conteudos: _apagar_soltos(c for c, _ in conteudos))
+        pacotes.append(pacote)
+    return pacotes
@@ -0,0 +1,447 @@
+"""
+busca.py
+========
+
+Pesquisa de texto integral nos documentos.
+
+Os campos pesquisáveis de cada Documento (título + nº de protocolo, tags,
+conteúdo e texto extraído dos ficheiros, ver extracao.py) são copiados, já
+normalizados (minúsculas e sem acentos), para a tabela DocumentoBusca.
+Sobre essa tabela cada banco mantém o seu índice:
+
+    PostgreSQL -> coluna gerada `vetor` (tsvector, dicionário 'portuguese',
+                  com pesos A/B/C/D) e índice GIN
+    SQLite     -> tabela virtual FTS5 (unicode61) sincronizada por triggers
+    outros     -> icontains sobre o texto normalizado (sem índice)
+
+Como a normalização é feita em Python, não é preciso a extensão `unaccent`.
+
+Para a pesquisa aproximada (protocolo parcial, nome do utente mal escrito,
+referência) a mesma tabela guarda protocolo, utente e referência
+normalizados, com índice de trigramas:
+
+    PostgreSQL -> pg_trgm (índices GIN gin_trgm_ops, operador <%)
+    outros     -> tabela TrigramaDocumento mantida em Python
+
+Uso:
+    documentos = pesquisar(Documento.objects.para_usuario(user), 'ofício saúde')
+    documentos.order_by('-relevancia')
+
+    aproximados(Documento.objects.para_usuario(user), 'Joao Sivla', 'utente')
+
+A estrutura específica do banco é criada pela migração 0048 e pode ser
+reposta com `manage.py reconstruir_indices`.
+"""
+
+import re
+import unicodedata
+from collections import Counter
+
+from django.db import connections
+from django.db.models import Count, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+
+TABELA_BUSCA = 'ARQUIVOS_documentobusca'
+TABELA_FTS = 'ARQUIVOS_documentobusca_fts'
+
+# Colunas indexadas e o seu peso no ranking (título > tags > conteúdo > ficheiros)
+COLUNAS = ('titulo', 'tags', 'conteudo', 'ficheiros')
+PESOS_POSTGRES = {'titulo': 'A', 'tags': 'B', 'conteudo': 'C', 'ficheiros': 'D'}
+PESOS_SQLITE = {'titulo': 10.0, 'tags': 5.0, 'conteudo': 1.0, 'ficheiros': 0.5}
+
+MAX_TERMOS = 12
+
+# Pesquisa aproximada por trigramas
+CAMPOS_APROXIMADOS = ('protocolo', 'utente', 'referencia')
+# Fração dos trigramas pesquisados que tem de existir no campo (= pg_trgm.word_similarity_threshold)
+LIMIAR_SEMELHANCA = 0.6
+LIMITE_APROXIMADOS = 20
+
+# Facetas da busca avançada: nome -> coluna de Documento
+FACETAS = {
+    'status': 'status',
+    'tipo_documento': 'tipo_documento_id',
+    'departamento': 'departamento_atual_id',
+    'prioridade': 'prioridade',
+}
+
+
+# ---------------------------------------------------------------------------
+# Normalização
+# ---------------------------------------------------------------------------
+
+def normalizar(texto):
+    """Minúsculas e sem acentos ('Ofício nº 3' -> 'oficio no 3')."""
+    if not texto:
+        return ''
+    decomposto = unicodedata.normalize('NFKD', str(texto).lower())
+    return ''.join(c for c in decomposto if not unicodedata.combining(c))
+
+
+def termos(texto):
+    """Palavras normalizadas do texto, pela ordem em que aparecem."""
+    return re.findall(r'\w+', normalizar(texto))
+
+
+def campos_indexados(titulo, numero_protocolo, tags, conteudo):
+    """Valores das colunas de DocumentoBusca para os campos de um documento."""
+    return {
+        'titulo': ' '.join(termos(f'{titulo or ""} {numero_protocolo or ""}')),
+        'tags': ' '.join(termos(tags)),
+        'conteudo': ' '.join(termos(conteudo)),
+    }
+
+
+def campos_aproximados(numero_protocolo, utente, referencia):
+    """Valores das colunas de pesquisa aproximada de DocumentoBusca."""
+    return {
+        'protocolo': ' '.join(termos(numero_protocolo)),
+        'utente': ' '.join(termos(utente)),
+        'referencia': ' '.join(termos(referencia)),
+    }
+
+
+def trigramas(texto):
+    """Trigramas de cada palavra, com o mesmo enchimento do pg_trgm ('  ab ' -> '  a', ' ab', 'ab ')."""
+    resultado = set()
+    for palavra in termos(texto):
+        palavra = f'  {palavra} '
+        resultado.update(palavra[i:i + 3] for i in range(len(palavra) - 2))
+    return resultado
+
+
+def semelhancas(pesquisa, valor):
+    """
+    (semelhança da pesquisa dentro do valor, semelhança total) entre dois
+    conjuntos de trigramas, como word_similarity() e similarity() do pg_trgm.
+    """
+    if not pesquisa or not valor:
+        return 0.0, 0.0
+    comuns = len(pesquisa & valor)
+    return comuns / len(pesquisa), comuns / len(pesquisa | valor)
+
+
+def _com_prefixo(palavras):
+    """
+    (palavra, por_prefixo): as palavras pesquisam por prefixo (plurais,
+    pesquisa enquanto se escreve); os números só por prefixo se forem a última
+    palavra, para que '12/2026' não encontre também '120/2026'.
+    """
+    ultima = len(palavras) - 1
+    return [(palavra, i == ultima or not palavra.isdigit()) for i, palavra in enumerate(palavras)]
+
+
+# ---------------------------------------------------------------------------
+# Motores por banco
+# ---------------------------------------------------------------------------
+
+class _Motor:
+    """
+    Pesquisa genérica: icontains sobre o texto normalizado (sem índice) e
+    pesquisa aproximada pela tabela de trigramas mantida em Python.
+    """
+
+    # Este banco precisa da tabela TrigramaDocumento (sem pg_trgm)
+    trigramas_proprios = True
+
+    def __init__(self, conexao):
+        self.conexao = conexao
+
+    def instalar(self, colunas=COLUNAS, aproximados=CAMPOS_APROXIMADOS):
+        pass
+
+    def desinstalar(self):
+        pass
+
+    def reconstruir(self):
+        pass
+
+    def filtrar(self, queryset, palavras, colunas):
+        condicao = Q()
+        for palavra in palavras:
+            condicao &= Q(*[Q(**{f'busca__{coluna}__contains': palavra}) for coluna in colunas], _connector=Q.OR)
+        return queryset.filter(condicao).annotate(relevancia=Value(0.0, output_field=FloatField()))
+
+    def aproximados(self, queryset, texto, campo, limite):
+        from ARQUIVOS.models import DocumentoBusca, TrigramaDocumento
+
+        pesquisa = trigramas(texto)
+        if not pesquisa:
+            return []
+
+        # Candidatos: documentos com trigramas suficientes em comum (índice campo+trigrama)
+        minimo = max(1, int(LIMIAR_SEMELHANCA * len(pesquisa)))
+        candidatos = list(
+            TrigramaDocumento.objects.filter(
+                campo=campo, trigrama__in=pesquisa, documento__in=queryset.values('pk')
+            ).values('documento_id').annotate(comuns=Count('id')).filter(
+                comuns__gte=minimo
+            ).order_by('-comuns').values_list('documento_id', flat=True)[:limite * 5]
+        )
+
+        # Ordenação final com as duas semelhanças, como no PostgreSQL
+        pontuados = []
+        for documento_id, valor in DocumentoBusca.objects.filter(
+            documento_id__in=candidatos
+        ).values_list('documento_id', campo):
+            na_palavra, total = semelhancas(pesquisa, trigramas(valor))
+            if na_palavra >= LIMIAR_SEMELHANCA:
+                pontuados.append((na_palavra, total, documento_id))
+        pontuados.sort(reverse=True)
+        return [(documento_id, na_palavra) for na_palavra, _, documento_id in pontuados[:limite]]
+
+    def _tabela(self, queryset):
+        return self.conexao.ops.quote_name(queryset.model._meta.db_table)
+
+
+class _MotorPostgres(_Motor):
+    """tsvector com pesos numa coluna gerada + GIN; ranking por ts_rank_cd; trigramas pelo pg_trgm."""
+
+    trigramas_proprios = False
+
+    def instalar(self, colunas=COLUNAS, aproximados=CAMPOS_APROXIMADOS):
+        vetor = ' || '.join(
+            f"setweight(to_tsvector('portuguese', {coluna}), '{PESOS_POSTGRES[coluna]}')"
+            for coluna in colunas
+        )
+        with self.conexao.cursor() as cursor:
+            cursor.execute(
+                f'ALTER TABLE "{TABELA_BUSCA}" ADD COLUMN IF NOT EXISTS vetor tsvector '
+                f'GENERATED ALWAYS AS ({vetor}) STORED'
+            )
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS documentobusca_vetor_gin ON "{TABELA_BUSCA}" USING GIN (vetor)'
+            )
+            # pg_trgm é uma extensão do contrib: requer permissão de CREATE na base
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            for campo in aproximados:
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS documentobusca_{campo}_trgm '
+                    f'ON "{TABELA_BUSCA}" USING GIN ({campo} gin_trgm_ops)'
+                )
+
+    def desinstalar(self):
+        with self.conexao.cursor() as cursor:
+            for campo in CAMPOS_APROXIMADOS:
+                cursor.execute(f'DROP INDEX IF EXISTS documentobusca_{campo}_trgm')
+            cursor.execute('DROP INDEX IF EXISTS documentobusca_vetor_gin')
+            cursor.execute(f'ALTER TABLE "{TABELA_BUSCA}" DROP COLUMN IF EXISTS vetor')
+
+    def _consulta(self, palavras, colunas):
+        # Filtro pelos pesos das colunas (título=A, tags=B, conteúdo=C)
+        pesos = '' if colunas == COLUNAS else ''.join(PESOS_POSTGRES[c] for c in colunas)
+        return ' & '.join(
+            f"{palavra}:{'*' if prefixo else ''}{pesos}" if prefixo or pesos else palavra
+            for palavra, prefixo in _com_prefixo(palavras)
+        )
+
+    def filtrar(self, queryset, palavras, colunas):
+        consulta = self._consulta(palavras, colunas)
+        return queryset.filter(
+            pk__in=RawSQL(
+                f'SELECT documento_id FROM "{TABELA_BUSCA}" '
+                f"WHERE vetor @@ to_tsquery('portuguese', %s)",
+                [consulta]
+            )
+        ).annotate(
+            relevancia=RawSQL(
+                f"SELECT ts_rank_cd(vetor, to_tsquery('portuguese', %s)) FROM \"{TABELA_BUSCA}\" "
+                f'WHERE documento_id = {self._tabela(queryset)}."id"',
+                [consulta],
+                output_field=FloatField(),
+            )
+        )
+
+    def aproximados(self, queryset, texto, campo, limite):
+        pesquisa = ' '.join(termos(texto))
+        if not pesquisa:
+            return []
+        # `<%` (word_similarity acima do limiar) usa o índice GIN; o âmbito vem do queryset
+        linhas = queryset.filter(
+            pk__in=RawSQL(f'SELECT documento_id FROM "{TABELA_BUSCA}" WHERE %s <%% {campo}', [pesquisa])
+        ).annotate(
+            semelhanca=RawSQL(
+                f'SELECT word_similarity(%s, {campo}) FROM "{TABELA_BUSCA}" '
+                f'WHERE documento_id = {self._tabela(queryset)}."id"',
+                [pesquisa],
+                output_field=FloatField(),
+            ),
+            semelhanca_total=RawSQL(
+                f'SELECT similarity(%s, {campo}) FROM "{TABELA_BUSCA}" '
+                f'WHERE documento_id = {self._tabela(queryset)}."id"',
+                [pesquisa],
+                output_field=FloatField(),
+            ),
+        ).order_by('-semelhanca', '-semelhanca_total', '-pk').values_list('pk', 'semelhanca')
+        return list(linhas[:limite])
+
+
+class _MotorSqlite(_Motor):
+    """FTS5 de conteúdo externo (a própria DocumentoBusca) mantida por triggers; ranking por bm25."""
+
+    def instalar(self, colunas=COLUNAS, aproximados=CAMPOS_APROXIMADOS):
+        novas = ', '.join(f'new.{coluna}' for coluna in colunas)
+        antigas = ', '.join(f'old.{coluna}' for coluna in colunas)
+        colunas = ', '.join(colunas)
+        apagar = (
+            f"INSERT INTO \"{TABELA_FTS}\"(\"{TABELA_FTS}\", rowid, {colunas}) "
+            f"VALUES ('delete', old.documento_id, {antigas});"
+        )
+        inserir = f'INSERT INTO "{TABELA_FTS}"(rowid, {colunas}) VALUES (new.documento_id, {novas});'
+        with self.conexao.cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS "{TABELA_FTS}" USING fts5('
+                f"{colunas}, content='{TABELA_BUSCA}', content_rowid='documento_id', "
+                f"tokenize='unicode61 remove_diacritics 2')"
+            )
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS "{TABELA_FTS}_ai" AFTER INSERT ON "{TABELA_BUSCA}" '
+                f'BEGIN {inserir} END'
+            )
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS "{TABELA_FTS}_ad" AFTER DELETE ON "{TABELA_BUSCA}" '
+                f'BEGIN {apagar} END'
+            )
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS "{TABELA_FTS}_au" AFTER UPDATE ON "{TABELA_BUSCA}" '
+                f'BEGIN {apagar} {inserir} END'
+            )
+        # Linhas gravadas antes de existirem os triggers passam a estar no índice
+        self.reconstruir()
+
+    def desinstalar(self):
+        with self.conexao.cursor() as cursor:
+            for sufixo in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS "{TABELA_FTS}_{sufixo}"')
+            cursor.execute(f'DROP TABLE IF EXISTS "{TABELA_FTS}"')
+
+    def reconstruir(self):
+        with self.conexao.cursor() as cursor:
+            cursor.execute(f"INSERT INTO \"{TABELA_FTS}\"(\"{TABELA_FTS}\") VALUES ('rebuild')")
+
+    def _consulta(self, palavras, colunas):
+        # O FTS5 não traz stemmer português: o prefixo cobre plurais e flexões simples
+        consulta = ' '.join(
+            f'"{palavra}"*' if prefixo else f'"{palavra}"'
+            for palavra, prefixo in _com_prefixo(palavras)
+        )
+        if colunas != COLUNAS:
+            consulta = '{%s} : (%s)' % (' '.join(colunas), consulta)
+        return consulta
+
+    def filtrar(self, queryset, palavras, colunas):
+        consulta = self._consulta(palavras, colunas)
+        pesos = ', '.join(str(PESOS_SQLITE[coluna]) for coluna in COLUNAS)
+        return queryset.filter(
+            pk__in=RawSQL(f'SELECT rowid FROM "{TABELA_FTS}" WHERE "{TABELA_FTS}" MATCH %s', [consulta])
+        ).annotate(
+            # bm25 é negativo (menor = melhor): invertido para ordenar por -relevancia como no PostgreSQL
+            relevancia=RawSQL(
+                f'SELECT -bm25("{TABELA_FTS}", {pesos}) FROM "{TABELA_FTS}" '
+                f'WHERE "{TABELA_FTS}" MATCH %s AND rowid = {self._tabela(queryset)}."id"',
+                [consulta],
+                output_field=FloatField(),
+            )
+        )
+
+
+_MOTORES = {
+    'postgresql': _MotorPostgres,
+    'sqlite': _MotorSqlite,
+}
+
+
+def motor(alias='default', conexao=None):
+    """Motor de pesquisa adequado ao banco da ligação."""
+    conexao = conexao or connections[alias]
+    return _MOTORES.get(conexao.vendor, _Motor)(conexao)
+
+
+# ---------------------------------------------------------------------------
+# API
+# ---------------------------------------------------------------------------
+
+def pesquisar(queryset, texto, colunas=COLUNAS):
+    """
+    Filtra um queryset de Documento pelos documentos que contêm TODAS as
+    palavras de `texto` (por prefixo) nas `colunas` indicadas, anotando a
+    `relevancia` de cada um. O âmbito (administração, visibilidade) é o do
+    queryset recebido: use sempre Documento.objects.para_usuario(user).
+
+    Sem palavras válidas devolve o queryset vazio.
+    """
+    palavras = termos(texto)[:MAX_TERMOS]
+    if not palavras:
+        return queryset.none()
+    return motor(queryset.db).filtrar(queryset, palavras, tuple(colunas))
+
+
+def aproximados(queryset, texto, campos=CAMPOS_APROXIMADOS, limite=LIMITE_APROXIMADOS):
+    """
+    Documentos do queryset cujo protocolo, utente ou referência (`campos`)
+    se parecem com `texto`, tolerando partes em falta e erros de escrita.
+
+    Devolve uma lista (no máximo `limite`) ordenada da mais à menos
+    semelhante; cada documento traz `semelhanca` (0 a 1) e `campo_semelhante`.
+    O âmbito é o do queryset: use Documento.objects.para_usuario(user), que
+    restringe à administração do usuário.
+    """
+    motor_busca = motor(queryset.db)
+    melhores = {}
+    for campo in campos:
+        if campo not in CAMPOS_APROXIMADOS:
+            raise ValueError(f'Campo sem pesquisa aproximada: {campo}')
+        for documento_id, semelhanca in motor_busca.aproximados(queryset, texto, campo, limite):
+            if semelhanca > melhores.get(documento_id, (0,))[0]:
+                melhores[documento_id] = (semelhanca, campo)
+
+    ordem = sorted(melhores, key=lambda documento_id: (-melhores[documento_id][0], -documento_id))[:limite]
+    documentos = queryset.in_bulk(ordem)
+    resultado = []
+    for documento_id in ordem:
+        documento = documentos[documento_id]
+        documento.semelhanca, documento.campo_semelhante = melhores[documento_id]
+        resultado.append(documento)
+    return resultado
+
+
+def filtrar_facetas(queryset, selecionadas):
+    """Aplica os valores escolhidos {faceta: valor} ao queryset."""
+    return queryset.filter(**{FACETAS[faceta]: valor for faceta, valor in selecionadas.items()})
+
+
+def contar_facetas(queryset, selecionadas=None):
+    """
+    Contagens de todas as facetas numa única consulta agrupada pelas quatro
+    colunas; cada combinação é depois somada em Python às facetas a que
+    pertence.
+
+    `queryset` traz os filtros de texto/datas mas NÃO os das facetas: a
+    contagem de cada faceta aplica as outras facetas escolhidas e ignora a
+    própria, para que as alternativas continuem visíveis.
+
+    Devolve ({faceta: Counter(valor -> total)}, total de resultados).
+    """
+    selecionadas = selecionadas or {}
+    contagens = {faceta: Counter() for faceta in FACETAS}
+    total = 0
+
+    combinacoes = queryset.order_by().values(*FACETAS.values()).annotate(quantidade=Count('pk'))
+    for linha in combinacoes:
+        fora = [
+            faceta for faceta, valor in selecionadas.items()
+            if linha[FACETAS[faceta]] != valor
+        ]
+        if not fora:
+            total += linha['quantidade']
+        for faceta, coluna in FACETAS.items():
+            # Conta se só a própria faceta (ou nenhuma) exclui a combinação
+            if not fora or fora == [faceta]:
+                contagens[faceta][linha[coluna]] += linha['quantidade']
+    return contagens, total
+
+
+def instalar_estrutura(conexao):
+    """Cria (se faltar) o índice específico do banco sobre DocumentoBusca."""
+    motor(conexao=conexao).instalar()
@@ -2,10 +2,34 @@
 """
 WebSocket consumers for real-time notifications.
 """
+import asyncio
 import json
+from urllib.parse import parse_qs
+from channels.generic.http import AsyncHttpConsumer
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .notificacoes import grupo_pendencias, grupos_do_usuario, inscricao, sincronizar
+
+
+# Segundos durante os quais as atualizações de pendências de um grupo são
+# juntadas numa só (uma rajada de encaminhamentos = um refresh no browser)
+JANELA_PENDENCIAS_PADRAO = 0.3
+
+
+# Segundos que um pedido de /api/aguardar-notificacoes/ fica à espera de
+# eventos (abaixo do tempo limite habitual dos proxies)
+ESPERA_NOTIFICACOES_PADRAO = 25
+
+
+def janela_pendencias():
+    return getattr(settings, 'SGA_JANELA_PENDENCIAS', JANELA_PENDENCIAS_PADRAO)
+
+
+def espera_notificacoes():
+    return getattr(settings, 'SGA_ESPERA_NOTIFICACOES', ESPERA_NOTIFICACOES_PADRAO)
 
 
 class NotificacaoConsumer(AsyncWebsocketConsumer):
@@ -25,6 +49,11 @@ class NotificacaoConsumer(AsyncWebsocketConsumer):
         
         # Criar grupos baseados na hierarquia do utilizador
         self.groups = await self.get_user_groups()
+        # Grupo cujas pendências o utilizador vê (secção tem prioridade)
+        self.grupo_pendencias = grupo_pendencias(self.groups)
+        # Atualizações de pendências à espera do fim da janela, por grupo
+        self.pendencias_por_enviar = {}
+        self.tarefas_pendencias = set()
         
         print(f"[WS] Usuário {self.user.username} conectado. Grupos: {self.groups}")
         
@@ -49,6 +78,8 @@ class NotificacaoConsumer(AsyncWebsocketConsumer):
     
     async def disconnect(self, close_code):
         """Conexão WebSocket fechada."""
+        for tarefa in getattr(self, 'tarefas_pendencias', ()):
+            tarefa.cancel()
         if hasattr(self, 'groups'):
             for group_name in self.groups:
                 await self.channel_layer.group_discard(
@@ -69,6 +100,11 @@ class NotificacaoConsumer(AsyncWebsocketConsumer):
                     'success': True
                 }))
             
+            elif action == 'sync':
+                # Reconexão: só as notificações posteriores ao cursor do cliente
+                dados = await self.sincronizar(data.get('desde'))
+                await self.send(text_data=json.dumps({'type': 'notification_sync', **dados}))
+
             elif action == 'get_count':
                 count = await self.get_unread_count()
                 await self.send(text_data=json.dumps({
@@ -80,16 +116,16 @@ class NotificacaoConsumer(AsyncWebsocketConsumer):
             pass
     
     async def notification_message(self, event):
-        """Enviar notificação para o cliente."""
-        # Obter contagem atualizada
-        count = await self.get_unread_count()
-        await self.send(text_data=json.dumps({
+        """Enviar notificação para o cliente (a contagem vem no evento: ver notificacoes.py)."""
+        dados = {
             'type': 'new_notification',
             'message': event['message'],
             'link': event.get('link', ''),
-            'count': count
-        }))
-        print(f"[WS] Nova notificação enviada para {self.user.username}: {event['message']}")
+        }
+        count = event.get('contagens', {}).get(str(self.user.id))
+        if count is not None:
+            dados['count'] = count
+        await self.send(text_data=json.dumps(dados))
     
     async def notification_count_update(self, event):
         """Atualizar contagem de notificações."""
@@ -99,27 +135,43 @@ class NotificacaoConsumer(AsyncWebsocketConsumer):
         }))
     
     async def pendencia_update(self, event):
-        """Enviar atualização de pendências para o cliente."""
-        pendencias_count = await self.get_pendencias_count()
-        await self.send(text_data=json.dumps({
+        """
+        Atualização de pendências (com a contagem calculada pelo produtor).
+        Os eventos de um grupo que chegam dentro da janela saem num só, com a
+        última contagem e todas as movimentações alteradas.
+        """
+        # Um utilizador de secção também está no grupo do departamento, mas
+        # as suas pendências são as da secção
+        grupo = event.get('grupo')
+        if grupo and grupo != self.grupo_pendencias:
+            return
+
+        pendente = self.pendencias_por_enviar.get(grupo)
+        if pendente is None:
+            pendente = self.pendencias_por_enviar[grupo] = {'movimentacoes': set()}
+            tarefa = asyncio.ensure_future(self.enviar_pendencias(grupo))
+            self.tarefas_pendencias.add(tarefa)
+            tarefa.add_done_callback(self.tarefas_pendencias.discard)
+        pendente['movimentacoes'].update(event.get('movimentacoes', ()))
+        pendente['evento'] = event
+
+    async def enviar_pendencias(self, grupo):
+        await asyncio.sleep(janela_pendencias())
+        pendente = self.pendencias_por_enviar.pop(grupo)
+        event = pendente['evento']
+        dados = {
             'type': 'pendencia_update',
-            'count': pendencias_count,
-            'message': event.get('message', 'Pendências atualizadas')
-        }))
-        print(f"[WS] Pendências atualizadas para {self.user.username}: {pendencias_count}")
+            'message': event.get('message', 'Pendências atualizadas'),
+            'movimentacoes': sorted(pendente['movimentacoes']),
+        }
+        if 'count' in event:
+            dados['count'] = event['count']
+        await self.send(text_data=json.dumps(dados))
     
     @database_sync_to_async
     def get_user_groups(self):
-        """Obter grupos do utilizador baseados na hierarquia."""
-        groups = [f"user_{self.user.id}"]
-        
-        if self.user.seccao:
-            groups.append(f"seccao_{self.user.seccao.id}")
-            groups.append(f"departamento_{self.user.seccao.departamento.id}")
-        elif self.user.departamento:
-            groups.append(f"departamento_{self.user.departamento.id}")
-        
-        return groups
+        """Obter grupos do utilizador baseados na hierarquia (a partir do OrgSnapshot)."""
+        return grupos_do_usuario(self.user)
     
     @database_sync_to_async
     def get_unread_count(self):
@@ -130,6 +182,15 @@ class NotificacaoConsumer(AsyncWebsocketConsumer):
             lida=False
         ).count()
     
+    @database_sync_to_async
+    def sincronizar(self, desde):
+        """Delta desde o cursor (ver notificacoes.sincronizar)."""
+        try:
+            desde = int(desde) if desde is not None else None
+        except (TypeError, ValueError):
+            desde = None
+        return sincronizar(self.user, desde)
+    
     @database_sync_to_async
     def mark_notifications_read(self):
         """Marcar todas notificações como lidas."""
@@ -142,87 +203,81 @@ class NotificacaoConsumer(AsyncWebsocketConsumer):
     @database_sync_to_async
     def get_pendencias_count(self):
         """Obter contagem de pendências não confirmadas do utilizador."""
-        from .models import MovimentacaoDocumento
-        from django.db.models import Q, Exists, OuterRef
+        from .models import PendenciaAberta
         
         user = self.user
         
-        # Definir filtro baseado na hierarquia do utilizador
-        if user.seccao:
-            filtro_destino = Q(seccao_destino=user.seccao)
-        elif user.departamento:
-            filtro_destino = Q(departamento_destino=user.departamento)
-        else:
+        # Mesma lógica da view pendencias(): Secção tem prioridade sobre Departamento
+        if not user.seccao_id and not user.departamento_id:
             return 0
         
-        # SUBQUERY: Verificar Obsolescência (movimentações futuras)
-        movimentacoes_futuras = MovimentacaoDocumento.objects.filter(
-            documento=OuterRef('documento'),
-            id__gt=OuterRef('id')
-        )
-        
-        # Query com mesma lógica da view pendencias()
-        return MovimentacaoDocumento.objects.filter(
-            filtro_destino,
-            confirmado_recebimento=False,
-            tipo_movimentacao='encaminhamento'
-        ).annotate(
-            ja_teve_andamento=Exists(movimentacoes_futuras)
-        ).filter(
-            ja_teve_andamento=False
+        return PendenciaAberta.objects.da_unidade(
+            seccao=user.seccao_id,
+            departamento=user.departamento_id
         ).count()
 
 
-# Função helper para enviar notificações (usar em views/signals)
-async def send_notification_to_group(group_name, message, link=''):
+class AguardarNotificacoesConsumer(AsyncHttpConsumer):
     """
-    Enviar notificação para um grupo.
-    Usar em views ou signals para notificar utilizadores.
+    Long-poll HTTP para clientes sem WebSocket (GET /api/aguardar-notificacoes/?desde=<cursor>).
+
+    Fica fora da cadeia de middleware do Django (rota própria no asgi.py):
+    um cliente à espera não ocupa nenhuma thread nem faz consultas, só tem
+    um canal inscrito nos seus grupos. Responde:
+      200 logo, se já houver notificações depois do cursor (ou sem cursor);
+      200 quando chegam eventos (juntados durante SGA_JANELA_PENDENCIAS),
+          com o delta das notificações e os eventos de pendências;
+      204 se nada chegar em SGA_ESPERA_NOTIFICACOES segundos.
     """
-    from channels.layers import get_channel_layer
-    channel_layer = get_channel_layer()
-    
-    await channel_layer.group_send(
-        group_name,
-        {
-            'type': 'notification_message',
-            'message': message,
-            'link': link
-        }
-    )
 
+    async def handle(self, body):
+        self.user = self.scope.get('user')
+        if not self.user or not self.user.is_authenticated:
+            await self.responder(401, {'erro': 'Não autenticado'})
+            return
 
-def send_notification_sync(group_name, message, link=''):
-    """
-    Versão síncrona para usar em views normais.
-    """
-    from asgiref.sync import async_to_sync
-    from channels.layers import get_channel_layer
-    
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        group_name,
-        {
-            'type': 'notification_message',
-            'message': message,
-            'link': link
-        }
-    )
+        try:
+            desde = int(parse_qs(self.scope.get('query_string', b'').decode())['desde'][0])
+        except (KeyError, ValueError):
+            desde = None
 
+        grupos = await database_sync_to_async(grupos_do_usuario)(self.user)
+        # Inscrito antes da verificação: nenhum evento se perde entre as duas
+        async with inscricao(grupos) as espera:
+            dados = await database_sync_to_async(sincronizar)(self.user, desde)
+            if desde is None or dados['notificacoes']:
+                await self.responder(200, {**dados, 'eventos': []})
+                return
+            recebidos = await espera.receber(espera_notificacoes(), janela_pendencias())
 
-def send_pendencia_update_sync(group_name, message='Pendências atualizadas'):
-    """
-    Versão síncrona para enviar atualização de pendências.
-    Usar em views após encaminhamento ou confirmação de recebimento.
-    """
-    from asgiref.sync import async_to_sync
-    from channels.layers import get_channel_layer
-    
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        group_name,
-        {
-            'type': 'pendencia_update',
-            'message': message
-        }
-    )
+        eventos = self.eventos_para_cliente(recebidos, grupo_pendencias(grupos))
+        if not eventos:
+            await self.send_response(204, b'', headers=[(b'Cache-Control', b'no-store')])
+            return
+        if any(evento['type'] == 'new_notification' for evento in eventos):
+            dados = await database_sync_to_async(sincronizar)(self.user, desde)
+        await self.responder(200, {**dados, 'eventos': eventos})
+
+    @staticmethod
+    def eventos_para_cliente(recebidos, grupo_proprio):
+        """Mesmo formato das mensagens do NotificacaoConsumer; pendências de outra unidade ficam de fora."""
+        eventos = []
+        for evento in recebidos:
+            if evento['type'] == 'notification_message':
+                eventos.append({'type': 'new_notification', 'message': evento['message'], 'link': evento.get('link', '')})
+            elif evento['type'] == 'pendencia_update' and evento.get('grupo') in (None, grupo_proprio):
+                dados = {
+                    'type': 'pendencia_update',
+                    'message': evento.get('message', 'Pendências atualizadas'),
+                    'movimentacoes': evento.get('movimentacoes', []),
+                }
+                if 'count' in evento:
+                    dados['count'] = evento['count']
+                eventos.append(dados)
+        return eventos
+
+    async def responder(self, status, dados):
+        await self.send_response(status, json.dumps(dados).encode(), headers=[
+            (b'Content-Type', b'application/json'),
+            (b'Cache-Control', b'no-store'),
+        ])
@@ -0,0 +1,262 @@
+# ARQUIVOS/conteudo.py
+"""
+Armazenamento endereçado por conteúdo (storage por omissão, ver STORAGES).
+
+O mesmo requerimento digitalizado chega muitas vezes três vezes: em
+Documento.arquivo, em arquivo_digitalizado e num Anexo. Cada upload é
+lido uma única vez, em blocos, enquanto se calcula o SHA-256; o conteúdo
+fica guardado uma só vez em conteudo/<aa>/<bb>/<sha256> e o nome pedido
+pelo FileField (documentos/%Y/%m/..., anexos/...) passa a ser uma ligação
+(hard link) para esse ficheiro. Assim os FileFields, MEDIA_URL e o código
+que abre os ficheiros pelo nome continuam a funcionar sem alterações.
+
+As referências de cada conteúdo ficam na base de dados (Conteudo /
+ReferenciaConteudo); quando a última é apagada, o conteúdo também o é.
+Em sistemas de ficheiros sem hard links o nome recebe uma cópia (sem
+deduplicação, mas correto).
+
+Os ficheiros anteriores a este storage são incorporados com
+`python manage.py deduplicar_media`.
+"""
+
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, default_storage
+
+
+# Pasta (dentro de MEDIA_ROOT) com os conteúdos e os temporários dos uploads
+PASTA = 'conteudo'
+PASTA_TEMPORARIOS = f'{PASTA}/tmp'
+# Uploads por blocos ainda incompletos (ver ARQUIVOS/uploads.py)
+PASTA_UPLOADS = f'{PASTA}/uploads'
+
+TAMANHO_BLOCO = 64 * 1024
+
+# Erros de os.link que significam "sem hard links aqui": copia-se
+_SEM_LIGACOES = {errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP}
+
+
+def nome_conteudo(hash_conteudo):
+    """Nome, no storage, do ficheiro com o conteúdo `hash_conteudo`."""
+    return f'{PASTA}/{hash_conteudo[:2]}/{hash_conteudo[2:4]}/{hash_conteudo}'
+
+
+def hash_ficheiro(caminho):
+    """(SHA-256, tamanho) de um ficheiro em disco, lido em blocos."""
+    sha = hashlib.sha256()
+    tamanho = 0
+    with open(caminho, 'rb') as ficheiro:
+        for bloco in iter(lambda: ficheiro.read(TAMANHO_BLOCO), b''):
+            sha.update(bloco)
+            tamanho += len(bloco)
+    return sha.hexdigest(), tamanho
+
+
+def _ligar(origem, destino):
+    """Hard link `destino` -> `origem` (cópia se o sistema de ficheiros não permitir)."""
+    try:
+        os.link(origem, destino)
+    except OSError as erro:
+        if erro.errno not in _SEM_LIGACOES:
+            raise
+        with open(origem, 'rb') as fonte, open(destino, 'xb') as copia:
+            shutil.copyfileobj(fonte, copia, TAMANHO_BLOCO)
+
+
+class FicheiroArmazenado(File):
+    """
+    Ficheiro que já está no storage, para atribuir a outro FileField (ex.:
+    um upload por blocos concluído -> Documento.arquivo ou Anexo.arquivo).
+    Com o hash conhecido, o storage só cria mais uma ligação: nada é lido
+    nem copiado.
+    """
+
+    def __init__(self, nome, nome_original=None):
+        from ARQUIVOS.models import ReferenciaConteudo
+
+        super().__init__(None, nome_original or os.path.basename(nome))
+        self.nome_armazenado = nome
+        referencia = ReferenciaConteudo.objects.select_related('conteudo').filter(nome=nome).first()
+        self.hash_conteudo = referencia.conteudo.hash if referencia else None
+        self.size = referencia.conteudo.tamanho if referencia else default_storage.size(nome)
+
+    def open(self, mode='rb'):
+        if self.file is None or self.file.closed:
+            self.file = default_storage.open(self.nome_armazenado, mode)
+        else:
+            self.seek(0)
+        return self
+
+    def chunks(self, chunk_size=None):
+        self.open()
+        return super().chunks(chunk_size)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class ArmazenamentoConteudo(FileSystemStorage):
+    """FileSystemStorage que guarda cada conteúdo uma só vez (ver docstring do módulo)."""
+
+    def _criar_pasta(self, caminho):
+        pasta = os.path.dirname(caminho)
+        if self.directory_permissions_mode is not None:
+            # Como o FileSystemStorage: o modo das pastas não depende da umask
+            umask_anterior = os.umask(0o777 & ~self.directory_permissions_mode)
+            try:
+                os.makedirs(pasta, self.directory_permissions_mode, exist_ok=True)
+            finally:
+                os.umask(umask_anterior)
+        else:
+            os.makedirs(pasta, exist_ok=True)
+
+    def _temporario(self):
+        temporarios = self.path(PASTA_TEMPORARIOS)
+        self._criar_pasta(os.path.join(temporarios, 'x'))
+        descritor, temporario = tempfile.mkstemp(dir=temporarios)
+        return descritor, temporario
+
+    def _promover(self, temporario, hash_conteudo):
+        """Coloca o temporário no lugar do conteúdo (ou descarta-o se já existir)."""
+        caminho = self.path(nome_conteudo(hash_conteudo))
+        if os.path.exists(caminho):
+            os.unlink(temporario)
+            return
+        self._criar_pasta(caminho)
+        # Dois uploads iguais em simultâneo: o segundo substitui o primeiro
+        # pelo mesmo conteúdo
+        os.replace(temporario, caminho)
+        if self.file_permissions_mode is not None:
+            os.chmod(caminho, self.file_permissions_mode)
+
+    def _guardar_conteudo(self, content):
+        """Guarda o conteúdo de `content` (se ainda não existir); devolve (hash, tamanho)."""
+        hash_conteudo = getattr(content, 'hash_conteudo', None)
+        if hash_conteudo and os.path.exists(self.path(nome_conteudo(hash_conteudo))):
+            # FicheiroArmazenado: o conteúdo já cá está, basta outra ligação
+            return hash_conteudo, content.size
+
+        descritor, temporario = self._temporario()
+        try:
+            if hasattr(content, 'temporary_file_path'):
+                # Ficheiro já em disco (upload grande, upload por blocos): lido
+                # uma vez para o hash e movido, sem cópia no mesmo disco
+                os.close(descritor)
+                origem = content.temporary_file_path()
+                hash_conteudo, tamanho = hash_ficheiro(origem)
+                file_move_safe(origem, temporario, allow_overwrite=True)
+            else:
+                sha = hashlib.sha256()
+                tamanho = 0
+                with os.fdopen(descritor, 'wb') as destino:
+                    for bloco in content.chunks():
+                        if isinstance(bloco, str):
+                            bloco = bloco.encode()
+                        sha.update(bloco)
+                        destino.write(bloco)
+                        tamanho += len(bloco)
+                hash_conteudo = sha.hexdigest()
+            self._promover(temporario, hash_conteudo)
+        except BaseException:
+            if os.path.exists(temporario):
+                os.unlink(temporario)
+            raise
+        return hash_conteudo, tamanho
+
+    def _save(self, name, content):
+        from ARQUIVOS.models import Conteudo
+
+        hash_conteudo, tamanho = self._guardar_conteudo(content)
+        origem = self.path(nome_conteudo(hash_conteudo))
+        while True:
+            caminho = self.path(name)
+            self._criar_pasta(caminho)
+            try:
+                _ligar(origem, caminho)
+                break
+            except FileExistsError:
+                # Outro upload ocupou o nome entretanto
+                name = self.get_available_name(name)
+        name = os.path.relpath(caminho, self.location).replace('\\', '/')
+        Conteudo.objects.referenciar(hash_conteudo, tamanho, name)
+        return name
+
+    def _open(self, name, mode='rb'):
+        try:
+            return super()._open(name, mode)
+        except FileNotFoundError:
+            # Arquivo morto: o conteúdo já só existe num pacote (ARQUIVOS/arquivo_frio.py)
+            from ARQUIVOS.arquivo_frio import abrir, membro
+
+            arquivado = membro(name) if 'w' not in mode else None
+            if arquivado is None:
+                raise
+            ficheiro = File(abrir(arquivado), name)
+            ficheiro.size = arquivado.conteudo.tamanho
+            return ficheiro
+
+    def exists(self, name):
+        # Os nomes arquivados em pacotes continuam ocupados
+        from ARQUIVOS.models import ReferenciaConteudo
+
+        return super().exists(name) or ReferenciaConteudo.objects.filter(nome=name).exists()
+
+    def size(self, name):
+        from ARQUIVOS.models import ReferenciaConteudo
+
+        try:
+            return super().size(name)
+        except FileNotFoundError:
+            tamanho = ReferenciaConteudo.objects.filter(nome=name).values_list('conteudo__tamanho', flat=True).first()
+            if tamanho is None:
+                raise
+            return tamanho
+
+    def delete(self, name):
+        from ARQUIVOS.models import Conteudo
+        from ARQUIVOS.previas import apagar
+
+        conteudo = Conteudo.objects.libertar(name)
+        super().delete(name)
+        if conteudo is not None:
+            caminho = self.path(nome_conteudo(conteudo.hash))
+            if os.path.exists(caminho):
+                # Só se não restar nenhuma ligação (ex.: upload em curso do mesmo conteúdo)
+                if os.stat(caminho).st_nlink > 1:
+                    return
+                super().delete(nome_conteudo(conteudo.hash))
+            # (Conteúdo num pacote do arquivo frio: só o índice desaparece, com o Conteudo)
+            apagar(conteudo.hash)
+
+    def incorporar(self, name):
+        """
+        Passa um ficheiro já existente (de antes deste storage) a ligação
+        para o seu conteúdo. Devolve os bytes libertados (0 se era o primeiro
+        com este conteúdo) ou None se o nome já estava incorporado.
+        """
+        from ARQUIVOS.models import Conteudo, ReferenciaConteudo
+
+        if ReferenciaConteudo.objects.filter(nome=name).exists():
+            return None
+        caminho = self.path(name)
+        hash_conteudo, tamanho = hash_ficheiro(caminho)
+        origem = self.path(nome_conteudo(hash_conteudo))
+        libertados = 0
+        if not os.path.exists(origem):
+            self._criar_pasta(origem)
+            # O próprio ficheiro passa a ser o conteúdo: nada é copiado
+            _ligar(caminho, origem)
+        elif not os.path.samefile(origem, caminho):
+            temporario = f'{caminho}.{os.getpid()}.tmp'
+            _ligar(origem, temporario)
+            os.replace(temporario, caminho)
+            libertados = tamanho
+        Conteudo.objects.referenciar(hash_conteudo, tamanho, name)
+        return libertados
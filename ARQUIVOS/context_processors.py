@@ -6,7 +6,8 @@ def notificacoes_context(request):
         user = request.user
         
         # Filtro simplificado: apenas notificações do usuário
-        unread_count = Notificacao.objects.filter(usuario=user, lida=False).count()
+        # (contagem e cursor da sincronização numa só consulta)
+        unread_count, ultima_id = Notificacao.objects.estado(user)
         
         # Pega as 10 notificações mais recentes NÃO LIDAS para o dropdown
         recent_notifications = Notificacao.objects.filter(
@@ -15,6 +16,7 @@ def notificacoes_context(request):
 
         return {
             'unread_notifications_count': unread_count,
-            'recent_notifications': recent_notifications
+            'recent_notifications': recent_notifications,
+            'ultima_notificacao_id': ultima_id,
         }
     return {}
\ No newline at end of file
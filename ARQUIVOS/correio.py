@@ -0,0 +1,115 @@
+"""
+correio.py
+==========
+
+Caixa de saída de email (tabela EmailSaida). O código que quer enviar um
+email grava-o, na transação em curso:
+
+    enfileirar_email(assunto, corpo, [documento.email],
+                     anexo=documento.arquivo_digitalizado.name, documento=documento)
+
+e o worker envia os pendentes em lote (tarefa 'email.enviar', fila
+'email'): uma só ligação SMTP por lote em vez de uma por mensagem, cada
+falha fica registada no próprio email e é tentada de novo com atraso
+crescente. Os emails esgotados ficam como falhados e podem ser reenviados
+com `manage.py enviar_emails --reenviar-falhados`.
+
+O envio é "pelo menos uma vez": se o processo morrer a meio de um lote, os
+emails reservados voltam a pendentes quando a reserva expira.
+
+Funciona com qualquer EMAIL_BACKEND do Django (smtp, locmem nos testes,
+filebased ou console em desenvolvimento).
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.utils import timezone
+
+from ARQUIVOS.fila import agendar, identificador_trabalhador
+
+
+logger = logging.getLogger(__name__)
+
+# Emails enviados por cada ligação SMTP
+LOTE_PADRAO = 50
+
+
+def tamanho_lote():
+    return getattr(settings, 'SGA_EMAIL_LOTE', LOTE_PADRAO)
+
+
+def agendar_envio(atraso=None):
+    """
+    Agenda a tarefa de envio daqui a `atraso` segundos, se ainda não houver
+    uma à espera até lá. Uma tarefa pendente para mais tarde (o atraso de um
+    email recusado) é antecipada: os emails novos não ficam atrás dela.
+    """
+    from ARQUIVOS.models import Tarefa, EstadoTarefa
+
+    executar_em = timezone.now() + timedelta(seconds=atraso or 0)
+    pendentes = Tarefa.objects.filter(nome='email.enviar', estado=EstadoTarefa.PENDENTE)
+    if pendentes.filter(executar_em__lte=executar_em).exists():
+        return
+    if not pendentes.update(executar_em=executar_em):
+        agendar('email.enviar', atraso=atraso)
+
+
+def enfileirar_email(assunto, corpo, destinatarios, anexo='', anexo_tipo='application/pdf',
+                     documento=None, remetente=''):
+    """Grava o email na caixa de saída e garante que o worker o vai enviar."""
+    from ARQUIVOS.models import EmailSaida
+
+    email = EmailSaida.objects.create(
+        documento=documento,
+        assunto=assunto[:255],
+        corpo=corpo,
+        remetente=remetente,
+        destinatarios=list(destinatarios),
+        anexo=anexo or '',
+        anexo_tipo=anexo_tipo if anexo else '',
+    )
+    agendar_envio()
+    return email
+
+
+def enviar_pendentes(limite=None, conexao=None):
+    """
+    Envia até `limite` emails prontos usando uma única ligação (aberta aqui
+    se não for dada). Devolve (enviados, falhados).
+
+    Depois de um erro a ligação é fechada e reaberta para o email seguinte:
+    um servidor que cortou a ligação não faz falhar o resto do lote.
+    """
+    from ARQUIVOS.models import EmailSaida
+
+    emails = EmailSaida.objects.reservar(identificador_trabalhador(), limite or tamanho_lote())
+    if not emails:
+        return 0, 0
+
+    conexao = conexao or get_connection(fail_silently=False)
+    enviados = falhados = 0
+    aberta = False
+    try:
+        for email in emails:
+            try:
+                if not aberta:
+                    conexao.open()
+                    aberta = True
+                conexao.send_messages([email.mensagem(conexao)])
+            except Exception as exc:
+                logger.warning("Email %s não enviado (tentativa %s): %s", email.pk, email.tentativas + 1, exc)
+                email.falhar(f"{type(exc).__name__}: {exc}")
+                falhados += 1
+                if aberta:
+                    conexao.close()
+                    aberta = False
+            else:
+                email.marcar_enviado()
+                enviados += 1
+    finally:
+        if aberta:
+            conexao.close()
+    return enviados, falhados
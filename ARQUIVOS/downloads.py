@@ -0,0 +1,185 @@
+# ARQUIVOS/downloads.py
+"""
+Entrega dos ficheiros de MEDIA_ROOT depois da verificação de acesso.
+
+A autorização é feita no Django (views.ficheiro_protegido); a transferência
+em si, conforme SGA_ENTREGA_FICHEIROS:
+
+- 'nginx': cabeçalho X-Accel-Redirect para a location interna
+  SGA_ACCEL_PREFIXO (ver nginx.conf). O nginx envia o ficheiro com
+  sendfile() e trata sozinho os pedidos Range (downloads retomados).
+- 'sendfile': cabeçalho X-Sendfile com o caminho em disco (Apache
+  mod_xsendfile, lighttpd).
+- 'python' (por omissão, runserver/daphne sem proxy): o próprio Django,
+  com suporte a Range de um intervalo (206/416). O ficheiro inteiro vai
+  num FileResponse, que usa o wsgi.file_wrapper quando o servidor o tem.
+
+O ETag é o SHA-256 do conteúdo (ARQUIVOS/conteudo.py), quando conhecido:
+If-None-Match responde 304 e If-Range só aceita o intervalo se o
+conteúdo não mudou.
+
+Ficheiros do arquivo morto já empacotados (ARQUIVOS/arquivo_frio.py) são
+sempre entregues pelo Django, lidos do pacote pelo índice de offsets.
+"""
+
+import mimetypes
+import os
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+
+from . import arquivo_frio
+from .conteudo import TAMANHO_BLOCO
+from .models import Anexo, Documento, ReferenciaConteudo, UploadParcial
+
+
+ENTREGA_PADRAO = 'python'
+ACCEL_PREFIXO_PADRAO = '/protegido/'
+# Ficheiros com controlo de acesso: nunca em caches partilhadas
+CACHE_PRIVADO = 'private, no-cache'
+
+
+def modo_entrega():
+    return getattr(settings, 'SGA_ENTREGA_FICHEIROS', ENTREGA_PADRAO)
+
+
+class IntervaloInvalido(Exception):
+    """Range fora do ficheiro (resposta 416)."""
+
+
+def intervalo_pedido(cabecalho, tamanho):
+    """
+    (inicio, fim), inclusivos, do cabeçalho Range. None se não houver Range
+    ou não for suportado (vários intervalos, outra unidade, mal formado):
+    responde-se com o ficheiro inteiro. IntervaloInvalido se estiver fora
+    do ficheiro.
+    """
+    if not cabecalho or not cabecalho.startswith('bytes='):
+        return None
+    especificacao = cabecalho[len('bytes='):].strip()
+    inicio, separador, fim = especificacao.partition('-')
+    if ',' in especificacao or not separador:
+        return None
+    try:
+        if inicio:
+            inicio = int(inicio)
+            fim = int(fim) if fim else tamanho - 1
+        else:
+            # bytes=-N: os últimos N bytes
+            sufixo = int(fim)
+            if sufixo == 0:
+                raise IntervaloInvalido
+            inicio, fim = max(tamanho - sufixo, 0), tamanho - 1
+    except ValueError:
+        return None
+    fim = min(fim, tamanho - 1)
+    if inicio >= tamanho or inicio > fim:
+        raise IntervaloInvalido
+    return inicio, fim
+
+
+def _ler(caminho, inicio, comprimento):
+    with open(caminho, 'rb') as ficheiro:
+        ficheiro.seek(inicio)
+        while comprimento > 0:
+            dados = ficheiro.read(min(TAMANHO_BLOCO, comprimento))
+            if not dados:
+                break
+            comprimento -= len(dados)
+            yield dados
+
+
+def _disposicao(nome_download, como_anexo):
+    tipo = 'attachment' if como_anexo else 'inline'
+    # RFC 6266: nome ASCII simples + filename* em UTF-8
+    ascii_ = nome_download.encode('ascii', 'ignore').decode().replace('"', '') or 'ficheiro'
+    return f"{tipo}; filename=\"{ascii_}\"; filename*=UTF-8''{quote(nome_download)}"
+
+
+def responder_ficheiro(request, nome, como_anexo=False, hash_conteudo=None, cache=CACHE_PRIVADO):
+    """
+    Resposta com o ficheiro `nome` do storage (o acesso já foi verificado).
+    `hash_conteudo` (ETag) é procurado nas referências se não for dado.
+    """
+    caminho = default_storage.path(nome)
+    arquivado = None
+    if os.path.isfile(caminho):
+        tamanho = os.path.getsize(caminho)
+    else:
+        arquivado = arquivo_frio.membro(nome)
+        if arquivado is None:
+            raise Http404('Ficheiro não encontrado')
+        tamanho = arquivado.conteudo.tamanho
+        hash_conteudo = hash_conteudo or arquivado.conteudo.hash
+    tipo = mimetypes.guess_type(nome)[0] or 'application/octet-stream'
+    if hash_conteudo is None:
+        hash_conteudo = (
+            ReferenciaConteudo.objects.filter(nome=nome).values_list('conteudo__hash', flat=True).first()
+        )
+    etag = f'"{hash_conteudo}"' if hash_conteudo else None
+
+    if etag and request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    elif arquivado is not None:
+        # Num pacote do arquivo frio: descomprimido em streaming pelo Django (sem Range)
+        response = FileResponse(arquivo_frio.abrir(arquivado), content_type=tipo)
+        response['Content-Length'] = str(tamanho)
+        response['Accept-Ranges'] = 'none'
+    elif modo_entrega() == 'nginx':
+        response = HttpResponse(content_type=tipo)
+        prefixo = getattr(settings, 'SGA_ACCEL_PREFIXO', ACCEL_PREFIXO_PADRAO)
+        response['X-Accel-Redirect'] = prefixo + quote(nome)
+    elif modo_entrega() == 'sendfile':
+        response = HttpResponse(content_type=tipo)
+        response['X-Sendfile'] = caminho
+    else:
+        if etag and request.headers.get('If-Range', etag) != etag:
+            # Conteúdo mudou desde o download parcial: vai tudo
+            intervalo = None
+        else:
+            try:
+                intervalo = intervalo_pedido(request.headers.get('Range'), tamanho)
+            except IntervaloInvalido:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{tamanho}'
+                return response
+        if intervalo is None:
+            response = FileResponse(open(caminho, 'rb'), content_type=tipo)
+        else:
+            inicio, fim = intervalo
+            response = StreamingHttpResponse(_ler(caminho, inicio, fim - inicio + 1), status=206, content_type=tipo)
+            response['Content-Range'] = f'bytes {inicio}-{fim}/{tamanho}'
+            response['Content-Length'] = str(fim - inicio + 1)
+        response['Accept-Ranges'] = 'bytes'
+
+    if etag:
+        response['ETag'] = etag
+    if response.status_code != 304:
+        response['Content-Disposition'] = _disposicao(os.path.basename(nome), como_anexo)
+    response['Cache-Control'] = cache
+    return response
+
+
+def pode_descarregar(usuario, nome):
+    """
+    `nome` (caminho em MEDIA_ROOT) pertence a um documento ou anexo que o
+    utilizador pode ver (Documento.objects.para_usuario), ou a um upload seu.
+    """
+    visiveis = Documento.objects.para_usuario(usuario)
+    if visiveis.filter(Q(arquivo=nome) | Q(arquivo_digitalizado=nome)).exists():
+        return True
+    if Anexo.objects.filter(arquivo=nome, documento__in=visiveis).exists():
+        return True
+    return UploadParcial.objects.filter(usuario=usuario, ficheiro=nome).exists()
+
+
+def pode_ver_conteudo(usuario, hash_conteudo):
+    """Algum documento ou anexo visível para o utilizador tem o conteúdo `hash_conteudo`."""
+    nomes = ReferenciaConteudo.objects.filter(conteudo__hash=hash_conteudo).values('nome')
+    visiveis = Documento.objects.para_usuario(usuario)
+    if visiveis.filter(Q(arquivo__in=nomes) | Q(arquivo_digitalizado__in=nomes)).exists():
+        return True
+    return Anexo.objects.filter(arquivo__in=nomes, documento__in=visiveis).exists()
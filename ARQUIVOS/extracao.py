@@ -0,0 +1,327 @@
+"""
+extracao.py
+===========
+
+Extração do texto dos ficheiros (Documento.arquivo, arquivo_digitalizado e
+Anexo.arquivo) para o índice de pesquisa.
+
+O save() de Documento e de Anexo apenas regista o ficheiro como pendente
+(TextoExtraido); a extração corre fora do pedido, num pool de processos:
+
+    python manage.py extrair_textos [--processos 4] [--continuo]
+
+Cada ficheiro é identificado pelo SHA-256 do conteúdo: um ficheiro igual ao
+já processado (ou a outro com o mesmo conteúdo) nunca é reprocessado.
+
+Extratores, por ordem de preferência (todos opcionais, sem dependências
+obrigatórias novas):
+    PDF  -> pypdf (se instalado), `pdftotext` (poppler), leitor interno
+    DOCX -> leitor interno (zip + XML)
+    OCR  -> `tesseract` (imagens e PDFs sem camada de texto; PDFs precisam
+            também de `pdftoppm`), só se o binário existir
+"""
+
+import base64
+import hashlib
+import io
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree import ElementTree
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+
+TAMANHO_BLOCO = 1024 * 1024
+MAX_CARACTERES = 500_000
+# Menos do que isto num PDF = provavelmente digitalizado (sem camada de texto)
+MIN_CARACTERES_PDF = 20
+TIMEOUT_PROGRAMA = 120
+
+
+class ErroExtracao(Exception):
+    """O ficheiro não pôde ser lido (corrompido, formato não suportado...)."""
+
+
+# ---------------------------------------------------------------------------
+# Utilitários
+# ---------------------------------------------------------------------------
+
+def hash_conteudo(ficheiro):
+    """SHA-256 (hex) do conteúdo de um ficheiro aberto, lido por blocos."""
+    sha = hashlib.sha256()
+    for bloco in iter(lambda: ficheiro.read(TAMANHO_BLOCO), b''):
+        sha.update(bloco)
+    return sha.hexdigest()
+
+
+def _extensao(nome):
+    return os.path.splitext(nome or '')[1].lower().lstrip('.')
+
+
+def _limpar(texto):
+    texto = re.sub(r'[ \t\r\f\v]+', ' ', texto or '')
+    texto = re.sub(r'\n\s*\n+', '\n\n', texto)
+    return texto.strip()[:MAX_CARACTERES]
+
+
+def _programa(nome):
+    return shutil.which(nome)
+
+
+def _executar(argumentos, entrada=None):
+    resultado = subprocess.run(
+        argumentos, input=entrada, capture_output=True, timeout=TIMEOUT_PROGRAMA, check=False
+    )
+    if resultado.returncode != 0:
+        raise ErroExtracao(resultado.stderr.decode(errors='replace')[:500] or f'{argumentos[0]} falhou')
+    return resultado.stdout
+
+
+def ocr_disponivel():
+    return bool(_programa('tesseract'))
+
+
+# ---------------------------------------------------------------------------
+# DOCX
+# ---------------------------------------------------------------------------
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+def texto_docx(dados):
+    """Texto dos parágrafos (corpo, cabeçalhos e rodapés) de um .docx."""
+    try:
+        with zipfile.ZipFile(io.BytesIO(dados)) as arquivo:
+            partes = [
+                nome for nome in arquivo.namelist()
+                if nome == 'word/document.xml' or re.match(r'word/(header|footer)\d*\.xml$', nome)
+            ]
+            if 'word/document.xml' not in partes:
+                raise ErroExtracao('DOCX sem word/document.xml')
+            paragrafos = []
+            for nome in sorted(partes, key=lambda n: n != 'word/document.xml'):
+                raiz = ElementTree.fromstring(arquivo.read(nome))
+                for paragrafo in raiz.iter(f'{_W}p'):
+                    texto = ''.join(
+                        '\t' if no.tag == f'{_W}tab' else (no.text or '')
+                        for no in paragrafo.iter()
+                        if no.tag in (f'{_W}t', f'{_W}tab')
+                    )
+                    if texto.strip():
+                        paragrafos.append(texto)
+    except (zipfile.BadZipFile, ElementTree.ParseError, KeyError) as erro:
+        raise ErroExtracao(f'DOCX inválido: {erro}')
+    return '\n'.join(paragrafos)
+
+
+# ---------------------------------------------------------------------------
+# PDF
+# ---------------------------------------------------------------------------
+
+# Dicionário e dados de cada stream (sem atravessar para o objeto seguinte)
+_STREAM = re.compile(rb'\bobj\s*<<((?:(?!endobj).)*?)>>\s*stream\r?\n(.*?)(?:\r?\n)?endstream', re.S)
+_TEXTO_PDF = re.compile(rb'\((?:\\.|[^\\)])*\)\s*(?:Tj|\'|")|\[(?:\\.|[^\]])*\]\s*TJ|T\*|Td|TD|ET', re.S)
+_STRING_PDF = re.compile(rb'\(((?:\\.|[^\\)])*)\)', re.S)
+_ESCAPES_PDF = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+
+
+def _string_pdf(bruto):
+    """Desfaz os escapes de uma string literal de PDF."""
+    def trocar(m):
+        sequencia = m.group(1)
+        if sequencia[:1].isdigit():
+            return bytes([int(sequencia, 8) & 0xFF])
+        return _ESCAPES_PDF.get(sequencia, sequencia if sequencia != b'\n' else b'')
+    texto = re.sub(rb'\\([0-7]{1,3}|.)', trocar, bruto, flags=re.S)
+    return texto.decode('latin-1')
+
+
+def _descodificar_stream(dicionario, conteudo):
+    """Aplica a cadeia /Filter do stream; None se algum filtro não for suportado."""
+    filtro = re.search(rb'/Filter\s*(\[[^\]]*\]|/\w+)', dicionario)
+    for nome in re.findall(rb'/(\w+)', filtro.group(1)) if filtro else []:
+        try:
+            if nome == b'FlateDecode':
+                conteudo = zlib.decompress(conteudo)
+            elif nome == b'ASCII85Decode':
+                conteudo = base64.a85decode(re.sub(rb'\s', b'', conteudo).removesuffix(b'~>'))
+            elif nome == b'ASCIIHexDecode':
+                conteudo = bytes.fromhex(re.sub(rb'\s', b'', conteudo).removesuffix(b'>').decode())
+            else:
+                return None
+        except (zlib.error, ValueError):
+            return None
+    return conteudo
+
+
+def _texto_pdf_interno(dados):
+    """
+    Leitor mínimo da camada de texto: descodifica os content streams
+    (FlateDecode, ASCII85, ASCIIHex) e recolhe as strings dos operadores Tj/TJ. Cobre os PDFs
+    gerados por aplicações (ex.: reportlab); fontes CID/Type3 ficam de fora.
+    """
+    partes = []
+    for dicionario, conteudo in _STREAM.findall(dados):
+        conteudo = _descodificar_stream(dicionario, conteudo)
+        if conteudo is None or b'BT' not in conteudo:
+            continue
+        linha = []
+        for operador in _TEXTO_PDF.finditer(conteudo):
+            token = operador.group(0)
+            if token in (b'T*', b'Td', b'TD', b'ET'):
+                if linha:
+                    partes.append(''.join(linha))
+                    linha = []
+                continue
+            linha.extend(_string_pdf(s) for s in _STRING_PDF.findall(token))
+        if linha:
+            partes.append(''.join(linha))
+    return '\n'.join(partes)
+
+
+def texto_pdf(dados):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        PdfReader = None
+
+    if PdfReader is not None:
+        try:
+            leitor = PdfReader(io.BytesIO(dados))
+            return '\n'.join(pagina.extract_text() or '' for pagina in leitor.pages)
+        except Exception as erro:
+            raise ErroExtracao(f'PDF inválido: {erro}')
+
+    if _programa('pdftotext'):
+        return _executar(['pdftotext', '-q', '-enc', 'UTF-8', '-', '-'], dados).decode('utf-8', errors='replace')
+
+    return _texto_pdf_interno(dados)
+
+
+# ---------------------------------------------------------------------------
+# OCR
+# ---------------------------------------------------------------------------
+
+def _idioma_ocr():
+    return getattr(settings, 'EXTRACAO_OCR_IDIOMA', 'por')
+
+
+def ocr_imagem(dados):
+    return _executar(['tesseract', 'stdin', 'stdout', '-l', _idioma_ocr()], dados).decode('utf-8', errors='replace')
+
+
+def ocr_pdf(dados):
+    """Rasteriza cada página (pdftoppm) e passa-a pelo tesseract."""
+    if not _programa('pdftoppm'):
+        return ''
+    with tempfile.TemporaryDirectory() as pasta:
+        _executar(['pdftoppm', '-r', '200', '-png', '-', os.path.join(pasta, 'pagina')], dados)
+        paginas = sorted(nome for nome in os.listdir(pasta) if nome.endswith('.png'))
+        textos = []
+        for nome in paginas:
+            with open(os.path.join(pasta, nome), 'rb') as imagem:
+                textos.append(ocr_imagem(imagem.read()))
+    return '\n'.join(textos)
+
+
+# ---------------------------------------------------------------------------
+# Extração (corre nos processos do pool)
+# ---------------------------------------------------------------------------
+
+def extrair(dados, nome, ocr=True):
+    """
+    Texto de um ficheiro. Devolve (texto, metodo); metodo vazio se o
+    formato não tem texto extraível (ou falta o OCR).
+    """
+    extensao = _extensao(nome)
+
+    if extensao == 'pdf':
+        texto = texto_pdf(dados)
+        if len(texto.strip()) >= MIN_CARACTERES_PDF:
+            return _limpar(texto), 'pdf'
+        if ocr and ocr_disponivel():
+            return _limpar(ocr_pdf(dados)), 'ocr'
+        return _limpar(texto), 'pdf' if texto.strip() else ''
+
+    if extensao == 'docx':
+        return _limpar(texto_docx(dados)), 'docx'
+
+    if extensao in ('txt', 'csv'):
+        return _limpar(dados.decode('utf-8', errors='replace')), 'texto'
+
+    if extensao in ('jpg', 'jpeg', 'png', 'tif', 'tiff') and ocr and ocr_disponivel():
+        return _limpar(ocr_imagem(dados)), 'ocr'
+
+    # .doc (Word 97) e imagens sem OCR: sem texto
+    return '', ''
+
+
+def _tarefa(identificador, caminho, nome, ocr):
+    """
+    Ponto de entrada no processo do pool: o ficheiro é lido aqui (e não no
+    processo principal) e nenhuma exceção se propaga, para que um ficheiro
+    inválido não interrompa o lote.
+    """
+    try:
+        with open(caminho, 'rb') as ficheiro:
+            dados = ficheiro.read()
+        texto, metodo = extrair(dados, nome, ocr)
+        return identificador, texto, metodo, ''
+    except Exception as erro:
+        return identificador, '', '', (str(erro) or erro.__class__.__name__)[:500]
+
+
+# ---------------------------------------------------------------------------
+# Pipeline
+# ---------------------------------------------------------------------------
+
+def processar_pendentes(limite=100, processos=None, ocr=True):
+    """
+    Processa até `limite` ficheiros pendentes. O hash é calculado aqui; só
+    os conteúdos nunca vistos vão ao pool de processos, que recebe o caminho
+    e lê o ficheiro. Devolve o número de ficheiros tratados.
+    """
+    from ARQUIVOS.models import TextoExtraido
+
+    pendentes = list(TextoExtraido.objects.pendentes()[:limite])
+    if not pendentes:
+        return 0
+
+    por_extrair = {}
+    for registo in pendentes:
+        try:
+            with registo.abrir() as ficheiro:
+                conteudo = hash_conteudo(ficheiro)
+        except (FileNotFoundError, OSError, ValueError) as erro:
+            registo.concluir(erro=f'Ficheiro inacessível: {erro}')
+            continue
+
+        # Conteúdo igual ao já extraído (deste ou de outro registo): reutiliza
+        if TextoExtraido.objects.reutilizar(registo, conteudo):
+            continue
+        por_extrair.setdefault(conteudo, []).append(registo)
+
+    if por_extrair:
+        tarefas = [
+            (conteudo, default_storage.path(registos[0].ficheiro), registos[0].ficheiro, ocr)
+            for conteudo, registos in por_extrair.items()
+        ]
+
+        if processos == 1 or len(tarefas) == 1:
+            resultados = [_tarefa(*tarefa) for tarefa in tarefas]
+        else:
+            with ProcessPoolExecutor(max_workers=processos) as pool:
+                resultados = list(pool.map(_tarefa, *zip(*tarefas)))
+
+        for conteudo, texto, metodo, erro in resultados:
+            for registo in por_extrair[conteudo]:
+                registo.concluir(conteudo, texto, metodo, erro)
+
+    return len(pendentes)
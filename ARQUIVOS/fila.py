@@ -0,0 +1,130 @@
+"""
+fila.py
+=======
+
+Fila de tarefas em segundo plano sem broker externo: as tarefas ficam na
+tabela Tarefa do próprio banco e são executadas por
+
+    python manage.py sga_worker [--processos 4] [--filas pdf,email]
+
+Registo (ARQUIVOS/tarefas.py):
+
+    @tarefa('despacho.gerar_pdf', fila='pdf')
+    def gerar_pdf(documento_id, ...):
+        ...
+
+Agendamento (numa view, dentro da transação do pedido):
+
+    agendar('despacho.gerar_pdf', {'documento_id': documento.pk, ...})
+
+A tarefa é gravada na mesma transação dos dados: só existe se o pedido
+confirmar, e o worker só a vê depois do commit. Uma tarefa pode correr mais
+do que uma vez (nova tentativa depois de erro ou de uma reserva expirada):
+as funções registadas devem ser idempotentes.
+"""
+
+import logging
+import os
+import socket
+import time
+import traceback
+from dataclasses import dataclass
+from typing import Callable
+
+from django.db import close_old_connections, transaction
+
+from ARQUIVOS.notificacoes import lote
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Definicao:
+    funcao: Callable
+    fila: str
+    max_tentativas: int
+
+
+_REGISTO = {}
+
+
+def tarefa(nome, fila='default', max_tentativas=5):
+    """Regista a função como tarefa `nome`, executada na fila `fila`."""
+    def registar(funcao):
+        _REGISTO[nome] = Definicao(funcao, fila, max_tentativas)
+        return funcao
+    return registar
+
+
+def definicao(nome):
+    # As tarefas do projeto registam-se ao importar ARQUIVOS.tarefas (AppConfig.ready)
+    try:
+        return _REGISTO[nome]
+    except KeyError:
+        raise LookupError(f"Tarefa não registada: {nome}")
+
+
+def agendar(nome, argumentos=None, atraso=None):
+    """
+    Grava a tarefa `nome` (argumentos serializáveis em JSON) para execução
+    pelo worker, daqui a `atraso` segundos.
+    """
+    from ARQUIVOS.models import Tarefa
+
+    registo = definicao(nome)
+    return Tarefa.objects.agendar(
+        nome, argumentos or {}, registo.fila, atraso=atraso, max_tentativas=registo.max_tentativas
+    )
+
+
+def identificador_trabalhador():
+    return f"{socket.gethostname()}:{os.getpid()}"[:100]
+
+
+def executar(tarefa_reservada):
+    """
+    Executa uma tarefa reservada numa transação: se falhar, as escritas da
+    tentativa são desfeitas e a tarefa volta à fila com atraso crescente.
+    Devolve True se concluiu.
+    """
+    try:
+        funcao = definicao(tarefa_reservada.nome).funcao
+        # As notificações WebSocket da tarefa saem juntas, depois do commit
+        with lote(), transaction.atomic():
+            funcao(**tarefa_reservada.argumentos)
+    except Exception:
+        logger.exception("Tarefa %s (%s) falhou", tarefa_reservada.pk, tarefa_reservada.nome)
+        tarefa_reservada.falhar(traceback.format_exc())
+        return False
+    tarefa_reservada.concluir()
+    return True
+
+
+def trabalhar(filas=None, lote=10, intervalo=1.0, uma_vez=False, parar=None):
+    """
+    Ciclo de um processo do worker: reserva até `lote` tarefas, executa-as
+    e repete; sem trabalho espera `intervalo` segundos (ou termina, com
+    uma_vez). `parar` é um Event que termina o ciclo. Devolve o número de
+    tarefas executadas.
+    """
+    from ARQUIVOS.models import Tarefa
+
+    trabalhador = identificador_trabalhador()
+    executadas = 0
+    while not (parar and parar.is_set()):
+        close_old_connections()
+        Tarefa.objects.recuperar_expiradas()
+        reservadas = Tarefa.objects.reservar(trabalhador, filas, lote)
+        for reservada in reservadas:
+            executar(reservada)
+            executadas += 1
+        if reservadas:
+            continue
+        if uma_vez:
+            break
+        if parar:
+            parar.wait(intervalo)
+        else:
+            time.sleep(intervalo)
+    return executadas
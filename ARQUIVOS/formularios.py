@@ -31,6 +31,19 @@ from .hierarchy_manager import (
     validar_destino_encaminhamento,
     obter_label_dinamico,
 )
+from .busca import pesquisar, filtrar_facetas
+
+
+class PaginasInput(forms.FileInput):
+    """
+    Aceita várias imagens (uma por página). O campo recebe a primeira; as
+    seguintes são juntadas num PDF fora do pedido (normalizacao.registar_paginas).
+    """
+    allow_multiple_selected = True
+
+    def value_from_datadict(self, data, files, name):
+        ficheiros = super().value_from_datadict(data, files, name)
+        return ficheiros[0] if ficheiros else None
 
 
 # ===========================================================================
@@ -78,13 +91,18 @@ class DocumentoForm(forms.ModelForm):
                     ('urgente', '🔴 Urgente')
                 ]
             }),
+            # data-upload-blocos: ficheiros grandes enviados por blocos (static/js/uploads.js)
             'arquivo': forms.FileInput(attrs={
                 'class': 'file-input',
-                'accept': '.pdf,.doc,.docx,.jpg,.jpeg,.png'
+                'accept': '.pdf,.doc,.docx,.jpg,.jpeg,.png',
+                'data-upload-blocos': 'true',
             }),
-            'arquivo_digitalizado': forms.FileInput(attrs={
+            # Várias imagens = páginas de uma digitalização, juntadas num PDF
+            'arquivo_digitalizado': PaginasInput(attrs={
                 'class': 'file-input',
-                'accept': '.pdf,.jpg,.jpeg,.png'
+                'accept': '.pdf,.jpg,.jpeg,.png',
+                'data-upload-blocos': 'true',
+                'multiple': True,
             }),
             'tags': forms.TextInput(attrs={
                 'class': 'form-input',
@@ -111,6 +129,14 @@ class EncaminharDocumentoForm(forms.ModelForm):
     funcionando para TODOS os tipos de usuário (admin, dept, secção, superuser).
     """
 
+    # Só para utilizadores do Governo Provincial: difusão para a Secretaria
+    # Geral de todas as administrações municipais da província
+    enviar_todas = forms.BooleanField(
+        required=False,
+        label='Enviar para todas as administrações municipais',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+
     class Meta:
         model = MovimentacaoDocumento
         fields = [
@@ -194,13 +220,18 @@ class EncaminharDocumentoForm(forms.ModelForm):
 
         self.fields['seccao_destino'].label_from_instance = lambda obj: obj.nome
 
+        administracao = getattr(self.user, 'administracao', None)
+        if not (administracao and administracao.tipo_municipio == 'G'):
+            del self.fields['enviar_todas']
+
     def clean(self):
         cleaned_data = super().clean()
         dept_destino = cleaned_data.get('departamento_destino')
         sec_destino = cleaned_data.get('seccao_destino')
         tipo_mov = cleaned_data.get('tipo_movimentacao')
 
-        if tipo_mov == 'encaminhamento':
+        # Na difusão os destinos são as Secretarias Gerais (resolvidas na tarefa)
+        if tipo_mov == 'encaminhamento' and not cleaned_data.get('enviar_todas'):
             is_valid, error_msg = validar_destino_encaminhamento(
                 self.user,
                 dept_id=dept_destino.pk if dept_destino else None,
@@ -211,6 +242,13 @@ class EncaminharDocumentoForm(forms.ModelForm):
 
         return cleaned_data
 
+    def _post_clean(self):
+        # Na difusão esta instância não é gravada: as movimentações são criadas
+        # (e validadas) pela tarefa documento.difundir
+        if self.cleaned_data.get('enviar_todas'):
+            return
+        super()._post_clean()
+
 
 # ===========================================================================
 # CustomUserCreationForm (REFATORADO COM HierarchyManager)
@@ -634,6 +672,43 @@ class BuscaAvancadaForm(forms.Form):
         else:
             self.fields['departamento'].queryset = Departamento.objects.none()
 
+    def facetas_selecionadas(self):
+        """{faceta: valor} das facetas escolhidas (ver busca.FACETAS)."""
+        dados = self.cleaned_data
+        selecionadas = {
+            'status': dados.get('status'),
+            'tipo_documento': dados['tipo_documento'].pk if dados.get('tipo_documento') else None,
+            'departamento': dados['departamento'].pk if dados.get('departamento') else None,
+            'prioridade': dados.get('prioridade'),
+        }
+        return {faceta: valor for faceta, valor in selecionadas.items() if valor}
+
+    def filtrar(self, documentos, facetas=True):
+        """
+        Aplica os critérios ao queryset de documentos (já restrito ao usuário).
+        Título, conteúdo e tags usam o índice de texto integral (ARQUIVOS/busca.py).
+        Com facetas=False ficam de fora os filtros das facetas, para as contar.
+        """
+        dados = self.cleaned_data
+
+        for campo, colunas in (('titulo', ('titulo',)), ('conteudo', ('conteudo', 'ficheiros'))):
+            if dados.get(campo):
+                documentos = pesquisar(documentos, dados[campo], colunas=colunas)
+        for tag in (dados.get('tags') or '').split(','):
+            if tag.strip():
+                documentos = pesquisar(documentos, tag, colunas=('tags',))
+
+        if dados.get('numero_protocolo'):
+            documentos = documentos.filter(numero_protocolo__startswith=dados['numero_protocolo'].strip())
+        if dados.get('data_inicio'):
+            documentos = documentos.filter(data_criacao__date__gte=dados['data_inicio'])
+        if dados.get('data_fim'):
+            documentos = documentos.filter(data_criacao__date__lte=dados['data_fim'])
+
+        if facetas:
+            documentos = filtrar_facetas(documentos, self.facetas_selecionadas())
+        return documentos
+
 
 class DepartamentoForm(forms.ModelForm):
     """Formulário para departamentos."""
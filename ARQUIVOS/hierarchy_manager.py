@@ -8,12 +8,14 @@ Este módulo fornece:
 - Cálculo de destinos permitidos (departamentos e secções)
 - Validação de acessos IDOR
 - Métodos reutilizáveis por todos os formulários
+- Destinos calculados sobre o OrgSnapshot (sem consultas à BD), memorizados
+  por versão da estrutura (invalidada pelos sinais em ARQUIVOS/signals.py)
 
 A lógica é agnóstica ao contexto (encaminhamento, criação de usuário, etc).
 """
 
-from django.db.models import Q
-from .models import Administracao, Departamento, Seccoes
+from .models import Departamento, Seccoes
+from .org_snapshot import obter_snapshot, como_id
 
 
 # ---------------------------------------------------------------------------
@@ -27,20 +29,25 @@ def _is_secretaria_geral(departamento) -> bool:
     return "secretaria geral" in departamento.nome.lower()
 
 
-def _get_contexto_usuario(user):
+def _get_contexto_usuario(user, snapshot=None):
     """
-    Retorna o contexto resolvido do usuário.
+    Retorna o contexto resolvido do usuário, a partir do OrgSnapshot
+    (registos imutáveis com .pk/.nome, sem consultas à BD).
     
     Returns:
         dict com chaves: 'admin', 'dept', 'seccao', 'em_seccao'
     """
-    admin = getattr(user, 'administracao', None)
-    dept = getattr(user, 'departamento_efetivo', None)
-    seccao = getattr(user, 'seccao', None)
-    
-    # Validar seccão
-    if seccao and not seccao.pk:
-        seccao = None
+    if snapshot is None:
+        snapshot = obter_snapshot()
+
+    admin = snapshot.administracoes.get(getattr(user, 'administracao_id', None))
+    seccao = snapshot.seccoes.get(getattr(user, 'seccao_id', None))
+
+    # Departamento efetivo: PRIORIZA a secção se existir
+    if seccao:
+        dept = snapshot.departamentos.get(seccao.departamento_id)
+    else:
+        dept = snapshot.departamentos.get(getattr(user, 'departamento_id', None))
     
     return {
         'admin': admin,
@@ -50,6 +57,42 @@ def _get_contexto_usuario(user):
     }
 
 
+# ---------------------------------------------------------------------------
+# Destinos memorizados por versão da estrutura
+# ---------------------------------------------------------------------------
+
+def _destinos_memorizados(user, ctx, incluir_self, snapshot):
+    """
+    IDs de departamentos e secções permitidos, por
+    (administração, departamento, secção, incluir_self), calculados uma vez
+    por versão do OrgSnapshot.
+
+    Returns:
+        tuple(tuple[int], tuple, tuple[int], tuple, bool)
+        - IDs e ordenação dos departamentos
+        - IDs e ordenação das secções
+        - bool: secções fixas
+    """
+    admin, dept, seccao = ctx['admin'], ctx['dept'], ctx['seccao']
+    chave = (
+        'destinos',
+        admin.pk if admin else None,
+        dept.pk if dept else None,
+        seccao.pk if seccao else None,
+        incluir_self,
+        # Sem administração, só o superuser tem destinos
+        user.is_superuser if not admin else None,
+    )
+    return snapshot.memorizar(
+        chave, lambda: _calcular_destinos_permitidos(user, ctx, incluir_self=incluir_self, snapshot=snapshot)
+    )
+
+
+def _queryset_de_ids(modelo, ids, ordem):
+    queryset = modelo.objects.filter(pk__in=ids)
+    return queryset.order_by(*ordem) if ordem else queryset
+
+
 # ---------------------------------------------------------------------------
 # API Pública
 # ---------------------------------------------------------------------------
@@ -68,7 +111,17 @@ class HierarchyManager:
     
     def __init__(self, user):
         self.user = user
-        self.ctx = _get_contexto_usuario(user)
+        self.snapshot = obter_snapshot()
+        self.ctx = _get_contexto_usuario(user, self.snapshot)
+        self._destinos = {}
+
+    def _ids_permitidos(self, incluir_self):
+        """IDs permitidos, memorizados também na instância (várias chamadas por pedido)."""
+        if incluir_self not in self._destinos:
+            self._destinos[incluir_self] = _destinos_memorizados(
+                self.user, self.ctx, incluir_self, self.snapshot
+            )
+        return self._destinos[incluir_self]
     
     def obter_destinos_permitidos(self, incluir_self=True):
         """
@@ -83,10 +136,11 @@ class HierarchyManager:
             - QuerySet de secções
             - bool: True se secções são FIXAS, False se dinâmicas
         """
-        return _calcular_destinos_permitidos(
-            self.user,
-            self.ctx,
-            incluir_self=incluir_self
+        dept_ids, dept_ordem, sec_ids, sec_ordem, seccoes_fixas = self._ids_permitidos(incluir_self)
+        return (
+            _queryset_de_ids(Departamento, dept_ids, dept_ordem),
+            _queryset_de_ids(Seccoes, sec_ids, sec_ordem),
+            seccoes_fixas,
         )
     
     def obter_departamentos(self, incluir_self=True):
@@ -101,18 +155,15 @@ class HierarchyManager:
     
     def seccoes_sao_fixas(self):
         """Retorna True se as secções do usuário são fixas (não mudam com dept selecionado)."""
-        _, _, seccoes_fixas = self.obter_destinos_permitidos()
-        return seccoes_fixas
+        return self._ids_permitidos(True)[4]
     
     def validar_departamento(self, dept_id):
-        """Verifica se um departamento é permitido para o usuário."""
-        depts, _, _ = self.obter_destinos_permitidos(incluir_self=False)
-        return depts.filter(pk=dept_id).exists()
+        """Verifica se um departamento é permitido para o usuário (sem consultar a BD)."""
+        return como_id(dept_id) in self._ids_permitidos(False)[0]
     
     def validar_seccao(self, seccao_id):
-        """Verifica se uma secção é permitida para o usuário."""
-        _, seccoes, _ = self.obter_destinos_permitidos(incluir_self=False)
-        return seccoes.filter(pk=seccao_id).exists()
+        """Verifica se uma secção é permitida para o usuário (sem consultar a BD)."""
+        return como_id(seccao_id) in self._ids_permitidos(False)[2]
     
     @staticmethod
     def obter_seccoes_para_departamento(user, dept_id):
@@ -123,48 +174,50 @@ class HierarchyManager:
         Returns:
             list[dict]: [{'id': 1, 'nome': 'Secção A'}, ...]
         """
-        ctx = _get_contexto_usuario(user)
-        admin = ctx['admin']
-        dept_user = ctx['dept']
+        manager = HierarchyManager(user)
         
-        if not admin:
+        if not manager.ctx['admin']:
             return []
         
         # Validar que o departamento solicitado é permitido
-        depts_permitidos, _, _ = _calcular_destinos_permitidos(user, ctx, incluir_self=False)
-        if not depts_permitidos.filter(pk=dept_id).exists():
+        if not manager.validar_departamento(dept_id):
             return []  # Não permitido
         
         # Retornar secções do departamento
-        return list(
-            Seccoes.objects.filter(
-                departamento_id=dept_id
-            ).values('id', 'nome')
-        )
+        return [
+            {'id': s.id, 'nome': s.nome}
+            for s in manager.snapshot.seccoes_do_departamento(como_id(dept_id))
+        ]
 
 
 # ---------------------------------------------------------------------------
 # Lógica Central
 # ---------------------------------------------------------------------------
 
-def _calcular_destinos_permitidos(user, ctx=None, incluir_self=True):
+ORDEM_DEPARTAMENTOS = ('administracao__nome', 'nome')
+
+
+def _calcular_destinos_permitidos(user, ctx=None, incluir_self=True, snapshot=None):
     """
-    Calcula os querysets de departamentos e secções permitidos.
+    Calcula os IDs de departamentos e secções permitidos, sobre o OrgSnapshot.
     
     Args:
         user: CustomUser
         ctx: dict retornado por _get_contexto_usuario (calculado se None)
         incluir_self: Se False, exclui o próprio departamento/secção
+        snapshot: OrgSnapshot (o atual se None)
     
     Returns:
-        tuple(QuerySet[Departamento], QuerySet[Seccoes], bool)
-        - QuerySet de departamentos
-        - QuerySet de secções
+        tuple(tuple[int], tuple, tuple[int], tuple, bool)
+        - IDs e ordenação (order_by) dos departamentos
+        - IDs e ordenação (order_by) das secções
         - bool: True se secções são FIXAS (Cenário B), False se dependem do dept (Cenário A)
     """
     
+    if snapshot is None:
+        snapshot = obter_snapshot()
     if ctx is None:
-        ctx = _get_contexto_usuario(user)
+        ctx = _get_contexto_usuario(user, snapshot)
     
     admin   = ctx['admin']
     dept    = ctx['dept']
@@ -174,64 +227,45 @@ def _calcular_destinos_permitidos(user, ctx=None, incluir_self=True):
     # Superuser sem administração
     if not admin:
         if user.is_superuser:
-            depts = Departamento.objects.all().order_by('administracao__nome', 'nome')
-            if not incluir_self and dept:
-                depts = depts.exclude(pk=dept.pk)
-            
-            seccoes = Seccoes.objects.all().order_by('departamento__nome', 'nome')
-            if not incluir_self and seccao:
-                seccoes = seccoes.exclude(pk=seccao.pk)
-            
-            return depts, seccoes, False
+            depts = [i for i in snapshot.departamentos if incluir_self or not dept or i != dept.pk]
+            seccoes = [i for i in snapshot.seccoes if incluir_self or not seccao or i != seccao.pk]
+            return tuple(depts), ORDEM_DEPARTAMENTOS, tuple(seccoes), ('departamento__nome', 'nome'), False
         
-        return Departamento.objects.none(), Seccoes.objects.none(), False
+        return (), (), (), (), False
 
     # =========================================================================
-    # PARTE 1: Calcular queryset BASE de departamentos (hierarquia MAT/GOV/Municipal)
+    # PARTE 1: Calcular conjunto BASE de departamentos (hierarquia MAT/GOV/Municipal)
     # =========================================================================
 
-    # MAT (Ministério)
-    if admin.tipo_municipio == 'M':
-        governos_ids = Administracao.objects.filter(
-            tipo_municipio='G'
-        ).values_list('id', flat=True)
+    def secretarias_gerais(admin_ids):
+        return {i for admin_id in admin_ids for i in snapshot.secretaria_geral(admin_id)}
 
-        qs_dept_base = Departamento.objects.filter(
-            Q(administracao=admin) |
-            Q(administracao_id__in=governos_ids, nome__icontains='Secretaria Geral')
-        ).distinct()
+    dept_base = set(snapshot.departamentos_por_administracao.get(admin.pk, ()))
 
-    # Governo Provincial
-    elif admin.tipo_municipio == 'G':
-        admins_municipais_ids = Administracao.objects.filter(
-            provincia=admin.provincia
-        ).exclude(tipo_municipio__in=['G', 'M']).values_list('id', flat=True)
-
-        mat_ids = Administracao.objects.filter(
-            tipo_municipio='M'
-        ).values_list('id', flat=True)
-
-        qs_dept_base = Departamento.objects.filter(
-            Q(administracao=admin) |
-            Q(administracao_id__in=admins_municipais_ids, nome__icontains='Secretaria Geral') |
-            Q(administracao_id__in=mat_ids, nome__icontains='Secretaria Geral')
-        ).distinct()
+    # MAT (Ministério): + Secretarias Gerais dos Governos Provinciais
+    if admin.tipo_municipio == 'M':
+        dept_base |= secretarias_gerais(snapshot.administracoes_do_tipo('G'))
 
-    # Secretaria Geral de Municipal
+    # Governo Provincial: + Secretarias Gerais das Municipais da província e do MAT
+    elif admin.tipo_municipio == 'G':
+        municipais = [
+            i for i in snapshot.administracoes_da_provincia(admin.provincia)
+            if snapshot.administracoes[i].tipo_municipio not in ('G', 'M')
+        ]
+        dept_base |= secretarias_gerais(municipais)
+        dept_base |= secretarias_gerais(snapshot.administracoes_do_tipo('M'))
+
+    # Secretaria Geral de Municipal: + Secretaria Geral do Governo da província
     elif _is_secretaria_geral(dept):
-        governo_prov = Administracao.objects.filter(
-            provincia=admin.provincia,
-            tipo_municipio='G',
-        ).first()
+        governos = [
+            i for i in snapshot.administracoes_da_provincia(admin.provincia)
+            if snapshot.administracoes[i].tipo_municipio == 'G'
+        ]
+        if governos:
+            dept_base |= secretarias_gerais(governos[:1])
 
-        qs_dept_base = Departamento.objects.filter(
-            Q(administracao=admin) |
-            (Q(administracao=governo_prov, nome__icontains='Secretaria Geral') if governo_prov else Q(pk__in=[]))
-        ).distinct()
-
-    # Padrão
-    else:
-        qs_dept_base = Departamento.objects.para_administracao(admin)
+    # Padrão: Departamento.objects.para_administracao(admin)
+    # (departamentos desta administração; a FK é obrigatória, não há genéricos)
 
     # =========================================================================
     # PARTE 2: Aplicar restrições por cenário
@@ -239,50 +273,33 @@ def _calcular_destinos_permitidos(user, ctx=None, incluir_self=True):
 
     if em_seccao:
         # -----------------------------------------------------------------
-        # CENÁRIO A: Usuário em Secção (CORRIGIDO!)
-        # 
-        # NOVO COMPORTAMENTO:
-        # - Dept disponível: AGORA INCLUI O DEPARTAMENTO PAI!
+        # CENÁRIO A: Usuário em Secção
+        # - Dept disponível: apenas o departamento PAI (se estiver na base)
         # - Secções disponíveis: todas do mesmo dept, exceto a própria
         # - Secções são DINÂMICAS (mas dept é único, então na prática fixas)
         #
         # MOTIVO: Secção precisa comunicar com seu departamento pai
-        # SEGURANÇA: Ainda é validado que é o dept pai da secção
-        # -----------------------------------------------------------------
-        
-        # ✅ CORREÇÃO: Incluir SEMPRE o departamento pai
-        qs_dept_final = qs_dept_base.filter(pk=dept.pk) if dept else Departamento.objects.none()
-        
-        qs_sec_final = Seccoes.objects.filter(
-            departamento=dept,
-        ).exclude(
-            pk=seccao.pk,
-        ).order_by('nome') if dept else Seccoes.objects.none()
-        
-        seccoes_fixas = False
-
-    else:
-        # -----------------------------------------------------------------
-        # CENÁRIO B: Usuário em Departamento
-        # - Dept disponível: todos do base, exceto o próprio (se incluir_self=False)
-        # - Secções disponíveis: SEMPRE as do departamento DO USUÁRIO
-        # - Secções são FIXAS: não mudam ao selecionar dept
         # -----------------------------------------------------------------
-        if incluir_self:
-            qs_dept_final = qs_dept_base.order_by('administracao__nome', 'nome')
-        else:
-            qs_dept_final = qs_dept_base.exclude(
-                pk=dept.pk if dept else -1
-            ).order_by('administracao__nome', 'nome')
-        
-        qs_sec_final = Seccoes.objects.filter(
-            departamento=dept,
-            departamento__administracao=admin,
-        ).order_by('nome') if dept else Seccoes.objects.none()
-        
-        seccoes_fixas = True
-
-    return qs_dept_final, qs_sec_final, seccoes_fixas
+        depts = (dept.pk,) if dept and dept.pk in dept_base else ()
+        seccoes = tuple(
+            i for i in snapshot.seccoes_por_departamento.get(dept.pk, ()) if i != seccao.pk
+        ) if dept else ()
+        return depts, (), seccoes, ('nome',), False
+
+    # -----------------------------------------------------------------
+    # CENÁRIO B: Usuário em Departamento
+    # - Dept disponível: todos do base, exceto o próprio (se incluir_self=False)
+    # - Secções disponíveis: SEMPRE as do departamento DO USUÁRIO
+    # - Secções são FIXAS: não mudam ao selecionar dept
+    # -----------------------------------------------------------------
+    if not incluir_self and dept:
+        dept_base.discard(dept.pk)
+
+    seccoes = ()
+    if dept and snapshot.administracao_do_departamento(dept.pk) == admin.pk:
+        seccoes = snapshot.seccoes_por_departamento.get(dept.pk, ())
+
+    return tuple(sorted(dept_base)), ORDEM_DEPARTAMENTOS, tuple(seccoes), ('nome',), True
 
 
 # ---------------------------------------------------------------------------
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from ARQUIVOS.arquivo_frio import arquivar, dias
+
+
+class Command(BaseCommand):
+    help = (
+        'Junta os ficheiros dos documentos do arquivo morto (finalizados há mais de SGA_ARQUIVO_FRIO_DIAS) '
+        'em pacotes comprimidos por administração e mês'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=None,
+            help='Idade mínima, em dias desde a conclusão (padrão: SGA_ARQUIVO_FRIO_DIAS)'
+        )
+        parser.add_argument(
+            '--simular',
+            action='store_true',
+            help='Só mostra o que seria empacotado'
+        )
+
+    def handle(self, *args, **options):
+        idade = options['dias'] if options['dias'] is not None else dias()
+        if options['simular']:
+            grupos = arquivar(idade, simular=True)
+            for (administracao_id, mes), conteudos in sorted(grupos.items()):
+                tamanho = sum(conteudo.tamanho for conteudo, _ in conteudos)
+                self.stdout.write(
+                    f'Administração {administracao_id}, {mes:%Y-%m}: {len(conteudos)} ficheiros, '
+                    f'{tamanho / 1024 / 1024:.1f} MiB'
+                )
+            return
+
+        pacotes = arquivar(idade)
+        for pacote in pacotes:
+            self.stdout.write(
+                f'{pacote.nome}: {pacote.ficheiros} ficheiros, '
+                f'{pacote.tamanho_original / 1024 / 1024:.1f} MiB -> {pacote.tamanho / 1024 / 1024:.1f} MiB'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(pacotes)} pacotes criados (documentos finalizados há mais de {idade} dias).'
+        ))
@@ -0,0 +1,81 @@
+import os
+import time
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand
+
+from ARQUIVOS.pdf import renderizar, timbrado
+
+
+TEXTO = (
+    "Analisado o pedido e os documentos que o acompanham, defere-se nos termos da lei. "
+    "Remeta-se à secção competente para os devidos efeitos.\n"
+) * 6
+
+
+def _dados(i, administracoes):
+    return {
+        'instituicao': f"Administração Municipal {i % administracoes}",
+        'protocolo': f"{i:05d}/2026",
+        'titulo': f"Pedido de licença n.º {i}",
+        'utente': "João Manuel",
+        'data_pedido': "18/10/2026",
+        'estado': "APROVADO",
+        'texto': TEXTO,
+        'responsavel': "Administrador Municipal",
+        'gerado_em': "18/10/2026 10:00",
+    }
+
+
+def _sem_cache(dados):
+    timbrado.cache_clear()
+    return renderizar(dados)
+
+
+class Command(BaseCommand):
+    help = 'Mede a renderização das notas de despacho (PDFs por segundo e por núcleo)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--quantidade',
+            type=int,
+            default=500,
+            help='PDFs gerados em cada medição (padrão: 500)'
+        )
+        parser.add_argument(
+            '--processos',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Processos do pool (padrão: número de CPUs)'
+        )
+        parser.add_argument(
+            '--administracoes',
+            type=int,
+            default=20,
+            help='Administrações diferentes entre os PDFs (padrão: 20)'
+        )
+
+    def _medir(self, titulo, nucleos, gerar):
+        inicio = time.perf_counter()
+        tamanho = sum(len(pdf) for pdf in gerar())
+        duracao = time.perf_counter() - inicio
+        por_segundo = self.quantidade / duracao
+        self.stdout.write(
+            f"{titulo:<32} {por_segundo:8.1f} PDFs/s  {por_segundo / nucleos:8.1f} PDFs/s/núcleo  "
+            f"({tamanho / self.quantidade / 1024:.1f} KiB/PDF)"
+        )
+
+    def handle(self, *args, **options):
+        self.quantidade = options['quantidade']
+        processos = options['processos']
+        dados = [_dados(i, options['administracoes']) for i in range(self.quantidade)]
+
+        self._medir("1 processo, sem cache de timbrado", 1, lambda: map(_sem_cache, dados))
+        self._medir("1 processo, com cache", 1, lambda: map(renderizar, dados))
+        with Pool(processes=processos) as pool:
+            # Aquece o pool (arranque dos processos fora da medição)
+            pool.map(renderizar, dados[:processos])
+            self._medir(
+                f"pool de {processos} processos", processos,
+                lambda: pool.imap_unordered(renderizar, dados, chunksize=8)
+            )
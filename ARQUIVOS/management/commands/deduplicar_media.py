@@ -0,0 +1,94 @@
+import os
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from ARQUIVOS.arquivo_frio import PASTA as PASTA_ARQUIVO_FRIO
+from ARQUIVOS.conteudo import PASTA, PASTA_TEMPORARIOS, PASTA_UPLOADS, ArmazenamentoConteudo
+from ARQUIVOS.models import Conteudo
+from ARQUIVOS.previas import PASTA as PASTA_PREVIAS
+
+
+# Temporários de uploads interrompidos mais antigos do que isto são apagados
+IDADE_TEMPORARIOS = 24 * 3600
+
+
+class Command(BaseCommand):
+    help = (
+        'Incorpora os ficheiros de MEDIA_ROOT no armazenamento por conteúdo: '
+        'cada conteúdo repetido passa a existir uma só vez'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pasta',
+            action='append',
+            default=None,
+            help='Só esta pasta de MEDIA_ROOT (repetível; padrão: todas)'
+        )
+        parser.add_argument(
+            '--limpar',
+            action='store_true',
+            help='Apaga também conteúdos sem referências e temporários abandonados'
+        )
+
+    def _ficheiros(self, pastas):
+        raiz = default_storage.location
+        for pasta in pastas:
+            for atual, subpastas, ficheiros in os.walk(os.path.join(raiz, pasta)):
+                relativa = os.path.relpath(atual, raiz).replace('\\', '/')
+                if relativa in (PASTA, PASTA_PREVIAS, PASTA_ARQUIVO_FRIO):
+                    subpastas[:] = []
+                    continue
+                subpastas.sort()
+                for ficheiro in sorted(ficheiros):
+                    yield f'{relativa}/{ficheiro}' if relativa != '.' else ficheiro
+
+    def _limpar(self):
+        raiz = default_storage.path(PASTA)
+        conhecidos = set(Conteudo.objects.values_list('hash', flat=True))
+        apagados = 0
+        limite = time.time() - IDADE_TEMPORARIOS
+        for atual, subpastas, ficheiros in os.walk(raiz):
+            if os.path.normpath(atual) == os.path.normpath(raiz):
+                # Os uploads por blocos têm validade própria (limpar_uploads)
+                subpastas[:] = [p for p in subpastas if f'{PASTA}/{p}' != PASTA_UPLOADS]
+            temporarios = os.path.normpath(atual) == os.path.normpath(default_storage.path(PASTA_TEMPORARIOS))
+            for ficheiro in ficheiros:
+                caminho = os.path.join(atual, ficheiro)
+                if temporarios:
+                    orfao = os.stat(caminho).st_mtime < limite
+                else:
+                    # Sem registo (transação desfeita) e sem nenhum nome a apontar para ele
+                    orfao = ficheiro not in conhecidos and os.stat(caminho).st_nlink <= 1
+                if orfao:
+                    os.unlink(caminho)
+                    apagados += 1
+        return apagados
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ArmazenamentoConteudo):
+            raise CommandError('O storage por omissão não é ARQUIVOS.conteudo.ArmazenamentoConteudo (ver STORAGES).')
+
+        pastas = options['pasta'] or ['.']
+        incorporados = repetidos = ignorados = 0
+        libertados = 0
+        for nome in self._ficheiros(pastas):
+            resultado = default_storage.incorporar(nome)
+            if resultado is None:
+                ignorados += 1
+                continue
+            incorporados += 1
+            if resultado:
+                repetidos += 1
+                libertados += resultado
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{nome}: {"repetido" if resultado else "novo"}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{incorporados} ficheiros incorporados ({repetidos} repetidos, '
+            f'{libertados / 1024 / 1024:.1f} MiB libertados), {ignorados} já incorporados.'
+        ))
+        if options['limpar']:
+            self.stdout.write(f'{self._limpar()} ficheiros órfãos apagados.')
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ARQUIVOS.correio import enviar_pendentes, tamanho_lote
+from ARQUIVOS.models import EmailSaida, EstadoEmail
+
+
+class Command(BaseCommand):
+    help = 'Envia os emails pendentes da caixa de saída (uma ligação SMTP por lote)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=None,
+            help='Emails enviados por ligação (padrão: SGA_EMAIL_LOTE)'
+        )
+        parser.add_argument(
+            '--reenviar-falhados',
+            action='store_true',
+            help='Volta a pôr na fila os emails que esgotaram as tentativas'
+        )
+
+    def handle(self, *args, **options):
+        if options['reenviar_falhados']:
+            total = EmailSaida.objects.filter(estado=EstadoEmail.FALHADO).update(
+                estado=EstadoEmail.PENDENTE, tentativas=0, proxima_tentativa=timezone.now()
+            )
+            self.stdout.write(f'{total} emails falhados voltaram à fila.')
+
+        lote = options['lote'] or tamanho_lote()
+        enviados = falhados = 0
+        while True:
+            lote_enviados, lote_falhados = enviar_pendentes(lote)
+            enviados += lote_enviados
+            falhados += lote_falhados
+            if lote_enviados + lote_falhados < lote:
+                break
+
+        pendentes = EmailSaida.objects.filter(estado=EstadoEmail.PENDENTE).count()
+        self.stdout.write(self.style.SUCCESS(
+            f'{enviados} emails enviados, {falhados} falhas, {pendentes} pendentes.'
+        ))
@@ -0,0 +1,75 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ARQUIVOS.extracao import ocr_disponivel, processar_pendentes
+from ARQUIVOS.models import TextoExtraido, EstadoExtracao
+
+
+class Command(BaseCommand):
+    help = 'Extrai o texto dos ficheiros pendentes (PDF, DOCX e OCR opcional) para o índice de pesquisa'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processos',
+            type=int,
+            default=None,
+            help='Número de processos do pool (padrão: número de CPUs)'
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=100,
+            help='Ficheiros lidos da fila por passagem (padrão: 100)'
+        )
+        parser.add_argument(
+            '--continuo',
+            action='store_true',
+            help='Continua a correr, verificando a fila a cada --intervalo segundos'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=10,
+            help='Segundos entre verificações no modo contínuo (padrão: 10)'
+        )
+        parser.add_argument(
+            '--sem-ocr',
+            action='store_true',
+            help='Não usa o tesseract mesmo que esteja instalado'
+        )
+        parser.add_argument(
+            '--refazer',
+            choices=['sem_texto', 'erro', 'todos'],
+            help='Volta a pôr na fila os ficheiros sem texto, com erro ou todos (ex.: depois de instalar o OCR)'
+        )
+
+    def handle(self, *args, **options):
+        ocr = not options['sem_ocr'] and ocr_disponivel()
+        if not options['sem_ocr'] and not ocr:
+            self.stdout.write(self.style.WARNING('tesseract não encontrado: OCR desativado.'))
+
+        if options['refazer']:
+            registos = TextoExtraido.objects.all()
+            if options['refazer'] != 'todos':
+                registos = registos.filter(estado=options['refazer'])
+            # Sem hash, o conteúdo volta a ser extraído
+            total = registos.update(estado=EstadoExtracao.PENDENTE, hash_conteudo='')
+            self.stdout.write(f'{total} ficheiros voltaram à fila.')
+
+        while True:
+            total = 0
+            while True:
+                processados = processar_pendentes(
+                    limite=options['lote'], processos=options['processos'], ocr=ocr
+                )
+                if not processados:
+                    break
+                total += processados
+                self.stdout.write(f'{processados} ficheiros processados.')
+
+            if total:
+                self.stdout.write(self.style.SUCCESS(f'Extração concluída: {total} ficheiros.'))
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from ARQUIVOS.fila import agendar
+from ARQUIVOS.models import Anexo, Documento, EstadoPrevia, Previa
+
+
+class Command(BaseCommand):
+    help = (
+        'Agenda as miniaturas (pré-visualizações) dos ficheiros de documentos e anexos '
+        'que ainda não as têm (corre depois de deduplicar_media)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--refazer',
+            action='store_true',
+            help='Volta a agendar as falhadas e as sem renderizador (ex.: depois de instalar o poppler)'
+        )
+
+    def _nomes(self):
+        for arquivo, digitalizado in Documento.objects.values_list('arquivo', 'arquivo_digitalizado').iterator():
+            yield arquivo
+            yield digitalizado
+        yield from Anexo.objects.values_list('arquivo', flat=True).iterator()
+
+    def handle(self, *args, **options):
+        existentes = Previa.objects.count()
+        for nome in self._nomes():
+            if nome:
+                Previa.objects.agendar(nome)
+        novas = Previa.objects.count() - existentes
+
+        refeitas = 0
+        if options['refazer']:
+            for hash_conteudo in Previa.objects.filter(
+                estado__in=[EstadoPrevia.FALHADA, EstadoPrevia.INDISPONIVEL]
+            ).values_list('hash', flat=True):
+                Previa.objects.filter(hash=hash_conteudo).update(estado=EstadoPrevia.PENDENTE, erro='')
+                agendar('previa.gerar', {'hash_conteudo': hash_conteudo})
+                refeitas += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{novas} miniaturas agendadas, {refeitas} reagendadas (worker: sga_worker --filas previas).'
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from ARQUIVOS.uploads import limpar_expirados, validade
+
+
+class Command(BaseCommand):
+    help = 'Apaga os uploads por blocos abandonados (sem atividade há mais de SGA_UPLOAD_VALIDADE horas)'
+
+    def handle(self, *args, **options):
+        total = limpar_expirados()
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} uploads expirados apagados (validade: {validade()}).'
+        ))
@@ -0,0 +1,69 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+
+from ARQUIVOS.models import EstadoNormalizacao, NormalizacaoFicheiro
+from ARQUIVOS.normalizacao import ativa, processar_pendentes
+
+
+class Command(BaseCommand):
+    help = (
+        'Normaliza as imagens carregadas pendentes (reamostragem, compressão, sem metadados) '
+        'e junta as páginas das digitalizações num PDF'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processos',
+            type=int,
+            default=None,
+            help='Número de processos do pool (padrão: número de CPUs)'
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=50,
+            help='Ficheiros lidos da fila por passagem (padrão: 50)'
+        )
+        parser.add_argument(
+            '--continuo',
+            action='store_true',
+            help='Continua a correr, verificando a fila a cada --intervalo segundos'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=10,
+            help='Segundos entre verificações no modo contínuo (padrão: 10)'
+        )
+
+    def _resumo(self):
+        totais = NormalizacaoFicheiro.objects.filter(estado=EstadoNormalizacao.NORMALIZADO).aggregate(
+            antes=Sum('tamanho_original'), depois=Sum('tamanho_final')
+        )
+        antes, depois = totais['antes'] or 0, totais['depois'] or 0
+        return f'{antes / 1024 / 1024:.1f} MiB -> {depois / 1024 / 1024:.1f} MiB'
+
+    def handle(self, *args, **options):
+        if not ativa():
+            self.stdout.write(self.style.WARNING(
+                'SGA_NORMALIZAR_IMAGENS desativado: só as digitalizações com várias páginas são processadas.'
+            ))
+
+        while True:
+            total = 0
+            while True:
+                processados = processar_pendentes(limite=options['lote'], processos=options['processos'])
+                if not processados:
+                    break
+                total += processados
+                self.stdout.write(f'{processados} ficheiros processados.')
+
+            if total:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Normalização concluída: {total} ficheiros (acumulado: {self._resumo()}).'
+                ))
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
@@ -0,0 +1,153 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction, connection
+
+from ARQUIVOS.busca import instalar_estrutura
+from ARQUIVOS.models import (
+    Documento, MovimentacaoDocumento, VisibilidadeDocumento, PendenciaAberta, ContadorUnidade,
+    DocumentoBusca
+)
+from ARQUIVOS.models.indices import (
+    CAMPOS_CONTAGEM_DOCUMENTO, CAMPOS_CONTAGEM_MOVIMENTACAO, CAMPOS_BUSCA_DOCUMENTO, calcular_contadores
+)
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói os índices desnormalizados (visibilidade, pendências abertas, contadores do dashboard e pesquisa)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=2000,
+            help='Número de registos processados por lote (padrão: 2000)'
+        )
+        parser.add_argument(
+            '--limpar',
+            action='store_true',
+            help='Apaga os índices existentes antes de reconstruir'
+        )
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+
+        if options['limpar']:
+            apagados, _ = VisibilidadeDocumento.objects.all().delete()
+            self.stdout.write(self.style.WARNING(f'{apagados} linhas de visibilidade apagadas.'))
+            apagados, _ = PendenciaAberta.objects.all().delete()
+            self.stdout.write(self.style.WARNING(f'{apagados} pendências abertas apagadas.'))
+
+        self.stdout.write('Reconstruindo visibilidade a partir das movimentações...')
+        total = self._reconstruir_visibilidade(lote)
+        self.stdout.write(self.style.SUCCESS(f'Visibilidade reconstruída: {total} registos processados.'))
+
+        self.stdout.write('Reconstruindo pendências abertas...')
+        total = self._reconstruir_pendencias(lote)
+        self.stdout.write(self.style.SUCCESS(f'Pendências reconstruídas: {total} documentos processados.'))
+
+        # Os contadores são sempre recalculados de raiz (dependem da visibilidade já reconstruída)
+        self.stdout.write('Recalculando contadores do dashboard...')
+        total = self._reconstruir_contadores(lote)
+        self.stdout.write(self.style.SUCCESS(f'Contadores recalculados: {total} linhas.'))
+
+        self.stdout.write('Reindexando a pesquisa de texto integral...')
+        total = self._reconstruir_busca(lote)
+        self.stdout.write(self.style.SUCCESS(f'Pesquisa reindexada: {total} documentos.'))
+
+    def _reconstruir_visibilidade(self, lote):
+        total = 0
+
+        # 1. Localização atual de cada documento (inclui os apagados logicamente)
+        documentos = Documento.all_objects.values_list(
+            'id', 'departamento_atual_id', 'seccao_atual_id'
+        ).order_by('id')
+        total += self._processar(documentos, lote, lambda linha: [linha])
+
+        # 2. Origem e destino de todas as movimentações
+        movimentacoes = MovimentacaoDocumento.objects.values_list(
+            'documento_id',
+            'departamento_origem_id', 'seccao_origem_id',
+            'departamento_destino_id', 'seccao_destino_id',
+        ).order_by('id')
+        total += self._processar(
+            movimentacoes,
+            lote,
+            lambda linha: [(linha[0], linha[1], linha[2]), (linha[0], linha[3], linha[4])]
+        )
+        return total
+
+    def _reconstruir_pendencias(self, lote):
+        # A pendência de cada documento só pode ser a sua ÚLTIMA movimentação
+        movimentacoes = MovimentacaoDocumento.objects.order_by('documento_id', 'id').only(
+            'id', 'documento_id', 'tipo_movimentacao', 'confirmado_recebimento',
+            'departamento_destino_id', 'seccao_destino_id', 'data_movimentacao',
+        )
+
+        processados = 0
+        ultimas = {}
+        for mov in movimentacoes.iterator(chunk_size=lote):
+            if mov.documento_id not in ultimas and len(ultimas) >= lote:
+                self._aplicar_pendencias(ultimas)
+                processados += len(ultimas)
+                ultimas = {}
+            ultimas[mov.documento_id] = mov
+        if ultimas:
+            self._aplicar_pendencias(ultimas)
+            processados += len(ultimas)
+        return processados
+
+    def _aplicar_pendencias(self, ultimas):
+        with transaction.atomic():
+            PendenciaAberta.objects.registar_movimentacoes(ultimas.values())
+
+    def _reconstruir_contadores(self, lote):
+        contagem = calcular_contadores(
+            Documento.all_objects.values(*CAMPOS_CONTAGEM_DOCUMENTO).iterator(chunk_size=lote),
+            MovimentacaoDocumento.objects.values(*CAMPOS_CONTAGEM_MOVIMENTACAO).iterator(chunk_size=lote),
+            VisibilidadeDocumento.objects.da_mesma_administracao().values_list(
+                'departamento_id', 'seccao_id', 'documento__is_deleted', 'documento__status'
+            ).iterator(chunk_size=lote),
+        )
+        linhas = [
+            ContadorUnidade(unidade=unidade, dia=dia, metrica=metrica, valor=valor)
+            for (unidade, dia, metrica), valor in contagem.items()
+            if valor
+        ]
+        with transaction.atomic():
+            ContadorUnidade.objects.all().delete()
+            ContadorUnidade.objects.bulk_create(linhas, batch_size=lote)
+        return len(linhas)
+
+    def _reconstruir_busca(self, lote):
+        # Repõe a estrutura do banco (tsvector/GIN ou FTS5) se tiver sido perdida
+        instalar_estrutura(connection)
+
+        documentos = Documento.all_objects.values_list('id', *CAMPOS_BUSCA_DOCUMENTO).order_by('id')
+        processados = 0
+        linhas = []
+        for linha in documentos.iterator(chunk_size=lote):
+            linhas.append(linha)
+            if len(linhas) >= lote:
+                with transaction.atomic():
+                    DocumentoBusca.objects.registar_lote(linhas)
+                processados += len(linhas)
+                linhas = []
+        if linhas:
+            with transaction.atomic():
+                DocumentoBusca.objects.registar_lote(linhas)
+            processados += len(linhas)
+        return processados
+
+    def _processar(self, queryset, lote, expandir):
+        processados = 0
+        pares = []
+        for linha in queryset.iterator(chunk_size=lote):
+            pares.extend(expandir(linha))
+            processados += 1
+            if len(pares) >= lote:
+                with transaction.atomic():
+                    VisibilidadeDocumento.objects.registar(pares)
+                pares = []
+        if pares:
+            with transaction.atomic():
+                VisibilidadeDocumento.objects.registar(pares)
+        return processados
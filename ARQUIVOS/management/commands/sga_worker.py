@@ -0,0 +1,104 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from ARQUIVOS.fila import trabalhar
+from ARQUIVOS.pdf import fechar_pool
+from ARQUIVOS.models import Tarefa
+
+
+def _processo(filas, lote, intervalo, uma_vez, parar):
+    # Cada processo abre as suas próprias ligações ao banco
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        trabalhar(filas=filas, lote=lote, intervalo=intervalo, uma_vez=uma_vez, parar=parar)
+    finally:
+        fechar_pool()
+
+
+class Command(BaseCommand):
+    help = 'Executa as tarefas em segundo plano da fila (PDF de despacho, emails, notificações, difusões)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--filas',
+            default='',
+            help='Filas a servir, separadas por vírgulas (padrão: todas)'
+        )
+        parser.add_argument(
+            '--processos',
+            type=int,
+            default=1,
+            help='Número de processos do worker (padrão: 1)'
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=10,
+            help='Tarefas reservadas de cada vez por processo (padrão: 10)'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=1,
+            help='Segundos de espera quando a fila está vazia (padrão: 1)'
+        )
+        parser.add_argument(
+            '--uma-vez',
+            action='store_true',
+            help='Esvazia a fila e termina (ex.: cron)'
+        )
+        parser.add_argument(
+            '--limpar-dias',
+            type=int,
+            default=7,
+            help='Apaga ao arrancar as tarefas concluídas há mais destes dias (padrão: 7)'
+        )
+
+    def handle(self, *args, **options):
+        filas = [fila.strip() for fila in options['filas'].split(',') if fila.strip()] or None
+        argumentos = (filas, options['lote'], options['intervalo'], options['uma_vez'])
+
+        apagadas = Tarefa.objects.limpar(options['limpar_dias'])
+        if apagadas:
+            self.stdout.write(f'{apagadas} tarefas concluídas antigas apagadas.')
+
+        if options['processos'] <= 1:
+            try:
+                executadas = trabalhar(*argumentos)
+            finally:
+                fechar_pool()
+            self.stdout.write(self.style.SUCCESS(f'{executadas} tarefas executadas.'))
+            return
+
+        # As ligações do processo pai não podem ser partilhadas com os filhos
+        connections.close_all()
+        parar = multiprocessing.Event()
+
+        def terminar(*_):
+            parar.set()
+
+        signal.signal(signal.SIGTERM, terminar)
+        signal.signal(signal.SIGINT, terminar)
+
+        def iniciar():
+            # Não daemon: cada processo pode ter o seu pool de renderização de PDFs
+            processo = multiprocessing.Process(target=_processo, args=(*argumentos, parar))
+            processo.start()
+            return processo
+
+        processos = [iniciar() for _ in range(options['processos'])]
+        self.stdout.write(f"Worker com {len(processos)} processos (filas: {', '.join(filas or ['todas'])}).")
+
+        while any(processo.is_alive() for processo in processos):
+            for i, processo in enumerate(processos):
+                processo.join(timeout=1)
+                # Um processo que morreu (ex.: falta de memória) é substituído
+                if not processo.is_alive() and processo.exitcode != 0 and not parar.is_set() \
+                        and not options['uma_vez']:
+                    self.stderr.write(f'Processo {processo.pid} terminou ({processo.exitcode}); a reiniciar.')
+                    processos[i] = iniciar()
+
+        self.stdout.write(self.style.SUCCESS('Worker terminado.'))
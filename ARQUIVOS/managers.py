@@ -1,7 +1,12 @@
-from django.db import models
+from collections import Counter
+
+from django.db import models, transaction
 from django.db.models import Q
 from ARQUIVOS.models.mixins import SoftDeleteManager
 
+# Níveis que veem todos os documentos da sua administração
+NIVEIS_ADMIN_DOCUMENTOS = ['admin_sistema', 'admin_municipal', 'admin', 'diretor', 'diretor_municipal']
+
 
 class DocumentoManager(SoftDeleteManager):
     def get_queryset(self):
@@ -19,6 +24,8 @@ class DocumentoManager(SoftDeleteManager):
         Filtra documentos visíveis para o usuário baseado na hierarquia, 
         ADMINISTRAÇÃO e HISTÓRICO de movimentação.
         """
+        from ARQUIVOS.models.indices import VisibilidadeDocumento
+
         qs = self.get_queryset()
 
         # 0. Regra de Ouro: Isolamento por Administração
@@ -30,34 +37,68 @@ class DocumentoManager(SoftDeleteManager):
             qs = qs.filter(administracao=user.administracao)
 
         # 1. Admins da Administração veem tudo da sua admin
-        niveis_admin = ['admin_sistema', 'admin_municipal', 'admin', 'diretor', 'diretor_municipal']
-        if user.is_superuser or user.nivel_acesso in niveis_admin:
+        if user.is_superuser or user.nivel_acesso in NIVEIS_ADMIN_DOCUMENTOS:
             return qs
 
         # 2. Usuário de Secção
+        # Vê se o documento está ou já passou pela sua secção. O histórico vem
+        # do índice materializado VisibilidadeDocumento (semi-join, sem DISTINCT).
         if hasattr(user, 'seccao') and user.seccao:
-            # Vê APENAS se:
-            # - Está atualmente na sua secção
-            # - Já passou pela sua secção no passado (histórico)
-            return qs.filter(
-                Q(seccao_atual=user.seccao) |
-                Q(movimentacoes__seccao_origem=user.seccao) |
-                Q(movimentacoes__seccao_destino=user.seccao)
-            ).distinct()
-
-        # 3. Usuário de Departamento
+            return qs.filter(pk__in=VisibilidadeDocumento.objects.documentos_da_seccao(user.seccao))
+
+        # 3. Usuário de Departamento (mesma regra, ao nível do departamento)
         if hasattr(user, 'departamento') and user.departamento:
-            # Vê se:
-            # - Está atualmente no seu departamento
-            # - Já passou pelo seu departamento no passado (histórico)
-            return qs.filter(
-                Q(departamento_atual=user.departamento) |
-                Q(movimentacoes__departamento_origem=user.departamento) |
-                Q(movimentacoes__departamento_destino=user.departamento)
-            ).distinct()
+            return qs.filter(pk__in=VisibilidadeDocumento.objects.documentos_do_departamento(user.departamento))
 
         # 4. Fallback: Ver apenas seus próprios documentos criados se não tiver setor
-        return qs.filter(criado_por=user).distinct()
+        return qs.filter(criado_por=user)
+
+
+class MovimentacaoManager(models.Manager):
+    def criar_em_lote(self, movimentacoes):
+        """
+        Grava várias movimentações NOVAS com um só INSERT e atualiza os
+        índices (visibilidade, pendências, contadores) em lote, na mesma
+        transação. Ao contrário de save(), não chama full_clean() em cada
+        uma: quem chama valida as movimentações antes (ex.: uma vez, quando
+        só o destino muda e vem de uma consulta já restrita).
+        """
+        from ARQUIVOS.models.indices import (
+            VisibilidadeDocumento, PendenciaAberta, ContadorUnidade, contribuicoes_movimentacao
+        )
+
+        if not movimentacoes:
+            return []
+        with transaction.atomic():
+            criadas = self.bulk_create(movimentacoes)
+            visibilidades_novas = VisibilidadeDocumento.objects.registar_movimentacoes(criadas)
+            PendenciaAberta.objects.registar_movimentacoes(criadas)
+
+            deltas = Counter()
+            for movimentacao in criadas:
+                estado = movimentacao._estado_contagem()
+                deltas.update(contribuicoes_movimentacao(estado))
+                movimentacao._estado_carregado = estado
+            ContadorUnidade.objects.incrementar(deltas)
+            ContadorUnidade.objects.registar_visibilidades(visibilidades_novas)
+        return criadas
+
+
+class NotificacaoManager(models.Manager):
+    def nao_lidas(self, usuario):
+        return self.filter(usuario=usuario, lida=False)
+
+    def estado(self, usuario):
+        """(não lidas, id da mais recente não lida) numa consulta; muda sempre que há novas ou lidas."""
+        estado = self.nao_lidas(usuario).aggregate(total=models.Count('id'), ultima=models.Max('id'))
+        return estado['total'], estado['ultima'] or 0
+
+    def novas(self, usuario, desde=None, limite=20):
+        """Não lidas com id maior que `desde` (todas, sem cursor), as mais recentes primeiro."""
+        notificacoes = self.nao_lidas(usuario)
+        if desde is not None:
+            notificacoes = notificacoes.filter(id__gt=desde)
+        return notificacoes.order_by('-id')[:limite]
 
 
 class AdministracaoManager(models.Manager):
@@ -82,6 +123,22 @@ class DepartamentoManager(models.Manager):
             Q(administracao=administracao)  # Específicos desta administração
         ).distinct()
 
+    def secretarias_gerais_municipais(self, provincia):
+        """
+        Secretaria Geral de cada administração municipal da província (a
+        primeira, se houver várias), numa só consulta. Destino da difusão
+        do Governo Provincial.
+        """
+        secretarias = {}
+        for departamento in self.filter(
+            administracao__provincia=provincia,
+            nome__icontains="Secretaria Geral",
+        ).exclude(
+            administracao__tipo_municipio='G'
+        ).select_related('administracao').order_by('administracao_id', 'pk'):
+            secretarias.setdefault(departamento.administracao_id, departamento)
+        return list(secretarias.values())
+
 
 from django.contrib.auth.models import UserManager as BaseUserManager
 
@@ -2,6 +2,8 @@ import logging
 from django.shortcuts import redirect
 from django.contrib import messages
 
+from .notificacoes import lote
+
 logger = logging.getLogger('security_audit')
 
 class SecurityAuditMiddleware:
@@ -20,3 +22,14 @@ class SecurityAuditMiddleware:
                 )
                 
         return response
+
+
+class NotificacoesMiddleware:
+    """Junta as notificações WebSocket do pedido e envia-as de uma vez no fim (ver notificacoes.py)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with lote():
+            return self.get_response(request)
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.11 on 2026-10-18 18:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def preencher_visibilidade(apps, schema_editor):
+    """Backfill inicial: localização atual + origem/destino de cada movimentação."""
+    Documento = apps.get_model('ARQUIVOS', 'Documento')
+    MovimentacaoDocumento = apps.get_model('ARQUIVOS', 'MovimentacaoDocumento')
+    VisibilidadeDocumento = apps.get_model('ARQUIVOS', 'VisibilidadeDocumento')
+
+    linhas = set()
+    for doc_id, dept_id, sec_id in Documento.objects.values_list('id', 'departamento_atual_id', 'seccao_atual_id'):
+        linhas.add((doc_id, dept_id, None))
+        linhas.add((doc_id, None, sec_id))
+
+    for doc_id, d_orig, s_orig, d_dest, s_dest in MovimentacaoDocumento.objects.values_list(
+        'documento_id', 'departamento_origem_id', 'seccao_origem_id',
+        'departamento_destino_id', 'seccao_destino_id',
+    ):
+        linhas.update([(doc_id, d_orig, None), (doc_id, None, s_orig), (doc_id, d_dest, None), (doc_id, None, s_dest)])
+
+    VisibilidadeDocumento.objects.bulk_create(
+        [
+            VisibilidadeDocumento(documento_id=doc_id, departamento_id=dept_id, seccao_id=sec_id)
+            for doc_id, dept_id, sec_id in linhas
+            if dept_id or sec_id
+        ],
+        batch_size=2000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ARQUIVOS', '0043_ministerio_alter_administracao_tipo_municipio_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisibilidadeDocumento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('departamento', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='visibilidades', to='ARQUIVOS.departamento')),
+                ('documento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='visibilidades', to='ARQUIVOS.documento')),
+                ('seccao', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='visibilidades', to='ARQUIVOS.seccoes')),
+            ],
+            options={
+                'verbose_name': 'Visibilidade de Documento',
+                'verbose_name_plural': 'Visibilidades de Documentos',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='visibilidadedocumento',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('departamento__isnull', False), ('seccao__isnull', True)), models.Q(('departamento__isnull', True), ('seccao__isnull', False)), _connector='OR'), name='visibilidade_uma_unidade'),
+        ),
+        migrations.AddConstraint(
+            model_name='visibilidadedocumento',
+            constraint=models.UniqueConstraint(fields=('departamento', 'documento'), name='visibilidade_unica_departamento'),
+        ),
+        migrations.AddConstraint(
+            model_name='visibilidadedocumento',
+            constraint=models.UniqueConstraint(fields=('seccao', 'documento'), name='visibilidade_unica_seccao'),
+        ),
+        migrations.RunPython(preencher_visibilidade, migrations.RunPython.noop),
+    ]
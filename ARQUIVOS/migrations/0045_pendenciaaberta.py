@@ -0,0 +1,55 @@
+# Generated by Django 4.2.11 on 2026-10-18 18:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def preencher_pendencias(apps, schema_editor):
+    """Backfill inicial: a última movimentação de cada documento, se for encaminhamento por confirmar."""
+    MovimentacaoDocumento = apps.get_model('ARQUIVOS', 'MovimentacaoDocumento')
+    PendenciaAberta = apps.get_model('ARQUIVOS', 'PendenciaAberta')
+
+    ultimas = {}
+    for mov in MovimentacaoDocumento.objects.order_by('documento_id', 'id').iterator():
+        ultimas[mov.documento_id] = mov
+
+    PendenciaAberta.objects.bulk_create(
+        [
+            PendenciaAberta(
+                movimentacao_id=mov.pk,
+                documento_id=mov.documento_id,
+                departamento_destino_id=mov.departamento_destino_id,
+                seccao_destino_id=mov.seccao_destino_id,
+                data_movimentacao=mov.data_movimentacao,
+            )
+            for mov in ultimas.values()
+            if mov.tipo_movimentacao == 'encaminhamento' and not mov.confirmado_recebimento
+        ],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ARQUIVOS', '0044_visibilidadedocumento'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendenciaAberta',
+            fields=[
+                ('movimentacao', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pendencia_aberta', serialize=False, to='ARQUIVOS.movimentacaodocumento')),
+                ('data_movimentacao', models.DateTimeField()),
+                ('departamento_destino', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pendencias_abertas', to='ARQUIVOS.departamento')),
+                ('documento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pendencias_abertas', to='ARQUIVOS.documento')),
+                ('seccao_destino', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pendencias_abertas', to='ARQUIVOS.seccoes')),
+            ],
+            options={
+                'verbose_name': 'Pendência Aberta',
+                'verbose_name_plural': 'Pendências Abertas',
+                'indexes': [models.Index(fields=['seccao_destino', '-data_movimentacao'], name='pendencia_seccao_idx'), models.Index(fields=['departamento_destino', '-data_movimentacao'], name='pendencia_dept_idx')],
+            },
+        ),
+        migrations.RunPython(preencher_pendencias, migrations.RunPython.noop),
+    ]
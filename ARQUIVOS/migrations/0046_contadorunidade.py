@@ -0,0 +1,64 @@
+# Generated by Django 4.2.11 on 2026-10-18 19:20
+
+from django.db import migrations, models
+
+from ARQUIVOS.models.indices import (
+    CAMPOS_CONTAGEM_DOCUMENTO, CAMPOS_CONTAGEM_MOVIMENTACAO, calcular_contadores
+)
+
+
+def preencher_contadores(apps, schema_editor):
+    """Backfill inicial dos contadores do dashboard a partir dos documentos e movimentações."""
+    Documento = apps.get_model('ARQUIVOS', 'Documento')
+    MovimentacaoDocumento = apps.get_model('ARQUIVOS', 'MovimentacaoDocumento')
+    VisibilidadeDocumento = apps.get_model('ARQUIVOS', 'VisibilidadeDocumento')
+    ContadorUnidade = apps.get_model('ARQUIVOS', 'ContadorUnidade')
+
+    contagem = calcular_contadores(
+        Documento.objects.values(*CAMPOS_CONTAGEM_DOCUMENTO).iterator(),
+        MovimentacaoDocumento.objects.values(*CAMPOS_CONTAGEM_MOVIMENTACAO).iterator(),
+        VisibilidadeDocumento.objects.values_list(
+            'departamento_id', 'seccao_id', 'documento__is_deleted', 'documento__status'
+        ).iterator(),
+    )
+    ContadorUnidade.objects.bulk_create(
+        [
+            ContadorUnidade(unidade=unidade, dia=dia, metrica=metrica, valor=valor)
+            for (unidade, dia, metrica), valor in contagem.items()
+            if valor
+        ],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ARQUIVOS', '0045_pendenciaaberta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorUnidade',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unidade', models.CharField(max_length=40)),
+                ('dia', models.DateField(blank=True, null=True)),
+                ('metrica', models.CharField(max_length=20)),
+                ('valor', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Contador de Unidade',
+                'verbose_name_plural': 'Contadores de Unidades',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='contadorunidade',
+            constraint=models.UniqueConstraint(condition=models.Q(('dia__isnull', False)), fields=('unidade', 'metrica', 'dia'), name='contador_unico_diario'),
+        ),
+        migrations.AddConstraint(
+            model_name='contadorunidade',
+            constraint=models.UniqueConstraint(condition=models.Q(('dia__isnull', True)), fields=('unidade', 'metrica'), name='contador_unico_total'),
+        ),
+        migrations.RunPython(preencher_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.11 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ARQUIVOS', '0046_contadorunidade'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='armazenamentodocumento',
+            index=models.Index(fields=['-data_armazenamento', '-id'], name='armazenamento_cursor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documento',
+            index=models.Index(fields=['-data_criacao', '-id'], name='documento_cursor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documento',
+            index=models.Index(fields=['-data_conclusao', '-id'], name='documento_conclusao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaodocumento',
+            index=models.Index(fields=['-data_movimentacao', '-id'], name='movimentacao_cursor_idx'),
+        ),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 4.2.11 on 2026-10-18 20:40
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# SQL desta migração, congelado: só as colunas que existem aqui (titulo,
+# tags, conteudo). Não usa ARQUIVOS.busca, que muda com as migrações seguintes.
+INSTALAR = {
+    'postgresql': [
+        'ALTER TABLE "ARQUIVOS_documentobusca" ADD COLUMN IF NOT EXISTS vetor tsvector GENERATED ALWAYS AS ('
+        "setweight(to_tsvector('portuguese', titulo), 'A') || "
+        "setweight(to_tsvector('portuguese', tags), 'B') || "
+        "setweight(to_tsvector('portuguese', conteudo), 'C')) STORED",
+        'CREATE INDEX IF NOT EXISTS documentobusca_vetor_gin ON "ARQUIVOS_documentobusca" USING GIN (vetor)',
+    ],
+    'sqlite': [
+        'CREATE VIRTUAL TABLE IF NOT EXISTS "ARQUIVOS_documentobusca_fts" USING fts5('
+        "titulo, tags, conteudo, content='ARQUIVOS_documentobusca', content_rowid='documento_id', "
+        "tokenize='unicode61 remove_diacritics 2')",
+        'CREATE TRIGGER IF NOT EXISTS "ARQUIVOS_documentobusca_fts_ai" AFTER INSERT ON "ARQUIVOS_documentobusca" BEGIN '
+        'INSERT INTO "ARQUIVOS_documentobusca_fts"(rowid, titulo, tags, conteudo) '
+        'VALUES (new.documento_id, new.titulo, new.tags, new.conteudo); END',
+        'CREATE TRIGGER IF NOT EXISTS "ARQUIVOS_documentobusca_fts_ad" AFTER DELETE ON "ARQUIVOS_documentobusca" BEGIN '
+        'INSERT INTO "ARQUIVOS_documentobusca_fts"("ARQUIVOS_documentobusca_fts", rowid, titulo, tags, conteudo) '
+        "VALUES ('delete', old.documento_id, old.titulo, old.tags, old.conteudo); END",
+        'CREATE TRIGGER IF NOT EXISTS "ARQUIVOS_documentobusca_fts_au" AFTER UPDATE ON "ARQUIVOS_documentobusca" BEGIN '
+        'INSERT INTO "ARQUIVOS_documentobusca_fts"("ARQUIVOS_documentobusca_fts", rowid, titulo, tags, conteudo) '
+        "VALUES ('delete', old.documento_id, old.titulo, old.tags, old.conteudo); "
+        'INSERT INTO "ARQUIVOS_documentobusca_fts"(rowid, titulo, tags, conteudo) '
+        'VALUES (new.documento_id, new.titulo, new.tags, new.conteudo); END',
+    ],
+}
+REMOVER = {
+    'postgresql': [
+        'DROP INDEX IF EXISTS documentobusca_vetor_gin',
+        'ALTER TABLE "ARQUIVOS_documentobusca" DROP COLUMN IF EXISTS vetor',
+    ],
+    'sqlite': [
+        'DROP TRIGGER IF EXISTS "ARQUIVOS_documentobusca_fts_ai"',
+        'DROP TRIGGER IF EXISTS "ARQUIVOS_documentobusca_fts_ad"',
+        'DROP TRIGGER IF EXISTS "ARQUIVOS_documentobusca_fts_au"',
+        'DROP TABLE IF EXISTS "ARQUIVOS_documentobusca_fts"',
+    ],
+}
+
+
+def _termos(texto):
+    """Palavras em minúsculas e sem acentos (cópia congelada de ARQUIVOS.busca.termos)."""
+    if not texto:
+        return []
+    decomposto = unicodedata.normalize('NFKD', str(texto).lower())
+    return re.findall(r'\w+', ''.join(c for c in decomposto if not unicodedata.combining(c)))
+
+
+def instalar_busca(apps, schema_editor):
+    """Índice do banco (tsvector/GIN ou FTS5) e backfill do texto pesquisável."""
+    for sql in INSTALAR.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+    Documento = apps.get_model('ARQUIVOS', 'Documento')
+    DocumentoBusca = apps.get_model('ARQUIVOS', 'DocumentoBusca')
+    linhas = Documento.objects.values_list('id', 'titulo', 'numero_protocolo', 'tags', 'conteudo')
+    DocumentoBusca.objects.bulk_create(
+        (
+            DocumentoBusca(
+                documento_id=documento_id,
+                titulo=' '.join(_termos(f'{titulo or ""} {numero_protocolo or ""}')),
+                tags=' '.join(_termos(tags)),
+                conteudo=' '.join(_termos(conteudo)),
+            )
+            for documento_id, titulo, numero_protocolo, tags, conteudo in linhas.iterator()
+        ),
+        batch_size=2000,
+    )
+
+
+def remover_busca(apps, schema_editor):
+    for sql in REMOVER.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ARQUIVOS', '0047_indices_paginacao_cursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentoBusca',
+            fields=[
+                ('documento', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='busca', serialize=False, to='ARQUIVOS.documento')),
+                ('titulo', models.TextField(blank=True)),
+                ('tags', models.TextField(blank=True)),
+                ('conteudo', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Índice de Pesquisa de Documento',
+                'verbose_name_plural': 'Índices de Pesquisa de Documentos',
+            },
+        ),
+        migrations.RunPython(instalar_busca, remover_busca),
+    ]
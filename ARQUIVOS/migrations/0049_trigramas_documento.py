@@ -0,0 +1,119 @@
+# Generated by Django 4.2.11 on 2026-10-18 21:15
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# SQL desta migração, congelado (não usa ARQUIVOS.busca). No SQLite e nos
+# outros bancos os trigramas ficam na tabela TrigramaDocumento.
+CAMPOS_APROXIMADOS = ('protocolo', 'utente', 'referencia')
+INSTALAR = {
+    'postgresql': [
+        # pg_trgm é uma extensão do contrib: requer permissão de CREATE na base
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        'CREATE INDEX IF NOT EXISTS documentobusca_protocolo_trgm '
+        'ON "ARQUIVOS_documentobusca" USING GIN (protocolo gin_trgm_ops)',
+        'CREATE INDEX IF NOT EXISTS documentobusca_utente_trgm '
+        'ON "ARQUIVOS_documentobusca" USING GIN (utente gin_trgm_ops)',
+        'CREATE INDEX IF NOT EXISTS documentobusca_referencia_trgm '
+        'ON "ARQUIVOS_documentobusca" USING GIN (referencia gin_trgm_ops)',
+    ],
+}
+REMOVER = {
+    'postgresql': [
+        'DROP INDEX IF EXISTS documentobusca_protocolo_trgm',
+        'DROP INDEX IF EXISTS documentobusca_utente_trgm',
+        'DROP INDEX IF EXISTS documentobusca_referencia_trgm',
+    ],
+}
+
+
+def _termos(texto):
+    """Palavras em minúsculas e sem acentos (cópia congelada de ARQUIVOS.busca.termos)."""
+    if not texto:
+        return []
+    decomposto = unicodedata.normalize('NFKD', str(texto).lower())
+    return re.findall(r'\w+', ''.join(c for c in decomposto if not unicodedata.combining(c)))
+
+
+def _trigramas(texto):
+    """Trigramas de cada palavra, com o enchimento do pg_trgm (cópia congelada de ARQUIVOS.busca.trigramas)."""
+    resultado = set()
+    for palavra in _termos(texto):
+        palavra = f'  {palavra} '
+        resultado.update(palavra[i:i + 3] for i in range(len(palavra) - 2))
+    return resultado
+
+
+def instalar_trigramas(apps, schema_editor):
+    """pg_trgm (PostgreSQL) ou tabela de trigramas, e backfill dos campos aproximados."""
+    vendor = schema_editor.connection.vendor
+    for sql in INSTALAR.get(vendor, []):
+        schema_editor.execute(sql)
+
+    Documento = apps.get_model('ARQUIVOS', 'Documento')
+    DocumentoBusca = apps.get_model('ARQUIVOS', 'DocumentoBusca')
+    TrigramaDocumento = apps.get_model('ARQUIVOS', 'TrigramaDocumento')
+
+    linhas = Documento.objects.values_list('id', 'numero_protocolo', 'utente', 'referencia')
+    for documento_id, *valores in linhas.iterator():
+        campos = {campo: ' '.join(_termos(valor)) for campo, valor in zip(CAMPOS_APROXIMADOS, valores)}
+        DocumentoBusca.objects.filter(documento_id=documento_id).update(**campos)
+        if vendor != 'postgresql':
+            TrigramaDocumento.objects.bulk_create([
+                TrigramaDocumento(documento_id=documento_id, campo=campo, trigrama=trigrama)
+                for campo, valor in campos.items()
+                for trigrama in _trigramas(valor)
+            ])
+
+
+def remover_trigramas(apps, schema_editor):
+    for sql in REMOVER.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ARQUIVOS', '0048_documentobusca'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentobusca',
+            name='protocolo',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='documentobusca',
+            name='referencia',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='documentobusca',
+            name='utente',
+            field=models.TextField(blank=True),
+        ),
+        migrations.CreateModel(
+            name='TrigramaDocumento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('campo', models.CharField(max_length=20)),
+                ('trigrama', models.CharField(max_length=3)),
+                ('documento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigramas', to='ARQUIVOS.documento')),
+            ],
+            options={
+                'verbose_name': 'Trigrama de Documento',
+                'verbose_name_plural': 'Trigramas de Documentos',
+                'indexes': [models.Index(fields=['campo', 'trigrama'], name='trigrama_documento_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='trigramadocumento',
+            constraint=models.UniqueConstraint(fields=('documento', 'campo', 'trigrama'), name='trigrama_unico'),
+        ),
+        migrations.RunPython(instalar_trigramas, remover_trigramas),
+    ]
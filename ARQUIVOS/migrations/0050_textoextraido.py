@@ -0,0 +1,124 @@
+# Generated by Django 4.2.11 on 2026-10-18 22:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# SQL desta migração, congelado (não usa ARQUIVOS.busca): o índice do banco
+# passa de (titulo, tags, conteudo) para (titulo, tags, conteudo, ficheiros).
+def _sql_postgres(colunas):
+    pesos = {'titulo': 'A', 'tags': 'B', 'conteudo': 'C', 'ficheiros': 'D'}
+    vetor = ' || '.join(f"setweight(to_tsvector('portuguese', {coluna}), '{pesos[coluna]}')" for coluna in colunas)
+    return [
+        'DROP INDEX IF EXISTS documentobusca_vetor_gin',
+        'ALTER TABLE "ARQUIVOS_documentobusca" DROP COLUMN IF EXISTS vetor',
+        f'ALTER TABLE "ARQUIVOS_documentobusca" ADD COLUMN vetor tsvector GENERATED ALWAYS AS ({vetor}) STORED',
+        'CREATE INDEX documentobusca_vetor_gin ON "ARQUIVOS_documentobusca" USING GIN (vetor)',
+    ]
+
+
+def _sql_sqlite(colunas):
+    novas = ', '.join(f'new.{coluna}' for coluna in colunas)
+    antigas = ', '.join(f'old.{coluna}' for coluna in colunas)
+    colunas = ', '.join(colunas)
+    apagar = (
+        f'INSERT INTO "ARQUIVOS_documentobusca_fts"("ARQUIVOS_documentobusca_fts", rowid, {colunas}) '
+        f"VALUES ('delete', old.documento_id, {antigas});"
+    )
+    inserir = f'INSERT INTO "ARQUIVOS_documentobusca_fts"(rowid, {colunas}) VALUES (new.documento_id, {novas});'
+    return [
+        'DROP TRIGGER IF EXISTS "ARQUIVOS_documentobusca_fts_ai"',
+        'DROP TRIGGER IF EXISTS "ARQUIVOS_documentobusca_fts_ad"',
+        'DROP TRIGGER IF EXISTS "ARQUIVOS_documentobusca_fts_au"',
+        'DROP TABLE IF EXISTS "ARQUIVOS_documentobusca_fts"',
+        f'CREATE VIRTUAL TABLE "ARQUIVOS_documentobusca_fts" USING fts5({colunas}, '
+        "content='ARQUIVOS_documentobusca', content_rowid='documento_id', "
+        "tokenize='unicode61 remove_diacritics 2')",
+        f'CREATE TRIGGER "ARQUIVOS_documentobusca_fts_ai" AFTER INSERT ON "ARQUIVOS_documentobusca" BEGIN {inserir} END',
+        f'CREATE TRIGGER "ARQUIVOS_documentobusca_fts_ad" AFTER DELETE ON "ARQUIVOS_documentobusca" BEGIN {apagar} END',
+        f'CREATE TRIGGER "ARQUIVOS_documentobusca_fts_au" AFTER UPDATE ON "ARQUIVOS_documentobusca" '
+        f'BEGIN {apagar} {inserir} END',
+        # Linhas já gravadas entram no índice novo
+        'INSERT INTO "ARQUIVOS_documentobusca_fts"("ARQUIVOS_documentobusca_fts") VALUES (\'rebuild\')',
+    ]
+
+
+_SQL = {'postgresql': _sql_postgres, 'sqlite': _sql_sqlite}
+
+
+def _reinstalar_indice(schema_editor, colunas):
+    gerar = _SQL.get(schema_editor.connection.vendor)
+    for sql in gerar(colunas) if gerar else []:
+        schema_editor.execute(sql)
+
+
+def reinstalar_busca(apps, schema_editor):
+    """Recria o índice do banco com a coluna `ficheiros` e agenda a extração dos ficheiros existentes."""
+    _reinstalar_indice(schema_editor, ('titulo', 'tags', 'conteudo', 'ficheiros'))
+
+    Documento = apps.get_model('ARQUIVOS', 'Documento')
+    Anexo = apps.get_model('ARQUIVOS', 'Anexo')
+    TextoExtraido = apps.get_model('ARQUIVOS', 'TextoExtraido')
+
+    pendentes = []
+    for documento_id, arquivo, digitalizado in Documento.objects.values_list(
+        'id', 'arquivo', 'arquivo_digitalizado'
+    ).iterator():
+        for origem, ficheiro in (('arquivo', arquivo), ('arquivo_digitalizado', digitalizado)):
+            if ficheiro:
+                pendentes.append(TextoExtraido(documento_id=documento_id, origem=origem, ficheiro=ficheiro))
+    for anexo_id, documento_id, ficheiro in Anexo.objects.values_list('id', 'documento_id', 'arquivo').iterator():
+        if ficheiro:
+            pendentes.append(
+                TextoExtraido(documento_id=documento_id, anexo_id=anexo_id, origem='anexo', ficheiro=ficheiro)
+            )
+    TextoExtraido.objects.bulk_create(pendentes, batch_size=2000)
+
+
+def reverter_busca(apps, schema_editor):
+    _reinstalar_indice(schema_editor, ('titulo', 'tags', 'conteudo'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ARQUIVOS', '0049_trigramas_documento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentobusca',
+            name='ficheiros',
+            field=models.TextField(blank=True),
+        ),
+        migrations.CreateModel(
+            name='TextoExtraido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origem', models.CharField(choices=[('arquivo', 'Arquivo'), ('arquivo_digitalizado', 'Arquivo digitalizado'), ('anexo', 'Anexo')], max_length=20)),
+                ('ficheiro', models.CharField(max_length=255)),
+                ('hash_conteudo', models.CharField(blank=True, db_index=True, max_length=64)),
+                ('estado', models.CharField(choices=[('pendente', 'Pendente'), ('extraido', 'Texto extraído'), ('sem_texto', 'Sem texto'), ('erro', 'Erro')], default='pendente', max_length=10)),
+                ('metodo', models.CharField(blank=True, max_length=10)),
+                ('texto', models.TextField(blank=True)),
+                ('erro', models.TextField(blank=True)),
+                ('data_atualizacao', models.DateTimeField(auto_now=True)),
+                ('anexo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='textos_extraidos', to='ARQUIVOS.anexo')),
+                ('documento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='textos_extraidos', to='ARQUIVOS.documento')),
+            ],
+            options={
+                'verbose_name': 'Texto Extraído',
+                'verbose_name_plural': 'Textos Extraídos',
+                'indexes': [models.Index(fields=['estado', 'data_atualizacao'], name='texto_extraido_estado_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='textoextraido',
+            constraint=models.UniqueConstraint(condition=models.Q(('anexo__isnull', True)), fields=('documento', 'origem'), name='texto_extraido_unico_campo'),
+        ),
+        migrations.AddConstraint(
+            model_name='textoextraido',
+            constraint=models.UniqueConstraint(condition=models.Q(('anexo__isnull', False)), fields=('anexo',), name='texto_extraido_unico_anexo'),
+        ),
+        migrations.RunPython(reinstalar_busca, reverter_busca),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.11 on 2026-10-18 22:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ARQUIVOS', '0050_textoextraido'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarefa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=100)),
+                ('fila', models.CharField(default='default', max_length=50)),
+                ('argumentos', models.JSONField(blank=True, default=dict)),
+                ('estado', models.CharField(choices=[('pendente', 'Pendente'), ('em_execucao', 'Em execução'), ('concluida', 'Concluída'), ('falhada', 'Falhada')], default='pendente', max_length=15)),
+                ('tentativas', models.PositiveIntegerField(default=0)),
+                ('max_tentativas', models.PositiveIntegerField(default=5)),
+                ('executar_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('trabalhador', models.CharField(blank=True, max_length=100)),
+                ('iniciada_em', models.DateTimeField(blank=True, null=True)),
+                ('reservada_ate', models.DateTimeField(blank=True, null=True)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('data_conclusao', models.DateTimeField(blank=True, null=True)),
+                ('erro', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Tarefa',
+                'verbose_name_plural': 'Tarefas',
+                'indexes': [models.Index(condition=models.Q(('estado', 'pendente')), fields=['fila', 'executar_em', 'id'], name='tarefa_pendente_idx'), models.Index(fields=['estado', 'reservada_ate'], name='tarefa_estado_idx')],
+            },
+        ),
+    ]
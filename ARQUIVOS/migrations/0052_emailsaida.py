@@ -0,0 +1,42 @@
+# Generated by Django 4.2.11 on 2026-10-18 23:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ARQUIVOS', '0051_tarefa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailSaida',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('assunto', models.CharField(max_length=255)),
+                ('corpo', models.TextField()),
+                ('remetente', models.CharField(blank=True, help_text='Vazio: DEFAULT_FROM_EMAIL', max_length=255)),
+                ('destinatarios', models.JSONField(default=list)),
+                ('anexo', models.CharField(blank=True, help_text='Nome do ficheiro no storage', max_length=500)),
+                ('anexo_tipo', models.CharField(blank=True, max_length=100)),
+                ('estado', models.CharField(choices=[('pendente', 'Pendente'), ('a_enviar', 'A enviar'), ('enviado', 'Enviado'), ('falhado', 'Falhado')], default='pendente', max_length=10)),
+                ('tentativas', models.PositiveIntegerField(default=0)),
+                ('max_tentativas', models.PositiveIntegerField(default=8)),
+                ('proxima_tentativa', models.DateTimeField(default=django.utils.timezone.now)),
+                ('trabalhador', models.CharField(blank=True, max_length=100)),
+                ('reservado_ate', models.DateTimeField(blank=True, null=True)),
+                ('erro', models.TextField(blank=True)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('data_envio', models.DateTimeField(blank=True, null=True)),
+                ('documento', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='emails', to='ARQUIVOS.documento')),
+            ],
+            options={
+                'verbose_name': 'Email (caixa de saída)',
+                'verbose_name_plural': 'Emails (caixa de saída)',
+                'indexes': [models.Index(condition=models.Q(('estado', 'pendente')), fields=['proxima_tentativa', 'id'], name='emailsaida_pendente_idx')],
+            },
+        ),
+    ]
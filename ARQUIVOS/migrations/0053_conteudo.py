@@ -0,0 +1,41 @@
+# Generated by Django 4.2.11 on 2026-10-18 23:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ARQUIVOS', '0052_emailsaida'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conteudo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(help_text='SHA-256 (hexadecimal)', max_length=64, unique=True)),
+                ('tamanho', models.BigIntegerField(help_text='Bytes')),
+                ('referencias', models.PositiveIntegerField(default=0, help_text='Nomes no storage que apontam para este conteúdo')),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Conteúdo armazenado',
+                'verbose_name_plural': 'Conteúdos armazenados',
+            },
+        ),
+        migrations.CreateModel(
+            name='ReferenciaConteudo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=500, unique=True)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('conteudo', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='nomes', to='ARQUIVOS.conteudo')),
+            ],
+            options={
+                'verbose_name': 'Referência de conteúdo',
+                'verbose_name_plural': 'Referências de conteúdo',
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.11 on 2026-10-19 00:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ARQUIVOS', '0053_conteudo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadParcial',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('nome_ficheiro', models.CharField(max_length=255)),
+                ('tamanho', models.BigIntegerField(help_text='Bytes do ficheiro completo')),
+                ('recebido', models.BigIntegerField(default=0, help_text='Bytes já recebidos (o próximo bloco começa aqui)')),
+                ('sha256', models.CharField(blank=True, help_text='SHA-256 do ficheiro completo (opcional, verificado no fim)', max_length=64)),
+                ('estado', models.CharField(choices=[('aberto', 'A receber'), ('concluido', 'Concluído'), ('anexado', 'Anexado'), ('falhado', 'Falhado')], default='aberto', max_length=10)),
+                ('ficheiro', models.CharField(blank=True, help_text='Nome no storage depois de concluído', max_length=500)),
+                ('erro', models.CharField(blank=True, max_length=255)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('data_atualizacao', models.DateTimeField(auto_now=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Upload por blocos',
+                'verbose_name_plural': 'Uploads por blocos',
+                'indexes': [models.Index(fields=['estado', 'data_atualizacao'], name='upload_estado_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.11 on 2026-10-19 00:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ARQUIVOS', '0054_uploadparcial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='documento',
+            index=models.Index(fields=['arquivo'], name='documento_arquivo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documento',
+            index=models.Index(fields=['arquivo_digitalizado'], name='documento_digitalizado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='anexo',
+            index=models.Index(fields=['arquivo'], name='anexo_arquivo_idx'),
+        ),
+    ]
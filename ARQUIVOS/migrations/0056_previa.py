@@ -0,0 +1,32 @@
+# Generated by Django 4.2.11 on 2026-10-19 02:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ARQUIVOS', '0055_indices_ficheiros'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Previa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(help_text='SHA-256 do ficheiro original', max_length=64, unique=True)),
+                ('tipo', models.CharField(help_text="'imagem' ou 'pdf'", max_length=10)),
+                ('estado', models.CharField(choices=[('pendente', 'Pendente'), ('gerada', 'Gerada'), ('indisponivel', 'Sem renderizador'), ('falhada', 'Falhada')], default='pendente', max_length=12)),
+                ('largura', models.PositiveIntegerField(default=0)),
+                ('altura', models.PositiveIntegerField(default=0)),
+                ('tamanho', models.PositiveIntegerField(default=0, help_text='Bytes da miniatura')),
+                ('erro', models.CharField(blank=True, max_length=255)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('data_atualizacao', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Pré-visualização',
+                'verbose_name_plural': 'Pré-visualizações',
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.11 on 2026-10-19 03:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ARQUIVOS', '0056_previa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NormalizacaoFicheiro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origem', models.CharField(help_text='Campo do ficheiro: arquivo, arquivo_digitalizado ou anexo', max_length=20)),
+                ('ficheiro', models.CharField(help_text='Ficheiro enviado (primeira página)', max_length=500)),
+                ('paginas', models.JSONField(blank=True, default=list, help_text='Páginas seguintes, a juntar num PDF')),
+                ('ficheiro_final', models.CharField(blank=True, max_length=500)),
+                ('estado', models.CharField(choices=[('pendente', 'Pendente'), ('normalizado', 'Normalizado'), ('mantido', 'Original mantido'), ('erro', 'Erro')], default='pendente', max_length=12)),
+                ('tamanho_original', models.BigIntegerField(default=0, help_text='Bytes enviados (todas as páginas)')),
+                ('tamanho_final', models.BigIntegerField(default=0, help_text='Bytes depois da normalização')),
+                ('erro', models.CharField(blank=True, max_length=500)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('data_atualizacao', models.DateTimeField(auto_now=True)),
+                ('anexo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='normalizacoes', to='ARQUIVOS.anexo')),
+                ('documento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='normalizacoes', to='ARQUIVOS.documento')),
+            ],
+            options={
+                'verbose_name': 'Normalização de ficheiro',
+                'verbose_name_plural': 'Normalizações de ficheiros',
+                'indexes': [models.Index(fields=['estado', 'data_atualizacao'], name='normalizacao_estado_idx'), models.Index(fields=['ficheiro_final'], name='normalizacao_final_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.11 on 2026-10-19 04:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ARQUIVOS', '0057_normalizacaoficheiro'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PacoteArquivo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(help_text='Primeiro dia do mês de conclusão dos documentos')),
+                ('nome', models.CharField(help_text='Caminho dentro de SGA_ARQUIVO_FRIO_PASTA', max_length=500, unique=True)),
+                ('ficheiros', models.PositiveIntegerField(default=0)),
+                ('tamanho', models.BigIntegerField(default=0, help_text='Bytes do pacote')),
+                ('tamanho_original', models.BigIntegerField(default=0, help_text='Bytes dos conteúdos antes da compressão')),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('administracao', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='pacotes_arquivo', to='ARQUIVOS.administracao')),
+            ],
+            options={
+                'verbose_name': 'Pacote do arquivo frio',
+                'verbose_name_plural': 'Pacotes do arquivo frio',
+                'indexes': [models.Index(fields=['administracao', 'mes'], name='pacote_admin_mes_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ConteudoArquivado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.BigIntegerField(help_text='Offset, no pacote, do primeiro byte dos dados')),
+                ('tamanho_comprimido', models.BigIntegerField()),
+                ('comprimido', models.BooleanField(default=True, help_text='Deflate (senão, guardado tal como está)')),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('conteudo', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='arquivado', to='ARQUIVOS.conteudo')),
+                ('pacote', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='conteudos', to='ARQUIVOS.pacotearquivo')),
+            ],
+            options={
+                'verbose_name': 'Conteúdo arquivado',
+                'verbose_name_plural': 'Conteúdos arquivados',
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.11 on 2026-10-19 09:10
+
+from collections import Counter
+
+from django.db import migrations
+from django.db.models import F, Q
+
+
+# Cópia congelada de ARQUIVOS.models.indices.ESTADOS_FINAIS
+ESTADOS_FINAIS = ('despacho', 'aprovado', 'reprovado', 'arquivado')
+
+
+def recontar_visibilidade(apps, schema_editor):
+    """
+    Os totais 'visivel'/'finalizado' das secções e departamentos contavam
+    também documentos de outras administrações (ex.: difusão do Governo),
+    que para_usuario não mostra. Recalcula-os só com as linhas de
+    visibilidade da administração do próprio documento.
+    """
+    VisibilidadeDocumento = apps.get_model('ARQUIVOS', 'VisibilidadeDocumento')
+    ContadorUnidade = apps.get_model('ARQUIVOS', 'ContadorUnidade')
+
+    contagem = Counter()
+    linhas = VisibilidadeDocumento.objects.filter(
+        Q(departamento__administracao=F('documento__administracao')) |
+        Q(seccao__departamento__administracao=F('documento__administracao')),
+        documento__is_deleted=False,
+    ).values_list('departamento_id', 'seccao_id', 'documento__status')
+    for departamento_id, seccao_id, status in linhas.iterator():
+        unidade = f'seccao_{seccao_id}' if seccao_id else f'departamento_{departamento_id}'
+        contagem[(unidade, 'visivel')] += 1
+        if status in ESTADOS_FINAIS:
+            contagem[(unidade, 'finalizado')] += 1
+
+    ContadorUnidade.objects.filter(
+        Q(unidade__startswith='seccao_') | Q(unidade__startswith='departamento_'),
+        dia__isnull=True, metrica__in=['visivel', 'finalizado'],
+    ).delete()
+    ContadorUnidade.objects.bulk_create(
+        [
+            ContadorUnidade(unidade=unidade, dia=None, metrica=metrica, valor=valor)
+            for (unidade, metrica), valor in contagem.items()
+        ],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ARQUIVOS', '0058_arquivo_frio'),
+    ]
+
+    operations = [
+        migrations.RunPython(recontar_visibilidade, migrations.RunPython.noop),
+    ]
@@ -4,3 +4,13 @@ from .usuario import Administracao, CustomUser, GovernoProvincial, Administracao
 from .documento import TipoDocumento, Documento, Anexo, StatusDocumento
 from .movimentacao import MovimentacaoDocumento
 from .armazenamento import LocalArmazenamento, ArmazenamentoDocumento
+from .indices import (
+    VisibilidadeDocumento, PendenciaAberta, ContadorUnidade, DocumentoBusca, TrigramaDocumento,
+    TextoExtraido, EstadoExtracao
+)
+from .fila import Tarefa, EstadoTarefa
+from .correio import EmailSaida, EstadoEmail
+from .conteudo import (
+    Conteudo, ReferenciaConteudo, UploadParcial, EstadoUpload, Previa, EstadoPrevia,
+    NormalizacaoFicheiro, EstadoNormalizacao, PacoteArquivo, ConteudoArquivado
+)
@@ -215,3 +215,7 @@ class ArmazenamentoDocumento(models.Model):
         verbose_name = "Armazenamento de Documento"
         verbose_name_plural = "Armazenamentos de Documentos"
         ordering = ['-data_armazenamento']
+        indexes = [
+            # Paginação por cursor (data_armazenamento, id)
+            models.Index(fields=['-data_armazenamento', '-id'], name='armazenamento_cursor_idx'),
+        ]
@@ -0,0 +1,316 @@
+import uuid
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F
+
+
+# ===================================================================
+# Armazenamento endereçado por conteúdo
+# ===================================================================
+#
+# Cada ficheiro carregado (Documento.arquivo, arquivo_digitalizado,
+# Anexo.arquivo, ...) é guardado uma só vez, sob o seu SHA-256; os nomes
+# dos FileFields continuam a existir como ligações (hard links) para esse
+# conteúdo. Ver ARQUIVOS/conteudo.py.
+
+
+class ConteudoManager(models.Manager):
+
+    def referenciar(self, hash_conteudo, tamanho, nome):
+        """Regista `nome` como mais uma referência ao conteúdo `hash_conteudo`."""
+        with transaction.atomic():
+            conteudo, _ = self.get_or_create(hash=hash_conteudo, defaults={'tamanho': tamanho})
+            ReferenciaConteudo.objects.create(nome=nome, conteudo=conteudo)
+            self.filter(pk=conteudo.pk).update(referencias=F('referencias') + 1)
+        return conteudo
+
+    def libertar(self, nome):
+        """
+        Remove a referência `nome`. Devolve o Conteudo que ficou sem
+        referências (o ficheiro pode ser apagado), senão None.
+        """
+        with transaction.atomic():
+            referencia = (
+                ReferenciaConteudo.objects.select_related('conteudo').select_for_update()
+                .filter(nome=nome).first()
+            )
+            if referencia is None:
+                return None
+            conteudo = referencia.conteudo
+            referencia.delete()
+            self.filter(pk=conteudo.pk).update(referencias=F('referencias') - 1)
+            conteudo.refresh_from_db(fields=['referencias'])
+            if conteudo.referencias > 0:
+                return None
+            conteudo.delete()
+            return conteudo
+
+
+class Conteudo(models.Model):
+    """Um ficheiro guardado uma só vez, identificado pelo SHA-256."""
+    objects = ConteudoManager()
+
+    hash = models.CharField(max_length=64, unique=True, help_text="SHA-256 (hexadecimal)")
+    tamanho = models.BigIntegerField(help_text="Bytes")
+    referencias = models.PositiveIntegerField(default=0, help_text="Nomes no storage que apontam para este conteúdo")
+    data_criacao = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.hash[:12]} ({self.referencias} ref.)"
+
+    class Meta:
+        verbose_name = "Conteúdo armazenado"
+        verbose_name_plural = "Conteúdos armazenados"
+
+
+class ReferenciaConteudo(models.Model):
+    """Nome de um ficheiro no storage (o valor do FileField) e o conteúdo a que corresponde."""
+    nome = models.CharField(max_length=500, unique=True)
+    conteudo = models.ForeignKey(Conteudo, on_delete=models.PROTECT, related_name='nomes')
+    data_criacao = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.nome
+
+    class Meta:
+        verbose_name = "Referência de conteúdo"
+        verbose_name_plural = "Referências de conteúdo"
+
+
+# ===================================================================
+# Uploads por blocos (retomáveis)
+# ===================================================================
+#
+# Os ficheiros grandes chegam em blocos (cada um com o seu SHA-256) para
+# um ficheiro parcial; o cliente pode retomar a partir de `recebido`.
+# Concluído, o upload passa para o storage por conteúdo e é depois
+# atribuído ao Documento/Anexo sem nova cópia. Ver ARQUIVOS/uploads.py.
+
+
+class EstadoUpload(models.TextChoices):
+    ABERTO = 'aberto', 'A receber'
+    CONCLUIDO = 'concluido', 'Concluído'
+    ANEXADO = 'anexado', 'Anexado'
+    FALHADO = 'falhado', 'Falhado'
+
+
+class UploadParcial(models.Model):
+    """Upload por blocos de um ficheiro grande (ex.: digitalizações de centenas de MB)."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='uploads')
+    nome_ficheiro = models.CharField(max_length=255)
+    tamanho = models.BigIntegerField(help_text="Bytes do ficheiro completo")
+    recebido = models.BigIntegerField(default=0, help_text="Bytes já recebidos (o próximo bloco começa aqui)")
+    sha256 = models.CharField(max_length=64, blank=True, help_text="SHA-256 do ficheiro completo (opcional, verificado no fim)")
+    estado = models.CharField(max_length=10, choices=EstadoUpload.choices, default=EstadoUpload.ABERTO)
+    ficheiro = models.CharField(max_length=500, blank=True, help_text="Nome no storage depois de concluído")
+    erro = models.CharField(max_length=255, blank=True)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_atualizacao = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.nome_ficheiro} ({self.recebido}/{self.tamanho})"
+
+    class Meta:
+        verbose_name = "Upload por blocos"
+        verbose_name_plural = "Uploads por blocos"
+        indexes = [
+            models.Index(fields=['estado', 'data_atualizacao'], name='upload_estado_idx'),
+        ]
+
+
+# ===================================================================
+# Pré-visualizações (miniaturas)
+# ===================================================================
+#
+# Miniatura JPEG da primeira página de cada digitalização, imagem ou PDF,
+# gerada pelo worker e guardada pelo SHA-256 do conteúdo: ficheiros iguais
+# partilham a mesma miniatura. Ver ARQUIVOS/previas.py.
+
+
+class EstadoPrevia(models.TextChoices):
+    PENDENTE = 'pendente', 'Pendente'
+    GERADA = 'gerada', 'Gerada'
+    INDISPONIVEL = 'indisponivel', 'Sem renderizador'
+    FALHADA = 'falhada', 'Falhada'
+
+
+class PreviaManager(models.Manager):
+
+    def agendar(self, nome):
+        """
+        Agenda a miniatura do ficheiro `nome` (se o formato tiver
+        pré-visualização e o conteúdo ainda não tiver miniatura).
+        """
+        from ARQUIVOS.fila import agendar
+        from ARQUIVOS.previas import tipo_previa
+
+        tipo = tipo_previa(nome)
+        if not tipo:
+            return None
+        hash_conteudo = (
+            ReferenciaConteudo.objects.filter(nome=nome).values_list('conteudo__hash', flat=True).first()
+        )
+        if not hash_conteudo:
+            # Ficheiro de antes do storage por conteúdo: manage.py gerar_previas
+            return None
+        previa, criada = self.get_or_create(hash=hash_conteudo, defaults={'tipo': tipo})
+        if criada:
+            agendar('previa.gerar', {'hash_conteudo': hash_conteudo})
+        return previa
+
+
+class Previa(models.Model):
+    """Miniatura (JPEG) da primeira página de um conteúdo."""
+    objects = PreviaManager()
+
+    hash = models.CharField(max_length=64, unique=True, help_text="SHA-256 do ficheiro original")
+    tipo = models.CharField(max_length=10, help_text="'imagem' ou 'pdf'")
+    estado = models.CharField(max_length=12, choices=EstadoPrevia.choices, default=EstadoPrevia.PENDENTE)
+    largura = models.PositiveIntegerField(default=0)
+    altura = models.PositiveIntegerField(default=0)
+    tamanho = models.PositiveIntegerField(default=0, help_text="Bytes da miniatura")
+    erro = models.CharField(max_length=255, blank=True)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_atualizacao = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.hash[:12]} ({self.get_estado_display()})"
+
+    class Meta:
+        verbose_name = "Pré-visualização"
+        verbose_name_plural = "Pré-visualizações"
+
+
+# ===================================================================
+# Normalização das imagens carregadas
+# ===================================================================
+#
+# Etapa opcional (SGA_NORMALIZAR_IMAGENS) à chegada das digitalizações e
+# anexos em JPG/PNG: reamostragem para a resolução de arquivo, nova
+# compressão sem metadados e, quando uma digitalização chega como várias
+# imagens, junção das páginas num só PDF. Corre num pool de processos
+# (manage.py normalizar_ficheiros); ver ARQUIVOS/normalizacao.py.
+
+
+class EstadoNormalizacao(models.TextChoices):
+    PENDENTE = 'pendente', 'Pendente'
+    NORMALIZADO = 'normalizado', 'Normalizado'
+    MANTIDO = 'mantido', 'Original mantido'
+    ERRO = 'erro', 'Erro'
+
+
+class NormalizacaoFicheiroManager(models.Manager):
+
+    def agendar(self, documento_id, origem, ficheiro, anexo_id=None, paginas=None):
+        """
+        Regista o ficheiro atual de um campo (e as páginas seguintes, já
+        gravadas no storage) como pendente de normalização.
+        """
+        from ARQUIVOS.normalizacao import ativa, descartar_paginas, normalizavel
+
+        chave = {'documento_id': documento_id, 'origem': origem, 'anexo_id': anexo_id}
+        anterior = self.filter(**chave, estado=EstadoNormalizacao.PENDENTE).first()
+        if anterior is not None and anterior.paginas != (paginas or []):
+            # Páginas de um envio que foi substituído antes de processado
+            descartar_paginas(anterior.paginas)
+
+        if not ficheiro or not normalizavel(ficheiro) or not (paginas or ativa()):
+            if anterior is not None:
+                anterior.delete()
+            return None
+        if self.filter(ficheiro_final=ficheiro).exists():
+            # O próprio resultado de uma normalização a ser gravado no campo
+            return None
+        registo, _ = self.update_or_create(**chave, defaults={
+            'ficheiro': ficheiro, 'paginas': paginas or [], 'estado': EstadoNormalizacao.PENDENTE,
+            'ficheiro_final': '', 'tamanho_original': 0, 'tamanho_final': 0, 'erro': '',
+        })
+        return registo
+
+    def pendentes(self):
+        return self.filter(estado=EstadoNormalizacao.PENDENTE).order_by('data_atualizacao', 'id')
+
+
+class NormalizacaoFicheiro(models.Model):
+    """Normalização de uma imagem (ou de várias páginas para um PDF) e os tamanhos antes e depois."""
+    documento = models.ForeignKey('Documento', on_delete=models.CASCADE, related_name='normalizacoes')
+    anexo = models.ForeignKey(
+        'Anexo',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='normalizacoes'
+    )
+    origem = models.CharField(max_length=20, help_text="Campo do ficheiro: arquivo, arquivo_digitalizado ou anexo")
+    ficheiro = models.CharField(max_length=500, help_text="Ficheiro enviado (primeira página)")
+    paginas = models.JSONField(default=list, blank=True, help_text="Páginas seguintes, a juntar num PDF")
+    ficheiro_final = models.CharField(max_length=500, blank=True)
+    estado = models.CharField(max_length=12, choices=EstadoNormalizacao.choices, default=EstadoNormalizacao.PENDENTE)
+    tamanho_original = models.BigIntegerField(default=0, help_text="Bytes enviados (todas as páginas)")
+    tamanho_final = models.BigIntegerField(default=0, help_text="Bytes depois da normalização")
+    erro = models.CharField(max_length=500, blank=True)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_atualizacao = models.DateTimeField(auto_now=True)
+
+    objects = NormalizacaoFicheiroManager()
+
+    def __str__(self):
+        return f"{self.ficheiro} ({self.get_estado_display()}: {self.tamanho_original} -> {self.tamanho_final})"
+
+    class Meta:
+        verbose_name = "Normalização de ficheiro"
+        verbose_name_plural = "Normalizações de ficheiros"
+        indexes = [
+            models.Index(fields=['estado', 'data_atualizacao'], name='normalizacao_estado_idx'),
+            models.Index(fields=['ficheiro_final'], name='normalizacao_final_idx'),
+        ]
+
+
+# ===================================================================
+# Arquivo frio (pacotes do arquivo morto)
+# ===================================================================
+#
+# Os ficheiros dos documentos finalizados há mais de SGA_ARQUIVO_FRIO_DIAS
+# saem do storage "quente" para pacotes ZIP por administração e mês.
+# O índice (onde começa cada conteúdo dentro do pacote) fica aqui, para se
+# ler um só ficheiro sem abrir o pacote inteiro. Ver ARQUIVOS/arquivo_frio.py.
+
+
+class PacoteArquivo(models.Model):
+    """Pacote ZIP com os conteúdos arquivados de uma administração num mês."""
+    administracao = models.ForeignKey('Administracao', on_delete=models.PROTECT, related_name='pacotes_arquivo')
+    mes = models.DateField(help_text="Primeiro dia do mês de conclusão dos documentos")
+    nome = models.CharField(max_length=500, unique=True, help_text="Caminho dentro de SGA_ARQUIVO_FRIO_PASTA")
+    ficheiros = models.PositiveIntegerField(default=0)
+    tamanho = models.BigIntegerField(default=0, help_text="Bytes do pacote")
+    tamanho_original = models.BigIntegerField(default=0, help_text="Bytes dos conteúdos antes da compressão")
+    data_criacao = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.nome} ({self.ficheiros} ficheiros)"
+
+    class Meta:
+        verbose_name = "Pacote do arquivo frio"
+        verbose_name_plural = "Pacotes do arquivo frio"
+        indexes = [
+            models.Index(fields=['administracao', 'mes'], name='pacote_admin_mes_idx'),
+        ]
+
+
+class ConteudoArquivado(models.Model):
+    """Posição de um conteúdo dentro de um pacote (índice de offsets)."""
+    conteudo = models.OneToOneField(Conteudo, on_delete=models.CASCADE, related_name='arquivado')
+    pacote = models.ForeignKey(PacoteArquivo, on_delete=models.PROTECT, related_name='conteudos')
+    inicio = models.BigIntegerField(help_text="Offset, no pacote, do primeiro byte dos dados")
+    tamanho_comprimido = models.BigIntegerField()
+    comprimido = models.BooleanField(default=True, help_text="Deflate (senão, guardado tal como está)")
+    data_criacao = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.conteudo.hash[:12]} @ {self.pacote.nome}:{self.inicio}"
+
+    class Meta:
+        verbose_name = "Conteúdo arquivado"
+        verbose_name_plural = "Conteúdos arquivados"
@@ -0,0 +1,138 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.mail import EmailMessage
+from django.db import models
+from django.utils import timezone
+
+from .fila import BACKOFF_BASE, BACKOFF_MAXIMO, DURACAO_RESERVA
+
+
+# ===================================================================
+# Caixa de saída de email
+# ===================================================================
+#
+# Os emails ficam gravados na mesma transação que os originou e são
+# enviados em lote pelo worker (tarefa 'email.enviar'), com uma única
+# ligação SMTP por lote. Ver ARQUIVOS/correio.py.
+
+
+class EstadoEmail(models.TextChoices):
+    PENDENTE = 'pendente', 'Pendente'
+    A_ENVIAR = 'a_enviar', 'A enviar'
+    ENVIADO = 'enviado', 'Enviado'
+    FALHADO = 'falhado', 'Falhado'
+
+
+class EmailSaidaManager(models.Manager):
+    """Manager da caixa de saída: reserva dos emails prontos para envio."""
+
+    def prontos(self, agora=None):
+        return self.filter(estado=EstadoEmail.PENDENTE, proxima_tentativa__lte=agora or timezone.now())
+
+    def reservar(self, trabalhador, limite=50):
+        """
+        Reserva até `limite` emails prontos para `trabalhador`. O UPDATE só
+        apanha linhas ainda pendentes: dois processos nunca ficam com o mesmo
+        email. As reservas expiradas voltam primeiro a pendentes.
+        """
+        agora = timezone.now()
+        self.filter(estado=EstadoEmail.A_ENVIAR, reservado_ate__lt=agora).update(
+            estado=EstadoEmail.PENDENTE, trabalhador='', reservado_ate=None
+        )
+        ids = list(self.prontos(agora).order_by('proxima_tentativa', 'id').values_list('id', flat=True)[:limite])
+        self.filter(pk__in=ids, estado=EstadoEmail.PENDENTE).update(
+            estado=EstadoEmail.A_ENVIAR,
+            trabalhador=trabalhador,
+            reservado_ate=agora + timedelta(seconds=DURACAO_RESERVA),
+        )
+        return list(
+            self.filter(pk__in=ids, estado=EstadoEmail.A_ENVIAR, trabalhador=trabalhador)
+            .order_by('proxima_tentativa', 'id')
+        )
+
+    def proxima_tentativa(self):
+        """Data do próximo email pendente (None se não houver)."""
+        return self.filter(estado=EstadoEmail.PENDENTE).aggregate(
+            proxima=models.Min('proxima_tentativa')
+        )['proxima']
+
+
+class EmailSaida(models.Model):
+    """
+    Email por enviar ou já enviado: conteúdo, destinatários, referência ao
+    anexo no storage (não uma cópia) e histórico de tentativas.
+    """
+    documento = models.ForeignKey(
+        'Documento', on_delete=models.SET_NULL, null=True, blank=True, related_name='emails'
+    )
+    assunto = models.CharField(max_length=255)
+    corpo = models.TextField()
+    remetente = models.CharField(max_length=255, blank=True, help_text="Vazio: DEFAULT_FROM_EMAIL")
+    destinatarios = models.JSONField(default=list)
+    anexo = models.CharField(max_length=500, blank=True, help_text="Nome do ficheiro no storage")
+    anexo_tipo = models.CharField(max_length=100, blank=True)
+    estado = models.CharField(max_length=10, choices=EstadoEmail.choices, default=EstadoEmail.PENDENTE)
+    tentativas = models.PositiveIntegerField(default=0)
+    max_tentativas = models.PositiveIntegerField(default=8)
+    proxima_tentativa = models.DateTimeField(default=timezone.now)
+    trabalhador = models.CharField(max_length=100, blank=True)
+    reservado_ate = models.DateTimeField(null=True, blank=True)
+    erro = models.TextField(blank=True)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_envio = models.DateTimeField(null=True, blank=True)
+
+    objects = EmailSaidaManager()
+
+    def __str__(self):
+        return f"{self.assunto} -> {', '.join(self.destinatarios)} ({self.estado})"
+
+    def mensagem(self, conexao=None):
+        """EmailMessage pronto a enviar; o anexo é lido do storage neste momento."""
+        email = EmailMessage(
+            self.assunto,
+            self.corpo,
+            self.remetente or settings.DEFAULT_FROM_EMAIL,
+            self.destinatarios,
+            connection=conexao,
+        )
+        if self.anexo:
+            with default_storage.open(self.anexo, 'rb') as ficheiro:
+                email.attach(self.anexo.rsplit('/', 1)[-1], ficheiro.read(), self.anexo_tipo or None)
+        return email
+
+    def marcar_enviado(self):
+        self.estado = EstadoEmail.ENVIADO
+        self.tentativas += 1
+        self.data_envio = timezone.now()
+        self.reservado_ate = None
+        self.erro = ''
+        self.save(update_fields=['estado', 'tentativas', 'data_envio', 'reservado_ate', 'erro'])
+
+    def falhar(self, erro):
+        """
+        Regista a tentativa falhada: volta a pendente com atraso exponencial
+        (como as tarefas da fila) ou, esgotadas as tentativas, fica falhado.
+        """
+        self.tentativas += 1
+        self.erro = erro[-5000:]
+        self.reservado_ate = None
+        if self.tentativas < self.max_tentativas:
+            atraso = min(BACKOFF_MAXIMO, BACKOFF_BASE * 2 ** (self.tentativas - 1))
+            self.estado = EstadoEmail.PENDENTE
+            self.proxima_tentativa = timezone.now() + timedelta(seconds=atraso)
+        else:
+            self.estado = EstadoEmail.FALHADO
+        self.save(update_fields=['estado', 'tentativas', 'erro', 'reservado_ate', 'proxima_tentativa'])
+
+    class Meta:
+        verbose_name = "Email (caixa de saída)"
+        verbose_name_plural = "Emails (caixa de saída)"
+        indexes = [
+            models.Index(
+                fields=['proxima_tentativa', 'id'],
+                condition=models.Q(estado='pendente'),
+                name='emailsaida_pendente_idx',
+            ),
+        ]
@@ -1,10 +1,14 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.core.validators import RegexValidator, FileExtensionValidator
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from ARQUIVOS.managers import DocumentoManager
 from ARQUIVOS.models.mixins import SoftDeleteModel, AuditoriaModel
+from ARQUIVOS.models.indices import (
+    CAMPOS_CONTAGEM_DOCUMENTO, CAMPOS_BUSCA_DOCUMENTO, CAMPOS_FICHEIROS_DOCUMENTO,
+    DocumentoBusca, sincronizar_documento, sincronizar_anexo
+)
 
 class TipoDocumento(models.Model):
     """
@@ -127,15 +131,56 @@ class Documento(SoftDeleteModel, AuditoriaModel):
         delta = timezone.now() - self.data_ultima_movimentacao
         return delta.days
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Guarda a localização carregada para detetar mudanças no save()
+        instance._local_carregado = (
+            instance.__dict__.get('departamento_atual_id'),
+            instance.__dict__.get('seccao_atual_id'),
+        )
+        # E o estado de que dependem os contadores do dashboard (se não houver campos adiados)
+        if all(campo in instance.__dict__ for campo in CAMPOS_CONTAGEM_DOCUMENTO):
+            instance._estado_carregado = instance._estado_contagem()
+        # E o texto pesquisável, para só reindexar quando muda
+        if all(campo in instance.__dict__ for campo in CAMPOS_BUSCA_DOCUMENTO):
+            instance._busca_carregada = instance._texto_busca()
+        # E os ficheiros, para só agendar a extração de texto quando mudam
+        if all(campo in instance.__dict__ for campo in CAMPOS_FICHEIROS_DOCUMENTO):
+            instance._ficheiros_carregados = instance._ficheiros()
+        return instance
+
+    def _estado_contagem(self):
+        return {campo: getattr(self, campo) for campo in CAMPOS_CONTAGEM_DOCUMENTO}
+
+    def _ficheiros(self):
+        return {campo: getattr(self, campo).name or '' for campo in CAMPOS_FICHEIROS_DOCUMENTO}
+
+    def _texto_busca(self):
+        return tuple(getattr(self, campo) for campo in CAMPOS_BUSCA_DOCUMENTO)
+
+    def _estado_anterior(self):
+        if self._state.adding:
+            return None
+        estado = getattr(self, '_estado_carregado', None)
+        if estado is None:
+            estado = self.__class__.all_objects.filter(pk=self.pk).values(*CAMPOS_CONTAGEM_DOCUMENTO).first()
+        return estado
+
     def save(self, *args, **kwargs):
-        if not self.numero_protocolo:
-            super().save(*args, **kwargs)
-            ano = timezone.now().year
-            self.numero_protocolo = f"{self.pk}/{ano}"
-            # Update only the protocol field to avoid race conditions and double saves of other fields
-            self.__class__.objects.filter(pk=self.pk).update(numero_protocolo=self.numero_protocolo)
-        else:
-            super().save(*args, **kwargs)
+        with transaction.atomic():
+            anterior = self._estado_anterior()
+            if not self.numero_protocolo:
+                super().save(*args, **kwargs)
+                ano = timezone.now().year
+                self.numero_protocolo = f"{self.pk}/{ano}"
+                # Update only the protocol field to avoid race conditions and double saves of other fields
+                self.__class__.objects.filter(pk=self.pk).update(numero_protocolo=self.numero_protocolo)
+            else:
+                super().save(*args, **kwargs)
+
+            # Índices derivados, na mesma transação (visibilidade, contadores, pesquisa, ficheiros)
+            sincronizar_documento(self, anterior)
 
     def __str__(self):
         return f"{self.numero_protocolo} - {self.titulo}"
@@ -168,6 +213,14 @@ class Documento(SoftDeleteModel, AuditoriaModel):
         verbose_name = "Documento"
         verbose_name_plural = "Documentos"
         ordering = ['-data_criacao']
+        indexes = [
+            # Paginação por cursor: listagem (data_criacao, id) e arquivo morto (data_conclusao, id)
+            models.Index(fields=['-data_criacao', '-id'], name='documento_cursor_idx'),
+            models.Index(fields=['-data_conclusao', '-id'], name='documento_conclusao_idx'),
+            # Verificação de acesso aos ficheiros de media pelo nome (ARQUIVOS/downloads.py)
+            models.Index(fields=['arquivo'], name='documento_arquivo_idx'),
+            models.Index(fields=['arquivo_digitalizado'], name='documento_digitalizado_idx'),
+        ]
 
 
 class Anexo(models.Model):
@@ -184,6 +237,29 @@ class Anexo(models.Model):
     def __str__(self):
         return f"{self.documento.numero_protocolo} - {self.nome}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'arquivo' in instance.__dict__:
+            instance._arquivo_carregado = instance.arquivo.name or ''
+        return instance
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Ficheiro novo: texto para a pesquisa, miniatura e normalização (fora do pedido)
+            sincronizar_anexo(self)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            resultado = super().delete(*args, **kwargs)
+            # O texto do anexo (apagado em cascata) sai da pesquisa
+            DocumentoBusca.objects.registar_ficheiros(self.documento_id)
+        return resultado
+
     class Meta:
         verbose_name = "Anexo"
         verbose_name_plural = "Anexos"
+        indexes = [
+            models.Index(fields=['arquivo'], name='anexo_arquivo_idx'),
+        ]
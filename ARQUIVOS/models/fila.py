@@ -0,0 +1,207 @@
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, models, transaction
+from django.db.models import Count, F, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
+
+
+# ===================================================================
+# Fila de tarefas em segundo plano (tabela no próprio banco)
+# ===================================================================
+#
+# As views gravam a tarefa na mesma transação dos dados (se o pedido
+# falhar, a tarefa não existe); `manage.py sga_worker` executa-as fora do
+# pedido. Ver ARQUIVOS/fila.py.
+
+# Segundos que uma tarefa pode ficar reservada antes de voltar à fila
+# (o processo que a tinha morreu ou ficou preso)
+DURACAO_RESERVA = 600
+BACKOFF_BASE = 10
+BACKOFF_MAXIMO = 3600
+
+
+def limites_filas():
+    """{fila: máximo de tarefas em execução em simultâneo}; filas ausentes não têm limite."""
+    return getattr(settings, 'SGA_FILAS', {})
+
+
+def _chave_bloqueio(fila):
+    # Chave do advisory lock do PostgreSQL para a reserva numa fila com limite
+    return zlib.crc32(fila.encode()) & 0x7FFFFFFF
+
+
+class EstadoTarefa(models.TextChoices):
+    PENDENTE = 'pendente', 'Pendente'
+    EM_EXECUCAO = 'em_execucao', 'Em execução'
+    CONCLUIDA = 'concluida', 'Concluída'
+    FALHADA = 'falhada', 'Falhada'
+
+
+class TarefaManager(models.Manager):
+    """Manager da fila: agendamento e reserva concorrente de tarefas."""
+
+    def agendar(self, nome, argumentos, fila, atraso=None, max_tentativas=5):
+        executar_em = timezone.now() + timedelta(seconds=atraso or 0)
+        return self.create(
+            nome=nome, fila=fila, argumentos=argumentos,
+            executar_em=executar_em, max_tentativas=max_tentativas,
+        )
+
+    def disponiveis(self, agora=None):
+        return self.filter(estado=EstadoTarefa.PENDENTE, executar_em__lte=agora or timezone.now())
+
+    def em_execucao(self, fila):
+        return self.filter(fila=fila, estado=EstadoTarefa.EM_EXECUCAO)
+
+    def reservar(self, trabalhador, filas=None, limite=1):
+        """
+        Reserva até `limite` tarefas prontas para `trabalhador`, respeitando
+        o máximo de tarefas em execução de cada fila (SGA_FILAS).
+
+        PostgreSQL: SELECT ... FOR UPDATE SKIP LOCKED, para que vários
+        processos reservem em paralelo sem se bloquearem; nas filas com
+        limite, a contagem e a reserva correm sob um advisory lock da fila.
+        Outros bancos (SQLite): UPDATE condicional linha a linha (estado
+        ainda pendente e fila abaixo do limite), atómico por instrução.
+        """
+        agora = timezone.now()
+        disponiveis = self.disponiveis(agora)
+        if filas:
+            disponiveis = disponiveis.filter(fila__in=filas)
+        filas_prontas = sorted(set(disponiveis.values_list('fila', flat=True)))
+
+        reservadas = []
+        limites = limites_filas()
+        for fila in filas_prontas:
+            vagas = limite - len(reservadas)
+            if vagas <= 0:
+                break
+            reserva = (trabalhador, fila, limites.get(fila), vagas, agora)
+            if connections[self.db].vendor == 'postgresql':
+                ids = self._reservar_postgres(*reserva)
+            else:
+                ids = self._reservar_condicional(*reserva)
+            reservadas.extend(self.filter(pk__in=ids).order_by('executar_em', 'id'))
+        return reservadas
+
+    def _marcar(self, queryset, trabalhador, agora):
+        return queryset.update(
+            estado=EstadoTarefa.EM_EXECUCAO,
+            tentativas=F('tentativas') + 1,
+            trabalhador=trabalhador,
+            iniciada_em=agora,
+            reservada_ate=agora + timedelta(seconds=DURACAO_RESERVA),
+        )
+
+    def _reservar_postgres(self, trabalhador, fila, maximo, vagas, agora):
+        with transaction.atomic(using=self.db):
+            if maximo is not None:
+                with connections[self.db].cursor() as cursor:
+                    cursor.execute('SELECT pg_advisory_xact_lock(%s)', [_chave_bloqueio(fila)])
+                vagas = min(vagas, maximo - self.em_execucao(fila).count())
+                if vagas <= 0:
+                    return []
+            ids = list(
+                self.disponiveis(agora).filter(fila=fila)
+                .order_by('executar_em', 'id')
+                .select_for_update(skip_locked=True)
+                .values_list('id', flat=True)[:vagas]
+            )
+            self._marcar(self.filter(pk__in=ids), trabalhador, agora)
+        return ids
+
+    def _reservar_condicional(self, trabalhador, fila, maximo, vagas, agora):
+        candidatas = list(
+            self.disponiveis(agora).filter(fila=fila).order_by('executar_em', 'id').values_list('id', flat=True)[:vagas]
+        )
+        ids = []
+        for pk in candidatas:
+            tarefa = self.filter(pk=pk, estado=EstadoTarefa.PENDENTE)
+            if maximo is not None:
+                ocupadas = self.em_execucao(fila).order_by().values('fila').annotate(n=Count('id')).values('n')
+                tarefa = tarefa.filter(GreaterThan(Value(maximo), Coalesce(Subquery(ocupadas), 0)))
+            if self._marcar(tarefa, trabalhador, agora):
+                ids.append(pk)
+            elif maximo is not None and self.em_execucao(fila).count() >= maximo:
+                break
+        return ids
+
+    def recuperar_expiradas(self):
+        """Devolve à fila (ou dá como falhadas) as tarefas cuja reserva expirou."""
+        expiradas = self.filter(estado=EstadoTarefa.EM_EXECUCAO, reservada_ate__lt=timezone.now())
+        falhadas = expiradas.filter(tentativas__gte=F('max_tentativas')).update(
+            estado=EstadoTarefa.FALHADA, erro='Reserva expirada', data_conclusao=timezone.now()
+        )
+        devolvidas = expiradas.update(estado=EstadoTarefa.PENDENTE, trabalhador='', reservada_ate=None)
+        return falhadas + devolvidas
+
+    def limpar(self, dias=7):
+        """Apaga as tarefas concluídas há mais de `dias` dias (as falhadas ficam para análise)."""
+        limite = timezone.now() - timedelta(days=dias)
+        return self.filter(estado=EstadoTarefa.CONCLUIDA, data_conclusao__lt=limite).delete()[0]
+
+
+class Tarefa(models.Model):
+    """
+    Tarefa em segundo plano: nome da função registada (ARQUIVOS/tarefas.py),
+    argumentos JSON, fila, tentativas e próxima execução.
+    """
+    nome = models.CharField(max_length=100)
+    fila = models.CharField(max_length=50, default='default')
+    argumentos = models.JSONField(default=dict, blank=True)
+    estado = models.CharField(max_length=15, choices=EstadoTarefa.choices, default=EstadoTarefa.PENDENTE)
+    tentativas = models.PositiveIntegerField(default=0)
+    max_tentativas = models.PositiveIntegerField(default=5)
+    executar_em = models.DateTimeField(default=timezone.now)
+    trabalhador = models.CharField(max_length=100, blank=True)
+    iniciada_em = models.DateTimeField(null=True, blank=True)
+    reservada_ate = models.DateTimeField(null=True, blank=True)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_conclusao = models.DateTimeField(null=True, blank=True)
+    erro = models.TextField(blank=True)
+
+    objects = TarefaManager()
+
+    def __str__(self):
+        return f"{self.nome} [{self.fila}] ({self.estado})"
+
+    def concluir(self):
+        self.estado = EstadoTarefa.CONCLUIDA
+        self.data_conclusao = timezone.now()
+        self.reservada_ate = None
+        self.erro = ''
+        self.save(update_fields=['estado', 'data_conclusao', 'reservada_ate', 'erro'])
+
+    def falhar(self, erro):
+        """
+        Regista a falha. Com tentativas restantes volta à fila com atraso
+        exponencial (BACKOFF_BASE * 2^(n-1) segundos, até BACKOFF_MAXIMO);
+        senão fica como falhada.
+        """
+        self.erro = erro[-5000:]
+        self.reservada_ate = None
+        if self.tentativas < self.max_tentativas:
+            atraso = min(BACKOFF_MAXIMO, BACKOFF_BASE * 2 ** max(self.tentativas - 1, 0))
+            self.estado = EstadoTarefa.PENDENTE
+            self.executar_em = timezone.now() + timedelta(seconds=atraso)
+        else:
+            self.estado = EstadoTarefa.FALHADA
+            self.data_conclusao = timezone.now()
+        self.save(update_fields=['estado', 'erro', 'reservada_ate', 'executar_em', 'data_conclusao'])
+
+    class Meta:
+        verbose_name = "Tarefa"
+        verbose_name_plural = "Tarefas"
+        indexes = [
+            # Reserva: pendentes prontas por fila, pela ordem de execução
+            models.Index(
+                fields=['fila', 'executar_em', 'id'],
+                condition=Q(estado='pendente'),
+                name='tarefa_pendente_idx',
+            ),
+            models.Index(fields=['estado', 'reservada_ate'], name='tarefa_estado_idx'),
+        ]
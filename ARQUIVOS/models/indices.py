@@ -0,0 +1,884 @@
+from collections import Counter, defaultdict
+
+from django.db import models, transaction
+from django.db.models import Q, F
+from django.utils import timezone
+
+from ARQUIVOS.busca import CAMPOS_APROXIMADOS, campos_indexados, campos_aproximados, motor, termos, trigramas
+from ARQUIVOS.models.conteudo import NormalizacaoFicheiro, Previa
+
+
+# Campos de que dependem os contadores (snapshot guardado em from_db)
+CAMPOS_CONTAGEM_DOCUMENTO = (
+    'administracao_id', 'departamento_origem_id', 'departamento_atual_id',
+    'seccao_atual_id', 'data_criacao', 'status', 'is_deleted',
+)
+CAMPOS_CONTAGEM_MOVIMENTACAO = (
+    'tipo_movimentacao', 'confirmado_recebimento', 'data_movimentacao', 'data_confirmacao',
+    'departamento_origem_id', 'seccao_origem_id', 'departamento_destino_id', 'seccao_destino_id',
+)
+ESTADOS_FINAIS = ('despacho', 'aprovado', 'reprovado', 'arquivado')
+# Campos copiados para o índice de pesquisa (DocumentoBusca)
+CAMPOS_BUSCA_DOCUMENTO = ('titulo', 'numero_protocolo', 'tags', 'conteudo', 'utente', 'referencia')
+# Ficheiros do documento cujo texto é extraído para a pesquisa (TextoExtraido)
+CAMPOS_FICHEIROS_DOCUMENTO = ('arquivo', 'arquivo_digitalizado')
+
+
+class VisibilidadeDocumentoManager(models.Manager):
+    """Manager para manter e consultar o índice de visibilidade."""
+
+    def registar(self, pares):
+        """
+        Regista que cada (documento_id, departamento_id, seccao_id) passou pela unidade.
+        Linhas já existentes são ignoradas (INSERT ... ON CONFLICT DO NOTHING).
+        Devolve as linhas novas, para os contadores de visibilidade.
+        """
+        linhas = {}
+        for documento_id, departamento_id, seccao_id in pares:
+            if not documento_id:
+                continue
+            if departamento_id:
+                linhas[(documento_id, departamento_id, None)] = None
+            if seccao_id:
+                linhas[(documento_id, None, seccao_id)] = None
+
+        if not linhas:
+            return []
+
+        existentes = set(
+            self.filter(documento_id__in={doc_id for doc_id, _, _ in linhas})
+            .values_list('documento_id', 'departamento_id', 'seccao_id')
+        )
+        novas = [linha for linha in linhas if linha not in existentes]
+        self.bulk_create(
+            [
+                self.model(documento_id=doc_id, departamento_id=dept_id, seccao_id=sec_id)
+                for doc_id, dept_id, sec_id in novas
+            ],
+            ignore_conflicts=True,
+        )
+        return novas
+
+    def registar_movimentacoes(self, movimentacoes):
+        """Regista origem e destino de cada movimentação."""
+        pares = []
+        for mov in movimentacoes:
+            pares.append((mov.documento_id, mov.departamento_origem_id, mov.seccao_origem_id))
+            pares.append((mov.documento_id, mov.departamento_destino_id, mov.seccao_destino_id))
+        return self.registar(pares)
+
+    def da_mesma_administracao(self):
+        """Linhas cuja unidade é da administração do próprio documento (as que para_usuario considera)."""
+        return self.filter(
+            Q(departamento__administracao=F('documento__administracao')) |
+            Q(seccao__departamento__administracao=F('documento__administracao'))
+        )
+
+    def documentos_da_seccao(self, seccao):
+        """IDs de documentos que alguma vez estiveram na secção (para usar em pk__in)."""
+        return self.filter(seccao=seccao).values('documento_id')
+
+    def documentos_do_departamento(self, departamento):
+        """IDs de documentos que alguma vez estiveram no departamento (para usar em pk__in)."""
+        return self.filter(departamento=departamento).values('documento_id')
+
+
+class VisibilidadeDocumento(models.Model):
+    """
+    Índice materializado de visibilidade: cada Secção ou Departamento que
+    alguma vez teve o documento (origem, destino ou localização atual).
+
+    É escrito na mesma transação de cada MovimentacaoDocumento e substitui o
+    OR-join sobre movimentacoes + DISTINCT em DocumentoManager.para_usuario.
+    Pode ser reconstruído com `manage.py reconstruir_indices`.
+    """
+    documento = models.ForeignKey('Documento', on_delete=models.CASCADE, related_name='visibilidades')
+    departamento = models.ForeignKey(
+        'Departamento',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='visibilidades'
+    )
+    seccao = models.ForeignKey(
+        'Seccoes',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='visibilidades'
+    )
+
+    objects = VisibilidadeDocumentoManager()
+
+    def __str__(self):
+        unidade = self.seccao or self.departamento
+        return f"{self.documento_id} -> {unidade}"
+
+    class Meta:
+        verbose_name = "Visibilidade de Documento"
+        verbose_name_plural = "Visibilidades de Documentos"
+        constraints = [
+            # Cada linha é de UMA unidade: departamento OU secção
+            models.CheckConstraint(
+                check=(
+                    Q(departamento__isnull=False, seccao__isnull=True) |
+                    Q(departamento__isnull=True, seccao__isnull=False)
+                ),
+                name='visibilidade_uma_unidade',
+            ),
+            # Os índices únicos servem também a consulta (unidade -> documentos)
+            models.UniqueConstraint(fields=['departamento', 'documento'], name='visibilidade_unica_departamento'),
+            models.UniqueConstraint(fields=['seccao', 'documento'], name='visibilidade_unica_seccao'),
+        ]
+
+
+class PendenciaAbertaManager(models.Manager):
+    """Manager para manter e consultar as pendências abertas."""
+
+    @staticmethod
+    def _esta_aberta(movimentacao):
+        return (
+            movimentacao.tipo_movimentacao == 'encaminhamento' and
+            not movimentacao.confirmado_recebimento
+        )
+
+    def _de_movimentacao(self, movimentacao):
+        return self.model(
+            movimentacao_id=movimentacao.pk,
+            documento_id=movimentacao.documento_id,
+            departamento_destino_id=movimentacao.departamento_destino_id,
+            seccao_destino_id=movimentacao.seccao_destino_id,
+            data_movimentacao=movimentacao.data_movimentacao,
+        )
+
+    def registar_movimentacoes(self, movimentacoes):
+        """
+        Aplica movimentações NOVAS: qualquer movimentação posterior torna
+        obsoleta a pendência anterior do mesmo documento, e a última
+        movimentação de cada documento abre pendência se for um
+        encaminhamento por confirmar.
+        """
+        ultimas = {}
+        for mov in sorted(movimentacoes, key=lambda m: m.pk):
+            ultimas[mov.documento_id] = mov
+
+        if not ultimas:
+            return
+
+        self.filter(documento_id__in=list(ultimas)).delete()
+        self.bulk_create([
+            self._de_movimentacao(mov)
+            for mov in ultimas.values()
+            if self._esta_aberta(mov)
+        ])
+
+    def sincronizar(self, movimentacao, criada):
+        """Mantém a pendência coerente após gravar uma movimentação."""
+        if criada:
+            self.registar_movimentacoes([movimentacao])
+            return
+
+        # Edição de uma movimentação existente (ex.: confirmação de recebimento,
+        # ou a movimentação de criação convertida em encaminhamento)
+        aberta = self._esta_aberta(movimentacao) and not movimentacao.__class__.objects.filter(
+            documento_id=movimentacao.documento_id,
+            pk__gt=movimentacao.pk
+        ).exists()
+
+        if aberta:
+            nova = self._de_movimentacao(movimentacao)
+            self.update_or_create(
+                movimentacao_id=movimentacao.pk,
+                defaults={
+                    'documento_id': nova.documento_id,
+                    'departamento_destino_id': nova.departamento_destino_id,
+                    'seccao_destino_id': nova.seccao_destino_id,
+                    'data_movimentacao': nova.data_movimentacao,
+                }
+            )
+        else:
+            self.filter(movimentacao_id=movimentacao.pk).delete()
+
+    def da_unidade(self, seccao=None, departamento=None):
+        """Pendências abertas de uma secção (prioritária) ou de um departamento."""
+        if seccao:
+            return self.filter(seccao_destino=seccao)
+        if departamento:
+            return self.filter(departamento_destino=departamento)
+        return self.none()
+
+    def movimentacoes_da_unidade(self, seccao=None, departamento=None):
+        """Movimentações pendentes (queryset de MovimentacaoDocumento) de uma unidade."""
+        from ARQUIVOS.models.movimentacao import MovimentacaoDocumento
+
+        if seccao:
+            return MovimentacaoDocumento.objects.filter(pendencia_aberta__seccao_destino=seccao)
+        if departamento:
+            return MovimentacaoDocumento.objects.filter(pendencia_aberta__departamento_destino=departamento)
+        return MovimentacaoDocumento.objects.none()
+
+
+class PendenciaAberta(models.Model):
+    """
+    Encaminhamentos por confirmar que ainda não tiveram andamento posterior.
+
+    No máximo uma por documento (a última movimentação). Atualizada quando o
+    documento é encaminhado ou o recebimento é confirmado, substituindo o
+    Exists(movimentacoes_futuras) usado nas listagens e contagens.
+    """
+    movimentacao = models.OneToOneField(
+        'MovimentacaoDocumento',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='pendencia_aberta'
+    )
+    documento = models.ForeignKey('Documento', on_delete=models.CASCADE, related_name='pendencias_abertas')
+    departamento_destino = models.ForeignKey(
+        'Departamento',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='pendencias_abertas'
+    )
+    seccao_destino = models.ForeignKey(
+        'Seccoes',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='pendencias_abertas'
+    )
+    data_movimentacao = models.DateTimeField()
+
+    objects = PendenciaAbertaManager()
+
+    def __str__(self):
+        return f"Pendência {self.movimentacao_id} (documento {self.documento_id})"
+
+    class Meta:
+        verbose_name = "Pendência Aberta"
+        verbose_name_plural = "Pendências Abertas"
+        indexes = [
+            models.Index(fields=['seccao_destino', '-data_movimentacao'], name='pendencia_seccao_idx'),
+            models.Index(fields=['departamento_destino', '-data_movimentacao'], name='pendencia_dept_idx'),
+        ]
+
+
+def chave_unidade(departamento_id=None, seccao_id=None):
+    """Chave de unidade dos contadores: a secção tem prioridade sobre o departamento."""
+    if seccao_id:
+        return f'seccao_{seccao_id}'
+    if departamento_id:
+        return f'departamento_{departamento_id}'
+    return None
+
+
+def _unidades(departamento_id, seccao_id):
+    """Todas as unidades atingidas (um filtro por departamento também apanha as suas secções)."""
+    return [
+        chave for chave in (chave_unidade(departamento_id=departamento_id), chave_unidade(seccao_id=seccao_id))
+        if chave
+    ]
+
+
+def _dia(data):
+    return timezone.localdate(data) if data else None
+
+
+def contribuicoes_documento(estado):
+    """Contadores que dependem só do próprio documento."""
+    contagem = Counter()
+    if not estado or estado['is_deleted']:
+        return contagem
+
+    if estado['departamento_origem_id'] and estado['data_criacao']:
+        contagem[(chave_unidade(departamento_id=estado['departamento_origem_id']),
+                  _dia(estado['data_criacao']), 'registado')] += 1
+
+    # Na posse: na secção, ou no departamento sem secção atribuída
+    posse = chave_unidade(estado['departamento_atual_id'], estado['seccao_atual_id'])
+    if posse:
+        contagem[(posse, None, 'posse')] += 1
+
+    # Visibilidade dos administradores (toda a administração / todo o sistema)
+    for unidade in (f"administracao_{estado['administracao_id']}", 'global'):
+        for metrica, valor in peso_documento(estado).items():
+            contagem[(unidade, None, metrica)] += valor
+    return contagem
+
+
+def peso_documento(estado):
+    """Quanto o documento conta em cada unidade que o vê (VisibilidadeDocumento)."""
+    if not estado or estado['is_deleted']:
+        return Counter()
+    peso = Counter(visivel=1)
+    if estado['status'] in ESTADOS_FINAIS:
+        peso['finalizado'] = 1
+    return peso
+
+
+def contribuicoes_movimentacao(estado):
+    """Contadores diários de uma movimentação (encaminhados, pendentes e recebidos)."""
+    contagem = Counter()
+    if not estado:
+        return contagem
+
+    destinos = _unidades(estado['departamento_destino_id'], estado['seccao_destino_id'])
+    if estado['tipo_movimentacao'] == 'encaminhamento':
+        dia = _dia(estado['data_movimentacao'])
+        for unidade in _unidades(estado['departamento_origem_id'], estado['seccao_origem_id']):
+            contagem[(unidade, dia, 'encaminhado')] += 1
+        if not estado['confirmado_recebimento']:
+            for unidade in destinos:
+                contagem[(unidade, dia, 'pendente')] += 1
+
+    if estado['confirmado_recebimento']:
+        dia = _dia(estado['data_confirmacao'] or estado['data_movimentacao'])
+        for unidade in destinos:
+            contagem[(unidade, dia, 'recebido')] += 1
+    return contagem
+
+
+def contribuicoes_visibilidade(linhas, peso, administracao_id, administracoes):
+    """
+    Aplica o peso do documento a cada linha (documento, departamento, secção)
+    de visibilidade. Como em para_usuario, só contam as unidades da própria
+    administração do documento (`administracoes`: {unidade: administracao_id}).
+    """
+    contagem = Counter()
+    for _, departamento_id, seccao_id in linhas:
+        unidade = chave_unidade(departamento_id, seccao_id)
+        if administracoes.get(unidade) != administracao_id:
+            continue
+        for metrica, valor in peso.items():
+            contagem[(unidade, None, metrica)] += valor
+    return contagem
+
+
+def calcular_contadores(documentos, movimentacoes, visibilidades):
+    """
+    Recalcula todos os contadores de raiz.
+    `documentos` e `movimentacoes` são dicts com os CAMPOS_CONTAGEM_*;
+    `visibilidades` são tuplos (departamento_id, seccao_id, is_deleted, status)
+    só das unidades da administração do documento
+    (VisibilidadeDocumento.objects.da_mesma_administracao()).
+    """
+    contagem = Counter()
+    for estado in documentos:
+        contagem.update(contribuicoes_documento(estado))
+    for estado in movimentacoes:
+        contagem.update(contribuicoes_movimentacao(estado))
+    for departamento_id, seccao_id, is_deleted, status in visibilidades:
+        unidade = chave_unidade(departamento_id, seccao_id)
+        for metrica, valor in peso_documento({'is_deleted': is_deleted, 'status': status}).items():
+            contagem[(unidade, None, metrica)] += valor
+    return contagem
+
+
+def _diferenca(depois, antes):
+    delta = Counter(depois)
+    delta.subtract(antes)
+    return delta
+
+
+class ContadorUnidadeManager(models.Manager):
+    """Manager para manter e ler os contadores por unidade."""
+
+    def incrementar(self, deltas):
+        """
+        Soma cada delta {(unidade, dia, metrica): valor} com UPDATE ... SET valor = valor + n,
+        num número fixo de consultas (qualquer que seja o número de unidades):
+        cria as linhas em falta (INSERT ... ON CONFLICT DO NOTHING), bloqueia-as
+        e soma com um UPDATE por valor de delta.
+        """
+        deltas = {chave: valor for chave, valor in deltas.items() if valor and chave[0]}
+        if not deltas:
+            return
+
+        filtro = Q(pk__in=[])
+        for unidade, dia, metrica in deltas:
+            filtro |= Q(unidade=unidade, dia=dia, metrica=metrica)
+
+        with transaction.atomic():
+            self.bulk_create(
+                [self.model(unidade=unidade, dia=dia, metrica=metrica) for unidade, dia, metrica in deltas],
+                ignore_conflicts=True,
+            )
+            # Bloqueio por ordem fixa das chaves para evitar deadlocks entre transações concorrentes
+            linhas = self.filter(filtro).order_by('unidade', 'dia', 'metrica').select_for_update()
+            por_valor = defaultdict(list)
+            for pk, unidade, dia, metrica in linhas.values_list('pk', 'unidade', 'dia', 'metrica'):
+                por_valor[deltas[(unidade, dia, metrica)]].append(pk)
+            for valor, pks in sorted(por_valor.items()):
+                self.filter(pk__in=pks).update(valor=F('valor') + valor)
+
+    @staticmethod
+    def administracoes_das_unidades(linhas):
+        """{unidade: administracao_id} das unidades das linhas (documento, departamento, secção)."""
+        Departamento = VisibilidadeDocumento._meta.get_field('departamento').related_model
+        Seccoes = VisibilidadeDocumento._meta.get_field('seccao').related_model
+
+        departamentos = {departamento_id for _, departamento_id, _ in linhas if departamento_id}
+        seccoes = {seccao_id for _, _, seccao_id in linhas if seccao_id}
+        administracoes = {}
+        if departamentos:
+            for pk, administracao_id in Departamento.objects.filter(pk__in=departamentos).values_list(
+                'pk', 'administracao_id'
+            ):
+                administracoes[chave_unidade(departamento_id=pk)] = administracao_id
+        if seccoes:
+            for pk, administracao_id in Seccoes.objects.filter(pk__in=seccoes).values_list(
+                'pk', 'departamento__administracao_id'
+            ):
+                administracoes[chave_unidade(seccao_id=pk)] = administracao_id
+        return administracoes
+
+    def registar_documento(self, documento_id, anterior, estado, visibilidades_novas=()):
+        """Aplica a mudança de estado de um documento (anterior=None para documentos novos)."""
+        deltas = _diferenca(contribuicoes_documento(estado), contribuicoes_documento(anterior))
+
+        peso = peso_documento(estado)
+        existentes = []
+        if anterior is not None and (
+            peso != peso_documento(anterior) or estado['administracao_id'] != anterior['administracao_id']
+        ):
+            # O documento passou a contar de outra forma nas unidades que já o viam
+            novas = set(visibilidades_novas)
+            existentes = [
+                linha for linha in VisibilidadeDocumento.objects.filter(documento_id=documento_id)
+                .values_list('documento_id', 'departamento_id', 'seccao_id')
+                if linha not in novas
+            ]
+        if not existentes and not visibilidades_novas:
+            self.incrementar(deltas)
+            return
+
+        administracoes = self.administracoes_das_unidades([*existentes, *visibilidades_novas])
+        if existentes:
+            deltas.update(contribuicoes_visibilidade(existentes, peso, estado['administracao_id'], administracoes))
+            deltas.subtract(contribuicoes_visibilidade(
+                existentes, peso_documento(anterior), anterior['administracao_id'], administracoes
+            ))
+        deltas.update(contribuicoes_visibilidade(visibilidades_novas, peso, estado['administracao_id'], administracoes))
+        self.incrementar(deltas)
+
+    def registar_movimentacao(self, anterior, estado):
+        """Aplica a criação (anterior=None) ou edição de uma movimentação."""
+        self.incrementar(_diferenca(contribuicoes_movimentacao(estado), contribuicoes_movimentacao(anterior)))
+
+    def registar_visibilidades(self, linhas):
+        """Conta os documentos nas unidades que os passaram a ver."""
+        if not linhas:
+            return
+        Documento = VisibilidadeDocumento._meta.get_field('documento').related_model
+        estados = {
+            pk: {'is_deleted': is_deleted, 'status': status, 'administracao_id': administracao_id}
+            for pk, is_deleted, status, administracao_id in Documento.all_objects.filter(
+                pk__in={linha[0] for linha in linhas}
+            ).values_list('pk', 'is_deleted', 'status', 'administracao_id')
+        }
+        administracoes = self.administracoes_das_unidades(linhas)
+        deltas = Counter()
+        for linha in linhas:
+            estado = estados.get(linha[0])
+            if estado:
+                deltas.update(contribuicoes_visibilidade(
+                    [linha], peso_documento(estado), estado['administracao_id'], administracoes
+                ))
+        self.incrementar(deltas)
+
+    def valores(self, unidades, dia):
+        """{(unidade, metrica): valor} das métricas do dia e dos totais correntes, numa só consulta."""
+        linhas = self.filter(unidade__in=[u for u in unidades if u]).filter(
+            Q(dia=dia) | Q(dia__isnull=True)
+        ).values_list('unidade', 'metrica', 'valor')
+        return {(unidade, metrica): valor for unidade, metrica, valor in linhas}
+
+    def unidade_de_visibilidade(self, user):
+        """
+        Unidade cujos contadores 'visivel'/'finalizado' equivalem a
+        Documento.objects.para_usuario(user): os das secções e departamentos
+        só contam documentos da sua administração. None no fallback (criado_por).
+        """
+        from ARQUIVOS.managers import NIVEIS_ADMIN_DOCUMENTOS
+
+        if user.nivel_acesso == 'admin_sistema':
+            return 'global'
+        if not user.administracao:
+            return 'nenhuma'
+        if user.is_superuser or user.nivel_acesso in NIVEIS_ADMIN_DOCUMENTOS:
+            return f'administracao_{user.administracao_id}'
+        if getattr(user, 'seccao', None):
+            return chave_unidade(seccao_id=user.seccao_id)
+        if getattr(user, 'departamento', None):
+            return chave_unidade(departamento_id=user.departamento_id)
+        return None
+
+
+class ContadorUnidade(models.Model):
+    """
+    Contadores do dashboard por unidade, dia e métrica.
+
+    `unidade` é 'seccao_<id>', 'departamento_<id>', 'administracao_<id>' ou
+    'global'. Com `dia` preenchido são contagens diárias (registado,
+    encaminhado, pendente, recebido); com `dia` nulo são totais correntes
+    (posse, visivel, finalizado). Atualizados na mesma transação que grava
+    Documento e MovimentacaoDocumento; reconstruídos com
+    `manage.py reconstruir_indices`.
+    """
+    unidade = models.CharField(max_length=40)
+    dia = models.DateField(null=True, blank=True)
+    metrica = models.CharField(max_length=20)
+    valor = models.IntegerField(default=0)
+
+    objects = ContadorUnidadeManager()
+
+    def __str__(self):
+        return f"{self.unidade} {self.dia or 'total'} {self.metrica}={self.valor}"
+
+    class Meta:
+        verbose_name = "Contador de Unidade"
+        verbose_name_plural = "Contadores de Unidades"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['unidade', 'metrica', 'dia'],
+                condition=Q(dia__isnull=False),
+                name='contador_unico_diario',
+            ),
+            models.UniqueConstraint(
+                fields=['unidade', 'metrica'],
+                condition=Q(dia__isnull=True),
+                name='contador_unico_total',
+            ),
+        ]
+
+
+class DocumentoBuscaManager(models.Manager):
+    """Manager para manter o índice de pesquisa de texto integral e aproximada."""
+
+    @staticmethod
+    def _campos(valores):
+        """Colunas de DocumentoBusca a partir de {campo do Documento: valor}."""
+        return {
+            **campos_indexados(
+                valores['titulo'], valores['numero_protocolo'], valores['tags'], valores['conteudo']
+            ),
+            **campos_aproximados(valores['numero_protocolo'], valores['utente'], valores['referencia']),
+        }
+
+    def registar(self, documento):
+        """Grava (ou atualiza) o texto pesquisável de um documento."""
+        campos = self._campos({campo: getattr(documento, campo) for campo in CAMPOS_BUSCA_DOCUMENTO})
+
+        if not motor(self.db).trigramas_proprios:
+            self.update_or_create(documento_id=documento.pk, defaults=campos)
+            return
+
+        anteriores = self.filter(documento_id=documento.pk).values(*CAMPOS_APROXIMADOS).first()
+        self.update_or_create(documento_id=documento.pk, defaults=campos)
+        TrigramaDocumento.objects.registar(documento.pk, campos, anteriores)
+
+    def registar_ficheiros(self, documento_id):
+        """Atualiza o texto extraído dos ficheiros do documento (ver extracao.py)."""
+        texto = TextoExtraido.objects.texto_dos_documentos([documento_id]).get(documento_id, '')
+        self.filter(documento_id=documento_id).update(ficheiros=texto)
+
+    def registar_lote(self, linhas):
+        """
+        Substitui as linhas de um lote de (documento_id, *CAMPOS_BUSCA_DOCUMENTO).
+        Usado na reconstrução do índice.
+        """
+        novas = [
+            self.model(documento_id=linha[0], **self._campos(dict(zip(CAMPOS_BUSCA_DOCUMENTO, linha[1:]))))
+            for linha in linhas
+        ]
+        ficheiros = TextoExtraido.objects.texto_dos_documentos([linha.documento_id for linha in novas])
+        ids = [linha.documento_id for linha in novas]
+        for linha in novas:
+            linha.ficheiros = ficheiros.get(linha.documento_id, '')
+        self.filter(documento_id__in=ids).delete()
+        self.bulk_create(novas)
+
+        if motor(self.db).trigramas_proprios:
+            TrigramaDocumento.objects.filter(documento_id__in=ids).delete()
+            TrigramaDocumento.objects.bulk_create(
+                [
+                    trigrama
+                    for linha in novas
+                    for trigrama in TrigramaDocumento.objects.linhas(
+                        linha.documento_id, {campo: getattr(linha, campo) for campo in CAMPOS_APROXIMADOS}
+                    )
+                ],
+                batch_size=2000,
+            )
+
+
+class DocumentoBusca(models.Model):
+    """
+    Texto pesquisável de cada documento, normalizado (minúsculas, sem
+    acentos). É a base do índice de texto integral do banco: tsvector + GIN
+    no PostgreSQL, FTS5 no SQLite (ver ARQUIVOS/busca.py).
+
+    Guarda também protocolo, utente e referência para a pesquisa aproximada
+    (pg_trgm no PostgreSQL, TrigramaDocumento nos outros bancos).
+
+    Escrito no save() do Documento quando algum destes campos muda;
+    reconstruído com `manage.py reconstruir_indices`.
+    """
+    documento = models.OneToOneField(
+        'Documento',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='busca'
+    )
+    titulo = models.TextField(blank=True)
+    tags = models.TextField(blank=True)
+    conteudo = models.TextField(blank=True)
+    # Texto extraído dos ficheiros e anexos (TextoExtraido)
+    ficheiros = models.TextField(blank=True)
+
+    # Pesquisa aproximada (trigramas)
+    protocolo = models.TextField(blank=True)
+    utente = models.TextField(blank=True)
+    referencia = models.TextField(blank=True)
+
+    objects = DocumentoBuscaManager()
+
+    def __str__(self):
+        return f"{self.documento_id}: {self.titulo}"
+
+    class Meta:
+        verbose_name = "Índice de Pesquisa de Documento"
+        verbose_name_plural = "Índices de Pesquisa de Documentos"
+
+
+class TrigramaDocumentoManager(models.Manager):
+    """Manager do índice de trigramas usado quando o banco não tem pg_trgm."""
+
+    def linhas(self, documento_id, campos):
+        """Linhas (por gravar) dos trigramas de {campo: valor normalizado}."""
+        return [
+            self.model(documento_id=documento_id, campo=campo, trigrama=trigrama)
+            for campo, valor in campos.items()
+            for trigrama in trigramas(valor)
+        ]
+
+    def registar(self, documento_id, campos, anteriores=None):
+        """Reescreve os trigramas dos campos aproximados que mudaram."""
+        mudados = {
+            campo: campos[campo]
+            for campo in CAMPOS_APROXIMADOS
+            if anteriores is None or anteriores[campo] != campos[campo]
+        }
+        if not mudados:
+            return
+        if anteriores is not None:
+            self.filter(documento_id=documento_id, campo__in=list(mudados)).delete()
+        self.bulk_create(self.linhas(documento_id, mudados))
+
+
+class TrigramaDocumento(models.Model):
+    """
+    Índice de trigramas do protocolo, utente e referência de cada documento,
+    para a pesquisa aproximada em bancos sem pg_trgm (SQLite). No PostgreSQL
+    fica vazio: os índices GIN gin_trgm_ops sobre DocumentoBusca substituem-no.
+    """
+    documento = models.ForeignKey('Documento', on_delete=models.CASCADE, related_name='trigramas')
+    campo = models.CharField(max_length=20)
+    trigrama = models.CharField(max_length=3)
+
+    objects = TrigramaDocumentoManager()
+
+    def __str__(self):
+        return f"{self.documento_id} {self.campo} '{self.trigrama}'"
+
+    class Meta:
+        verbose_name = "Trigrama de Documento"
+        verbose_name_plural = "Trigramas de Documentos"
+        indexes = [
+            models.Index(fields=['campo', 'trigrama'], name='trigrama_documento_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['documento', 'campo', 'trigrama'], name='trigrama_unico'),
+        ]
+
+
+class EstadoExtracao(models.TextChoices):
+    PENDENTE = 'pendente', 'Pendente'
+    EXTRAIDO = 'extraido', 'Texto extraído'
+    SEM_TEXTO = 'sem_texto', 'Sem texto'
+    ERRO = 'erro', 'Erro'
+
+
+class TextoExtraidoManager(models.Manager):
+    """Manager da fila de extração de texto dos ficheiros."""
+
+    def agendar(self, documento_id, origem, ficheiro, anexo_id=None):
+        """
+        Regista o ficheiro atual de um campo como pendente de extração.
+        Sem ficheiro, remove o registo (e o texto deixa de ser pesquisável).
+        """
+        chave = {'documento_id': documento_id, 'origem': origem, 'anexo_id': anexo_id}
+        if not ficheiro:
+            if self.filter(**chave).delete()[0]:
+                DocumentoBusca.objects.registar_ficheiros(documento_id)
+            return
+        self.update_or_create(**chave, defaults={'ficheiro': ficheiro, 'estado': EstadoExtracao.PENDENTE})
+
+    def pendentes(self):
+        return self.filter(estado=EstadoExtracao.PENDENTE).order_by('data_atualizacao', 'id')
+
+    def reutilizar(self, registo, hash_conteudo):
+        """
+        Conclui sem extrair se o conteúdo já foi processado (pelo próprio
+        registo ou por outro ficheiro igual). Devolve True se reutilizou.
+        """
+        if registo.hash_conteudo == hash_conteudo and not registo.erro:
+            return registo.concluir(hash_conteudo, registo.texto, registo.metodo)
+
+        igual = self.filter(
+            hash_conteudo=hash_conteudo, estado__in=[EstadoExtracao.EXTRAIDO, EstadoExtracao.SEM_TEXTO]
+        ).exclude(pk=registo.pk).only('texto', 'metodo').first()
+        if igual is None:
+            return False
+        return registo.concluir(hash_conteudo, igual.texto, igual.metodo)
+
+    def texto_dos_documentos(self, documento_ids):
+        """{documento_id: texto normalizado de todos os ficheiros extraídos}."""
+        textos = {}
+        for documento_id, texto in self.filter(
+            documento_id__in=documento_ids, estado=EstadoExtracao.EXTRAIDO
+        ).order_by('id').values_list('documento_id', 'texto'):
+            textos.setdefault(documento_id, []).extend(termos(texto))
+        return {documento_id: ' '.join(palavras) for documento_id, palavras in textos.items()}
+
+
+class TextoExtraido(models.Model):
+    """
+    Texto extraído de um ficheiro do documento (arquivo, arquivo digitalizado
+    ou anexo), identificado pelo SHA-256 do conteúdo.
+
+    O save() do Documento/Anexo marca-o como pendente quando o ficheiro muda;
+    `manage.py extrair_textos` processa os pendentes num pool de processos e
+    acrescenta o texto a DocumentoBusca.ficheiros.
+    """
+    ORIGEM_CHOICES = [
+        ('arquivo', 'Arquivo'),
+        ('arquivo_digitalizado', 'Arquivo digitalizado'),
+        ('anexo', 'Anexo'),
+    ]
+
+    documento = models.ForeignKey('Documento', on_delete=models.CASCADE, related_name='textos_extraidos')
+    anexo = models.ForeignKey(
+        'Anexo',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='textos_extraidos'
+    )
+    origem = models.CharField(max_length=20, choices=ORIGEM_CHOICES)
+    ficheiro = models.CharField(max_length=255)
+    hash_conteudo = models.CharField(max_length=64, blank=True, db_index=True)
+    estado = models.CharField(max_length=10, choices=EstadoExtracao.choices, default=EstadoExtracao.PENDENTE)
+    metodo = models.CharField(max_length=10, blank=True)
+    texto = models.TextField(blank=True)
+    erro = models.TextField(blank=True)
+    data_atualizacao = models.DateTimeField(auto_now=True)
+
+    objects = TextoExtraidoManager()
+
+    def __str__(self):
+        return f"{self.documento_id} {self.origem}: {self.ficheiro} ({self.estado})"
+
+    def abrir(self):
+        from django.core.files.storage import default_storage
+        return default_storage.open(self.ficheiro, 'rb')
+
+    def concluir(self, hash_conteudo='', texto='', metodo='', erro=''):
+        """
+        Grava o resultado, se o ficheiro não mudou entretanto (senão fica
+        pendente para a próxima passagem), e atualiza o índice de pesquisa.
+        """
+        if erro:
+            estado = EstadoExtracao.ERRO
+        else:
+            estado = EstadoExtracao.EXTRAIDO if texto else EstadoExtracao.SEM_TEXTO
+        with transaction.atomic():
+            atualizados = TextoExtraido.objects.filter(
+                pk=self.pk, ficheiro=self.ficheiro, estado=EstadoExtracao.PENDENTE
+            ).update(
+                hash_conteudo=hash_conteudo, texto=texto, metodo=metodo, erro=erro,
+                estado=estado, data_atualizacao=timezone.now(),
+            )
+            if atualizados:
+                DocumentoBusca.objects.registar_ficheiros(self.documento_id)
+        return True
+
+    class Meta:
+        verbose_name = "Texto Extraído"
+        verbose_name_plural = "Textos Extraídos"
+        indexes = [
+            models.Index(fields=['estado', 'data_atualizacao'], name='texto_extraido_estado_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['documento', 'origem'],
+                condition=Q(anexo__isnull=True),
+                name='texto_extraido_unico_campo',
+            ),
+            models.UniqueConstraint(
+                fields=['anexo'],
+                condition=Q(anexo__isnull=False),
+                name='texto_extraido_unico_anexo',
+            ),
+        ]
+
+
+# ---------------------------------------------------------------------------
+# Sincronização (chamada uma vez pelo save() de Documento e de Anexo)
+# ---------------------------------------------------------------------------
+
+def agendar_ficheiro(documento_id, origem, nome, anexo_id=None):
+    """Ficheiro novo num campo: extração de texto, miniatura e normalização, fora do pedido."""
+    TextoExtraido.objects.agendar(documento_id, origem, nome, anexo_id=anexo_id)
+    Previa.objects.agendar(nome)
+    NormalizacaoFicheiro.objects.agendar(documento_id, origem, nome, anexo_id=anexo_id)
+
+
+def sincronizar_documento(documento, anterior):
+    """
+    Atualiza tudo o que deriva de um Documento acabado de gravar (na
+    transação do save()): visibilidade, contadores do dashboard, índice de
+    pesquisa e ficheiros a processar. Cada parte só escreve se os seus campos
+    mudaram desde o carregamento. `anterior`: estado de contagem antes do
+    save (None num documento novo).
+    """
+    # Quem tem o documento agora passa a vê-lo
+    local_atual = (documento.departamento_atual_id, documento.seccao_atual_id)
+    visibilidades_novas = []
+    if local_atual != getattr(documento, '_local_carregado', None):
+        visibilidades_novas = VisibilidadeDocumento.objects.registar([(documento.pk, *local_atual)])
+        documento._local_carregado = local_atual
+
+    estado = documento._estado_contagem()
+    ContadorUnidade.objects.registar_documento(documento.pk, anterior, estado, visibilidades_novas)
+    documento._estado_carregado = estado
+
+    texto = documento._texto_busca()
+    if texto != getattr(documento, '_busca_carregada', None):
+        DocumentoBusca.objects.registar(documento)
+        documento._busca_carregada = texto
+
+    ficheiros = documento._ficheiros()
+    anteriores = getattr(documento, '_ficheiros_carregados', {})
+    for campo, nome in ficheiros.items():
+        if nome != anteriores.get(campo, ''):
+            agendar_ficheiro(documento.pk, campo, nome)
+    documento._ficheiros_carregados = ficheiros
+
+
+def sincronizar_anexo(anexo):
+    """Agenda o processamento do ficheiro de um Anexo acabado de gravar, se mudou."""
+    nome = anexo.arquivo.name or ''
+    if nome != getattr(anexo, '_arquivo_carregado', ''):
+        agendar_ficheiro(anexo.documento_id, 'anexo', nome, anexo_id=anexo.pk)
+        anexo._arquivo_carregado = nome
@@ -1,6 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from ARQUIVOS.managers import MovimentacaoManager
+from ARQUIVOS.models.indices import CAMPOS_CONTAGEM_MOVIMENTACAO
 
 class MovimentacaoDocumento(models.Model):
     TIPO_MOVIMENTACAO_CHOICES = [
@@ -62,6 +64,8 @@ class MovimentacaoDocumento(models.Model):
         related_name='confirmacoes_movimentacao'
     )
 
+    objects = MovimentacaoManager()
+
     def clean(self):
         """Validações de negócio"""
         super().clean()
@@ -143,9 +147,38 @@ class MovimentacaoDocumento(models.Model):
                     'seccao_destino': f'A secção de destino "{self.seccao_destino.nome}" pertence a outra administração ({admin_seccao.nome}).'
                 })
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Estado de que dependem os contadores do dashboard (se não houver campos adiados)
+        if all(campo in instance.__dict__ for campo in CAMPOS_CONTAGEM_MOVIMENTACAO):
+            instance._estado_carregado = instance._estado_contagem()
+        return instance
+
+    def _estado_contagem(self):
+        return {campo: getattr(self, campo) for campo in CAMPOS_CONTAGEM_MOVIMENTACAO}
+
     def save(self, *args, **kwargs):
+        from ARQUIVOS.models.indices import VisibilidadeDocumento, PendenciaAberta, ContadorUnidade
+
         self.full_clean()
-        super().save(*args, **kwargs)
+        criada = self._state.adding
+        # Os índices desnormalizados são escritos na MESMA transação da movimentação
+        with transaction.atomic():
+            anterior = None
+            if not criada:
+                anterior = getattr(self, '_estado_carregado', None) or self.__class__.objects.filter(
+                    pk=self.pk
+                ).values(*CAMPOS_CONTAGEM_MOVIMENTACAO).first()
+
+            super().save(*args, **kwargs)
+            visibilidades_novas = VisibilidadeDocumento.objects.registar_movimentacoes([self])
+            PendenciaAberta.objects.sincronizar(self, criada)
+
+            estado = self._estado_contagem()
+            ContadorUnidade.objects.registar_movimentacao(anterior, estado)
+            ContadorUnidade.objects.registar_visibilidades(visibilidades_novas)
+            self._estado_carregado = estado
 
     @property
     def destino_completo(self):
@@ -172,3 +205,7 @@ class MovimentacaoDocumento(models.Model):
         verbose_name = "Movimentação"
         verbose_name_plural = "Movimentações"
         ordering = ['-data_movimentacao']
+        indexes = [
+            # Paginação por cursor (data_movimentacao, id)
+            models.Index(fields=['-data_movimentacao', '-id'], name='movimentacao_cursor_idx'),
+        ]
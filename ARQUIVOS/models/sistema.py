@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from ARQUIVOS.managers import NotificacaoManager
 
 class ConfiguracaoSistema(models.Model):
     """
@@ -29,6 +30,8 @@ class Notificacao(models.Model):
     data_criacao = models.DateTimeField(auto_now_add=True)
     lida = models.BooleanField(default=False)
 
+    objects = NotificacaoManager()
+
     def __str__(self):
         return f"Notificação para {self.usuario.username}: {self.mensagem[:30]}..."
 
@@ -0,0 +1,264 @@
+# ARQUIVOS/normalizacao.py
+"""
+Normalização das imagens carregadas (digitalizações e anexos em JPG/PNG).
+
+Fotografias de telemóvel e digitalizações a 600 dpi chegam com 5-20 MB
+por página, que depois são guardadas, copiadas nas cópias de segurança e
+descarregadas a cada consulta. Com SGA_NORMALIZAR_IMAGENS ativo, cada
+imagem nova fica registada (NormalizacaoFicheiro) e é processada fora do
+pedido, num pool de processos:
+
+    python manage.py normalizar_ficheiros [--processos 4] [--continuo]
+
+Em cada imagem (Pillow):
+- orientação EXIF aplicada e depois todos os metadados removidos (EXIF,
+  GPS, perfis de cor, miniaturas);
+- reamostragem para SGA_NORMALIZAR_DPI: pela resolução declarada pelo
+  digitalizador ou, sem ela (telemóveis declaram 72/96 dpi), supondo que
+  o maior lado é o de uma folha A4;
+- nova compressão: JPEG (SGA_NORMALIZAR_QUALIDADE) ou, nas imagens a
+  preto e branco, PNG de 1 bit.
+
+O resultado só substitui o original se for mais pequeno; os tamanhos antes
+e depois ficam registados. Uma digitalização enviada como várias imagens
+(uma por página) é sempre juntada num só PDF, mesmo sem a normalização
+ativa: as páginas seguintes esperam no storage (PASTA_PAGINAS) até lá.
+"""
+
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .extracao import _extensao
+
+
+DPI_PADRAO = 300
+QUALIDADE_PADRAO = 80
+# Maior lado de uma folha A4, em polegadas
+LADO_A4 = 11.69
+# Abaixo disto a resolução declarada não é do digitalizador (72/96 dpi de ecrã)
+DPI_MINIMO_DECLARADO = 100
+PASTA_PAGINAS = 'digitalizados/paginas'
+
+EXTENSOES = {'jpg', 'jpeg', 'png', 'tif', 'tiff'}
+
+
+class ErroNormalizacao(Exception):
+    """A imagem não pôde ser lida ou gravada."""
+
+
+def ativa():
+    return getattr(settings, 'SGA_NORMALIZAR_IMAGENS', False)
+
+
+def dpi():
+    return getattr(settings, 'SGA_NORMALIZAR_DPI', DPI_PADRAO)
+
+
+def qualidade():
+    return getattr(settings, 'SGA_NORMALIZAR_QUALIDADE', QUALIDADE_PADRAO)
+
+
+def normalizavel(nome):
+    return _extensao(nome) in EXTENSOES
+
+
+def descartar_paginas(paginas):
+    for nome in paginas:
+        default_storage.delete(nome)
+
+
+# ---------------------------------------------------------------------------
+# Imagens (corre nos processos do pool)
+# ---------------------------------------------------------------------------
+
+def dimensoes_alvo(largura, altura, dpi_declarado, dpi_alvo):
+    """Tamanho reamostrado (nunca maior do que o original)."""
+    if dpi_declarado and dpi_declarado >= DPI_MINIMO_DECLARADO:
+        fator = dpi_alvo / dpi_declarado
+    else:
+        fator = LADO_A4 * dpi_alvo / max(largura, altura)
+    fator = min(fator, 1.0)
+    return max(1, round(largura * fator)), max(1, round(altura * fator))
+
+
+def preparar_imagem(caminho, dpi_alvo):
+    """Imagem aberta, orientada, sem metadados e reamostrada (modo RGB, L ou 1)."""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        with Image.open(caminho) as original:
+            declarado = original.info.get('dpi', (0, 0))[0]
+            alvo = dimensoes_alvo(*original.size, declarado, dpi_alvo)
+            # JPEG: o descodificador já lê a imagem reduzida (1/2, 1/4, 1/8)
+            original.draft(original.mode, alvo)
+            imagem = ImageOps.exif_transpose(original)
+
+            if imagem.mode == '1':
+                # Reamostragem em tons de cinzento, depois de volta a 1 bit
+                imagem = imagem.convert('L')
+                bilevel = True
+            else:
+                bilevel = False
+            if imagem.mode in ('RGBA', 'LA', 'P', 'PA'):
+                # Transparência: fundo branco (o papel)
+                imagem = imagem.convert('RGBA')
+                fundo = Image.new('RGBA', imagem.size, (255, 255, 255, 255))
+                imagem = Image.alpha_composite(fundo, imagem).convert('RGB')
+            elif imagem.mode not in ('RGB', 'L'):
+                imagem = imagem.convert('RGB')
+
+            if (imagem.width > imagem.height) != (alvo[0] > alvo[1]):
+                # Rodada pela orientação EXIF
+                alvo = alvo[::-1]
+            if imagem.size != alvo:
+                imagem = imagem.resize(alvo, Image.Resampling.LANCZOS)
+            if bilevel:
+                imagem = imagem.convert('1', dither=Image.Dither.NONE)
+            # Cópia sem os metadados do original (EXIF, ICC, texto)
+            limpa = imagem.copy()
+            limpa.info = {}
+            return limpa
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as erro:
+        raise ErroNormalizacao(f'Imagem inválida: {erro}')
+
+
+def codificar_imagem(imagem, dpi_alvo, qualidade_jpeg):
+    """(bytes, extensão) da imagem: PNG se for a preto e branco, senão JPEG."""
+    saida = io.BytesIO()
+    if imagem.mode == '1':
+        imagem.save(saida, 'PNG', optimize=True, dpi=(dpi_alvo, dpi_alvo))
+        return saida.getvalue(), 'png'
+    imagem.save(
+        saida, 'JPEG', quality=qualidade_jpeg, optimize=True, progressive=True, dpi=(dpi_alvo, dpi_alvo)
+    )
+    return saida.getvalue(), 'jpg'
+
+
+def empacotar_pdf(imagens, dpi_alvo, qualidade_jpeg):
+    """PDF com uma página por imagem, do tamanho da imagem a `dpi_alvo`."""
+    saida = io.BytesIO()
+    imagens[0].save(
+        saida, 'PDF', save_all=True, append_images=imagens[1:],
+        resolution=float(dpi_alvo), quality=qualidade_jpeg,
+    )
+    return saida.getvalue()
+
+
+def normalizar(caminhos, dpi_alvo, qualidade_jpeg):
+    """(bytes, extensão) da imagem normalizada ou, com várias, do PDF com todas."""
+    imagens = [preparar_imagem(caminho, dpi_alvo) for caminho in caminhos]
+    if len(imagens) == 1:
+        return codificar_imagem(imagens[0], dpi_alvo, qualidade_jpeg)
+    return empacotar_pdf(imagens, dpi_alvo, qualidade_jpeg), 'pdf'
+
+
+def _tarefa(identificador, caminhos, dpi_alvo, qualidade_jpeg):
+    """Ponto de entrada no processo do pool: nunca propaga exceções (uma imagem inválida não interrompe o lote)."""
+    try:
+        dados, extensao = normalizar(caminhos, dpi_alvo, qualidade_jpeg)
+        return identificador, dados, extensao, ''
+    except Exception as erro:
+        return identificador, b'', '', (str(erro) or erro.__class__.__name__)[:500]
+
+
+# ---------------------------------------------------------------------------
+# Pipeline
+# ---------------------------------------------------------------------------
+
+def _instancia(registo):
+    """(objeto, campo) onde está o ficheiro do registo, relido e bloqueado (dentro de uma transação)."""
+    from ARQUIVOS.models import Anexo, Documento
+
+    # Relido aqui: o estado, o título, ... podem ter mudado enquanto o pool trabalhava
+    if registo.anexo_id:
+        return Anexo.objects.select_for_update().get(pk=registo.anexo_id), 'arquivo'
+    return Documento.all_objects.select_for_update().get(pk=registo.documento_id), registo.origem
+
+
+def _concluir(registo, dados, extensao, erro):
+    """Grava o resultado no campo, se o ficheiro não mudou entretanto, e os tamanhos."""
+    from ARQUIVOS.models import EstadoNormalizacao, NormalizacaoFicheiro
+
+    nomes = [registo.ficheiro, *registo.paginas]
+    if erro:
+        registo.estado = EstadoNormalizacao.ERRO
+        registo.erro = erro
+        registo.save(update_fields=['estado', 'erro', 'data_atualizacao'])
+        return
+
+    registo.tamanho_original = sum(default_storage.size(nome) for nome in nomes)
+    if not registo.paginas and len(dados) >= registo.tamanho_original:
+        # A imagem já estava otimizada: fica o original
+        registo.estado = EstadoNormalizacao.MANTIDO
+        registo.tamanho_final = registo.tamanho_original
+        registo.save(update_fields=['estado', 'tamanho_original', 'tamanho_final', 'data_atualizacao'])
+        return
+
+    base = os.path.splitext(registo.ficheiro)[0]
+    novo = default_storage.save(f'{base}.{extensao}', ContentFile(dados))
+    with transaction.atomic():
+        atual = NormalizacaoFicheiro.objects.select_for_update().filter(
+            pk=registo.pk, ficheiro=registo.ficheiro, estado=EstadoNormalizacao.PENDENTE
+        ).first()
+        instancia, campo = _instancia(registo) if atual is not None else (None, None)
+        if instancia is None or getattr(instancia, campo).name != registo.ficheiro:
+            # Substituído por outro envio entretanto: o resultado não serve
+            transaction.on_commit(lambda: default_storage.delete(novo))
+            return
+        registo.ficheiro_final = novo
+        registo.tamanho_final = len(dados)
+        registo.estado = EstadoNormalizacao.NORMALIZADO
+        registo.save(update_fields=['ficheiro_final', 'tamanho_original', 'tamanho_final', 'estado', 'data_atualizacao'])
+        # Só o campo do ficheiro: o save() do Documento/Anexo agenda a extração de texto e a miniatura do novo
+        setattr(instancia, campo, novo)
+        instancia.save(update_fields=[campo])
+        # O original e as páginas já estão no resultado
+        transaction.on_commit(lambda: descartar_paginas(nomes))
+
+
+def processar_pendentes(limite=50, processos=None):
+    """
+    Normaliza até `limite` registos pendentes. O Pillow corre no pool de
+    processos; a gravação dos resultados, aqui. Devolve o número tratado.
+    """
+    from ARQUIVOS.models import NormalizacaoFicheiro
+
+    pendentes = list(NormalizacaoFicheiro.objects.pendentes()[:limite])
+    if not pendentes:
+        return 0
+
+    tarefas = [
+        (registo.pk, [default_storage.path(nome) for nome in (registo.ficheiro, *registo.paginas)], dpi(), qualidade())
+        for registo in pendentes
+    ]
+    if processos == 1 or len(tarefas) == 1:
+        resultados = [_tarefa(*tarefa) for tarefa in tarefas]
+    else:
+        with ProcessPoolExecutor(max_workers=processos) as pool:
+            resultados = list(pool.map(_tarefa, *zip(*tarefas)))
+
+    por_id = {registo.pk: registo for registo in pendentes}
+    for identificador, dados, extensao, erro in resultados:
+        _concluir(por_id[identificador], dados, extensao, erro)
+    return len(pendentes)
+
+
+def registar_paginas(documento, ficheiros):
+    """
+    Digitalização enviada como várias imagens: a primeira já está em
+    arquivo_digitalizado; as seguintes ficam no storage até serem juntadas
+    num PDF. Devolve o registo, ou None se não forem todas imagens.
+    """
+    from ARQUIVOS.models import NormalizacaoFicheiro
+
+    primeira = documento.arquivo_digitalizado.name or ''
+    if not ficheiros or not normalizavel(primeira) or not all(normalizavel(f.name) for f in ficheiros):
+        return None
+    paginas = [default_storage.save(f'{PASTA_PAGINAS}/{ficheiro.name}', ficheiro) for ficheiro in ficheiros]
+    return NormalizacaoFicheiro.objects.agendar(documento.pk, 'arquivo_digitalizado', primeira, paginas=paginas)
@@ -0,0 +1,329 @@
+"""
+notificacoes.py
+===============
+
+Envio das notificações em tempo real (WebSocket) para o channel layer.
+
+Views e tarefas não chamam o channel layer diretamente:
+
+    notificar('departamento_3', 'Novo documento: 12/2026', link)
+    atualizar_pendencias('seccao_7', 'Documento 12/2026 foi recebido')
+
+Cada evento só entra no lote depois do commit da transação em que foi
+criado (transaction.on_commit): se a transação for desfeita, o evento
+perde-se com ela. O lote é aberto por pedido (NotificacoesMiddleware) ou
+por tarefa do worker e é enviado no fim, de uma só vez:
+
+- eventos repetidos para o mesmo grupo são fundidos; as atualizações de
+  pendências de um grupo ficam numa só, com a última mensagem e todas as
+  movimentações alteradas;
+- todos os group_send correm numa única passagem pelo loop assíncrono, em
+  paralelo (com channels_redis, sobre o mesmo pool de ligações), em vez de
+  um async_to_sync bloqueante por envio.
+
+Fora de um lote (ex.: shell) cada evento é enviado logo após o commit.
+
+Os eventos levam as contagens já calculadas, para que o consumer as passe
+ao browser sem ir ao banco (uma contagem por evento e por socket):
+
+- notification_message: 'contagens' = {id do utilizador: não lidas} dos
+  membros do grupo;
+- pendencia_update: 'count' = pendências abertas da unidade do grupo.
+
+Entre pedidos (vários encaminhamentos seguidos) as atualizações de
+pendências são ainda agrupadas pelo consumer, numa janela de
+SGA_JANELA_PENDENCIAS segundos por grupo (ver consumers.py).
+
+Todas as contagens do lote saem de no máximo três consultas agregadas.
+
+Sincronização por cursor (sincronizar): o cliente guarda o id da última
+notificação que recebeu e pede só as mais recentes, por WebSocket (ação
+'sync') ou HTTP (verificar_notificacoes?desde=<id>, com ETag/304).
+
+Sem WebSocket (proxies), o cliente fica em espera em
+/api/aguardar-notificacoes/ (AguardarNotificacoesConsumer): a ligação só é
+respondida quando chega um evento aos grupos do utilizador ou o tempo
+expira (inscricao / EsperaEventos).
+"""
+
+import asyncio
+import contextvars
+import logging
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import async_to_sync
+from django.db import transaction
+from django.db.models import Count, Q
+
+
+logger = logging.getLogger(__name__)
+
+_lote_atual = contextvars.ContextVar('sga_lote_notificacoes', default=None)
+
+
+class LoteNotificacoes:
+    """Eventos confirmados à espera de envio, já sem repetições."""
+
+    def __init__(self):
+        self._eventos = {}
+
+    def __len__(self):
+        return len(self._eventos)
+
+    def adicionar(self, grupo, evento):
+        if evento['type'] == 'pendencia_update':
+            # O cliente volta a ler a lista: basta a última atualização do grupo
+            chave = (grupo, evento['type'])
+            anterior = self._eventos.pop(chave, None)
+            if anterior:
+                evento = dict(evento, movimentacoes=sorted(
+                    set(anterior[1]['movimentacoes']) | set(evento['movimentacoes'])
+                ))
+        else:
+            chave = (grupo, evento['type'], evento.get('message'), evento.get('link'))
+        self._eventos[chave] = (grupo, evento)
+
+    def enviar(self):
+        eventos = list(self._eventos.values())
+        self._eventos.clear()
+        enviar_eventos(eventos)
+        return len(eventos)
+
+
+def _unidade(grupo):
+    """'seccao_7' -> ('seccao', 7); None se o grupo não for de uma unidade/utilizador."""
+    tipo, _, identificador = grupo.rpartition('_')
+    if tipo in ('user', 'seccao', 'departamento') and identificador.isdigit():
+        return tipo, int(identificador)
+    return None
+
+
+def _ids(grupos, tipo):
+    return {u[1] for u in map(_unidade, grupos) if u and u[0] == tipo}
+
+
+def contagens_nao_lidas(grupos):
+    """
+    {grupo: {str(id do utilizador): não lidas}} para os membros de cada
+    grupo (os mesmos grupos em que o consumer os inscreve), numa consulta.
+    """
+    from ARQUIVOS.models import CustomUser
+
+    utilizadores, seccoes, departamentos = _ids(grupos, 'user'), _ids(grupos, 'seccao'), _ids(grupos, 'departamento')
+    filtro = Q(pk__in=utilizadores) | Q(seccao__in=seccoes) | Q(departamento__in=departamentos) \
+        | Q(seccao__departamento__in=departamentos)
+    membros = CustomUser.objects.filter(filtro).annotate(
+        nao_lidas=Count('notificacoes', filter=Q(notificacoes__lida=False))
+    ).values_list('pk', 'seccao_id', 'departamento_id', 'seccao__departamento_id', 'nao_lidas')
+
+    contagens = {grupo: {} for grupo in grupos}
+    for pk, seccao_id, departamento_id, departamento_seccao_id, nao_lidas in membros:
+        # Mesmos grupos que NotificacaoConsumer.get_user_groups()
+        grupos_membro = [f"user_{pk}"]
+        if seccao_id:
+            grupos_membro += [f"seccao_{seccao_id}", f"departamento_{departamento_seccao_id}"]
+        elif departamento_id:
+            grupos_membro.append(f"departamento_{departamento_id}")
+        for grupo in grupos_membro:
+            if grupo in contagens:
+                contagens[grupo][str(pk)] = nao_lidas
+    return contagens
+
+
+def contagens_pendencias(grupos):
+    """{grupo: pendências abertas} para grupos 'seccao_N' / 'departamento_N' (PendenciaAberta.da_unidade)."""
+    from ARQUIVOS.models import PendenciaAberta
+
+    contagens = {}
+    for tipo, campo in (('seccao', 'seccao_destino'), ('departamento', 'departamento_destino')):
+        ids = _ids(grupos, tipo)
+        if not ids:
+            continue
+        por_unidade = dict(
+            PendenciaAberta.objects.filter(**{f'{campo}__in': ids})
+            .values(campo).annotate(n=Count('pk')).values_list(campo, 'n')
+        )
+        for identificador in ids:
+            contagens[f"{tipo}_{identificador}"] = por_unidade.get(identificador, 0)
+    return contagens
+
+
+def _acrescentar_contagens(eventos):
+    notificacoes = {grupo for grupo, evento in eventos if evento['type'] == 'notification_message'}
+    pendencias = {grupo for grupo, evento in eventos if evento['type'] == 'pendencia_update'}
+    nao_lidas = contagens_nao_lidas(notificacoes) if notificacoes else {}
+    abertas = contagens_pendencias(pendencias) if pendencias else {}
+
+    for grupo, evento in eventos:
+        evento['grupo'] = grupo
+        if evento['type'] == 'notification_message':
+            evento['contagens'] = nao_lidas.get(grupo, {})
+        elif evento['type'] == 'pendencia_update' and grupo in abertas:
+            evento['count'] = abertas[grupo]
+
+
+def enviar_eventos(eventos):
+    """
+    Acrescenta as contagens e envia [(grupo, evento), ...] ao channel layer
+    numa só passagem. Erros de envio só ficam no log.
+    """
+    from channels.layers import get_channel_layer
+
+    camada = get_channel_layer()
+    if not eventos or camada is None:
+        return
+    _acrescentar_contagens(eventos)
+
+    async def enviar_todos():
+        resultados = await asyncio.gather(
+            *(camada.group_send(grupo, evento) for grupo, evento in eventos),
+            return_exceptions=True,
+        )
+        for (grupo, evento), resultado in zip(eventos, resultados):
+            if isinstance(resultado, Exception):
+                logger.warning("Falha ao enviar %s para %s: %s", evento['type'], grupo, resultado)
+
+    async_to_sync(enviar_todos)()
+
+
+@contextmanager
+def lote():
+    """Junta os eventos confirmados dentro do bloco e envia-os à saída (reentrante)."""
+    if _lote_atual.get() is not None:
+        yield _lote_atual.get()
+        return
+
+    atual = LoteNotificacoes()
+    token = _lote_atual.set(atual)
+    try:
+        yield atual
+    finally:
+        _lote_atual.reset(token)
+        atual.enviar()
+
+
+def _publicar(grupo, evento):
+    def confirmar():
+        atual = _lote_atual.get()
+        if atual is None:
+            enviar_eventos([(grupo, evento)])
+        else:
+            atual.adicionar(grupo, evento)
+
+    transaction.on_commit(confirmar)
+
+
+def notificar(grupo, mensagem, link=''):
+    """Nova notificação para os clientes do grupo (evento notification_message)."""
+    _publicar(grupo, {'type': 'notification_message', 'message': mensagem, 'link': link})
+
+
+def atualizar_pendencias(grupo, mensagem='Pendências atualizadas', movimentacoes=()):
+    """
+    Pede aos clientes do grupo que atualizem a lista de pendências (evento
+    pendencia_update); `movimentacoes` são os ids das movimentações alteradas.
+    """
+    _publicar(grupo, {'type': 'pendencia_update', 'message': mensagem, 'movimentacoes': sorted(movimentacoes)})
+
+
+# ---------------------------------------------------------------------------
+# Sincronização por cursor
+# ---------------------------------------------------------------------------
+
+LIMITE_SINCRONIZACAO = 20
+
+
+def serializar(notificacao):
+    return {
+        'id': notificacao.id,
+        'mensagem': notificacao.mensagem,
+        'link': notificacao.link or '#',
+        'data': notificacao.data_criacao.strftime('%d/%m/%Y %H:%M') if notificacao.data_criacao else '',
+        'lida': notificacao.lida,
+    }
+
+
+def sincronizar(usuario, desde=None, estado=None):
+    """
+    Notificações não lidas posteriores ao cursor `desde` (sem cursor: as
+    mais recentes), contagem e novo cursor. Se nada mudou desde o cursor,
+    basta a consulta agregada de Notificacao.objects.estado(), que pode ser
+    passada em `estado`.
+    """
+    from ARQUIVOS.models import Notificacao
+
+    count, ultima = estado or Notificacao.objects.estado(usuario)
+    if desde is not None and ultima <= desde:
+        notificacoes = []
+    else:
+        notificacoes = [serializar(n) for n in Notificacao.objects.novas(usuario, desde, LIMITE_SINCRONIZACAO)]
+    return {
+        'count': count,
+        'cursor': max(ultima, desde or 0),
+        'notificacoes': notificacoes,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Grupos e espera de eventos
+# ---------------------------------------------------------------------------
+
+def grupos_do_usuario(usuario):
+    """Grupos do channel layer do utilizador: o próprio, a secção e o departamento (OrgSnapshot)."""
+    from ARQUIVOS.org_snapshot import obter_snapshot
+
+    grupos = [f"user_{usuario.id}"]
+    seccao = obter_snapshot().seccoes.get(usuario.seccao_id)
+    if seccao:
+        grupos.append(f"seccao_{seccao.id}")
+        grupos.append(f"departamento_{seccao.departamento_id}")
+    elif usuario.departamento_id:
+        grupos.append(f"departamento_{usuario.departamento_id}")
+    return grupos
+
+
+def grupo_pendencias(grupos):
+    """Grupo cujas pendências o utilizador vê (a secção tem prioridade sobre o departamento)."""
+    return grupos[1] if len(grupos) > 1 else None
+
+
+class EsperaEventos:
+    # Limite de eventos juntados numa resposta
+    MAXIMO = 100
+
+    def __init__(self, camada, canal):
+        self.camada = camada
+        self.canal = canal
+
+    async def _receber(self, timeout):
+        return await asyncio.wait_for(self.camada.receive(self.canal), timeout)
+
+    async def receber(self, timeout, janela):
+        """
+        Espera até `timeout` segundos pelo primeiro evento; depois junta os
+        que chegarem com menos de `janela` segundos entre si. [] se expirou.
+        """
+        eventos = []
+        try:
+            eventos.append(await self._receber(timeout))
+            while len(eventos) < self.MAXIMO:
+                eventos.append(await self._receber(janela))
+        except asyncio.TimeoutError:
+            pass
+        return eventos
+
+
+@asynccontextmanager
+async def inscricao(grupos):
+    """Canal próprio inscrito nos `grupos` enquanto dura o bloco."""
+    from channels.layers import get_channel_layer
+
+    camada = get_channel_layer()
+    canal = await camada.new_channel('aguardar.')
+    for grupo in grupos:
+        await camada.group_add(grupo, canal)
+    try:
+        yield EsperaEventos(camada, canal)
+    finally:
+        for grupo in grupos:
+            await camada.group_discard(grupo, canal)
@@ -0,0 +1,251 @@
+"""
+org_snapshot.py
+===============
+
+Fotografia (snapshot) em memória da estrutura organizacional.
+
+A estrutura (Administrações, Direções, Secções, províncias e tipo de
+município) muda raramente, mas é consultada em quase todos os pedidos.
+Este módulo carrega-a uma vez por processo para um objeto imutável com
+índices prontos a usar, e recarrega-o de forma preguiçosa quando o contador
+de versão (guardado na cache partilhada) muda.
+
+A versão é incrementada pelos sinais de save/delete (ver ARQUIVOS/signals.py).
+
+Uso:
+    snapshot = obter_snapshot()
+    snapshot.departamentos_da_administracao(admin_id)
+    snapshot.secretaria_geral(admin_id)
+"""
+
+import threading
+import time
+from types import MappingProxyType
+from typing import NamedTuple, Optional
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+# ---------------------------------------------------------------------------
+# Versão da estrutura
+# ---------------------------------------------------------------------------
+
+CHAVE_VERSAO_CACHE = 'estrutura:versao'
+
+
+def versao_estrutura():
+    """Versão atual da estrutura organizacional (partilhada entre workers)."""
+    versao = cache.get(CHAVE_VERSAO_CACHE)
+    if versao is None:
+        cache.add(CHAVE_VERSAO_CACHE, time.time_ns(), timeout=None)
+        versao = cache.get(CHAVE_VERSAO_CACHE)
+    return versao
+
+
+def _incrementar_versao():
+    try:
+        cache.incr(CHAVE_VERSAO_CACHE)
+    except ValueError:
+        # Chave expulsa da cache: um valor novo nunca colide com versões antigas
+        cache.set(CHAVE_VERSAO_CACHE, time.time_ns(), timeout=None)
+
+
+def invalidar_estrutura():
+    """
+    Marca a estrutura como alterada (snapshot e destinos do HierarchyManager).
+
+    Invalida já (a própria transação deixa de ver dados antigos) e de novo
+    após o commit, para que nenhum outro worker guarde entretanto o estado
+    anterior sob a versão nova.
+    """
+    _incrementar_versao()
+    transaction.on_commit(_incrementar_versao)
+
+
+def como_id(valor):
+    """Normaliza um ID vindo de formulário/URL (str ou int); None se inválido."""
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Registos imutáveis
+# ---------------------------------------------------------------------------
+
+class AdministracaoInfo(NamedTuple):
+    id: int
+    nome: str
+    tipo_municipio: str
+    provincia: Optional[str]
+
+    @property
+    def pk(self):
+        return self.id
+
+
+class DepartamentoInfo(NamedTuple):
+    id: int
+    nome: str
+    administracao_id: int
+    tipo_municipio: str
+    ativo: bool
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def is_secretaria_geral(self):
+        return 'secretaria geral' in self.nome.lower()
+
+
+class SeccaoInfo(NamedTuple):
+    id: int
+    nome: str
+    departamento_id: int
+    ativo: bool
+
+    @property
+    def pk(self):
+        return self.id
+
+
+def _agrupar(itens, chave, ordem):
+    """{chave: tuple(ids ordenados)} como mapeamento só de leitura."""
+    grupos = {}
+    for item in sorted(itens, key=ordem):
+        grupos.setdefault(chave(item), []).append(item.id)
+    return MappingProxyType({k: tuple(v) for k, v in grupos.items()})
+
+
+class OrgSnapshot:
+    """
+    Estrutura organizacional imutável com índices por id, por administração,
+    por província, por tipo de município e "Secretaria Geral de X".
+    """
+
+    def __init__(self, versao, administracoes, departamentos, seccoes):
+        self.versao = versao
+
+        self.administracoes = MappingProxyType({a.id: a for a in administracoes})
+        self.departamentos = MappingProxyType({d.id: d for d in departamentos})
+        self.seccoes = MappingProxyType({s.id: s for s in seccoes})
+
+        self.administracoes_por_tipo = _agrupar(
+            administracoes, lambda a: a.tipo_municipio, lambda a: a.id
+        )
+        self.administracoes_por_provincia = _agrupar(
+            administracoes, lambda a: a.provincia, lambda a: a.id
+        )
+        self.departamentos_por_administracao = _agrupar(
+            departamentos, lambda d: d.administracao_id, lambda d: d.nome
+        )
+        self.seccoes_por_departamento = _agrupar(
+            seccoes, lambda s: s.departamento_id, lambda s: s.nome
+        )
+        self.secretarias_gerais = _agrupar(
+            [d for d in departamentos if d.is_secretaria_geral], lambda d: d.administracao_id, lambda d: d.id
+        )
+
+        # Resultados derivados (ex.: destinos do HierarchyManager) desta versão
+        self._memo = {}
+        self._memo_lock = threading.Lock()
+
+    @classmethod
+    def carregar(cls, versao=None):
+        """Lê a estrutura completa da BD (três consultas)."""
+        from ARQUIVOS.models import Administracao, Departamento, Seccoes
+
+        return cls(
+            versao,
+            [AdministracaoInfo(*linha) for linha in Administracao.objects.values_list(
+                'id', 'nome', 'tipo_municipio', 'provincia'
+            )],
+            [DepartamentoInfo(*linha) for linha in Departamento.objects.values_list(
+                'id', 'nome', 'administracao_id', 'tipo_municipio', 'ativo'
+            )],
+            [SeccaoInfo(*linha) for linha in Seccoes.objects.values_list(
+                'id', 'nome', 'departamento_id', 'ativo'
+            )],
+        )
+
+    # -- Consultas ----------------------------------------------------------
+
+    def administracoes_do_tipo(self, *tipos):
+        return [i for tipo in tipos for i in self.administracoes_por_tipo.get(tipo, ())]
+
+    def administracoes_da_provincia(self, provincia):
+        return self.administracoes_por_provincia.get(provincia, ())
+
+    def departamentos_da_administracao(self, administracao_id, apenas_ativos=False):
+        """Departamentos da administração, ordenados por nome."""
+        departamentos = [
+            self.departamentos[i] for i in self.departamentos_por_administracao.get(administracao_id, ())
+        ]
+        if apenas_ativos:
+            departamentos = [d for d in departamentos if d.ativo]
+        return departamentos
+
+    def seccoes_do_departamento(self, departamento_id, apenas_ativas=False):
+        """Secções do departamento, ordenadas por nome."""
+        seccoes = [self.seccoes[i] for i in self.seccoes_por_departamento.get(departamento_id, ())]
+        if apenas_ativas:
+            seccoes = [s for s in seccoes if s.ativo]
+        return seccoes
+
+    def secretaria_geral(self, administracao_id):
+        """IDs das Secretarias Gerais de uma administração."""
+        return self.secretarias_gerais.get(administracao_id, ())
+
+    def administracao_do_departamento(self, departamento_id):
+        departamento = self.departamentos.get(departamento_id)
+        return departamento.administracao_id if departamento else None
+
+    def memorizar(self, chave, calcular):
+        """Calcula uma vez por versão um resultado derivado desta estrutura."""
+        try:
+            return self._memo[chave]
+        except KeyError:
+            pass
+        valor = calcular()
+        with self._memo_lock:
+            self._memo.setdefault(chave, valor)
+        return valor
+
+
+# ---------------------------------------------------------------------------
+# Snapshot do processo
+# ---------------------------------------------------------------------------
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def _alteracao_por_confirmar():
+    """True se a transação corrente alterou a estrutura e ainda não fez commit."""
+    conexao = transaction.get_connection()
+    return conexao.in_atomic_block and any(
+        callback[1] is _incrementar_versao for callback in conexao.run_on_commit
+    )
+
+
+def obter_snapshot():
+    """Snapshot atual, recarregado apenas quando a versão muda."""
+    global _snapshot
+
+    versao = versao_estrutura()
+    if _alteracao_por_confirmar():
+        # Dados ainda não confirmados (podem sofrer rollback): não partilhar com o processo
+        return OrgSnapshot.carregar(versao)
+
+    atual = _snapshot
+    if atual is not None and atual.versao == versao:
+        return atual
+
+    with _lock:
+        if _snapshot is None or _snapshot.versao != versao:
+            _snapshot = OrgSnapshot.carregar(versao)
+        return _snapshot
@@ -0,0 +1,254 @@
+"""
+paginacao.py
+============
+
+Paginação por cursor (keyset) para listagens grandes.
+
+O Paginator do Django faz um COUNT(*) completo e um OFFSET que percorre
+todas as linhas anteriores: as páginas profundas ficam linearmente mais
+lentas. Aqui a página seguinte começa DEPOIS da última linha vista,
+usando as colunas de ordenação (ex.: data_criacao, id) num WHERE que o
+índice resolve diretamente. O total é opcional ou estimado pelo planner.
+
+Uso (numa view):
+    pagina = paginar(request, queryset, ordenacao=('-data_criacao', '-id'))
+    # no template: {% include "paginacao_cursor.html" with pagina=pagina %}
+"""
+
+import base64
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import F, Q
+from django.utils.http import urlencode
+
+
+POR_PAGINA = 20
+PARAMETROS_PAGINACAO = ('cursor', 'direcao', 'page')
+
+
+# ---------------------------------------------------------------------------
+# Cursores
+# ---------------------------------------------------------------------------
+
+def _serializar(valor):
+    # isoformat completo: o DjangoJSONEncoder corta os microssegundos e o cursor perderia linhas
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    return str(valor)
+
+
+def _codificar_cursor(valores):
+    texto = json.dumps(valores, default=_serializar, separators=(',', ':'))
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip('=')
+
+
+def _descodificar_cursor(cursor, campos):
+    """Valores da linha-fronteira, convertidos para o tipo de cada campo. None se inválido."""
+    try:
+        texto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        valores = json.loads(texto)
+        if not isinstance(valores, list) or len(valores) != len(campos):
+            return None
+        return [
+            None if valor is None else campo.to_python(valor)
+            for campo, valor in zip(campos, valores)
+        ]
+    except Exception:
+        return None
+
+
+class _Chave:
+    """Uma coluna de ordenação: nome, sentido e tratamento de NULL (sempre no fim)."""
+
+    def __init__(self, modelo, expressao):
+        self.descendente = expressao.startswith('-')
+        self.nome = expressao.lstrip('-')
+        self.campo = modelo._meta.pk if self.nome == 'pk' else modelo._meta.get_field(self.nome)
+        self.anulavel = self.campo.null
+
+    def ordenacao(self, invertida=False):
+        descendente = self.descendente != invertida
+        # NULLs no fim no sentido normal, logo no início no sentido invertido
+        nulos = {'nulls_first': True} if invertida else {'nulls_last': True}
+        if not self.anulavel:
+            nulos = {}
+        return F(self.nome).desc(**nulos) if descendente else F(self.nome).asc(**nulos)
+
+    def depois(self, valor, invertida=False):
+        """Q das linhas estritamente depois de `valor` nesta coluna."""
+        descendente = self.descendente != invertida
+        nulos_no_fim = not invertida
+        if valor is None:
+            # Depois de NULL: nada (NULLs no fim) ou todos os não-nulos (NULLs no início)
+            return Q(pk__in=[]) if nulos_no_fim else Q(**{f'{self.nome}__isnull': False})
+        depois = Q(**{f'{self.nome}__{"lt" if descendente else "gt"}': valor})
+        if self.anulavel and nulos_no_fim:
+            depois |= Q(**{f'{self.nome}__isnull': True})
+        return depois
+
+    def igual(self, valor):
+        if valor is None:
+            return Q(**{f'{self.nome}__isnull': True})
+        return Q(**{self.nome: valor})
+
+
+# ---------------------------------------------------------------------------
+# Página
+# ---------------------------------------------------------------------------
+
+class PaginaCursor:
+    """
+    Página de resultados por cursor. Expõe a parte da API de Page usada nos
+    templates (iteração, has_next, has_previous, has_other_pages).
+    """
+
+    def __init__(self, object_list, has_next, has_previous, cursor_seguinte, cursor_anterior,
+                 total=None, total_estimado=False, parametros=None):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.cursor_seguinte = cursor_seguinte
+        self.cursor_anterior = cursor_anterior
+        self.total = total
+        self.total_estimado = total_estimado
+        self._parametros = parametros or {}
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, indice):
+        return self.object_list[indice]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def _query(self, cursor, direcao):
+        return urlencode({**self._parametros, 'cursor': cursor, 'direcao': direcao}, doseq=True)
+
+    @property
+    def query_seguinte(self):
+        """Query string da página seguinte (mantém os restantes filtros do pedido)."""
+        return self._query(self.cursor_seguinte, 'seguinte')
+
+    @property
+    def query_anterior(self):
+        return self._query(self.cursor_anterior, 'anterior')
+
+
+class CursorPaginator:
+    """
+    Paginação keyset sobre `ordenacao`, que deve ser total (terminar numa
+    coluna única, tipicamente '-id').
+
+    contagem:
+        None        -> sem total
+        'estimada'  -> estimativa do planner (PostgreSQL); sem total noutros bancos
+        'exata'     -> COUNT(*) (custo igual ao Paginator)
+    """
+
+    def __init__(self, queryset, ordenacao=('-id',), por_pagina=POR_PAGINA, contagem='estimada'):
+        self.queryset = queryset
+        self.chaves = [_Chave(queryset.model, expressao) for expressao in ordenacao]
+        self.por_pagina = por_pagina
+        self.contagem = contagem
+
+    def _valores(self, objeto):
+        return [getattr(objeto, chave.campo.attname) for chave in self.chaves]
+
+    def _depois(self, valores, invertida):
+        """(k1 > v1) OR (k1 = v1 AND k2 > v2) OR ... no sentido da ordenação."""
+        condicao = Q(pk__in=[])
+        iguais = Q()
+        for chave, valor in zip(self.chaves, valores):
+            condicao |= iguais & chave.depois(valor, invertida)
+            iguais &= chave.igual(valor)
+        return condicao
+
+    def total(self):
+        if self.contagem == 'exata':
+            return self.queryset.count()
+        if self.contagem == 'estimada':
+            return estimar_total(self.queryset)
+        return None
+
+    def get_page(self, cursor=None, direcao='seguinte', parametros=None):
+        anterior = direcao == 'anterior'
+        valores = _descodificar_cursor(cursor, [c.campo for c in self.chaves]) if cursor else None
+        if valores is None:
+            anterior = False
+
+        queryset = self.queryset.order_by(*[chave.ordenacao(invertida=anterior) for chave in self.chaves])
+        if valores is not None:
+            queryset = queryset.filter(self._depois(valores, invertida=anterior))
+
+        # Uma linha a mais diz se há mais páginas nesse sentido
+        linhas = list(queryset[:self.por_pagina + 1])
+        ha_mais = len(linhas) > self.por_pagina
+        linhas = linhas[:self.por_pagina]
+
+        if anterior:
+            linhas.reverse()
+            has_previous, has_next = ha_mais, True
+        else:
+            has_previous, has_next = valores is not None, ha_mais
+
+        return PaginaCursor(
+            linhas,
+            has_next=has_next and bool(linhas),
+            has_previous=has_previous and bool(linhas),
+            cursor_seguinte=_codificar_cursor(self._valores(linhas[-1])) if linhas else None,
+            cursor_anterior=_codificar_cursor(self._valores(linhas[0])) if linhas else None,
+            total=self.total(),
+            total_estimado=self.contagem == 'estimada',
+            parametros=parametros,
+        )
+
+
+def estimar_total(queryset):
+    """
+    Estimativa de linhas do planner do PostgreSQL (EXPLAIN, sem executar a
+    consulta). Noutros bancos devolve None.
+    """
+    conexao = connections[queryset.db]
+    if conexao.vendor != 'postgresql':
+        return None
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    with conexao.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plano = cursor.fetchone()[0]
+    if isinstance(plano, str):
+        plano = json.loads(plano)
+    return int(plano[0]['Plan']['Plan Rows'])
+
+
+def paginar(request, queryset, ordenacao, por_pagina=POR_PAGINA, contagem='estimada', classico=True):
+    """
+    Página do pedido. Com `?page=N` (links antigos) mantém o Paginator
+    clássico, salvo com classico=False; caso contrário usa o cursor
+    (`?cursor=...&direcao=seguinte|anterior`).
+    """
+    if classico and request.GET.get('page') and not request.GET.get('cursor'):
+        return Paginator(queryset.order_by(*ordenacao), por_pagina).get_page(request.GET.get('page'))
+
+    parametros = {
+        chave: request.GET.getlist(chave)
+        for chave in request.GET
+        if chave not in PARAMETROS_PAGINACAO
+    }
+    return CursorPaginator(queryset, ordenacao, por_pagina, contagem).get_page(
+        request.GET.get('cursor'),
+        request.GET.get('direcao', 'seguinte'),
+        parametros=parametros,
+    )
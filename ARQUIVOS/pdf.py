@@ -0,0 +1,194 @@
+"""
+pdf.py
+======
+
+Renderização das notas de despacho (ReportLab), fora do processo que a pede.
+
+A parte fixa da página (timbrado: "REPÚBLICA DE ANGOLA", nome da
+administração, filetes, título e linha de assinatura) é renderizada uma vez
+por administração e guardada em cache no processo, já como operadores PDF
+do conteúdo da página. Em cada PDF esses operadores são copiados tal como
+estão (Canvas.addLiteral) e só se compõe o texto variável (dados do
+documento e teor do despacho).
+
+Os PDFs são gerados num pool limitado de processos (SGA_PDF_PROCESSOS), com
+tempo máximo por PDF (SGA_PDF_TIMEOUT): um despacho que encrave o ReportLab
+não prende o worker. As funções de renderização recebem apenas valores
+simples (dicionário de strings) e não tocam no banco.
+
+    python manage.py benchmark_pdf [--quantidade 500] [--processos 4]
+
+mede PDFs por segundo e por núcleo.
+"""
+
+import io
+import multiprocessing
+from dataclasses import dataclass
+from functools import lru_cache
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Frame, KeepInFrame, Paragraph
+
+
+LARGURA, ALTURA = A4
+TOPO_DADOS = ALTURA - 7 * cm
+RODAPE_Y = 3 * cm
+
+PROCESSOS_PADRAO = 2
+TIMEOUT_PADRAO = 30
+
+ESTILO_DESPACHO = ParagraphStyle('Despacho', fontName='Helvetica', fontSize=10, leading=14)
+
+
+class ErroRenderizacao(Exception):
+    """O PDF não foi gerado (tempo esgotado ou erro no processo do pool)."""
+
+
+# ---------------------------------------------------------------------------
+# Timbrado (parte fixa da página, em cache por administração)
+# ---------------------------------------------------------------------------
+
+# Fonte do timbrado: registada primeiro em cada PDF (depois da Helvetica do
+# preâmbulo do ReportLab), tem sempre o mesmo nome interno (/F2) que nos
+# operadores pré-renderizados
+FONTE_TIMBRADO = "Helvetica-Bold"
+
+
+@dataclass(frozen=True)
+class Timbrado:
+    operadores: str   # conteúdo PDF da parte fixa (texto e filetes)
+
+    def desenhar(self, c):
+        c.setFont(FONTE_TIMBRADO, 14)
+        c.addLiteral(self.operadores)
+
+
+def _centrado(tamanho, y, texto):
+    return tamanho, (LARGURA - stringWidth(texto, FONTE_TIMBRADO, tamanho)) / 2, y, texto
+
+
+@lru_cache(maxsize=128)
+def timbrado(instituicao):
+    """Parte fixa da página para a administração `instituicao` (nome), já renderizada."""
+    textos = (
+        _centrado(14, ALTURA - 2 * cm, "REPÚBLICA DE ANGOLA"),
+        _centrado(12, ALTURA - 2.7 * cm, instituicao.upper()),
+        _centrado(16, ALTURA - 5 * cm, "NOTA DE DESPACHO"),
+        (11, 2.5 * cm, TOPO_DADOS - 5 * cm, "TEOR DO DESPACHO:"),
+    )
+    linhas = (
+        (2 * cm, ALTURA - 3.2 * cm, LARGURA - 2 * cm, ALTURA - 3.2 * cm),
+        (LARGURA / 2 - 4 * cm, RODAPE_Y, LARGURA / 2 + 4 * cm, RODAPE_Y),
+    )
+
+    # Renderizado num canvas de rascunho com a mesma ordem de fontes de renderizar()
+    rascunho = canvas.Canvas(io.BytesIO(), pagesize=A4)
+    rascunho.setFont(FONTE_TIMBRADO, 14)
+    operadores = []
+    for tamanho, x, y, texto in textos:
+        objeto = rascunho.beginText(x, y)
+        objeto.setFont(FONTE_TIMBRADO, tamanho)
+        objeto.textOut(texto)
+        operadores.append(objeto.getCode())
+    caminho = rascunho.beginPath()
+    for x1, y1, x2, y2 in linhas:
+        caminho.moveTo(x1, y1)
+        caminho.lineTo(x2, y2)
+    operadores.append(f'{caminho.getCode()} S')
+    return Timbrado(' '.join(operadores))
+
+
+# ---------------------------------------------------------------------------
+# Renderização (corre nos processos do pool)
+# ---------------------------------------------------------------------------
+
+def renderizar(dados):
+    """
+    PDF (bytes) da nota de despacho. `dados`: instituicao, protocolo, titulo,
+    utente, data_pedido, estado, texto, responsavel, gerado_em.
+    """
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    timbrado(dados['instituicao']).desenhar(c)
+
+    # --- Detalhes do Documento ---
+    c.setFont("Helvetica", 10)
+    c.drawString(2.5 * cm, TOPO_DADOS, f"Nº Protocolo: {dados['protocolo']}")
+    c.drawString(2.5 * cm, TOPO_DADOS - 0.7 * cm, f"Assunto: {dados['titulo']}")
+    c.drawString(2.5 * cm, TOPO_DADOS - 1.4 * cm, f"Utente: {dados['utente']}")
+    c.drawString(2.5 * cm, TOPO_DADOS - 2.1 * cm, f"Data do Pedido: {dados['data_pedido']}")
+
+    # --- Estado e Decisão ---
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(2.5 * cm, TOPO_DADOS - 3.5 * cm, f"Estado/Decisão: {dados['estado']}")
+
+    # --- Teor do despacho (quebra de linha automática) ---
+    frame_y = 5 * cm
+    frame_w = LARGURA - 5 * cm
+    frame_h = (TOPO_DADOS - 5.5 * cm) - frame_y
+    paragrafo = Paragraph(dados['texto'].replace("\n", "<br/>"), ESTILO_DESPACHO)
+    Frame(2.5 * cm, frame_y, frame_w, frame_h, showBoundary=0).addFromList(
+        [KeepInFrame(frame_w, frame_h, [paragrafo])], c
+    )
+
+    # --- Rodapé / Assinatura ---
+    c.setFont("Helvetica", 9)
+    c.drawCentredString(LARGURA / 2, RODAPE_Y - 0.5 * cm, f"O(A) Responsável: {dados['responsavel']}")
+    c.setFont("Helvetica-Oblique", 8)
+    c.drawCentredString(LARGURA / 2, RODAPE_Y - 1 * cm, f"Gerado em: {dados['gerado_em']}")
+
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+# ---------------------------------------------------------------------------
+# Pool de processos
+# ---------------------------------------------------------------------------
+
+_pool = None
+
+
+def numero_processos():
+    return getattr(settings, 'SGA_PDF_PROCESSOS', PROCESSOS_PADRAO)
+
+
+def _obter_pool():
+    global _pool
+    if _pool is None:
+        _pool = multiprocessing.Pool(processes=numero_processos())
+    return _pool
+
+
+def fechar_pool():
+    """Termina os processos do pool (são recriados no próximo PDF)."""
+    global _pool
+    if _pool is not None:
+        _pool.terminate()
+        _pool.join()
+        _pool = None
+
+
+def renderizar_no_pool(dados, timeout=None):
+    """
+    Renderiza num processo do pool e espera no máximo `timeout` segundos
+    (padrão SGA_PDF_TIMEOUT). Com SGA_PDF_PROCESSOS = 0 renderiza aqui.
+    """
+    if not numero_processos():
+        return renderizar(dados)
+
+    timeout = timeout or getattr(settings, 'SGA_PDF_TIMEOUT', TIMEOUT_PADRAO)
+    resultado = _obter_pool().apply_async(renderizar, (dados,))
+    try:
+        return resultado.get(timeout)
+    except multiprocessing.TimeoutError:
+        # O processo encravado só sai com o pool: recomeça com um novo
+        fechar_pool()
+        raise ErroRenderizacao(f"PDF de {dados.get('protocolo')} não gerado em {timeout}s")
+    except Exception as erro:
+        raise ErroRenderizacao(f"Falha ao gerar o PDF de {dados.get('protocolo')}: {erro}") from erro
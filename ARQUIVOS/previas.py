@@ -0,0 +1,182 @@
+# ARQUIVOS/previas.py
+"""
+Pré-visualizações (miniaturas) das digitalizações e anexos.
+
+Para saber o que é um ficheiro, o detalhe do documento mostrava apenas o
+link para o original: digitalizações de vários MB descarregadas só para
+as ver. Agora cada imagem ou PDF tem uma miniatura JPEG da primeira
+página (alguns KB), gerada pelo worker (tarefa 'previa.gerar', fila
+'previas') e guardada pelo SHA-256 do conteúdo em
+previas/<aa>/<sha256>.jpg: ficheiros iguais têm uma só miniatura.
+
+Como o conteúdo de um hash nunca muda, a miniatura é servida em
+/previas/<sha256>.jpg com cache de um ano (immutable): depois da primeira
+visita o browser nem volta a pedi-la.
+
+Renderizadores (opcionais, sem dependências novas):
+    imagens -> Pillow
+    PDF     -> `pdftoppm` (poppler), só a primeira página; sem o binário a
+               pré-visualização fica 'indisponivel' e mostra-se o ícone
+
+Ficheiros de antes do storage por conteúdo: `python manage.py gerar_previas`.
+"""
+
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.urls import reverse
+
+from .conteudo import nome_conteudo
+from .extracao import ErroExtracao, _executar, _extensao, _programa
+
+
+LADO_PADRAO = 480  # px, o maior lado da miniatura
+QUALIDADE_JPEG = 75
+PASTA = 'previas'
+
+EXTENSOES_IMAGEM = {'jpg', 'jpeg', 'png', 'gif', 'bmp', 'tif', 'tiff', 'webp'}
+
+
+class ErroPrevia(Exception):
+    """O ficheiro não pôde ser renderizado (corrompido, formato inesperado...)."""
+
+
+def lado():
+    return getattr(settings, 'SGA_PREVIA_LADO', LADO_PADRAO)
+
+
+def tipo_previa(nome):
+    """'imagem', 'pdf' ou None (formato sem pré-visualização)."""
+    extensao = _extensao(nome)
+    if extensao in EXTENSOES_IMAGEM:
+        return 'imagem'
+    if extensao == 'pdf':
+        return 'pdf'
+    return None
+
+
+def nome_previa(hash_conteudo):
+    """Nome, no storage, da miniatura do conteúdo `hash_conteudo`."""
+    return f'{PASTA}/{hash_conteudo[:2]}/{hash_conteudo}.jpg'
+
+
+def url_previa(hash_conteudo):
+    return reverse('previa_ficheiro', args=[hash_conteudo])
+
+
+def pdf_disponivel():
+    return bool(_programa('pdftoppm'))
+
+
+# ---------------------------------------------------------------------------
+# Renderização
+# ---------------------------------------------------------------------------
+
+def miniatura_imagem(origem, destino, tamanho):
+    """
+    Reduz a imagem `origem` (caminho ou ficheiro) para caber em
+    tamanho x tamanho e grava-a em JPEG. Devolve (largura, altura).
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        with Image.open(origem) as imagem:
+            # JPEG: o descodificador já lê a imagem reduzida (1/2, 1/4, 1/8),
+            # sem descomprimir a digitalização inteira em memória
+            imagem.draft('RGB', (tamanho, tamanho))
+            imagem = ImageOps.exif_transpose(imagem)
+            imagem.thumbnail((tamanho, tamanho))
+            if imagem.mode != 'RGB':
+                imagem = imagem.convert('RGB')
+            imagem.save(destino, 'JPEG', quality=QUALIDADE_JPEG, optimize=True, progressive=True)
+            return imagem.size
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as erro:
+        raise ErroPrevia(f'Imagem inválida: {erro}')
+
+
+def miniatura_pdf(origem, destino, tamanho):
+    """Primeira página do PDF `origem` (caminho), via pdftoppm."""
+    with tempfile.TemporaryDirectory() as pasta:
+        saida = os.path.join(pasta, 'pagina')
+        try:
+            # -scale-to: o poppler já rasteriza no tamanho da miniatura
+            _executar([
+                'pdftoppm', '-f', '1', '-l', '1', '-singlefile', '-scale-to', str(tamanho),
+                '-png', origem, saida,
+            ])
+        except ErroExtracao as erro:
+            raise ErroPrevia(f'PDF inválido: {erro}')
+        return miniatura_imagem(f'{saida}.png', destino, tamanho)
+
+
+def gerar(previa):
+    """
+    Gera a miniatura de `previa` a partir do conteúdo guardado e atualiza o
+    estado. Devolve o estado final.
+    """
+    from .models import EstadoPrevia
+
+    origem = default_storage.path(nome_conteudo(previa.hash))
+    if not os.path.exists(origem):
+        # O conteúdo foi apagado entretanto
+        previa.delete()
+        return None
+    if previa.tipo == 'pdf' and not pdf_disponivel():
+        previa.estado = EstadoPrevia.INDISPONIVEL
+        previa.save(update_fields=['estado', 'data_atualizacao'])
+        return previa.estado
+
+    destino = default_storage.path(nome_previa(previa.hash))
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    temporario = f'{destino}.{os.getpid()}.tmp'
+    renderizar = miniatura_pdf if previa.tipo == 'pdf' else miniatura_imagem
+    try:
+        with open(temporario, 'wb') as ficheiro:
+            largura, altura = renderizar(origem, ficheiro, lado())
+        os.replace(temporario, destino)
+    except ErroPrevia as erro:
+        previa.estado = EstadoPrevia.FALHADA
+        previa.erro = str(erro)[:255]
+        previa.save(update_fields=['estado', 'erro', 'data_atualizacao'])
+        return previa.estado
+    finally:
+        if os.path.exists(temporario):
+            os.unlink(temporario)
+
+    previa.estado = EstadoPrevia.GERADA
+    previa.largura, previa.altura = largura, altura
+    previa.tamanho = os.path.getsize(destino)
+    previa.erro = ''
+    previa.save(update_fields=['estado', 'largura', 'altura', 'tamanho', 'erro', 'data_atualizacao'])
+    return previa.estado
+
+
+def apagar(hash_conteudo):
+    """Remove a miniatura de um conteúdo que deixou de existir."""
+    from .models import Previa
+
+    Previa.objects.filter(hash=hash_conteudo).delete()
+    caminho = default_storage.path(nome_previa(hash_conteudo))
+    if os.path.exists(caminho):
+        os.unlink(caminho)
+
+
+# ---------------------------------------------------------------------------
+# Página de detalhe
+# ---------------------------------------------------------------------------
+
+def previas_de(nomes):
+    """{nome: url da miniatura} dos ficheiros `nomes` que já têm miniatura (2 consultas)."""
+    from .models import EstadoPrevia, Previa, ReferenciaConteudo
+
+    hashes = dict(
+        ReferenciaConteudo.objects.filter(nome__in=[n for n in nomes if n])
+        .values_list('nome', 'conteudo__hash')
+    )
+    geradas = set(
+        Previa.objects.filter(hash__in=set(hashes.values()), estado=EstadoPrevia.GERADA)
+        .values_list('hash', flat=True)
+    )
+    return {nome: url_previa(h) for nome, h in hashes.items() if h in geradas}
@@ -1,10 +1,19 @@
 # ARQUIVOS/routing.py
 """
-WebSocket URL routing for real-time notifications.
+WebSocket (and long-poll HTTP) URL routing for real-time notifications.
 """
+from channels.auth import AuthMiddlewareStack
 from django.urls import re_path
 from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/notificacoes/$', consumers.NotificacaoConsumer.as_asgi()),
 ]
+
+# Long-poll HTTP servido pelo Channels, antes da aplicação Django (ver asgi.py)
+http_urlpatterns = [
+    re_path(
+        r'^api/aguardar-notificacoes/$',
+        AuthMiddlewareStack(consumers.AguardarNotificacoesConsumer.as_asgi()),
+    ),
+]
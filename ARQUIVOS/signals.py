@@ -0,0 +1,37 @@
+"""
+signals.py
+==========
+
+Invalidação de caches derivados da estrutura organizacional.
+
+Qualquer alteração a Administração (e respetivos proxies), Departamento ou
+Secção muda a versão da estrutura: o OrgSnapshot de cada processo é
+recarregado e os destinos permitidos do HierarchyManager recalculados.
+Alterações em massa via QuerySet.update() não disparam sinais: nesses casos
+chame `invalidar_estrutura()` explicitamente.
+"""
+
+from django.db.models.signals import post_save, post_delete
+
+from ARQUIVOS.org_snapshot import invalidar_estrutura
+from ARQUIVOS.models import (
+    Administracao, GovernoProvincial, AdministracaoMunicipal, Ministerio, Departamento, Seccoes
+)
+
+# Os proxies enviam o sinal com o próprio modelo como sender
+MODELOS_HIERARQUIA = (
+    Administracao, GovernoProvincial, AdministracaoMunicipal, Ministerio, Departamento, Seccoes,
+)
+
+
+def _invalidar_estrutura(sender, **kwargs):
+    invalidar_estrutura()
+
+
+for _modelo in MODELOS_HIERARQUIA:
+    post_save.connect(
+        _invalidar_estrutura, sender=_modelo, dispatch_uid=f'estrutura_save_{_modelo.__name__}'
+    )
+    post_delete.connect(
+        _invalidar_estrutura, sender=_modelo, dispatch_uid=f'estrutura_delete_{_modelo.__name__}'
+    )
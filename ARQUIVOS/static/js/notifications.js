@@ -118,6 +118,14 @@ document.addEventListener('DOMContentLoaded', function () {
         window.notificationSocket = null;
         let reconnectAttempts = 0;
         const maxReconnectAttempts = 5;
+        const maxItensDropdown = 20;
+        // Pausa entre pedidos de long-poll depois de um erro de rede
+        const pausaAposErro = 10000;
+
+        // Cursor da sincronização: id da última notificação recebida
+        let cursorNotificacoes = config.notificationCursor || 0;
+        let etagNotificacoes = null;
+        let esperaAtiva = false;
 
         function connectWebSocket() {
             console.log('[WS] A conectar...');
@@ -126,6 +134,9 @@ document.addEventListener('DOMContentLoaded', function () {
             window.notificationSocket.onopen = function () {
                 console.log('[WS] ✅ Conectado');
                 reconnectAttempts = 0;
+                esperaAtiva = false;
+                // Recupera só o que chegou enquanto estava desligado
+                sincronizarNotificacoes();
             };
 
             window.notificationSocket.onmessage = function (e) {
@@ -133,14 +144,18 @@ document.addEventListener('DOMContentLoaded', function () {
                 console.log('[WS] Mensagem:', data);
 
                 // Update badge count
-                if (data.type === 'notification_count' || data.type === 'new_notification') {
+                if ((data.type === 'notification_count' || data.type === 'new_notification') && typeof data.count === 'number') {
                     atualizarBadgeNotificacoes(data.count);
                 }
 
                 // Show toast for new notification
                 if (data.type === 'new_notification') {
                     mostrarToastNotificacao(data.message, data.link);
-                    buscarNotificacoesViaAPI();
+                    sincronizarNotificacoes();
+                }
+
+                if (data.type === 'notification_sync') {
+                    aplicarSincronizacao(data);
                 }
 
                 // Dispatch event for pending confirmations page
@@ -156,6 +171,10 @@ document.addEventListener('DOMContentLoaded', function () {
                     const delay = 3000 * reconnectAttempts;
                     console.log(`[WS] Reconectando em ${delay / 1000}s...`);
                     setTimeout(connectWebSocket, delay);
+                } else if (!esperaAtiva) {
+                    // Sem WebSocket (ex.: proxy): long-poll por HTTP
+                    esperaAtiva = true;
+                    aguardarNotificacoes();
                 }
             };
 
@@ -190,54 +209,111 @@ document.addEventListener('DOMContentLoaded', function () {
             }
         }
 
-        // Fetch full notification list from API and update dropdown HTML
+        // Pede as notificações posteriores ao cursor (WebSocket se ligado, senão HTTP)
+        function sincronizarNotificacoes() {
+            if (window.notificationSocket && window.notificationSocket.readyState === WebSocket.OPEN) {
+                window.notificationSocket.send(JSON.stringify({ action: 'sync', desde: cursorNotificacoes }));
+            } else {
+                buscarNotificacoesViaAPI();
+            }
+        }
+
+        // HTTP: só as novas desde o cursor; 304 quando nada mudou
         function buscarNotificacoesViaAPI() {
-            fetch(config.checkNotificationsUrl)
-                .then(r => r.json())
+            const headers = etagNotificacoes ? { 'If-None-Match': etagNotificacoes } : {};
+            fetch(`${config.checkNotificationsUrl}?desde=${cursorNotificacoes}`, { headers: headers, cache: 'no-store' })
+                .then(r => {
+                    if (r.status === 304) return null;
+                    etagNotificacoes = r.headers.get('ETag');
+                    return r.json();
+                })
                 .then(data => {
-                    atualizarDropdownCompleto(data.notificacoes || []);
+                    if (data) aplicarSincronizacao(data);
                 })
                 .catch(err => console.error('[WS] Erro ao buscar notificações:', err));
         }
 
-        function atualizarDropdownCompleto(notificacoes) {
+        // Long-poll: o servidor só responde quando há eventos (200) ou o tempo expira (204)
+        function aguardarNotificacoes() {
+            if (!esperaAtiva) return;
+            fetch(`${config.waitNotificationsUrl}?desde=${cursorNotificacoes}`, { cache: 'no-store' })
+                .then(r => {
+                    if (r.status === 204) return null;
+                    if (!r.ok) throw new Error(`HTTP ${r.status}`);
+                    return r.json();
+                })
+                .then(data => {
+                    if (data) {
+                        aplicarSincronizacao(data);
+                        (data.eventos || []).forEach(aplicarEvento);
+                    }
+                    aguardarNotificacoes();
+                })
+                .catch(err => {
+                    console.error('[WS] Erro no long-poll de notificações:', err);
+                    setTimeout(aguardarNotificacoes, pausaAposErro);
+                });
+        }
+
+        // Eventos do long-poll: mesmo tratamento das mensagens do WebSocket
+        function aplicarEvento(data) {
+            if (data.type === 'new_notification') {
+                mostrarToastNotificacao(data.message, data.link);
+            }
+            if (data.type === 'pendencia_update' || data.type === 'new_notification') {
+                window.dispatchEvent(new CustomEvent('pendenciasAtualizadas', { detail: data }));
+            }
+        }
+
+        function aplicarSincronizacao(data) {
+            if (typeof data.count === 'number') atualizarBadgeNotificacoes(data.count);
+            adicionarAoDropdown(data.notificacoes || []);
+            cursorNotificacoes = Math.max(cursorNotificacoes, data.cursor || 0);
+        }
+
+        function criarItemNotificacao(n) {
+            const item = document.createElement('div');
+            item.className = 'notification-item group p-4 border-b border-slate-50 hover:bg-slate-50/80 transition-colors flex gap-3 cursor-pointer';
+            item.setAttribute('data-id', n.id);
+            item.innerHTML = `
+                <div class="flex-1 min-w-0">
+                    <p class="text-sm text-slate-700 font-medium leading-tight group-hover:text-slate-900 truncate">${n.mensagem}</p>
+                    <div class="mt-2 flex items-center justify-between">
+                        <span class="text-[11px] text-slate-400 font-medium italic">${n.data || 'Agora'}</span>
+                        <a href="${n.link || '#'}" class="notification-action text-[11px] font-bold text-sga-red hover:underline flex items-center gap-1">
+                            Abrir <svg xmlns="http://www.w3.org/2000/svg" width="12" height="12" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><path d="m9 18 6-6-6-6"/></svg>
+                        </a>
+                    </div>
+                </div>
+                ${!n.lida ? '<span class="unread-indicator w-2 h-2 bg-blue-500 rounded-full mt-1.5 flex-shrink-0 shadow-sm shadow-blue-200"></span>' : ''}
+            `;
+            return item;
+        }
+
+        // Acrescenta no topo as notificações novas (vêm das mais recentes para as mais antigas)
+        function adicionarAoDropdown(notificacoes) {
+            if (notificacoes.length === 0) return;
+
             const dropdownEl = document.getElementById('notificationsDropdown');
             if (!dropdownEl) return;
 
             const listContainer = dropdownEl.querySelector('.notification-list');
             if (!listContainer) return;
 
-            // Clear existing items
-            listContainer.innerHTML = '';
-
-            if (notificacoes.length === 0) {
-                listContainer.innerHTML = `
-                    <div class="p-8 text-center">
-                        <svg xmlns="http://www.w3.org/2000/svg" width="40" height="40" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="1.5" class="text-slate-200 mx-auto mb-2"><path d="M21 15a2 2 0 0 1-2 2H7l-4 4V5a2 2 0 0 1 2-2h14a2 2 0 0 1 2 2z"/></svg>
-                        <p class="text-sm text-slate-400 font-medium">Nenhuma notificação</p>
-                    </div>
-                `;
-                return;
+            // Remove a mensagem "Nenhuma notificação"
+            if (!listContainer.querySelector('.notification-item')) {
+                listContainer.innerHTML = '';
             }
 
-            notificacoes.forEach(n => {
-                const item = document.createElement('div');
-                item.className = 'notification-item group p-4 border-b border-slate-50 hover:bg-slate-50/80 transition-colors flex gap-3 cursor-pointer';
-                item.setAttribute('data-id', n.id);
-                item.innerHTML = `
-                    <div class="flex-1 min-w-0">
-                        <p class="text-sm text-slate-700 font-medium leading-tight group-hover:text-slate-900 truncate">${n.mensagem}</p>
-                        <div class="mt-2 flex items-center justify-between">
-                            <span class="text-[11px] text-slate-400 font-medium italic">${n.data || 'Agora'}</span>
-                            <a href="${n.link || '#'}" class="notification-action text-[11px] font-bold text-sga-red hover:underline flex items-center gap-1">
-                                Abrir <svg xmlns="http://www.w3.org/2000/svg" width="12" height="12" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><path d="m9 18 6-6-6-6"/></svg>
-                            </a>
-                        </div>
-                    </div>
-                    ${!n.lida ? '<span class="unread-indicator w-2 h-2 bg-blue-500 rounded-full mt-1.5 flex-shrink-0 shadow-sm shadow-blue-200"></span>' : ''}
-                `;
-                listContainer.appendChild(item);
+            notificacoes.slice().reverse().forEach(n => {
+                if (listContainer.querySelector(`.notification-item[data-id="${n.id}"]`)) return;
+                listContainer.insertBefore(criarItemNotificacao(n), listContainer.firstChild);
             });
+
+            const itens = listContainer.querySelectorAll('.notification-item');
+            for (let i = maxItensDropdown; i < itens.length; i++) {
+                itens[i].remove();
+            }
         }
 
         // Start WebSocket connection
@@ -0,0 +1,145 @@
+/**
+ * SGA - Uploads por blocos, retomáveis (API em /api/uploads/, ver ARQUIVOS/uploads.py)
+ *
+ * Os ficheiros grandes dos inputs com data-upload-blocos são enviados antes
+ * do formulário, em blocos com SHA-256. Se a ligação cair, o envio retoma no
+ * último byte confirmado pelo servidor (também depois de recarregar a página).
+ * No fim, o input fica vazio e o formulário leva só o id em <campo>_upload.
+ */
+document.addEventListener('DOMContentLoaded', function () {
+    const config = window.SGA_CONFIG;
+    if (!config || !config.uploadsUrl || !(window.crypto && crypto.subtle)) return;
+
+    // Abaixo disto o ficheiro segue no POST normal do formulário
+    const limiarBlocos = 8 * 1024 * 1024;
+    const maxTentativas = 8;
+    let uploadsAtivos = 0;
+
+    function chaveRetoma(ficheiro) {
+        return `sga-upload:${ficheiro.name}:${ficheiro.size}:${ficheiro.lastModified}`;
+    }
+
+    async function sha256Hex(buffer) {
+        const digest = await crypto.subtle.digest('SHA-256', buffer);
+        return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function pedidoJson(url, opcoes) {
+        const r = await fetch(url, Object.assign({ cache: 'no-store', credentials: 'same-origin' }, opcoes));
+        const dados = await r.json().catch(() => ({}));
+        return { status: r.status, dados: dados };
+    }
+
+    function esperar(ms) {
+        return new Promise(resolve => setTimeout(resolve, ms));
+    }
+
+    // Upload existente deste ficheiro (retoma) ou um novo
+    async function obterUpload(ficheiro) {
+        const guardado = localStorage.getItem(chaveRetoma(ficheiro));
+        if (guardado) {
+            const r = await pedidoJson(`${config.uploadsUrl}${guardado}/`, {});
+            if (r.status === 200 && (r.dados.estado === 'aberto' || r.dados.estado === 'concluido')) return r.dados;
+            localStorage.removeItem(chaveRetoma(ficheiro));
+        }
+        const r = await pedidoJson(config.uploadsUrl, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'X-CSRFToken': config.csrfToken },
+            body: JSON.stringify({ nome: ficheiro.name, tamanho: ficheiro.size })
+        });
+        if (r.status !== 201) throw new Error(r.dados.erro || `HTTP ${r.status}`);
+        localStorage.setItem(chaveRetoma(ficheiro), r.dados.id);
+        return r.dados;
+    }
+
+    async function enviarPorBlocos(ficheiro, progresso) {
+        let upload = await obterUpload(ficheiro);
+        let tentativas = 0;
+
+        while (upload.estado === 'aberto') {
+            const inicio = upload.recebido;
+            const bloco = ficheiro.slice(inicio, Math.min(inicio + upload.bloco_maximo, ficheiro.size));
+            const buffer = await bloco.arrayBuffer();
+            progresso(inicio / ficheiro.size);
+            try {
+                const r = await pedidoJson(`${config.uploadsUrl}${upload.id}/`, {
+                    method: 'PUT',
+                    headers: {
+                        'Content-Type': 'application/octet-stream',
+                        'X-CSRFToken': config.csrfToken,
+                        'Upload-Offset': String(inicio),
+                        'Upload-Checksum': `sha256 ${await sha256Hex(buffer)}`
+                    },
+                    body: buffer
+                });
+                if (r.status === 200) {
+                    upload = r.dados;
+                    tentativas = 0;
+                    continue;
+                }
+                // 409: o servidor tem outro offset; 422: bloco corrompido. Em ambos
+                // os casos retoma-se a partir do que o servidor diz ter recebido
+                if ((r.status === 409 || r.status === 422) && typeof r.dados.recebido === 'number') {
+                    upload = r.dados;
+                } else {
+                    throw new Error(r.dados.erro || `HTTP ${r.status}`);
+                }
+            } catch (err) {
+                if (++tentativas > maxTentativas) throw err;
+                console.warn('[Upload] Falha no bloco, a repetir:', err);
+                await esperar(Math.min(1000 * 2 ** tentativas, 30000));
+                const r = await pedidoJson(`${config.uploadsUrl}${upload.id}/`, {});
+                if (r.status === 200) upload = r.dados;
+            }
+        }
+
+        if (upload.estado !== 'concluido') throw new Error(upload.erro || 'Upload falhado');
+        progresso(1);
+        return upload;
+    }
+
+    document.querySelectorAll('input[type="file"][data-upload-blocos]').forEach(input => {
+        const oculto = document.createElement('input');
+        oculto.type = 'hidden';
+        oculto.name = `${input.name}_upload`;
+        input.insertAdjacentElement('afterend', oculto);
+
+        input.addEventListener('change', async function () {
+            const ficheiro = input.files[0];
+            oculto.value = '';
+            // Várias imagens (páginas de uma digitalização) seguem no formulário
+            if (!ficheiro || input.files.length > 1 || ficheiro.size < limiarBlocos) return;
+
+            const label = input.parentElement.querySelector('p');
+            const mostrar = texto => { if (label) label.textContent = texto; };
+
+            uploadsAtivos++;
+            try {
+                const upload = await enviarPorBlocos(ficheiro, fracao => {
+                    mostrar(`${ficheiro.name} — ${Math.floor(fracao * 100)}%`);
+                });
+                oculto.value = upload.id;
+                localStorage.removeItem(chaveRetoma(ficheiro));
+                // O ficheiro já está no servidor: não volta a seguir no formulário
+                input.value = '';
+                mostrar(`${ficheiro.name} — enviado`);
+            } catch (err) {
+                console.error('[Upload] Erro:', err);
+                mostrar(`${ficheiro.name} — falhou o envio por blocos; será enviado com o formulário`);
+            } finally {
+                uploadsAtivos--;
+            }
+        });
+
+        const form = input.form;
+        if (form && !form.dataset.uploadsBlocos) {
+            form.dataset.uploadsBlocos = 'true';
+            form.addEventListener('submit', function (e) {
+                if (uploadsAtivos > 0) {
+                    e.preventDefault();
+                    alert('Aguarde o fim do envio dos ficheiros.');
+                }
+            });
+        }
+    });
+});
@@ -0,0 +1,220 @@
+"""
+tarefas.py
+==========
+
+Tarefas executadas pelo worker (`manage.py sga_worker`), fora do pedido
+HTTP: geração do PDF do despacho, email ao utente (caixa de saída, ver
+correio.py), notificações de encaminhamento, difusão do Governo
+Provincial para as administrações e miniaturas dos ficheiros (previas.py).
+
+Cada função recebe apenas ids e valores JSON e volta a ler os objetos do
+banco: o estado pode ter mudado desde o agendamento.
+"""
+
+from django.db.models import F
+from django.utils import timezone
+
+from ARQUIVOS import previas
+from ARQUIVOS.correio import agendar_envio, enfileirar_email, enviar_pendentes
+from ARQUIVOS.fila import tarefa
+from ARQUIVOS.notificacoes import notificar
+from ARQUIVOS.models import (
+    CustomUser, Departamento, Documento, EmailSaida, MovimentacaoDocumento, Notificacao, Previa,
+    StatusDocumento
+)
+from ARQUIVOS.utils import gerar_pdf_despacho
+
+
+# ---------------------------------------------------------------------------
+# Despacho
+# ---------------------------------------------------------------------------
+
+@tarefa('despacho.gerar_pdf', fila='pdf', max_tentativas=3)
+def gerar_pdf(documento_id, texto_despacho, usuario_id, novo_status=None):
+    """Gera a nota de despacho, grava-a em arquivo_digitalizado e agenda o email ao utente."""
+    documento = Documento.objects.select_related('administracao').get(pk=documento_id)
+    usuario = CustomUser.objects.get(pk=usuario_id)
+
+    pdf_content = gerar_pdf_despacho(documento, texto_despacho, usuario, novo_status)
+    # Sobrescreve o ficheiro anterior, se existir
+    documento.arquivo_digitalizado.save(pdf_content.name, pdf_content, save=False)
+    documento.save(update_fields=['arquivo_digitalizado'])
+
+    if documento.email:
+        enviar_email_despacho(documento.pk, usuario.pk)
+
+
+@tarefa('despacho.enviar_email', fila='email', max_tentativas=8)
+def enviar_email_despacho(documento_id, usuario_id):
+    """Põe na caixa de saída o email do despacho ao utente, com o PDF em anexo."""
+    documento = Documento.objects.get(pk=documento_id)
+    usuario = CustomUser.objects.select_related('administracao').get(pk=usuario_id)
+    if not documento.email:
+        return
+
+    assunto = f"Notificação de Despacho - Protocolo {documento.numero_protocolo}"
+    mensagem = f"""
+    Prezado(a) {documento.utente},
+
+    O seu documento com número de protocolo {documento.numero_protocolo} recebeu um despacho.
+
+    Estado Atual: {documento.get_status_display()}
+
+    Segue em anexo o documento oficial com os detalhes do despacho.
+
+    Atenciosamente,
+    {usuario.administracao.nome if usuario.administracao else 'Sistema de Gestão de Arquivo'}
+    """
+
+    enfileirar_email(
+        assunto,
+        mensagem,
+        [documento.email],
+        anexo=documento.arquivo_digitalizado.name if documento.arquivo_digitalizado else '',
+        documento=documento,
+    )
+
+
+@tarefa('email.enviar', fila='email', max_tentativas=3)
+def enviar_emails():
+    """Envia um lote da caixa de saída e volta a agendar-se enquanto houver emails pendentes."""
+    enviar_pendentes()
+    proxima = EmailSaida.objects.proxima_tentativa()
+    if proxima is not None:
+        agendar_envio(atraso=max(0, (proxima - timezone.now()).total_seconds()))
+
+
+# ---------------------------------------------------------------------------
+# Encaminhamento
+# ---------------------------------------------------------------------------
+
+@tarefa('notificacoes.encaminhamento', fila='notificacoes')
+def notificar_encaminhamento(movimentacao_id, link_documento):
+    """Notifica (banco e WebSocket) os utilizadores da unidade de destino de um encaminhamento."""
+    movimentacao = MovimentacaoDocumento.objects.select_related(
+        'documento', 'departamento_destino', 'seccao_destino__departamento'
+    ).get(pk=movimentacao_id)
+    documento = movimentacao.documento
+
+    # O destino pode ser de OUTRA administração (Governo <-> Admin):
+    # filtram-se os utilizadores da administração DO DESTINO
+    if movimentacao.seccao_destino:
+        utilizadores = CustomUser.objects.filter(
+            seccao=movimentacao.seccao_destino,
+            administracao=movimentacao.seccao_destino.departamento.administracao_id,
+            is_active=True
+        )
+        destino_texto = f"secção {movimentacao.seccao_destino.nome}"
+        group_name = f"seccao_{movimentacao.seccao_destino.id}"
+    elif movimentacao.departamento_destino:
+        utilizadores = CustomUser.objects.filter(
+            departamento=movimentacao.departamento_destino,
+            administracao=movimentacao.departamento_destino.administracao_id,
+            is_active=True
+        )
+        destino_texto = f"departamento {movimentacao.departamento_destino.nome}"
+        group_name = f"departamento_{movimentacao.departamento_destino.id}"
+    else:
+        return
+
+    notificacoes = [
+        Notificacao(
+            usuario=u,
+            mensagem=f"Documento '{documento.numero_protocolo}' encaminhado para {destino_texto}.",
+            link=link_documento
+        )
+        for u in utilizadores
+    ]
+    if notificacoes:
+        Notificacao.objects.bulk_create(notificacoes)
+        notificar(
+            group_name, f"Novo documento: {documento.numero_protocolo} - {documento.titulo}", link_documento
+        )
+
+
+# ---------------------------------------------------------------------------
+# Difusão do Governo Provincial (enviar_todas)
+# ---------------------------------------------------------------------------
+
+@tarefa('documento.difundir', fila='difusao', max_tentativas=3)
+def difundir_documento(documento_id, usuario_id, observacoes='', despacho='', link_documento=''):
+    """
+    Encaminha o documento para a Secretaria Geral de cada administração
+    municipal da província do Governo e notifica os seus utilizadores. O
+    original fica com o Governo.
+
+    Número fixo de consultas, qualquer que seja o número de administrações:
+    as Secretarias Gerais saem de uma consulta, a validação corre uma vez e
+    movimentações e notificações são gravadas com bulk inserts (na transação
+    da tarefa).
+    """
+    documento = Documento.objects.select_related('administracao').get(pk=documento_id)
+    usuario = CustomUser.objects.select_related('administracao', 'seccao__departamento', 'departamento').get(
+        pk=usuario_id
+    )
+    secretarias = Departamento.objects.secretarias_gerais_municipais(usuario.administracao.provincia)
+    if not secretarias:
+        return 0
+
+    user_seccao = usuario.seccao
+    user_departamento = usuario.departamento_efetivo
+    movimentacoes = []
+    for sec_geral in secretarias:
+        nova_mov = MovimentacaoDocumento(
+            documento=documento,
+            tipo_movimentacao='encaminhamento',
+            usuario=usuario,
+            departamento_destino=sec_geral,
+            seccao_destino=None,
+            observacoes=observacoes,
+            despacho=despacho
+        )
+        if user_seccao:
+            nova_mov.seccao_origem = user_seccao
+            nova_mov.departamento_origem = user_seccao.departamento
+        elif user_departamento:
+            nova_mov.departamento_origem = user_departamento
+        movimentacoes.append(nova_mov)
+
+    # Validação única: as movimentações só diferem no destino, que é sempre
+    # uma administração municipal da província do Governo
+    movimentacoes[0].full_clean()
+    MovimentacaoDocumento.objects.criar_em_lote(movimentacoes)
+
+    # Notificações dos utilizadores de cada Secretaria Geral (da administração do destino)
+    nomes = {sec_geral.pk: sec_geral.nome for sec_geral in secretarias}
+    destinatarios = list(CustomUser.objects.filter(
+        departamento__in=list(nomes),
+        administracao=F('departamento__administracao'),
+        is_active=True,
+    ).values_list('pk', 'departamento_id'))
+    Notificacao.objects.bulk_create([
+        Notificacao(
+            usuario_id=usuario_destino,
+            mensagem=f"Documento '{documento.numero_protocolo}' encaminhado para departamento {nomes[departamento_id]}.",
+            link=link_documento
+        )
+        for usuario_destino, departamento_id in destinatarios
+    ])
+
+    # A localização "atual" não muda: o documento foi distribuído
+    documento.status = StatusDocumento.ENCAMINHAMENTO
+    documento.save()
+
+    mensagem_ws = f"Novo documento: {documento.numero_protocolo} - {documento.titulo}"
+    for departamento_id in sorted({d for _, d in destinatarios}):
+        notificar(f"departamento_{departamento_id}", mensagem_ws, link_documento)
+    return len(movimentacoes)
+
+
+# ---------------------------------------------------------------------------
+# Pré-visualizações
+# ---------------------------------------------------------------------------
+
+@tarefa('previa.gerar', fila='previas', max_tentativas=3)
+def gerar_previa(hash_conteudo):
+    """Miniatura da primeira página de um conteúdo (imagem ou PDF), ver previas.py."""
+    previa = Previa.objects.filter(hash=hash_conteudo).first()
+    if previa is None:
+        return None
+    return previas.gerar(previa)
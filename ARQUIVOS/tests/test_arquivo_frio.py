@@ -0,0 +1,106 @@
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ARQUIVOS.arquivo_frio import arquivar, pasta
+from ARQUIVOS.conteudo import nome_conteudo
+from ARQUIVOS.models import (
+    Administracao, Departamento, CustomUser, Documento, TipoDocumento,
+    Conteudo, ConteudoArquivado, PacoteArquivo
+)
+
+
+PDF = b'%PDF-1.4\n' + b'Requerimento de licenca comercial. ' * 2000
+FOTO = os.urandom(20_000)
+
+
+class ArquivoFrioTestCase(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.admin = Administracao.objects.create(nome="Uíge", tipo_municipio="A")
+        self.dept = Departamento.objects.create(nome="Finanças", administracao=self.admin, tipo_municipio="A")
+        self.user = CustomUser.objects.create_user(
+            username="user", password="p", administracao=self.admin, departamento=self.dept,
+            nivel_acesso='admin_municipal'
+        )
+        self.tipo = TipoDocumento.objects.create(nome="Ofício", prazo_dias=10)
+
+        self.antigo = self.criar(
+            'arquivado', arquivo=SimpleUploadedFile('requerimento.pdf', PDF),
+            arquivo_digitalizado=SimpleUploadedFile('foto.jpg', FOTO),
+        )
+        conclusao = timezone.now() - timedelta(days=400)
+        Documento.objects.filter(pk=self.antigo.pk).update(data_conclusao=conclusao)
+        self.mes = conclusao.date().replace(day=1)
+
+    def criar(self, status, **ficheiros):
+        return Documento.objects.create(
+            titulo="Requerimento", conteudo="Texto", status=status, **ficheiros,
+            departamento_origem=self.dept, departamento_atual=self.dept, criado_por=self.user,
+            tipo_documento=self.tipo, administracao=self.admin,
+        )
+
+    def test_pacote_com_indice_de_offsets(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            pacotes = arquivar(365)
+
+        self.assertEqual(len(pacotes), 1)
+        pacote = PacoteArquivo.objects.get()
+        self.assertEqual((pacote.administracao, pacote.mes, pacote.ficheiros), (self.admin, self.mes, 2))
+        self.assertLess(pacote.tamanho, pacote.tamanho_original)
+        caminho_pacote = os.path.join(pasta(), pacote.nome)
+        with zipfile.ZipFile(caminho_pacote) as zip_:
+            self.assertIsNone(zip_.testzip())
+
+        # O PDF é comprimido; a fotografia fica como está
+        self.assertEqual(
+            set(ConteudoArquivado.objects.values_list('conteudo__tamanho', 'comprimido')),
+            {(len(PDF), True), (len(FOTO), False)},
+        )
+
+        # Sem ficheiros soltos, mas os nomes continuam a abrir e ocupados
+        self.antigo.refresh_from_db()
+        nome = self.antigo.arquivo.name
+        self.assertFalse(os.path.exists(default_storage.path(nome)))
+        conteudo = Conteudo.objects.get(tamanho=len(PDF))
+        self.assertFalse(os.path.exists(default_storage.path(nome_conteudo(conteudo.hash))))
+        self.assertTrue(default_storage.exists(nome))
+        self.assertEqual(default_storage.size(nome), len(PDF))
+        with self.antigo.arquivo_digitalizado.open('rb') as ficheiro:
+            self.assertEqual(ficheiro.read(), FOTO)
+
+        self.client.force_login(self.user)
+        resposta = self.client.get(self.antigo.arquivo.url)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(b''.join(resposta.streaming_content), PDF)
+        self.assertEqual(resposta['Content-Length'], str(len(PDF)))
+
+    def test_so_documentos_antigos_e_conteudos_nao_partilhados(self):
+        # Mesmo PDF num documento em tramitação: fica no storage quente
+        self.criar('encaminhamento', arquivo=SimpleUploadedFile('copia.pdf', PDF))
+        # Finalizado há pouco tempo
+        self.criar('arquivado', arquivo=SimpleUploadedFile('recente.pdf', b'%PDF-1.4 recente'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            arquivar(365)
+        self.assertEqual(
+            list(ConteudoArquivado.objects.values_list('conteudo__tamanho', flat=True)), [len(FOTO)]
+        )
+        self.antigo.refresh_from_db()
+        self.assertTrue(os.path.exists(self.antigo.arquivo.path))
+
+        # Apagado o último nome, o índice desaparece com o conteúdo
+        default_storage.delete(self.antigo.arquivo_digitalizado.name)
+        self.assertFalse(ConteudoArquivado.objects.exists())
@@ -0,0 +1,99 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from ARQUIVOS.busca import instalar_estrutura, pesquisar
+from ARQUIVOS.formularios import BuscaAvancadaForm
+from ARQUIVOS.models import (
+    Administracao, Departamento, CustomUser, Documento, TipoDocumento, DocumentoBusca
+)
+
+
+class BuscaTextoIntegralTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Os testes correm sem migrações: a estrutura do banco é criada aqui
+        instalar_estrutura(connection)
+
+    def setUp(self):
+        self.tipo_doc = TipoDocumento.objects.create(nome="Ofício", prazo_dias=10)
+        self.admin = Administracao.objects.create(nome="Uíge", tipo_municipio="A")
+        self.outra_admin = Administracao.objects.create(nome="Negage", tipo_municipio="A")
+        self.dept = Departamento.objects.create(nome="Finanças", administracao=self.admin, tipo_municipio="A")
+        self.outro_dept = Departamento.objects.create(nome="Saúde", administracao=self.outra_admin, tipo_municipio="A")
+        self.user = CustomUser.objects.create_user(
+            username="user", password="password", administracao=self.admin,
+            departamento=self.dept, nivel_acesso='admin_municipal'
+        )
+
+        self.ferias = self._criar("Pedido de férias", "Solicito as férias do funcionário", tags="rh, ferias")
+        self.obras = self._criar("Relatório de obras", "Obras na estrada nacional", tags="obras")
+        self.alheio = self._criar(
+            "Pedido de férias", "Férias noutra administração", tags="rh",
+            administracao=self.outra_admin, departamento=self.outro_dept
+        )
+
+    def _criar(self, titulo, conteudo, tags='', administracao=None, departamento=None):
+        departamento = departamento or self.dept
+        return Documento.objects.create(
+            titulo=titulo,
+            conteudo=conteudo,
+            tags=tags,
+            departamento_origem=departamento,
+            departamento_atual=departamento,
+            criado_por=self.user,
+            tipo_documento=self.tipo_doc,
+            administracao=administracao or self.admin
+        )
+
+    def _ids(self, queryset):
+        return set(queryset.values_list('pk', flat=True))
+
+    def test_sem_acentos_e_por_prefixo(self):
+        documentos = Documento.objects.para_usuario(self.user)
+        self.assertEqual(self._ids(pesquisar(documentos, 'FERIAS')), {self.ferias.pk})
+        self.assertEqual(self._ids(pesquisar(documentos, 'relat obra')), {self.obras.pk})
+        self.assertEqual(self._ids(pesquisar(documentos, self.obras.numero_protocolo)), {self.obras.pk})
+        self.assertFalse(pesquisar(documentos, '  !! ').exists())
+
+    def test_relevancia_titulo_antes_do_conteudo(self):
+        so_conteudo = self._criar("Memorando", "Referente a obras pendentes")
+        documentos = pesquisar(Documento.objects.para_usuario(self.user), 'obras').order_by('-relevancia')
+        self.assertEqual([d.pk for d in documentos], [self.obras.pk, so_conteudo.pk])
+
+    def test_alteracao_reindexa(self):
+        self.obras.titulo = "Relatório de saneamento"
+        self.obras.save()
+        documentos = Documento.objects.para_usuario(self.user)
+        self.assertEqual(self._ids(pesquisar(documentos, 'saneamento')), {self.obras.pk})
+        self.assertFalse(pesquisar(documentos, 'relatorio obras', colunas=('titulo',)).exists())
+
+    def test_busca_ajax_restrita_a_administracao(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('busca_ajax'), {'termo': 'férias'})
+        self.assertEqual([r['id'] for r in response.json()['resultados']], [str(self.ferias.pk)])
+
+    def test_busca_avancada_por_coluna_e_tags(self):
+        documentos = Documento.objects.para_usuario(self.user)
+        form = BuscaAvancadaForm({'conteudo': 'estrada'}, user=self.user)
+        self.assertTrue(form.is_valid())
+        self.assertEqual(self._ids(form.filtrar(documentos)), {self.obras.pk})
+
+        form = BuscaAvancadaForm({'titulo': 'estrada'}, user=self.user)
+        self.assertTrue(form.is_valid())
+        self.assertFalse(form.filtrar(documentos).exists())
+
+        form = BuscaAvancadaForm({'tags': 'rh, férias'}, user=self.user)
+        self.assertTrue(form.is_valid())
+        self.assertEqual(self._ids(form.filtrar(documentos)), {self.ferias.pk})
+
+    def test_reconstruir_indices_repoe_pesquisa(self):
+        DocumentoBusca.objects.all().delete()
+        documentos = Documento.objects.para_usuario(self.user)
+        self.assertFalse(pesquisar(documentos, 'ferias').exists())
+
+        call_command('reconstruir_indices', stdout=StringIO())
+        self.assertEqual(self._ids(pesquisar(documentos, 'ferias')), {self.ferias.pk})
@@ -0,0 +1,87 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from ARQUIVOS.busca import aproximados, semelhancas, trigramas
+from ARQUIVOS.models import (
+    Administracao, Departamento, CustomUser, Documento, TipoDocumento, TrigramaDocumento
+)
+
+
+class BuscaAproximadaTestCase(TestCase):
+    def setUp(self):
+        self.tipo_doc = TipoDocumento.objects.create(nome="Ofício", prazo_dias=10)
+        self.admin = Administracao.objects.create(nome="Uíge", tipo_municipio="A")
+        self.outra_admin = Administracao.objects.create(nome="Negage", tipo_municipio="A")
+        self.dept = Departamento.objects.create(nome="Finanças", administracao=self.admin, tipo_municipio="A")
+        self.outro_dept = Departamento.objects.create(nome="Saúde", administracao=self.outra_admin, tipo_municipio="A")
+        self.user = CustomUser.objects.create_user(
+            username="balcao", password="password", administracao=self.admin,
+            departamento=self.dept, nivel_acesso='admin_municipal'
+        )
+
+        self.joao = self._criar("João Manuel da Silva", "Processo Armário-3/doc-335")
+        self.maria = self._criar("Maria Fernandes", "Contrato de obras 2025")
+        self.alheio = self._criar(
+            "João Manuel da Silva", "Processo Armário-3/doc-335",
+            administracao=self.outra_admin, departamento=self.outro_dept
+        )
+
+    def _criar(self, utente, referencia, administracao=None, departamento=None):
+        departamento = departamento or self.dept
+        return Documento.objects.create(
+            titulo="Requerimento",
+            conteudo="Texto",
+            utente=utente,
+            referencia=referencia,
+            departamento_origem=departamento,
+            departamento_atual=departamento,
+            criado_por=self.user,
+            tipo_documento=self.tipo_doc,
+            administracao=administracao or self.admin
+        )
+
+    def _ids(self, documentos):
+        return [d.pk for d in documentos]
+
+    def test_trigramas_como_pg_trgm(self):
+        self.assertEqual(trigramas('Cão'), {'  c', ' ca', 'cao', 'ao '})
+        na_palavra, total = semelhancas(trigramas('silva'), trigramas('joao silva'))
+        self.assertEqual(na_palavra, 1.0)
+        self.assertLess(total, 1.0)
+
+    def test_nome_mal_escrito(self):
+        documentos = Documento.objects.para_usuario(self.user)
+        resultado = aproximados(documentos, 'Joao Sivla', campos=('utente',))
+        self.assertEqual(self._ids(resultado), [self.joao.pk])
+        self.assertEqual(resultado[0].campo_semelhante, 'utente')
+        self.assertFalse(aproximados(documentos, 'Pedro Gomes', campos=('utente',)))
+
+    def test_protocolo_parcial_e_referencia(self):
+        documentos = Documento.objects.para_usuario(self.user)
+        self.assertEqual(self._ids(aproximados(documentos, self.maria.numero_protocolo))[0], self.maria.pk)
+        self.assertEqual(self._ids(aproximados(documentos, 'armario 3 doc 335')), [self.joao.pk])
+
+    def test_alteracao_reescreve_trigramas(self):
+        self.maria.utente = "Mariana Fernandes"
+        self.maria.save()
+        self.assertFalse(TrigramaDocumento.objects.filter(documento=self.maria, campo='utente', trigrama='ia ').exists())
+        self.assertTrue(TrigramaDocumento.objects.filter(documento=self.maria, campo='utente', trigrama='na ').exists())
+
+        resultado = aproximados(Documento.objects.para_usuario(self.user), 'mariana', campos=('utente',))
+        self.assertEqual(self._ids(resultado), [self.maria.pk])
+
+    def test_view_restrita_a_administracao(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('localizar_ajax'), {'q': 'joao da silva'})
+        self.assertEqual([r['id'] for r in response.json()['resultados']], [str(self.joao.pk)])
+
+        response = self.client.get(reverse('localizar_ajax'), {'q': 'joao', 'campo': 'titulo'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_reconstruir_indices_repoe_trigramas(self):
+        TrigramaDocumento.objects.all().delete()
+        call_command('reconstruir_indices', stdout=StringIO())
+        resultado = aproximados(Documento.objects.para_usuario(self.user), 'Joao Sivla', campos=('utente',))
+        self.assertEqual(self._ids(resultado), [self.joao.pk])
@@ -0,0 +1,92 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from ARQUIVOS.busca import contar_facetas, instalar_estrutura
+from ARQUIVOS.models import (
+    Administracao, Departamento, CustomUser, Documento, TipoDocumento, StatusDocumento
+)
+
+
+class BuscaFacetadaTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        instalar_estrutura(connection)
+
+    def setUp(self):
+        self.oficio = TipoDocumento.objects.create(nome="Ofício", prazo_dias=10)
+        self.requerimento = TipoDocumento.objects.create(nome="Requerimento", prazo_dias=10)
+        self.admin = Administracao.objects.create(nome="Uíge", tipo_municipio="A")
+        self.dept_a = Departamento.objects.create(nome="Finanças", administracao=self.admin, tipo_municipio="A")
+        self.dept_b = Departamento.objects.create(nome="Saúde", administracao=self.admin, tipo_municipio="A")
+        self.user_a = CustomUser.objects.create_user(
+            username="user_a", password="password", administracao=self.admin, departamento=self.dept_a
+        )
+
+        self._criar(self.oficio, self.dept_a, StatusDocumento.ARQUIVADO, "Ofício de obras")
+        self._criar(self.oficio, self.dept_a, StatusDocumento.ENCAMINHAMENTO, "Ofício de férias")
+        self._criar(self.requerimento, self.dept_a, StatusDocumento.ARQUIVADO, "Requerimento de obras")
+        # Noutro departamento: fora da visibilidade de user_a
+        self._criar(self.oficio, self.dept_b, StatusDocumento.ARQUIVADO, "Ofício de obras")
+
+    def _criar(self, tipo, departamento, status, titulo):
+        return Documento.objects.create(
+            titulo=titulo,
+            conteudo="Texto",
+            departamento_origem=departamento,
+            departamento_atual=departamento,
+            criado_por=self.user_a,
+            tipo_documento=tipo,
+            administracao=self.admin,
+            status=status,
+            prioridade='Normal',
+        )
+
+    def _facetas(self, dados):
+        return {
+            faceta: {item['valor']: item['total'] for item in itens}
+            for faceta, itens in dados['facetas'].items()
+        }
+
+    def test_uma_consulta_para_todas_as_facetas(self):
+        documentos = Documento.objects.para_usuario(self.user_a)
+        with CaptureQueriesContext(connection) as consultas:
+            contagens, total = contar_facetas(documentos)
+        self.assertEqual(len(consultas), 1)
+        self.assertEqual(total, 3)
+        self.assertEqual(contagens['status'], {'arquivado': 2, 'encaminhamento': 1})
+        self.assertEqual(contagens['tipo_documento'], {self.oficio.pk: 2, self.requerimento.pk: 1})
+        self.assertEqual(contagens['departamento'], {self.dept_a.pk: 3})
+
+    def test_faceta_escolhida_nao_se_restringe_a_si_propria(self):
+        self.client.force_login(self.user_a)
+        response = self.client.get(reverse('busca_avancada'), {'status': 'arquivado'})
+        self.assertEqual(response.status_code, 200)
+        dados = response.json()
+        facetas = self._facetas(dados)
+
+        self.assertEqual(dados['total'], 2)
+        self.assertEqual(len(dados['resultados']), 2)
+        # Status mostra as alternativas; as outras facetas já só contam os arquivados
+        self.assertEqual(facetas['status'], {'arquivado': 2, 'encaminhamento': 1})
+        self.assertEqual(facetas['tipo_documento'], {self.oficio.pk: 1, self.requerimento.pk: 1})
+        rotulos = {item['valor']: item['rotulo'] for item in dados['facetas']['departamento']}
+        self.assertEqual(rotulos, {self.dept_a.pk: "Finanças"})
+
+    def test_texto_e_facetas_combinados(self):
+        self.client.force_login(self.user_a)
+        response = self.client.get(reverse('busca_avancada'), {
+            'titulo': 'obras', 'tipo_documento': self.oficio.pk
+        })
+        dados = response.json()
+        self.assertEqual(dados['total'], 1)
+        self.assertEqual([r['titulo'] for r in dados['resultados']], ["Ofício de obras"])
+        self.assertEqual(
+            self._facetas(dados)['tipo_documento'], {self.oficio.pk: 1, self.requerimento.pk: 1}
+        )
+
+    def test_formulario_invalido(self):
+        self.client.force_login(self.user_a)
+        response = self.client.get(reverse('busca_avancada'), {'status': 'inexistente'})
+        self.assertEqual(response.status_code, 400)
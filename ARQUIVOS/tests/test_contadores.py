@@ -0,0 +1,178 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from ARQUIVOS.models import (
+    Administracao, Departamento, CustomUser, Documento, TipoDocumento,
+    MovimentacaoDocumento, Seccoes, StatusDocumento, ContadorUnidade
+)
+from ARQUIVOS.models.indices import ESTADOS_FINAIS
+
+
+class ContadorUnidadeTestCase(TestCase):
+    def setUp(self):
+        self.tipo_doc = TipoDocumento.objects.create(nome="Ofício", prazo_dias=10)
+        self.admin = Administracao.objects.create(nome="Uíge", tipo_municipio="A")
+        self.dept_a = Departamento.objects.create(nome="Finanças", administracao=self.admin, tipo_municipio="A")
+        self.dept_b = Departamento.objects.create(nome="Saúde", administracao=self.admin, tipo_municipio="A")
+        self.seccao_a = Seccoes.objects.create(nome="Contabilidade", departamento=self.dept_a)
+        self.seccao_b = Seccoes.objects.create(nome="Farmácia", departamento=self.dept_b)
+
+        self.user_seccao_a = CustomUser.objects.create_user(
+            username="sec_a", password="password", administracao=self.admin,
+            departamento=self.dept_a, seccao=self.seccao_a
+        )
+        self.user_dept_b = CustomUser.objects.create_user(
+            username="dept_b", password="password", administracao=self.admin, departamento=self.dept_b
+        )
+        self.user_seccao_b = CustomUser.objects.create_user(
+            username="sec_b", password="password", administracao=self.admin,
+            departamento=self.dept_b, seccao=self.seccao_b
+        )
+        self.diretor = CustomUser.objects.create_user(
+            username="diretor", password="password", administracao=self.admin,
+            departamento=self.dept_a, nivel_acesso='diretor_municipal'
+        )
+
+    def _criar_documento(self):
+        doc = Documento.objects.create(
+            titulo="Requerimento",
+            departamento_origem=self.dept_a,
+            departamento_atual=self.dept_a,
+            seccao_atual=self.seccao_a,
+            criado_por=self.user_seccao_a,
+            tipo_documento=self.tipo_doc,
+            administracao=self.admin
+        )
+        MovimentacaoDocumento.objects.create(
+            documento=doc,
+            tipo_movimentacao='criacao',
+            departamento_origem=self.dept_a,
+            seccao_origem=self.seccao_a,
+            usuario=self.user_seccao_a
+        )
+        return doc
+
+    def _encaminhar(self, doc, departamento, seccao=None):
+        mov = MovimentacaoDocumento.objects.create(
+            documento=doc,
+            tipo_movimentacao='encaminhamento',
+            departamento_origem=doc.departamento_atual,
+            seccao_origem=doc.seccao_atual,
+            departamento_destino=departamento,
+            seccao_destino=seccao,
+            usuario=self.user_seccao_a
+        )
+        doc.departamento_atual = departamento
+        doc.seccao_atual = seccao
+        doc.save()
+        return mov
+
+    def _esperado(self, user):
+        """As contagens calculadas como o dashboard fazia antes (consultas diretas)."""
+        hoje = timezone.localdate()
+        seccao = user.seccao
+        if seccao:
+            destino, origem = {'seccao_destino': seccao}, {'seccao_origem': seccao}
+            posse = Documento.objects.filter(seccao_atual=seccao).count()
+        else:
+            destino, origem = {'departamento_destino': user.departamento}, {'departamento_origem': user.departamento}
+            posse = Documento.objects.filter(departamento_atual=user.departamento, seccao_atual__isnull=True).count()
+        movs = MovimentacaoDocumento.objects.filter(tipo_movimentacao='encaminhamento', data_movimentacao__date=hoje)
+        meus = Documento.objects.para_usuario(user)
+        return {
+            'documentos_pendentes': movs.filter(confirmado_recebimento=False, **destino).count(),
+            'documentos_encaminhados_hoje': movs.filter(**origem).count(),
+            'documentos_registados_hoje': Documento.objects.filter(
+                departamento_origem=user.departamento, data_criacao__date=hoje
+            ).count(),
+            'doc_posse': posse,
+            'doc_historico': meus.count() - posse,
+            'documentos_mortos': meus.filter(status__in=ESTADOS_FINAIS).count(),
+        }
+
+    def _dashboard(self, user):
+        self.client.force_login(user)
+        response = self.client.get(reverse('Painel'))
+        self.assertEqual(response.status_code, 200)
+        return {chave: response.context[chave] for chave in self._esperado(user)}
+
+    def _cenario(self):
+        doc1 = self._criar_documento()
+        doc2 = self._criar_documento()
+        doc3 = self._criar_documento()
+
+        mov = self._encaminhar(doc1, self.dept_b)
+        self._encaminhar(doc2, self.dept_b, self.seccao_b)
+        self._encaminhar(doc3, self.dept_b)
+
+        # Confirmação do recebimento e despacho
+        mov.confirmado_recebimento = True
+        mov.data_confirmacao = timezone.now()
+        mov.usuario_confirmacao = self.user_dept_b
+        mov.save()
+        doc1.status = StatusDocumento.DESPACHO
+        doc1.save()
+
+        # Documento apagado logicamente deixa de contar
+        doc3.delete()
+
+    def test_dashboard_igual_as_consultas_diretas(self):
+        self._cenario()
+        for user in (self.user_seccao_a, self.user_dept_b, self.user_seccao_b, self.diretor):
+            with self.subTest(user=user.username):
+                self.assertEqual(self._dashboard(user), self._esperado(user))
+
+    def test_recebidos_e_finalizados(self):
+        self._cenario()
+        valores = ContadorUnidade.objects.valores([f'departamento_{self.dept_b.pk}'], timezone.localdate())
+        self.assertEqual(valores[(f'departamento_{self.dept_b.pk}', 'recebido')], 1)
+        self.assertEqual(valores[(f'departamento_{self.dept_b.pk}', 'finalizado')], 1)
+
+    def test_reconstruir_indices_recalcula_contadores(self):
+        self._cenario()
+        campos = ('unidade', 'dia', 'metrica', 'valor')
+        antes = set(ContadorUnidade.objects.exclude(valor=0).values_list(*campos))
+
+        ContadorUnidade.objects.all().delete()
+        call_command('reconstruir_indices', stdout=StringIO())
+
+        self.assertEqual(set(ContadorUnidade.objects.values_list(*campos)), antes)
+
+    def test_documento_de_outra_administracao_nao_conta(self):
+        # Documento do Governo difundido para um departamento municipal (como em enviar_todas)
+        governo = Administracao.objects.create(nome="Governo Provincial", tipo_municipio="A")
+        gabinete = Departamento.objects.create(nome="Gabinete", administracao=governo, tipo_municipio="A")
+        autor = CustomUser.objects.create_user(
+            username="governo", password="password", administracao=governo, departamento=gabinete
+        )
+        doc = Documento.objects.create(
+            titulo="Circular", departamento_origem=gabinete, departamento_atual=gabinete,
+            criado_por=autor, tipo_documento=self.tipo_doc, administracao=governo
+        )
+        MovimentacaoDocumento.objects.criar_em_lote([
+            MovimentacaoDocumento(
+                documento=doc, tipo_movimentacao='encaminhamento', usuario=autor,
+                departamento_origem=gabinete, departamento_destino=destino, seccao_destino=seccao,
+            )
+            for destino, seccao in ((self.dept_b, None), (self.dept_a, self.seccao_a))
+        ])
+        doc.status = StatusDocumento.ARQUIVADO
+        doc.save()
+
+        for user in (self.user_dept_b, self.user_seccao_a):
+            with self.subTest(user=user.username):
+                self.assertEqual(Documento.objects.para_usuario(user).count(), 0)
+                self.assertEqual(self._dashboard(user), self._esperado(user))
+        unidades = [f'departamento_{self.dept_b.pk}', f'seccao_{self.seccao_a.pk}', f'departamento_{gabinete.pk}']
+        valores = ContadorUnidade.objects.valores(unidades, timezone.localdate())
+        self.assertNotIn((unidades[0], 'visivel'), valores)
+        self.assertNotIn((unidades[1], 'visivel'), valores)
+        self.assertEqual(valores[(unidades[2], 'finalizado')], 1)
+
+        campos = ('unidade', 'dia', 'metrica', 'valor')
+        antes = set(ContadorUnidade.objects.exclude(valor=0).values_list(*campos))
+        call_command('reconstruir_indices', stdout=StringIO())
+        self.assertEqual(set(ContadorUnidade.objects.exclude(valor=0).values_list(*campos)), antes)
@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from ARQUIVOS.conteudo import nome_conteudo
+from ARQUIVOS.models import (
+    Administracao, Departamento, CustomUser, Documento, TipoDocumento, Anexo,
+    Conteudo, ReferenciaConteudo
+)
+
+
+DIGITALIZACAO = b'%PDF-1.4 requerimento digitalizado ' * 1000
+
+
+class ArmazenamentoConteudoTestCase(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_mesmo_conteudo_guardado_uma_vez(self):
+        admin = Administracao.objects.create(nome="Uíge", tipo_municipio="A")
+        dept = Departamento.objects.create(nome="Finanças", administracao=admin, tipo_municipio="A")
+        user = CustomUser.objects.create_user(username="user", password="p", administracao=admin, departamento=dept)
+        doc = Documento.objects.create(
+            titulo="Requerimento", conteudo="Texto",
+            arquivo=SimpleUploadedFile('requerimento.pdf', DIGITALIZACAO),
+            arquivo_digitalizado=SimpleUploadedFile('scan.pdf', DIGITALIZACAO),
+            departamento_origem=dept, departamento_atual=dept, criado_por=user,
+            tipo_documento=TipoDocumento.objects.create(nome="Ofício", prazo_dias=10), administracao=admin,
+        )
+        anexo = Anexo.objects.create(
+            documento=doc, nome="Cópia", usuario_upload=user,
+            arquivo=SimpleUploadedFile('copia.pdf', DIGITALIZACAO),
+        )
+
+        conteudo = Conteudo.objects.get()
+        self.assertEqual((conteudo.referencias, conteudo.tamanho), (3, len(DIGITALIZACAO)))
+        blob = default_storage.path(nome_conteudo(conteudo.hash))
+        for campo in (doc.arquivo, doc.arquivo_digitalizado, anexo.arquivo):
+            self.assertTrue(campo.name.endswith('.pdf'))
+            self.assertTrue(os.path.samefile(campo.path, blob))
+            with campo.open('rb') as ficheiro:
+                self.assertEqual(ficheiro.read(), DIGITALIZACAO)
+        self.assertEqual(os.stat(blob).st_nlink, 4)
+
+    def test_apagar_liberta_o_conteudo_na_ultima_referencia(self):
+        primeiro = default_storage.save('anexos/a.pdf', ContentFile(b'igual'))
+        segundo = default_storage.save('anexos/a.pdf', ContentFile(b'igual'))
+        self.assertNotEqual(primeiro, segundo)
+        blob = default_storage.path(nome_conteudo(Conteudo.objects.get().hash))
+
+        default_storage.delete(primeiro)
+        self.assertFalse(default_storage.exists(primeiro))
+        self.assertEqual(Conteudo.objects.get().referencias, 1)
+        self.assertTrue(os.path.exists(blob))
+
+        default_storage.delete(segundo)
+        self.assertFalse(Conteudo.objects.exists())
+        self.assertFalse(ReferenciaConteudo.objects.exists())
+        self.assertFalse(os.path.exists(blob))
+
+    def test_comando_deduplica_ficheiros_existentes(self):
+        for nome in ('documentos/2025/01/r.pdf', 'digitalizados/2025/01/r.pdf', 'anexos/2025/01/c.pdf'):
+            os.makedirs(os.path.dirname(os.path.join(self.media, nome)), exist_ok=True)
+            with open(os.path.join(self.media, nome), 'wb') as ficheiro:
+                ficheiro.write(DIGITALIZACAO)
+        with open(os.path.join(self.media, 'anexos/2025/01/outro.pdf'), 'wb') as ficheiro:
+            ficheiro.write(b'diferente')
+
+        saida = StringIO()
+        call_command('deduplicar_media', stdout=saida)
+        self.assertIn('4 ficheiros incorporados (2 repetidos', saida.getvalue())
+        conteudo = Conteudo.objects.get(tamanho=len(DIGITALIZACAO))
+        self.assertEqual(conteudo.referencias, 3)
+        self.assertEqual(os.stat(default_storage.path(nome_conteudo(conteudo.hash))).st_nlink, 4)
+
+        # Segunda execução: nada a fazer
+        saida = StringIO()
+        call_command('deduplicar_media', stdout=saida)
+        self.assertIn('0 ficheiros incorporados', saida.getvalue())
+        self.assertIn('4 já incorporados', saida.getvalue())
@@ -0,0 +1,123 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from smtplib import SMTPRecipientsRefused
+
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ARQUIVOS.correio import enfileirar_email, enviar_pendentes
+from ARQUIVOS.fila import trabalhar
+from ARQUIVOS.models import EmailSaida, EstadoEmail, Tarefa, EstadoTarefa
+
+
+class BackendContador(locmem.EmailBackend):
+    """locmem que conta as ligações abertas e recusa o destinatário 'recusado@...'."""
+    aberturas = 0
+
+    def open(self):
+        BackendContador.aberturas += 1
+        return True
+
+    def send_messages(self, messages):
+        for message in messages:
+            if any(d.startswith('recusado@') for d in message.to):
+                raise SMTPRecipientsRefused({message.to[0]: (550, b'Mailbox unavailable')})
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='ARQUIVOS.tests.test_correio.BackendContador', SGA_EMAIL_LOTE=50)
+class CaixaSaidaTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media)
+        cls.media_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_override.disable()
+        shutil.rmtree(cls.media, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        BackendContador.aberturas = 0
+
+    def test_lote_usa_uma_ligacao(self):
+        anexo = default_storage.save('despachos/nota.pdf', ContentFile(b'%PDF-1.4 teste'))
+        for i in range(5):
+            enfileirar_email(f'Despacho {i}', 'Texto', [f'utente{i}@example.ao'], anexo=anexo)
+        # Uma só tarefa de envio para todos
+        self.assertEqual(Tarefa.objects.filter(nome='email.enviar').count(), 1)
+
+        self.assertEqual(trabalhar(uma_vez=True), 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(BackendContador.aberturas, 1)
+        self.assertEqual(mail.outbox[0].attachments, [('nota.pdf', b'%PDF-1.4 teste', 'application/pdf')])
+        self.assertEqual(EmailSaida.objects.filter(estado=EstadoEmail.ENVIADO).count(), 5)
+        self.assertEqual(Tarefa.objects.get().estado, EstadoTarefa.CONCLUIDA)
+
+    def test_falha_fica_registada_e_e_reagendada(self):
+        enfileirar_email('A', 'Texto', ['a@example.ao'])
+        recusado = enfileirar_email('B', 'Texto', ['recusado@example.ao'])
+        enfileirar_email('C', 'Texto', ['c@example.ao'])
+
+        with self.assertLogs('ARQUIVOS.correio', 'WARNING'):
+            trabalhar(uma_vez=True)
+
+        self.assertEqual([m.subject for m in mail.outbox], ['A', 'C'])
+        # A ligação é reaberta depois do erro
+        self.assertEqual(BackendContador.aberturas, 2)
+        recusado.refresh_from_db()
+        self.assertEqual((recusado.estado, recusado.tentativas), (EstadoEmail.PENDENTE, 1))
+        self.assertIn('SMTPRecipientsRefused', recusado.erro)
+        self.assertGreater(recusado.proxima_tentativa, timezone.now())
+        # Nova tarefa de envio para quando o email voltar a estar pronto
+        proxima = Tarefa.objects.get(nome='email.enviar', estado=EstadoTarefa.PENDENTE)
+        self.assertAlmostEqual(proxima.executar_em, recusado.proxima_tentativa, delta=timedelta(seconds=1))
+
+    def test_email_novo_nao_espera_pelo_recusado(self):
+        recusado = enfileirar_email('B', 'Texto', ['recusado@example.ao'])
+        with self.assertLogs('ARQUIVOS.correio', 'WARNING'):
+            trabalhar(uma_vez=True)
+        # A tarefa seguinte ficou para o fim do atraso do recusado; o email novo antecipa-a
+        novo = enfileirar_email('N', 'Texto', ['n@example.ao'])
+        self.assertEqual(Tarefa.objects.filter(nome='email.enviar', estado=EstadoTarefa.PENDENTE).count(), 1)
+
+        self.assertEqual(trabalhar(uma_vez=True), 1)
+        novo.refresh_from_db()
+        self.assertEqual(novo.estado, EstadoEmail.ENVIADO)
+        self.assertEqual([m.subject for m in mail.outbox], ['N'])
+        # E o recusado continua agendado para a sua nova tentativa
+        recusado.refresh_from_db()
+        proxima = Tarefa.objects.get(nome='email.enviar', estado=EstadoTarefa.PENDENTE)
+        self.assertAlmostEqual(proxima.executar_em, recusado.proxima_tentativa, delta=timedelta(seconds=1))
+
+    def test_tentativas_esgotadas_e_reenvio(self):
+        email = enfileirar_email('B', 'Texto', ['recusado@example.ao'])
+        EmailSaida.objects.update(max_tentativas=1)
+        with self.assertLogs('ARQUIVOS.correio', 'WARNING'):
+            self.assertEqual(enviar_pendentes(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.estado, EstadoEmail.FALHADO)
+
+        EmailSaida.objects.update(destinatarios=['corrigido@example.ao'])
+        saida = StringIO()
+        call_command('enviar_emails', '--reenviar-falhados', stdout=saida)
+        self.assertIn('1 emails enviados, 0 falhas, 0 pendentes', saida.getvalue())
+        self.assertEqual(mail.outbox[0].to, ['corrigido@example.ao'])
+
+    def test_reserva_exclusiva(self):
+        enfileirar_email('A', 'Texto', ['a@example.ao'])
+        self.assertEqual(len(EmailSaida.objects.reservar('w1')), 1)
+        self.assertEqual(EmailSaida.objects.reservar('w2'), [])
+        # Reserva expirada (processo morto): volta a estar disponível
+        EmailSaida.objects.update(reservado_ate=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(len(EmailSaida.objects.reservar('w2')), 1)
@@ -0,0 +1,94 @@
+import shutil
+import tempfile
+from urllib.parse import quote
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from ARQUIVOS.downloads import IntervaloInvalido, intervalo_pedido
+from ARQUIVOS.models import Administracao, Departamento, CustomUser, Documento, TipoDocumento
+
+
+PDF = bytes(range(256)) * 40
+
+
+class IntervaloTestCase(TestCase):
+    def test_intervalos(self):
+        self.assertEqual(intervalo_pedido('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(intervalo_pedido('bytes=900-', 1000), (900, 999))
+        self.assertEqual(intervalo_pedido('bytes=-100', 1000), (900, 999))
+        self.assertEqual(intervalo_pedido('bytes=990-2000', 1000), (990, 999))
+        # Sem Range, vários intervalos ou mal formado: ficheiro inteiro
+        for cabecalho in (None, 'bytes=0-1,5-9', 'linhas=1-2', 'bytes=a-b'):
+            self.assertIsNone(intervalo_pedido(cabecalho, 1000))
+        for cabecalho in ('bytes=1000-', 'bytes=-0', 'bytes=50-10'):
+            with self.assertRaises(IntervaloInvalido):
+                intervalo_pedido(cabecalho, 1000)
+
+
+class FicheiroProtegidoTestCase(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        admin = Administracao.objects.create(nome="Uíge", tipo_municipio="A")
+        dept = Departamento.objects.create(nome="Finanças", administracao=admin, tipo_municipio="A")
+        self.user = CustomUser.objects.create_user(
+            username="user", password="p", administracao=admin, departamento=dept, nivel_acesso='admin_municipal'
+        )
+        self.documento = Documento.objects.create(
+            titulo="Requerimento", conteudo="Texto",
+            arquivo=SimpleUploadedFile('parecer técnico.pdf', PDF),
+            departamento_origem=dept, departamento_atual=dept, criado_por=self.user,
+            tipo_documento=TipoDocumento.objects.create(nome="Ofício", prazo_dias=10), administracao=admin,
+        )
+        self.url = self.documento.arquivo.url
+        self.client.force_login(self.user)
+
+    def test_ficheiro_inteiro_e_304(self):
+        resposta = self.client.get(self.url)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(b''.join(resposta.streaming_content), PDF)
+        self.assertEqual(resposta['Accept-Ranges'], 'bytes')
+        self.assertEqual(resposta['Content-Type'], 'application/pdf')
+        self.assertIn("filename*=UTF-8''parecer_t%C3%A9cnico.pdf", resposta['Content-Disposition'])
+
+        resposta = self.client.get(self.url, headers={'If-None-Match': resposta['ETag']})
+        self.assertEqual(resposta.status_code, 304)
+
+    def test_range_e_retoma(self):
+        resposta = self.client.get(self.url, headers={'Range': 'bytes=100-199'})
+        self.assertEqual(resposta.status_code, 206)
+        self.assertEqual(resposta['Content-Range'], f'bytes 100-199/{len(PDF)}')
+        self.assertEqual(b''.join(resposta.streaming_content), PDF[100:200])
+
+        etag = self.client.get(self.url)['ETag']
+        resposta = self.client.get(self.url, headers={'Range': 'bytes=-10', 'If-Range': etag})
+        self.assertEqual(b''.join(resposta.streaming_content), PDF[-10:])
+        # If-Range de outra versão: o ficheiro inteiro
+        resposta = self.client.get(self.url, headers={'Range': 'bytes=0-9', 'If-Range': '"outro"'})
+        self.assertEqual(resposta.status_code, 200)
+
+        resposta = self.client.get(self.url, headers={'Range': f'bytes={len(PDF)}-'})
+        self.assertEqual((resposta.status_code, resposta['Content-Range']), (416, f'bytes */{len(PDF)}'))
+
+    def test_outra_administracao_nao_ve(self):
+        outra = Administracao.objects.create(nome="Negage", tipo_municipio="A")
+        dept = Departamento.objects.create(nome="Saúde", administracao=outra, tipo_municipio="A")
+        alheio = CustomUser.objects.create_user(
+            username="alheio", password="p", administracao=outra, departamento=dept, nivel_acesso='admin_municipal'
+        )
+        self.client.force_login(alheio)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(self.client.get('/media/conteudo/tmp/x').status_code, 404)
+
+    def test_entrega_pelo_servidor_web(self):
+        with override_settings(SGA_ENTREGA_FICHEIROS='nginx'):
+            resposta = self.client.get(self.url)
+            self.assertEqual(resposta['X-Accel-Redirect'], '/protegido/' + quote(self.documento.arquivo.name))
+            self.assertEqual(resposta.content, b'')
+        with override_settings(SGA_ENTREGA_FICHEIROS='sendfile'):
+            self.assertEqual(self.client.get(self.url)['X-Sendfile'], self.documento.arquivo.path)
@@ -0,0 +1,174 @@
+import io
+import shutil
+import tempfile
+import zipfile
+from io import StringIO
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from reportlab.pdfgen import canvas
+
+from ARQUIVOS import extracao
+from ARQUIVOS.busca import instalar_estrutura, pesquisar
+from ARQUIVOS.models import (
+    Administracao, Departamento, CustomUser, Documento, TipoDocumento, Anexo,
+    TextoExtraido, EstadoExtracao
+)
+
+
+def gerar_pdf(*linhas):
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for i, linha in enumerate(linhas):
+        pdf.drawString(72, 750 - 20 * i, linha)
+    pdf.save()
+    return buffer.getvalue()
+
+
+def gerar_docx(*paragrafos):
+    corpo = ''.join(f'<w:p><w:r><w:t>{texto}</w:t></w:r></w:p>' for texto in paragrafos)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as docx:
+        docx.writestr('[Content_Types].xml', '<Types/>')
+        docx.writestr(
+            'word/document.xml',
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f'<w:body>{corpo}</w:body></w:document>'
+        )
+    return buffer.getvalue()
+
+
+class ExtratoresTestCase(TestCase):
+    def test_pdf_camada_de_texto(self):
+        texto = extracao._texto_pdf_interno(gerar_pdf("Parecer técnico (obras)", "Estrada nacional 12"))
+        self.assertIn("Parecer técnico (obras)", texto)
+        self.assertIn("Estrada nacional 12", texto)
+
+    def test_docx(self):
+        texto, metodo = extracao.extrair(gerar_docx("Contrato de fornecimento", "Cláusula segunda"), 'c.docx')
+        self.assertEqual(metodo, 'docx')
+        self.assertEqual(texto, "Contrato de fornecimento\nCláusula segunda")
+
+    def test_formato_sem_texto(self):
+        self.assertEqual(extracao.extrair(b'\x00\x01', 'antigo.doc'), ('', ''))
+        with self.assertRaises(extracao.ErroExtracao):
+            extracao.texto_docx(b'nao e um zip')
+
+
+class PipelineExtracaoTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        instalar_estrutura(connection)
+        cls.media = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media)
+        cls.media_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_override.disable()
+        shutil.rmtree(cls.media, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.tipo_doc = TipoDocumento.objects.create(nome="Ofício", prazo_dias=10)
+        self.admin = Administracao.objects.create(nome="Uíge", tipo_municipio="A")
+        self.dept = Departamento.objects.create(nome="Finanças", administracao=self.admin, tipo_municipio="A")
+        self.user = CustomUser.objects.create_user(
+            username="user", password="password", administracao=self.admin,
+            departamento=self.dept, nivel_acesso='admin_municipal'
+        )
+        self.doc = Documento.objects.create(
+            titulo="Requerimento",
+            conteudo="Texto",
+            arquivo=SimpleUploadedFile('parecer.pdf', gerar_pdf("Parecer sobre saneamento basico")),
+            departamento_origem=self.dept,
+            departamento_atual=self.dept,
+            criado_por=self.user,
+            tipo_documento=self.tipo_doc,
+            administracao=self.admin
+        )
+
+    def _encontrados(self, texto):
+        return list(pesquisar(Documento.objects.para_usuario(self.user), texto).values_list('pk', flat=True))
+
+    def test_ficheiro_agendado_e_extraido(self):
+        registo = TextoExtraido.objects.get(documento=self.doc)
+        self.assertEqual(registo.estado, EstadoExtracao.PENDENTE)
+        self.assertEqual(self._encontrados('saneamento'), [])
+
+        self.assertEqual(extracao.processar_pendentes(processos=1), 1)
+        registo.refresh_from_db()
+        self.assertEqual(registo.estado, EstadoExtracao.EXTRAIDO)
+        self.assertEqual(len(registo.hash_conteudo), 64)
+        self.assertEqual(self._encontrados('saneamento'), [self.doc.pk])
+
+        # Gravar o documento sem mudar o ficheiro não volta a agendar
+        self.doc.titulo = "Requerimento urgente"
+        self.doc.save()
+        self.assertFalse(TextoExtraido.objects.pendentes().exists())
+        self.assertEqual(self._encontrados('saneamento'), [self.doc.pk])
+
+    def test_conteudo_igual_nao_e_reprocessado(self):
+        extracao.processar_pendentes(processos=1)
+
+        # Novo ficheiro com o mesmo conteúdo (noutro documento): reutiliza o texto
+        outro = Documento.objects.get(pk=self.doc.pk)
+        outro.pk = None
+        outro.numero_protocolo = ''
+        outro._state.adding = True
+        with open(self.doc.arquivo.path, 'rb') as ficheiro:
+            outro.arquivo = SimpleUploadedFile('copia.pdf', ficheiro.read())
+        outro.save()
+
+        with mock.patch.object(extracao, 'extrair') as extrair:
+            self.assertEqual(extracao.processar_pendentes(processos=1), 1)
+        extrair.assert_not_called()
+        self.assertEqual(sorted(self._encontrados('saneamento')), [self.doc.pk, outro.pk])
+
+    def test_anexos_em_pool_de_processos(self):
+        Anexo.objects.create(
+            documento=self.doc, nome="Contrato", usuario_upload=self.user,
+            arquivo=SimpleUploadedFile('contrato.docx', gerar_docx("Contrato de fornecimento de cimento")),
+        )
+        anexo = Anexo.objects.create(
+            documento=self.doc, nome="Notas", usuario_upload=self.user,
+            arquivo=SimpleUploadedFile('notas.pdf', gerar_pdf("Notas da vistoria ao mercado")),
+        )
+        self.assertEqual(extracao.processar_pendentes(processos=2), 3)
+        self.assertEqual(self._encontrados('cimento'), [self.doc.pk])
+        self.assertEqual(self._encontrados('vistoria mercado'), [self.doc.pk])
+
+        anexo.delete()
+        self.assertEqual(self._encontrados('vistoria'), [])
+        self.assertEqual(self._encontrados('cimento'), [self.doc.pk])
+
+    def test_erro_inesperado_nao_interrompe_o_lote(self):
+        Anexo.objects.create(
+            documento=self.doc, nome="Contrato", usuario_upload=self.user,
+            arquivo=SimpleUploadedFile('contrato.docx', gerar_docx("Contrato de fornecimento de cimento")),
+        )
+        original = extracao.extrair
+
+        def extrair(dados, nome, ocr=True):
+            if nome.endswith('.docx'):
+                raise KeyError('word/styles.xml')
+            return original(dados, nome, ocr)
+
+        with mock.patch.object(extracao, 'extrair', side_effect=extrair):
+            self.assertEqual(extracao.processar_pendentes(processos=1), 2)
+        estados = dict(TextoExtraido.objects.values_list('origem', 'estado'))
+        self.assertEqual(estados, {'arquivo': EstadoExtracao.EXTRAIDO, 'anexo': EstadoExtracao.ERRO})
+        self.assertEqual(self._encontrados('saneamento'), [self.doc.pk])
+
+    def test_ficheiro_removido_sai_da_pesquisa(self):
+        call_command('extrair_textos', '--processos', '1', stdout=StringIO())
+        self.assertEqual(self._encontrados('saneamento'), [self.doc.pk])
+
+        self.doc.arquivo = None
+        self.doc.save()
+        self.assertFalse(TextoExtraido.objects.filter(documento=self.doc).exists())
+        self.assertEqual(self._encontrados('saneamento'), [])
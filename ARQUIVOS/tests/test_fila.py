@@ -0,0 +1,232 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from ARQUIVOS import fila
+from ARQUIVOS.formularios import EncaminharDocumentoForm
+from ARQUIVOS.tarefas import difundir_documento
+from ARQUIVOS.utils import gerar_pdf_despacho
+from ARQUIVOS.fila import agendar, tarefa, trabalhar
+from ARQUIVOS.models import (
+    Administracao, Departamento, CustomUser, Documento, TipoDocumento, MovimentacaoDocumento,
+    Notificacao, StatusDocumento, Tarefa, EstadoTarefa, ContadorUnidade, PendenciaAberta, VisibilidadeDocumento
+)
+
+
+EXECUTADAS = []
+
+
+@tarefa('teste.registar', fila='testes')
+def registar(valor):
+    EXECUTADAS.append(valor)
+
+
+@tarefa('teste.falhar', fila='testes', max_tentativas=2)
+def falhar():
+    Notificacao.objects.create(usuario=CustomUser.objects.first(), mensagem='não deve ficar')
+    raise RuntimeError('SMTP indisponível')
+
+
+class FilaTarefasTestCase(TestCase):
+    def setUp(self):
+        EXECUTADAS.clear()
+        admin = Administracao.objects.create(nome="Uíge", tipo_municipio="A")
+        dept = Departamento.objects.create(nome="Finanças", administracao=admin, tipo_municipio="A")
+        CustomUser.objects.create_user(username="u", password="password", administracao=admin, departamento=dept)
+
+    def test_agendar_e_executar(self):
+        agendar('teste.registar', {'valor': 1})
+        agendar('teste.registar', {'valor': 2}, atraso=60)
+
+        saida = StringIO()
+        call_command('sga_worker', '--uma-vez', stdout=saida)
+        self.assertIn('1 tarefas executadas', saida.getvalue())
+        self.assertEqual(EXECUTADAS, [1])
+        concluida = Tarefa.objects.get(estado=EstadoTarefa.CONCLUIDA)
+        self.assertEqual((concluida.tentativas, concluida.fila), (1, 'testes'))
+        # A tarefa com atraso ainda não está pronta
+        self.assertEqual(Tarefa.objects.filter(estado=EstadoTarefa.PENDENTE).count(), 1)
+
+    def test_nome_desconhecido(self):
+        with self.assertRaises(LookupError):
+            agendar('teste.inexistente')
+
+    def test_falha_volta_a_fila_com_backoff_e_desfaz_escritas(self):
+        agendar('teste.falhar')
+        with self.assertLogs('ARQUIVOS.fila', 'ERROR'):
+            trabalhar(uma_vez=True)
+
+        registo = Tarefa.objects.get()
+        self.assertEqual((registo.estado, registo.tentativas), (EstadoTarefa.PENDENTE, 1))
+        self.assertIn('SMTP indisponível', registo.erro)
+        self.assertGreater(registo.executar_em, timezone.now() + timedelta(seconds=5))
+        self.assertFalse(Notificacao.objects.exists())
+
+        # Última tentativa: fica como falhada
+        Tarefa.objects.update(executar_em=timezone.now())
+        with self.assertLogs('ARQUIVOS.fila', 'ERROR'):
+            trabalhar(uma_vez=True)
+        registo.refresh_from_db()
+        self.assertEqual((registo.estado, registo.tentativas), (EstadoTarefa.FALHADA, 2))
+
+    @override_settings(SGA_FILAS={'testes': 1})
+    def test_limite_de_concorrencia_por_fila(self):
+        for valor in range(3):
+            agendar('teste.registar', {'valor': valor})
+
+        reservadas = Tarefa.objects.reservar('w1', limite=10)
+        self.assertEqual(len(reservadas), 1)
+        self.assertEqual(Tarefa.objects.reservar('w2', limite=10), [])
+
+        fila.executar(reservadas[0])
+        self.assertEqual(len(Tarefa.objects.reservar('w2', limite=10)), 1)
+
+    def test_reserva_expirada_volta_a_fila(self):
+        agendar('teste.registar', {'valor': 1})
+        Tarefa.objects.reservar('morto')
+        Tarefa.objects.update(reservada_ate=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(trabalhar(uma_vez=True), 1)
+        registo = Tarefa.objects.get()
+        self.assertEqual((registo.estado, registo.tentativas), (EstadoTarefa.CONCLUIDA, 2))
+
+
+class DetalheDocumentoTarefasTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media)
+        cls.media_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_override.disable()
+        shutil.rmtree(cls.media, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.tipo_doc = TipoDocumento.objects.create(nome="Ofício", prazo_dias=10)
+        self.governo = Administracao.objects.create(nome="Governo do Uíge", tipo_municipio="G", provincia="Uíge")
+        self.gabinete = Departamento.objects.create(nome="Gabinete", administracao=self.governo, tipo_municipio="G")
+        self.user = CustomUser.objects.create_user(
+            username="gov", password="password", administracao=self.governo,
+            departamento=self.gabinete, nivel_acesso='admin_municipal'
+        )
+        self.doc = Documento.objects.create(
+            titulo="Circular",
+            conteudo="Texto",
+            utente="João",
+            email="joao@example.ao",
+            departamento_origem=self.gabinete,
+            departamento_atual=self.gabinete,
+            criado_por=self.user,
+            tipo_documento=self.tipo_doc,
+            administracao=self.governo
+        )
+        self.url = reverse('detalhe_documento', args=[self.doc.pk])
+        self.client.force_login(self.user)
+
+    def test_despacho_gera_pdf_e_email_no_worker(self):
+        with mock.patch('ARQUIVOS.tarefas.gerar_pdf_despacho', wraps=gerar_pdf_despacho) as gerar:
+            response = self.client.post(self.url, {
+                'action': 'despacho', 'despacho': 'Deferido', 'novo_status': StatusDocumento.APROVADO
+            })
+            self.assertEqual(response.status_code, 302)
+            # Nada de PDF nem email durante o pedido
+            gerar.assert_not_called()
+            self.assertEqual(mail.outbox, [])
+            self.doc.refresh_from_db()
+            self.assertEqual(self.doc.status, StatusDocumento.APROVADO)
+
+            # PDF e email (a miniatura do PDF vai para a fila 'previas')
+            self.assertEqual(trabalhar(filas=['pdf', 'email'], uma_vez=True), 2)
+
+        self.doc.refresh_from_db()
+        self.assertTrue(self.doc.arquivo_digitalizado.name.endswith('.pdf'))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['joao@example.ao'])
+        self.assertEqual(mail.outbox[0].attachments[0][2], 'application/pdf')
+
+    def _municipios(self, *nomes):
+        sgs = []
+        for nome in nomes:
+            admin = Administracao.objects.create(nome=nome, tipo_municipio="A", provincia="Uíge")
+            sg = Departamento.objects.create(nome="Secretaria Geral", administracao=admin, tipo_municipio="A")
+            CustomUser.objects.create_user(
+                username=f"sg_{nome}", password="password", administracao=admin, departamento=sg
+            )
+            sgs.append(sg)
+        return sgs
+
+    def test_difusao_do_governo_no_worker(self):
+        sgs = self._municipios("Negage", "Maquela")
+        # Administração sem Secretaria Geral: fica de fora
+        Administracao.objects.create(nome="Songo", tipo_municipio="A", provincia="Uíge")
+
+        response = self.client.post(self.url, {
+            'action': 'encaminhar', 'tipo_movimentacao': 'encaminhamento',
+            'enviar_todas': 'on', 'observacoes': 'Para conhecimento'
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(MovimentacaoDocumento.objects.filter(tipo_movimentacao='encaminhamento').exists())
+        self.assertEqual(Tarefa.objects.get().nome, 'documento.difundir')
+
+        trabalhar(uma_vez=True)
+        self.assertEqual(Tarefa.objects.get().estado, EstadoTarefa.CONCLUIDA)
+        self.assertEqual(
+            set(MovimentacaoDocumento.objects.filter(tipo_movimentacao='encaminhamento')
+                .values_list('departamento_destino', flat=True)),
+            {sg.pk for sg in sgs}
+        )
+        self.assertEqual(
+            set(Notificacao.objects.values_list('usuario__username', flat=True)),
+            {"sg_Negage", "sg_Maquela"}
+        )
+        self.assertTrue(Notificacao.objects.first().link.endswith(self.url))
+        self.doc.refresh_from_db()
+        self.assertEqual(self.doc.status, StatusDocumento.ENCAMINHAMENTO)
+
+        # Os índices gravados em lote são iguais aos reconstruídos de raiz
+        campos = ('unidade', 'dia', 'metrica', 'valor')
+        contadores = set(ContadorUnidade.objects.exclude(valor=0).values_list(*campos))
+        pendencias = set(PendenciaAberta.objects.values_list('movimentacao_id', flat=True))
+        visibilidades = set(VisibilidadeDocumento.objects.values_list('documento', 'departamento', 'seccao'))
+        call_command('reconstruir_indices', stdout=StringIO())
+        self.assertEqual(set(ContadorUnidade.objects.exclude(valor=0).values_list(*campos)), contadores)
+        self.assertEqual(set(PendenciaAberta.objects.values_list('movimentacao_id', flat=True)), pendencias)
+        self.assertEqual(
+            set(VisibilidadeDocumento.objects.values_list('documento', 'departamento', 'seccao')), visibilidades
+        )
+
+    def test_difusao_com_consultas_constantes(self):
+        def consultas(*nomes):
+            self._municipios(*nomes)
+            MovimentacaoDocumento.objects.filter(tipo_movimentacao='encaminhamento').delete()
+            with CaptureQueriesContext(connection) as capturadas:
+                difundir_documento(self.doc.pk, self.user.pk, link_documento='http://sga/doc')
+            return len(capturadas)
+
+        poucas = consultas("Negage", "Maquela")
+        muitas = consultas(*(f"Municipio_{i}" for i in range(10)))
+        self.assertEqual(poucas, muitas)
+        self.assertEqual(MovimentacaoDocumento.objects.filter(tipo_movimentacao='encaminhamento').count(), 12)
+
+    def test_opcao_so_para_o_governo(self):
+        admin = Administracao.objects.create(nome="Negage", tipo_municipio="A", provincia="Uíge")
+        dept = Departamento.objects.create(nome="Finanças", administracao=admin, tipo_municipio="A")
+        municipal = CustomUser.objects.create_user(
+            username="municipal", password="password", administracao=admin, departamento=dept
+        )
+        self.assertIn('enviar_todas', EncaminharDocumentoForm(user=self.user, documento=self.doc).fields)
+        self.assertNotIn('enviar_todas', EncaminharDocumentoForm(user=municipal, documento=self.doc).fields)
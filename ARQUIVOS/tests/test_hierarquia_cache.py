@@ -0,0 +1,89 @@
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
+from ARQUIVOS.hierarchy_manager import HierarchyManager
+from ARQUIVOS.models import Administracao, Departamento, CustomUser, Seccoes
+
+
+class HierarquiaMixin:
+    def setUp(self):
+        cache.clear()
+        self.admin = Administracao.objects.create(nome="Uíge", tipo_municipio="A", provincia="Uíge")
+        self.dept_a = Departamento.objects.create(nome="Finanças", administracao=self.admin, tipo_municipio="A")
+        self.dept_b = Departamento.objects.create(nome="Saúde", administracao=self.admin, tipo_municipio="A")
+        self.seccao_a = Seccoes.objects.create(nome="Contabilidade", departamento=self.dept_a)
+        self.seccao_a2 = Seccoes.objects.create(nome="Tesouraria", departamento=self.dept_a)
+
+        self.user = CustomUser.objects.create_user(
+            username="dept_a", password="password", administracao=self.admin, departamento=self.dept_a
+        )
+
+
+class HierarchyManagerCacheTestCase(HierarquiaMixin, TestCase):
+    def test_destinos_usuario_de_departamento(self):
+        depts, seccoes, fixas = HierarchyManager(self.user).obter_destinos_permitidos(incluir_self=False)
+        self.assertEqual(list(depts), [self.dept_b])
+        self.assertEqual(list(seccoes), [self.seccao_a, self.seccao_a2])
+        self.assertTrue(fixas)
+
+        depts = HierarchyManager(self.user).obter_departamentos(incluir_self=True)
+        self.assertEqual(list(depts), [self.dept_a, self.dept_b])
+
+    def test_destinos_usuario_de_seccao(self):
+        user = CustomUser.objects.create_user(
+            username="sec_a", password="password", administracao=self.admin,
+            departamento=self.dept_a, seccao=self.seccao_a
+        )
+        depts, seccoes, fixas = HierarchyManager(user).obter_destinos_permitidos(incluir_self=False)
+        self.assertEqual(list(depts), [self.dept_a])
+        self.assertEqual(list(seccoes), [self.seccao_a2])
+        self.assertFalse(fixas)
+
+    def test_secretaria_geral_municipal_ve_a_do_governo(self):
+        governo = Administracao.objects.create(nome="Governo do Uíge", tipo_municipio="G", provincia="Uíge")
+        sg_governo = Departamento.objects.create(
+            nome="Secretaria Geral", administracao=governo, tipo_municipio="G"
+        )
+        Departamento.objects.create(nome="Gabinete", administracao=governo, tipo_municipio="G")
+        sg = Departamento.objects.create(nome="Secretaria Geral", administracao=self.admin, tipo_municipio="A")
+        user = CustomUser.objects.create_user(
+            username="sg", password="password", administracao=self.admin, departamento=sg
+        )
+        self.assertEqual(
+            set(HierarchyManager(user).obter_departamentos(incluir_self=False)),
+            {self.dept_a, self.dept_b, sg_governo}
+        )
+
+    def test_invalidacao_ao_gravar_departamento(self):
+        manager = HierarchyManager(self.user)
+        self.assertTrue(manager.validar_departamento(self.dept_b.pk))
+
+        novo = Departamento.objects.create(nome="Educação", administracao=self.admin, tipo_municipio="A")
+        self.assertTrue(HierarchyManager(self.user).validar_departamento(novo.pk))
+
+        self.dept_b.delete()
+        self.assertFalse(HierarchyManager(self.user).validar_departamento(self.dept_b.pk))
+
+    def test_invalidacao_ao_mudar_de_administracao(self):
+        self.assertIn(self.dept_b, HierarchyManager(self.user).obter_departamentos())
+
+        outra = Administracao.objects.create(nome="Negage", tipo_municipio="A")
+        self.dept_b.administracao = outra
+        self.dept_b.save()
+        self.assertNotIn(self.dept_b, HierarchyManager(self.user).obter_departamentos())
+
+
+class HierarchyManagerSemConsultasTestCase(HierarquiaMixin, TransactionTestCase):
+    """Com a estrutura confirmada (commit), o snapshot é partilhado pelo processo."""
+
+    def test_validacao_sem_consultas(self):
+        self.assertTrue(HierarchyManager(self.user).validar_departamento(self.dept_b.pk))
+
+        # Novo pedido (nova instância): resolvido pelo snapshot, sem consultas
+        with self.assertNumQueries(0):
+            manager = HierarchyManager(self.user)
+            self.assertTrue(manager.validar_departamento(str(self.dept_b.pk)))
+            self.assertFalse(manager.validar_departamento(self.dept_a.pk))
+            self.assertTrue(manager.validar_seccao(self.seccao_a.pk))
+            self.assertEqual(
+                HierarchyManager.obter_seccoes_para_departamento(self.user, self.dept_b.pk), []
+            )
@@ -0,0 +1,175 @@
+import io
+import re
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from ARQUIVOS.models import (
+    Administracao, Departamento, CustomUser, Documento, TipoDocumento,
+    NormalizacaoFicheiro, EstadoNormalizacao, TextoExtraido, ContadorUnidade, StatusDocumento
+)
+from ARQUIVOS import normalizacao
+from ARQUIVOS.normalizacao import dimensoes_alvo, processar_pendentes
+
+
+def digitalizacao(largura, altura, dpi=None, formato='JPEG'):
+    """Imagem com ruído (não comprime bem), com EXIF e, opcionalmente, a resolução do digitalizador."""
+    imagem = Image.merge('RGB', [Image.effect_noise((largura, altura), 40) for _ in range(3)])
+    exif = Image.Exif()
+    exif[0x010F] = 'Telemovel'  # Make
+    opcoes = {'exif': exif.tobytes()}
+    if dpi:
+        opcoes['dpi'] = (dpi, dpi)
+    if formato == 'JPEG':
+        opcoes['quality'] = 95
+    saida = io.BytesIO()
+    imagem.save(saida, formato, **opcoes)
+    return saida.getvalue()
+
+
+class DimensoesTestCase(TestCase):
+    def test_resolucao_declarada_ou_folha_a4(self):
+        # Digitalizador a 600 dpi -> 300 dpi
+        self.assertEqual(dimensoes_alvo(4960, 7016, 600, 300), (2480, 3508))
+        # Telemóvel (72 dpi de ecrã): o maior lado passa a ser o de uma A4 a 300 dpi
+        self.assertEqual(dimensoes_alvo(3024, 4032, 72, 300), (2630, 3507))
+        # Nunca aumenta
+        self.assertEqual(dimensoes_alvo(800, 600, 150, 300), (800, 600))
+
+
+class NormalizacaoTestCase(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.admin = Administracao.objects.create(nome="Uíge", tipo_municipio="A")
+        self.dept = Departamento.objects.create(nome="Finanças", administracao=self.admin, tipo_municipio="A")
+        self.user = CustomUser.objects.create_user(
+            username="user", password="p", administracao=self.admin, departamento=self.dept
+        )
+        self.tipo = TipoDocumento.objects.create(nome="Ofício", prazo_dias=10)
+
+    def criar(self, **ficheiros):
+        return Documento.objects.create(
+            titulo="Requerimento", conteudo="Texto", **ficheiros,
+            departamento_origem=self.dept, departamento_atual=self.dept, criado_por=self.user,
+            tipo_documento=self.tipo, administracao=self.admin,
+        )
+
+    @override_settings(SGA_NORMALIZAR_IMAGENS=True, SGA_NORMALIZAR_DPI=150)
+    def test_reamostra_e_remove_metadados(self):
+        documento = self.criar(arquivo_digitalizado=SimpleUploadedFile('scan.png', digitalizacao(1200, 1600, 600, 'PNG')))
+        original = documento.arquivo_digitalizado.name
+        registo = NormalizacaoFicheiro.objects.get()
+        self.assertEqual(registo.estado, EstadoNormalizacao.PENDENTE)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(processar_pendentes(processos=1), 1)
+
+        registo.refresh_from_db()
+        documento.refresh_from_db()
+        self.assertEqual(registo.estado, EstadoNormalizacao.NORMALIZADO)
+        self.assertEqual(documento.arquivo_digitalizado.name, registo.ficheiro_final)
+        self.assertTrue(registo.ficheiro_final.endswith('.jpg'))
+        self.assertLess(registo.tamanho_final, registo.tamanho_original)
+        self.assertFalse(default_storage.exists(original))
+
+        with default_storage.open(registo.ficheiro_final) as ficheiro, Image.open(ficheiro) as imagem:
+            self.assertEqual(imagem.size, (300, 400))
+            self.assertFalse(imagem.getexif())
+        # A extração de texto segue o ficheiro novo; nada volta a ser normalizado
+        self.assertEqual(
+            TextoExtraido.objects.get(origem='arquivo_digitalizado').ficheiro, registo.ficheiro_final
+        )
+        self.assertEqual(NormalizacaoFicheiro.objects.get().pk, registo.pk)
+
+    @override_settings(SGA_NORMALIZAR_IMAGENS=True)
+    def test_erro_inesperado_nao_interrompe_o_lote(self):
+        self.criar(arquivo_digitalizado=SimpleUploadedFile('estragada.png', digitalizacao(200, 300, formato='PNG')))
+        self.criar(arquivo_digitalizado=SimpleUploadedFile('scan.png', digitalizacao(1200, 1600, 600, 'PNG')))
+        original = normalizacao.normalizar
+
+        def normalizar(caminhos, dpi_alvo, qualidade_jpeg):
+            if 'estragada' in caminhos[0]:
+                raise SyntaxError('broken PNG file')
+            return original(caminhos, dpi_alvo, qualidade_jpeg)
+
+        with mock.patch.object(normalizacao, 'normalizar', side_effect=normalizar), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(processar_pendentes(processos=1), 2)
+        self.assertEqual(
+            sorted(NormalizacaoFicheiro.objects.values_list('estado', flat=True)),
+            sorted([EstadoNormalizacao.ERRO, EstadoNormalizacao.NORMALIZADO]),
+        )
+
+    @override_settings(SGA_NORMALIZAR_IMAGENS=True)
+    def test_alteracoes_durante_a_normalizacao_nao_se_perdem(self):
+        documento = self.criar(arquivo_digitalizado=SimpleUploadedFile('scan.png', digitalizacao(1200, 1600, 600, 'PNG')))
+        original = normalizacao.normalizar
+
+        def normalizar(caminhos, dpi_alvo, qualidade_jpeg):
+            # Outra sessão arquiva o documento enquanto o pool trabalha
+            outro = Documento.objects.get(pk=documento.pk)
+            outro.titulo = 'Requerimento revisto'
+            outro.status = StatusDocumento.ARQUIVADO
+            outro.save()
+            return original(caminhos, dpi_alvo, qualidade_jpeg)
+
+        with mock.patch.object(normalizacao, 'normalizar', side_effect=normalizar), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(processar_pendentes(processos=1), 1)
+
+        documento.refresh_from_db()
+        registo = NormalizacaoFicheiro.objects.get()
+        self.assertEqual(registo.estado, EstadoNormalizacao.NORMALIZADO)
+        self.assertEqual(documento.arquivo_digitalizado.name, registo.ficheiro_final)
+        self.assertEqual(documento.titulo, 'Requerimento revisto')
+        self.assertEqual(documento.status, StatusDocumento.ARQUIVADO)
+        # A extração de texto segue o ficheiro novo
+        self.assertEqual(
+            TextoExtraido.objects.get(origem='arquivo_digitalizado').ficheiro, registo.ficheiro_final
+        )
+        # Os contadores do dashboard continuam iguais aos recalculados de raiz
+        campos = ('unidade', 'dia', 'metrica', 'valor')
+        antes = set(ContadorUnidade.objects.exclude(valor=0).values_list(*campos))
+        ContadorUnidade.objects.all().delete()
+        call_command('reconstruir_indices', stdout=io.StringIO())
+        self.assertEqual(set(ContadorUnidade.objects.values_list(*campos)), antes)
+
+    def test_desativada_por_omissao(self):
+        self.criar(arquivo_digitalizado=SimpleUploadedFile('scan.jpg', digitalizacao(200, 300)))
+        self.assertFalse(NormalizacaoFicheiro.objects.exists())
+
+    def test_varias_imagens_num_pdf(self):
+        self.client.force_login(self.user)
+        paginas = [
+            SimpleUploadedFile(f'pagina{i}.jpg', digitalizacao(600, 800, 150), content_type='image/jpeg')
+            for i in range(1, 4)
+        ]
+        resposta = self.client.post(reverse('criar_documento'), {
+            'titulo': 'Requerimento', 'tipo_documento': self.tipo.pk, 'prioridade': 'Normal', 'telefone': '923000000',
+            'utente': 'João', 'email': 'joao@example.com', 'origem': 'Pessoa Singular',
+            'niveis': 'Público', 'arquivo_digitalizado': paginas,
+        })
+        self.assertEqual(resposta.status_code, 302)
+        registo = NormalizacaoFicheiro.objects.get()
+        self.assertEqual(len(registo.paginas), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            processar_pendentes(processos=1)
+        documento = Documento.objects.get()
+        self.assertTrue(documento.arquivo_digitalizado.name.endswith('.pdf'))
+        with documento.arquivo_digitalizado.open('rb') as ficheiro:
+            self.assertEqual(len(re.findall(rb'/Type\s*/Page\b', ficheiro.read())), 3)
+        for nome in registo.paginas:
+            self.assertFalse(default_storage.exists(nome))
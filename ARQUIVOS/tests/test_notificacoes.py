@@ -0,0 +1,370 @@
+import asyncio
+import json
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import HttpCommunicator, WebsocketCommunicator
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from ARQUIVOS.consumers import AguardarNotificacoesConsumer, NotificacaoConsumer
+from ARQUIVOS.notificacoes import atualizar_pendencias, lote, notificar
+from ARQUIVOS.models import (
+    Administracao, Departamento, CustomUser, Documento, TipoDocumento, MovimentacaoDocumento,
+    Notificacao, Seccoes
+)
+
+
+class NotificacoesTestCase(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(get_channel_layer(), 'group_send', new_callable=mock.AsyncMock)
+        self.group_send = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def enviados(self):
+        return [chamada.args for chamada in self.group_send.await_args_list]
+
+    def tipos(self):
+        return [(grupo, evento['type'], evento.get('message'), evento.get('link')) for grupo, evento in self.enviados()]
+
+    def test_so_depois_do_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            notificar('departamento_1', 'Novo documento', '/doc/1/')
+            self.assertEqual(self.enviados(), [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.tipos(), [('departamento_1', 'notification_message', 'Novo documento', '/doc/1/')])
+
+    def test_lote_funde_eventos_repetidos(self):
+        with lote() as atual:
+            with self.captureOnCommitCallbacks(execute=True):
+                notificar('departamento_1', 'Novo documento', '/doc/1/')
+                notificar('departamento_1', 'Novo documento', '/doc/1/')
+                notificar('departamento_2', 'Novo documento', '/doc/1/')
+                atualizar_pendencias('seccao_3', 'Documento A recebido', movimentacoes=[7])
+                atualizar_pendencias('seccao_3', 'Documento B recebido', movimentacoes=[5])
+            self.assertEqual(len(atual), 3)
+            self.group_send.assert_not_awaited()
+
+        self.assertEqual(self.tipos(), [
+            ('departamento_1', 'notification_message', 'Novo documento', '/doc/1/'),
+            ('departamento_2', 'notification_message', 'Novo documento', '/doc/1/'),
+            ('seccao_3', 'pendencia_update', 'Documento B recebido', None),
+        ])
+        self.assertEqual(self.enviados()[-1][1]['movimentacoes'], [5, 7])
+
+    def test_falha_de_envio_nao_interrompe_o_lote(self):
+        self.group_send.side_effect = [ConnectionError('redis'), None]
+        with self.assertLogs('ARQUIVOS.notificacoes', 'WARNING'):
+            with lote(), self.captureOnCommitCallbacks(execute=True):
+                notificar('departamento_1', 'A')
+                notificar('departamento_2', 'B')
+        self.assertEqual(self.group_send.await_count, 2)
+
+    def test_contagens_calculadas_uma_vez_no_produtor(self):
+        admin = Administracao.objects.create(nome="Uíge", tipo_municipio="A")
+        dept = Departamento.objects.create(nome="Saúde", administracao=admin, tipo_municipio="A")
+        outro = Departamento.objects.create(nome="Finanças", administracao=admin, tipo_municipio="A")
+        seccao = Seccoes.objects.create(nome="Farmácia", departamento=dept)
+        chefe = CustomUser.objects.create_user(username="chefe", password="p", administracao=admin, departamento=dept)
+        tecnico = CustomUser.objects.create_user(
+            username="tecnico", password="p", administracao=admin, departamento=dept, seccao=seccao
+        )
+        CustomUser.objects.create_user(username="alheio", password="p", administracao=admin, departamento=outro)
+        Notificacao.objects.create(usuario=chefe, mensagem="a")
+        Notificacao.objects.create(usuario=chefe, mensagem="b")
+        Notificacao.objects.create(usuario=chefe, mensagem="lida", lida=True)
+        tipo_doc = TipoDocumento.objects.create(nome="Ofício", prazo_dias=10)
+        doc = Documento.objects.create(
+            titulo="Requerimento", departamento_origem=outro, departamento_atual=outro,
+            criado_por=chefe, tipo_documento=tipo_doc, administracao=admin
+        )
+        MovimentacaoDocumento.objects.create(
+            documento=doc, tipo_movimentacao='encaminhamento', departamento_origem=outro,
+            seccao_destino=seccao, usuario=chefe
+        )
+
+        # Todas as contagens do lote: não lidas + pendências de secções + de departamentos
+        with self.assertNumQueries(3), lote():
+            with self.captureOnCommitCallbacks(execute=True):
+                notificar(f'departamento_{dept.pk}', 'Novo documento')
+                atualizar_pendencias(f'seccao_{seccao.pk}')
+                atualizar_pendencias(f'departamento_{outro.pk}')
+
+        eventos = {grupo: evento for grupo, evento in self.enviados()}
+        self.assertEqual(
+            eventos[f'departamento_{dept.pk}']['contagens'], {str(chefe.pk): 2, str(tecnico.pk): 0}
+        )
+        self.assertEqual(eventos[f'seccao_{seccao.pk}']['count'], 1)
+        self.assertEqual(eventos[f'departamento_{outro.pk}']['count'], 0)
+
+    def test_confirmar_recebimento(self):
+        tipo_doc = TipoDocumento.objects.create(nome="Ofício", prazo_dias=10)
+        admin = Administracao.objects.create(nome="Uíge", tipo_municipio="A")
+        dept_a = Departamento.objects.create(nome="Finanças", administracao=admin, tipo_municipio="A")
+        dept_b = Departamento.objects.create(nome="Saúde", administracao=admin, tipo_municipio="A")
+        user_a = CustomUser.objects.create_user(
+            username="user_a", password="password", administracao=admin, departamento=dept_a
+        )
+        user_b = CustomUser.objects.create_user(
+            username="user_b", password="password", administracao=admin, departamento=dept_b
+        )
+        doc = Documento.objects.create(
+            titulo="Requerimento", departamento_origem=dept_a, departamento_atual=dept_a,
+            criado_por=user_a, tipo_documento=tipo_doc, administracao=admin
+        )
+        mov = MovimentacaoDocumento.objects.create(
+            documento=doc, tipo_movimentacao='encaminhamento', departamento_origem=dept_a,
+            departamento_destino=dept_b, usuario=user_a
+        )
+        self.client.force_login(user_b)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('confirmar_recebimento', args=[mov.pk]))
+            self.group_send.assert_not_awaited()
+
+        grupos = {grupo: evento['type'] for grupo, evento in self.enviados()}
+        self.assertEqual(grupos, {
+            f'departamento_{dept_b.pk}': 'pendencia_update',
+            f'user_{user_a.pk}': 'notification_message',
+        })
+
+
+class SincronizacaoNotificacoesTestCase(TestCase):
+    def setUp(self):
+        admin = Administracao.objects.create(nome="Uíge", tipo_municipio="A")
+        dept = Departamento.objects.create(nome="Saúde", administracao=admin, tipo_municipio="A")
+        self.user = CustomUser.objects.create_user(
+            username="chefe", password="p", administracao=admin, departamento=dept
+        )
+        self.antigas = [Notificacao.objects.create(usuario=self.user, mensagem=f"n{i}") for i in range(3)]
+        Notificacao.objects.create(usuario=self.user, mensagem="lida", lida=True)
+        self.url = reverse('verificar_notificacoes')
+        self.client.force_login(self.user)
+
+    def test_sem_cursor_devolve_as_recentes(self):
+        dados = self.client.get(self.url).json()
+        self.assertEqual([n['mensagem'] for n in dados['notificacoes']], ['n2', 'n1', 'n0'])
+        self.assertEqual((dados['count'], dados['cursor']), (3, self.antigas[-1].pk))
+
+    def test_so_as_posteriores_ao_cursor_e_304(self):
+        cursor = self.antigas[-1].pk
+        resposta = self.client.get(self.url, {'desde': cursor})
+        self.assertEqual(resposta.json()['notificacoes'], [])
+        etag = resposta['ETag']
+
+        # Nada mudou: 304 sem corpo
+        resposta = self.client.get(self.url, {'desde': cursor}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 304)
+
+        nova = Notificacao.objects.create(usuario=self.user, mensagem="nova")
+        resposta = self.client.get(self.url, {'desde': cursor}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        dados = resposta.json()
+        self.assertEqual([n['id'] for n in dados['notificacoes']], [nova.pk])
+        self.assertEqual((dados['count'], dados['cursor']), (4, nova.pk))
+
+        # Lida noutro separador: a contagem muda, o ETag também
+        Notificacao.objects.filter(pk=nova.pk).update(lida=True)
+        resposta = self.client.get(self.url, {'desde': nova.pk}, HTTP_IF_NONE_MATCH=resposta['ETag'])
+        self.assertEqual(resposta.json()['count'], 3)
+
+
+class NotificacoesRollbackTestCase(TransactionTestCase):
+    def test_rollback_descarta_eventos(self):
+        with mock.patch.object(get_channel_layer(), 'group_send', new_callable=mock.AsyncMock) as group_send:
+            with lote():
+                try:
+                    with transaction.atomic():
+                        notificar('departamento_1', 'Nunca enviado')
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+                with transaction.atomic():
+                    notificar('departamento_1', 'Enviado')
+            group_send.assert_awaited_once()
+            grupo, evento = group_send.await_args.args
+            self.assertEqual((grupo, evento['message']), ('departamento_1', 'Enviado'))
+
+
+class NotificacaoConsumerTestCase(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        admin = Administracao.objects.create(nome="Uíge", tipo_municipio="A")
+        self.dept = Departamento.objects.create(nome="Saúde", administracao=admin, tipo_municipio="A")
+        self.seccao = Seccoes.objects.create(nome="Farmácia", departamento=self.dept)
+        self.user = CustomUser.objects.create_user(
+            username="tecnico", password="p", administracao=admin, departamento=self.dept, seccao=self.seccao
+        )
+
+    def test_eventos_sem_consultas_no_consumer(self):
+        async def cenario():
+            comunicador = WebsocketCommunicator(NotificacaoConsumer.as_asgi(), '/ws/notificacoes/')
+            comunicador.scope['user'] = self.user
+            await comunicador.connect()
+            inicial = await comunicador.receive_json_from()
+            self.assertEqual((inicial['count'], inicial['pendencias_count']), (0, 0))
+
+            camada = get_channel_layer()
+            with mock.patch.object(NotificacaoConsumer, 'get_unread_count', side_effect=AssertionError), \
+                    mock.patch.object(NotificacaoConsumer, 'get_pendencias_count', side_effect=AssertionError):
+                await camada.group_send(f'departamento_{self.dept.pk}', {
+                    'type': 'notification_message', 'message': 'Novo', 'link': '/doc/1/',
+                    'grupo': f'departamento_{self.dept.pk}', 'contagens': {str(self.user.pk): 4},
+                })
+                self.assertEqual(await comunicador.receive_json_from(), {
+                    'type': 'new_notification', 'message': 'Novo', 'link': '/doc/1/', 'count': 4
+                })
+
+                # Pendências do departamento não são as da secção do utilizador: ignorado
+                await camada.group_send(f'departamento_{self.dept.pk}', {
+                    'type': 'pendencia_update', 'message': 'x', 'grupo': f'departamento_{self.dept.pk}', 'count': 9
+                })
+                await camada.group_send(f'seccao_{self.seccao.pk}', {
+                    'type': 'pendencia_update', 'message': 'y', 'grupo': f'seccao_{self.seccao.pk}', 'count': 2
+                })
+                self.assertEqual(await comunicador.receive_json_from(), {
+                    'type': 'pendencia_update', 'message': 'y', 'count': 2, 'movimentacoes': []
+                })
+                self.assertTrue(await comunicador.receive_nothing())
+            await comunicador.disconnect()
+
+        async_to_sync(cenario)()
+
+    def test_sincronizacao_por_websocket(self):
+        antiga = Notificacao.objects.create(usuario=self.user, mensagem="antiga")
+        nova = Notificacao.objects.create(usuario=self.user, mensagem="nova")
+
+        async def cenario():
+            comunicador = WebsocketCommunicator(NotificacaoConsumer.as_asgi(), '/ws/notificacoes/')
+            comunicador.scope['user'] = self.user
+            await comunicador.connect()
+            await comunicador.receive_json_from()
+
+            await comunicador.send_json_to({'action': 'sync', 'desde': antiga.pk})
+            dados = await comunicador.receive_json_from()
+            self.assertEqual(dados['type'], 'notification_sync')
+            self.assertEqual([n['mensagem'] for n in dados['notificacoes']], ['nova'])
+            self.assertEqual((dados['count'], dados['cursor']), (2, nova.pk))
+
+            await comunicador.send_json_to({'action': 'sync', 'desde': nova.pk})
+            self.assertEqual((await comunicador.receive_json_from())['notificacoes'], [])
+            await comunicador.disconnect()
+
+        async_to_sync(cenario)()
+
+    @override_settings(SGA_JANELA_PENDENCIAS=0.2)
+    def test_rajada_de_pendencias_numa_so_mensagem(self):
+        grupo = f'seccao_{self.seccao.pk}'
+
+        async def cenario():
+            comunicador = WebsocketCommunicator(NotificacaoConsumer.as_asgi(), '/ws/notificacoes/')
+            comunicador.scope['user'] = self.user
+            await comunicador.connect()
+            await comunicador.receive_json_from()
+
+            camada = get_channel_layer()
+            for contagem, movimentacao in ((1, 10), (2, 11), (1, 10)):
+                await camada.group_send(grupo, {
+                    'type': 'pendencia_update', 'message': f'm{contagem}', 'grupo': grupo,
+                    'count': contagem, 'movimentacoes': [movimentacao],
+                })
+            self.assertEqual(await comunicador.receive_json_from(timeout=2), {
+                'type': 'pendencia_update', 'message': 'm1', 'count': 1, 'movimentacoes': [10, 11]
+            })
+            self.assertTrue(await comunicador.receive_nothing(timeout=0.4))
+
+            # Janela seguinte: nova mensagem
+            await camada.group_send(grupo, {
+                'type': 'pendencia_update', 'message': 'm0', 'grupo': grupo, 'count': 0, 'movimentacoes': [11],
+            })
+            self.assertEqual((await comunicador.receive_json_from(timeout=2))['movimentacoes'], [11])
+            await comunicador.disconnect()
+
+        async_to_sync(cenario)()
+
+
+class AguardarNotificacoesTestCase(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        admin = Administracao.objects.create(nome="Uíge", tipo_municipio="A")
+        self.dept = Departamento.objects.create(nome="Saúde", administracao=admin, tipo_municipio="A")
+        self.seccao = Seccoes.objects.create(nome="Farmácia", departamento=self.dept)
+        self.user = CustomUser.objects.create_user(
+            username="tecnico", password="p", administracao=admin, departamento=self.dept, seccao=self.seccao
+        )
+
+    def pedido(self, desde, user=None):
+        comunicador = HttpCommunicator(AguardarNotificacoesConsumer.as_asgi(), 'GET', '/api/aguardar-notificacoes/')
+        comunicador.scope['query_string'] = f'desde={desde}'.encode() if desde is not None else b''
+        comunicador.scope['user'] = user or self.user
+        return comunicador
+
+    def resposta(self, desde, user=None):
+        async def cenario():
+            return await self.pedido(desde, user).get_response(timeout=2)
+
+        return async_to_sync(cenario)()
+
+    def test_sem_autenticacao(self):
+        from django.contrib.auth.models import AnonymousUser
+
+        resposta = self.resposta(None, AnonymousUser())
+        self.assertEqual(resposta['status'], 401)
+
+    def test_responde_logo_se_ha_notificacoes_novas(self):
+        antiga = Notificacao.objects.create(usuario=self.user, mensagem="antiga")
+        Notificacao.objects.create(usuario=self.user, mensagem="nova")
+
+        resposta = self.resposta(antiga.pk)
+        self.assertEqual(resposta['status'], 200)
+        dados = json.loads(resposta['body'])
+        self.assertEqual([n['mensagem'] for n in dados['notificacoes']], ['nova'])
+        self.assertEqual(dados['eventos'], [])
+
+    @override_settings(SGA_ESPERA_NOTIFICACOES=0.3)
+    def test_204_quando_o_tempo_expira(self):
+        ultima = Notificacao.objects.create(usuario=self.user, mensagem="lida")
+
+        resposta = self.resposta(ultima.pk)
+        self.assertEqual(resposta['status'], 204)
+
+    @override_settings(SGA_ESPERA_NOTIFICACOES=5, SGA_JANELA_PENDENCIAS=0.2)
+    def test_responde_quando_chega_um_evento(self):
+        ultima = Notificacao.objects.create(usuario=self.user, mensagem="lida")
+        grupo = f'seccao_{self.seccao.pk}'
+
+        async def cenario():
+            pedido = asyncio.ensure_future(self.pedido(ultima.pk).get_response(timeout=5))
+            camada = get_channel_layer()
+            # Espera a inscrição do canal do pedido nos grupos
+            while not camada.groups.get(grupo):
+                await asyncio.sleep(0.01)
+
+            nova = await database_sync_to_async(Notificacao.objects.create)(usuario=self.user, mensagem="nova")
+            await camada.group_send(f'user_{self.user.pk}', {
+                'type': 'notification_message', 'message': 'nova', 'link': '/doc/1/',
+            })
+            await camada.group_send(f'departamento_{self.dept.pk}', {
+                'type': 'pendencia_update', 'message': 'outra', 'grupo': f'departamento_{self.dept.pk}',
+            })
+            await camada.group_send(grupo, {
+                'type': 'pendencia_update', 'message': 'sua', 'grupo': grupo, 'count': 3, 'movimentacoes': [7],
+            })
+            resposta = await pedido
+            self.assertEqual(resposta['status'], 200)
+            dados = json.loads(resposta['body'])
+            self.assertEqual([n['id'] for n in dados['notificacoes']], [nova.pk])
+            self.assertEqual(dados['cursor'], nova.pk)
+            self.assertEqual(dados['eventos'], [
+                {'type': 'new_notification', 'message': 'nova', 'link': '/doc/1/'},
+                {'type': 'pendencia_update', 'message': 'sua', 'movimentacoes': [7], 'count': 3},
+            ])
+            # O canal sai dos grupos quando o pedido termina
+            self.assertFalse(camada.groups.get(grupo))
+
+        async_to_sync(cenario)()
@@ -0,0 +1,56 @@
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
+from ARQUIVOS.models import Administracao, Departamento, Seccoes
+from ARQUIVOS.org_snapshot import obter_snapshot, versao_estrutura
+
+
+class OrgSnapshotTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.governo = Administracao.objects.create(nome="Governo do Uíge", tipo_municipio="G", provincia="Uíge")
+        self.admin = Administracao.objects.create(nome="Negage", tipo_municipio="A", provincia="Uíge")
+        self.sg = Departamento.objects.create(
+            nome="Secretaria Geral", administracao=self.governo, tipo_municipio="G"
+        )
+        self.dept = Departamento.objects.create(nome="Saúde", administracao=self.admin, tipo_municipio="A")
+        self.seccao = Seccoes.objects.create(nome="Farmácia", departamento=self.dept)
+
+    def test_indices(self):
+        snapshot = obter_snapshot()
+        self.assertEqual(snapshot.administracoes[self.admin.pk].provincia, "Uíge")
+        self.assertEqual(list(snapshot.administracoes_do_tipo('G')), [self.governo.pk])
+        self.assertEqual(set(snapshot.administracoes_da_provincia("Uíge")), {self.governo.pk, self.admin.pk})
+        self.assertEqual(snapshot.secretaria_geral(self.governo.pk), (self.sg.pk,))
+        self.assertEqual([d.id for d in snapshot.departamentos_da_administracao(self.admin.pk)], [self.dept.pk])
+        self.assertEqual([s.nome for s in snapshot.seccoes_do_departamento(self.dept.pk)], ["Farmácia"])
+        self.assertEqual(snapshot.administracao_do_departamento(self.dept.pk), self.admin.pk)
+
+    def test_imutavel(self):
+        snapshot = obter_snapshot()
+        with self.assertRaises(TypeError):
+            snapshot.departamentos[0] = None
+        with self.assertRaises(AttributeError):
+            snapshot.departamentos[self.dept.pk].nome = "Outro"
+
+    def test_alteracao_muda_versao(self):
+        versao = versao_estrutura()
+        self.seccao.nome = "Farmácia Central"
+        self.seccao.save()
+        self.assertNotEqual(versao_estrutura(), versao)
+        self.assertEqual(obter_snapshot().seccoes[self.seccao.pk].nome, "Farmácia Central")
+
+
+class OrgSnapshotProcessoTestCase(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = Administracao.objects.create(nome="Negage", tipo_municipio="A")
+
+    def test_reutilizado_sem_consultas_enquanto_a_versao_nao_muda(self):
+        snapshot = obter_snapshot()
+        with self.assertNumQueries(0):
+            self.assertIs(obter_snapshot(), snapshot)
+
+        Departamento.objects.create(nome="Saúde", administracao=self.admin, tipo_municipio="A")
+        novo = obter_snapshot()
+        self.assertIsNot(novo, snapshot)
+        self.assertEqual(len(novo.departamentos_da_administracao(self.admin.pk)), 1)
@@ -0,0 +1,94 @@
+from datetime import timedelta
+
+from django.test import TestCase, RequestFactory
+from django.urls import reverse
+from django.utils import timezone
+from ARQUIVOS.models import (
+    Administracao, Departamento, CustomUser, Documento, TipoDocumento, StatusDocumento
+)
+from ARQUIVOS.paginacao import CursorPaginator, paginar
+
+
+class PaginacaoCursorTestCase(TestCase):
+    def setUp(self):
+        self.tipo_doc = TipoDocumento.objects.create(nome="Ofício", prazo_dias=10)
+        self.admin = Administracao.objects.create(nome="Uíge", tipo_municipio="A")
+        self.dept = Departamento.objects.create(nome="Finanças", administracao=self.admin, tipo_municipio="A")
+        self.user = CustomUser.objects.create_user(
+            username="user", password="password", administracao=self.admin, departamento=self.dept
+        )
+        agora = timezone.now()
+        for i in range(25):
+            Documento.objects.create(
+                titulo=f"Documento {i}",
+                departamento_origem=self.dept,
+                departamento_atual=self.dept,
+                criado_por=self.user,
+                tipo_documento=self.tipo_doc,
+                administracao=self.admin,
+                status=StatusDocumento.ARQUIVADO,
+                # Alguns sem data de conclusão e algumas datas repetidas (o id desempata)
+                data_conclusao=None if i % 5 == 0 else agora - timedelta(days=i // 3),
+            )
+        self.esperado_conclusao = list(
+            Documento.objects.order_by('-data_conclusao', '-id').values_list('id', flat=True)
+        )
+
+    def _percorrer(self, ordenacao, por_pagina=7):
+        paginator = CursorPaginator(Documento.objects.all(), ordenacao, por_pagina=por_pagina, contagem=None)
+        paginas = [paginator.get_page()]
+        while paginas[-1].has_next():
+            paginas.append(paginator.get_page(paginas[-1].cursor_seguinte))
+        return paginator, paginas
+
+    def test_percorre_todas_as_linhas_pela_ordem(self):
+        _, paginas = self._percorrer(('-data_criacao', '-id'))
+        ids = [doc.id for pagina in paginas for doc in pagina]
+        self.assertEqual(ids, list(Documento.objects.order_by('-data_criacao', '-id').values_list('id', flat=True)))
+        self.assertEqual([len(p) for p in paginas], [7, 7, 7, 4])
+        self.assertFalse(paginas[0].has_previous())
+
+    def test_coluna_anulavel_com_nulos_no_fim(self):
+        _, paginas = self._percorrer(('-data_conclusao', '-id'))
+        ids = [doc.id for pagina in paginas for doc in pagina]
+        # NULLs no fim, independentemente do banco
+        nao_nulos = [i for i in self.esperado_conclusao if Documento.objects.get(pk=i).data_conclusao]
+        nulos = list(Documento.objects.filter(data_conclusao__isnull=True).order_by('-id').values_list('id', flat=True))
+        self.assertEqual(ids, nao_nulos + nulos)
+
+    def test_pagina_anterior(self):
+        paginator, paginas = self._percorrer(('-data_conclusao', '-id'))
+        for atual, anterior in zip(paginas[1:], paginas):
+            voltar = paginator.get_page(atual.cursor_anterior, 'anterior')
+            self.assertEqual([d.id for d in voltar], [d.id for d in anterior])
+        primeira = paginator.get_page(paginas[1].cursor_anterior, 'anterior')
+        self.assertFalse(primeira.has_previous())
+        self.assertTrue(primeira.has_next())
+
+    def test_cursor_invalido_volta_ao_inicio(self):
+        paginator = CursorPaginator(Documento.objects.all(), ('-data_criacao', '-id'), contagem=None)
+        self.assertEqual(
+            [d.id for d in paginator.get_page('lixo')],
+            [d.id for d in paginator.get_page()]
+        )
+
+    def test_paginar_mantem_filtros_e_modo_classico(self):
+        request = RequestFactory().get('/', {'status': 'arquivado'})
+        pagina = paginar(request, Documento.objects.all(), ('-data_criacao', '-id'), contagem='exata')
+        self.assertEqual(pagina.total, 25)
+        self.assertIn('status=arquivado', pagina.query_seguinte)
+
+        request = RequestFactory().get('/', {'page': '2'})
+        pagina = paginar(request, Documento.objects.all(), ('-data_criacao', '-id'))
+        self.assertEqual(pagina.number, 2)
+
+    def test_views_com_cursor(self):
+        self.client.force_login(self.user)
+        for nome in ('listar_documentos', 'arquivo_morto', 'listar_armazenamentos'):
+            with self.subTest(view=nome):
+                response = self.client.get(reverse(nome))
+                self.assertEqual(response.status_code, 200)
+                pagina = response.context['documentos'] if nome != 'listar_armazenamentos' else response.context['armazenamentos']
+                if pagina.has_next():
+                    response = self.client.get(reverse(nome) + '?' + pagina.query_seguinte)
+                    self.assertEqual(response.status_code, 200)
@@ -0,0 +1,57 @@
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from ARQUIVOS import pdf
+from ARQUIVOS.extracao import texto_pdf
+from ARQUIVOS.pdf import ErroRenderizacao, renderizar, renderizar_no_pool, timbrado
+
+
+DADOS = {
+    'instituicao': "Administração Municipal do Negage",
+    'protocolo': "00012/2026",
+    'titulo': "Pedido de licença",
+    'utente': "João",
+    'data_pedido': "18/10/2026",
+    'estado': "APROVADO",
+    'texto': "Deferido.\nRemeta-se à secção competente.",
+    'responsavel': "Administrador",
+    'gerado_em': "18/10/2026 10:00",
+}
+
+
+def _lento(dados):
+    time.sleep(10)
+
+
+class RenderizacaoPdfTestCase(SimpleTestCase):
+    def tearDown(self):
+        pdf.fechar_pool()
+
+    def test_timbrado_em_cache_por_administracao(self):
+        timbrado.cache_clear()
+        renderizar(DADOS)
+        renderizar(dict(DADOS, protocolo="00013/2026"))
+        renderizar(dict(DADOS, instituicao="Administração Municipal de Maquela"))
+        info = timbrado.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 2))
+
+    def test_pdf_valido(self):
+        conteudo = renderizar(DADOS)
+        self.assertTrue(conteudo.startswith(b'%PDF'))
+        texto = texto_pdf(conteudo)
+        for esperado in ('NOTA DE DESPACHO', 'MUNICIPAL DO NEGAGE', '00012/2026', 'Remeta-se'):
+            self.assertIn(esperado, texto)
+
+    @override_settings(SGA_PDF_PROCESSOS=1)
+    def test_pool(self):
+        self.assertTrue(renderizar_no_pool(DADOS).startswith(b'%PDF'))
+
+    @override_settings(SGA_PDF_PROCESSOS=1)
+    def test_timeout_recria_o_pool(self):
+        with mock.patch('ARQUIVOS.pdf.renderizar', _lento):
+            with self.assertRaises(ErroRenderizacao):
+                renderizar_no_pool(DADOS, timeout=0.5)
+        self.assertIsNone(pdf._pool)
+        self.assertTrue(renderizar_no_pool(DADOS).startswith(b'%PDF'))
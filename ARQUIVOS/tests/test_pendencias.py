@@ -0,0 +1,96 @@
+from django.test import TestCase
+from django.urls import reverse
+from ARQUIVOS.models import (
+    Administracao, Departamento, CustomUser, Documento, TipoDocumento,
+    MovimentacaoDocumento, Seccoes, PendenciaAberta
+)
+
+
+class PendenciaAbertaTestCase(TestCase):
+    def setUp(self):
+        self.tipo_doc = TipoDocumento.objects.create(nome="Ofício", prazo_dias=10)
+        self.admin = Administracao.objects.create(nome="Uíge", tipo_municipio="A")
+        self.dept_a = Departamento.objects.create(nome="Finanças", administracao=self.admin, tipo_municipio="A")
+        self.dept_b = Departamento.objects.create(nome="Saúde", administracao=self.admin, tipo_municipio="A")
+        self.seccao_b = Seccoes.objects.create(nome="Farmácia", departamento=self.dept_b)
+
+        self.user_a = CustomUser.objects.create_user(
+            username="user_a", password="password", administracao=self.admin, departamento=self.dept_a
+        )
+        self.user_b = CustomUser.objects.create_user(
+            username="user_b", password="password", administracao=self.admin, departamento=self.dept_b
+        )
+        self.doc = Documento.objects.create(
+            titulo="Requerimento",
+            departamento_origem=self.dept_a,
+            departamento_atual=self.dept_a,
+            criado_por=self.user_a,
+            tipo_documento=self.tipo_doc,
+            administracao=self.admin
+        )
+
+    def _encaminhar(self, **destino):
+        return MovimentacaoDocumento.objects.create(
+            documento=self.doc,
+            tipo_movimentacao='encaminhamento',
+            departamento_origem=self.dept_a,
+            usuario=self.user_a,
+            **destino
+        )
+
+    def test_encaminhamento_abre_pendencia(self):
+        mov = self._encaminhar(departamento_destino=self.dept_b)
+        pendentes = PendenciaAberta.objects.movimentacoes_da_unidade(departamento=self.dept_b)
+        self.assertEqual(list(pendentes), [mov])
+
+    def test_confirmacao_fecha_pendencia(self):
+        mov = self._encaminhar(departamento_destino=self.dept_b)
+        mov.confirmado_recebimento = True
+        mov.usuario_confirmacao = self.user_b
+        mov.save()
+        self.assertFalse(PendenciaAberta.objects.da_unidade(departamento=self.dept_b).exists())
+
+    def test_movimentacao_posterior_torna_obsoleta(self):
+        """Equivalente ao antigo Exists(movimentacoes_futuras)."""
+        self._encaminhar(departamento_destino=self.dept_b)
+        mov_seccao = self._encaminhar(seccao_destino=self.seccao_b)
+
+        self.assertFalse(PendenciaAberta.objects.da_unidade(departamento=self.dept_b).exists())
+        self.assertEqual(
+            list(PendenciaAberta.objects.movimentacoes_da_unidade(seccao=self.seccao_b)),
+            [mov_seccao]
+        )
+
+    def test_criacao_convertida_em_encaminhamento(self):
+        """A movimentação de criação editada para encaminhamento passa a ser pendência."""
+        mov = MovimentacaoDocumento.objects.create(
+            documento=self.doc,
+            tipo_movimentacao='criacao',
+            departamento_origem=self.dept_a,
+            usuario=self.user_a
+        )
+        self.assertFalse(PendenciaAberta.objects.exists())
+
+        mov.tipo_movimentacao = 'encaminhamento'
+        mov.departamento_destino = self.dept_b
+        mov.save()
+        self.assertTrue(PendenciaAberta.objects.da_unidade(departamento=self.dept_b).exists())
+
+    def test_view_pendencias(self):
+        mov = self._encaminhar(departamento_destino=self.dept_b)
+        self.client.force_login(self.user_b)
+        response = self.client.get(reverse('pendencias'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['movimentacoes_pendentes']), [mov])
+
+    def test_reconstruir_indices_repoe_pendencias(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        mov = self._encaminhar(departamento_destino=self.dept_b)
+        PendenciaAberta.objects.all().delete()
+        call_command('reconstruir_indices', stdout=StringIO())
+        self.assertEqual(
+            list(PendenciaAberta.objects.values_list('movimentacao_id', flat=True)),
+            [mov.pk]
+        )
@@ -0,0 +1,106 @@
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from ARQUIVOS.fila import trabalhar
+from ARQUIVOS.models import (
+    Administracao, Departamento, CustomUser, Documento, TipoDocumento, Anexo,
+    Conteudo, Previa, EstadoPrevia, Tarefa
+)
+from ARQUIVOS.previas import nome_previa
+
+
+def digitalizacao(largura=2480, altura=3508):
+    """PNG do tamanho de uma folha A4 digitalizada a 300 dpi."""
+    saida = io.BytesIO()
+    Image.new('RGB', (largura, altura), (250, 250, 240)).save(saida, 'PNG')
+    return saida.getvalue()
+
+
+@override_settings(SGA_PREVIA_LADO=200)
+class PreviaTestCase(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.admin = Administracao.objects.create(nome="Uíge", tipo_municipio="A")
+        self.dept = Departamento.objects.create(nome="Finanças", administracao=self.admin, tipo_municipio="A")
+        self.user = CustomUser.objects.create_user(
+            username="user", password="p", administracao=self.admin, departamento=self.dept,
+            nivel_acesso='admin_municipal'
+        )
+        self.documento = Documento.objects.create(
+            titulo="Requerimento", conteudo="Texto",
+            arquivo_digitalizado=SimpleUploadedFile('scan.png', digitalizacao()),
+            departamento_origem=self.dept, departamento_atual=self.dept, criado_por=self.user,
+            tipo_documento=TipoDocumento.objects.create(nome="Ofício", prazo_dias=10), administracao=self.admin,
+        )
+        self.hash = Conteudo.objects.get().hash
+        self.client.force_login(self.user)
+
+    def test_miniatura_gerada_em_segundo_plano(self):
+        previa = Previa.objects.get()
+        self.assertEqual((previa.hash, previa.estado), (self.hash, EstadoPrevia.PENDENTE))
+        self.assertEqual(Tarefa.objects.filter(nome='previa.gerar').count(), 1)
+
+        self.assertEqual(trabalhar(filas=['previas'], uma_vez=True), 1)
+        previa.refresh_from_db()
+        self.assertEqual(previa.estado, EstadoPrevia.GERADA)
+        self.assertEqual(max(previa.largura, previa.altura), 200)
+        with Image.open(default_storage.path(nome_previa(self.hash))) as miniatura:
+            self.assertEqual(miniatura.format, 'JPEG')
+        self.assertLess(previa.tamanho, 10_000)
+
+        # O mesmo conteúdo num anexo reutiliza a miniatura
+        Anexo.objects.create(
+            documento=self.documento, nome='Cópia', usuario_upload=self.user,
+            arquivo=SimpleUploadedFile('copia.png', digitalizacao()),
+        )
+        self.assertEqual(Tarefa.objects.filter(nome='previa.gerar').count(), 1)
+
+    def test_detalhe_e_cache_longa(self):
+        trabalhar(filas=['previas'], uma_vez=True)
+        url = reverse('previa_ficheiro', args=[self.hash])
+        pagina = self.client.get(reverse('detalhe_documento', args=[self.documento.pk]))
+        self.assertContains(pagina, f'src="{url}"')
+
+        resposta = self.client.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta['Content-Type'], 'image/jpeg')
+        self.assertEqual(resposta['Cache-Control'], 'private, max-age=31536000, immutable')
+        self.assertEqual(resposta['ETag'], f'"{self.hash}"')
+
+        outra = Administracao.objects.create(nome="Negage", tipo_municipio="A")
+        dept = Departamento.objects.create(nome="Saúde", administracao=outra, tipo_municipio="A")
+        alheio = CustomUser.objects.create_user(
+            username="alheio", password="p", administracao=outra, departamento=dept, nivel_acesso='admin_municipal'
+        )
+        self.client.force_login(alheio)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_pdf_sem_renderizador_e_limpeza(self):
+        with mock.patch('ARQUIVOS.previas.pdf_disponivel', return_value=False):
+            self.documento.arquivo = SimpleUploadedFile('oficio.pdf', b'%PDF-1.4 oficio')
+            self.documento.save()
+            trabalhar(filas=['previas'], uma_vez=True)
+        pdf = Previa.objects.get(tipo='pdf')
+        self.assertEqual(pdf.estado, EstadoPrevia.INDISPONIVEL)
+
+        trabalhar(filas=['previas'], uma_vez=True)
+        caminho = default_storage.path(nome_previa(self.hash))
+        self.assertTrue(os.path.exists(caminho))
+        # Sem referências ao conteúdo, a miniatura também desaparece
+        default_storage.delete(self.documento.arquivo_digitalizado.name)
+        self.assertFalse(os.path.exists(caminho))
+        self.assertFalse(Previa.objects.filter(hash=self.hash).exists())
@@ -0,0 +1,116 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ARQUIVOS.conteudo import nome_conteudo
+from ARQUIVOS.models import (
+    Administracao, Departamento, CustomUser, Documento, TipoDocumento,
+    Conteudo, UploadParcial, EstadoUpload
+)
+
+
+DIGITALIZACAO = os.urandom(10_000)
+
+
+def checksum(dados):
+    return f'sha256 {hashlib.sha256(dados).hexdigest()}'
+
+
+@override_settings(SGA_UPLOAD_BLOCO=4096)
+class UploadPorBlocosTestCase(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.admin = Administracao.objects.create(nome="Uíge", tipo_municipio="A")
+        self.dept = Departamento.objects.create(nome="Finanças", administracao=self.admin, tipo_municipio="A")
+        self.user = CustomUser.objects.create_user(
+            username="user", password="p", administracao=self.admin, departamento=self.dept
+        )
+        self.client.force_login(self.user)
+
+    def criar(self, **dados):
+        resposta = self.client.post(
+            reverse('criar_upload'),
+            {'nome': 'scan.pdf', 'tamanho': len(DIGITALIZACAO), **dados},
+            content_type='application/json',
+        )
+        self.assertEqual(resposta.status_code, 201)
+        return resposta.json()
+
+    def enviar(self, upload_id, inicio, fim, soma=None):
+        bloco = DIGITALIZACAO[inicio:fim]
+        return self.client.put(
+            reverse('upload_parcial', args=[upload_id]), bloco, content_type='application/octet-stream',
+            headers={'Upload-Offset': str(inicio), 'Upload-Checksum': soma or checksum(bloco)},
+        )
+
+    def test_blocos_retomaveis_com_checksum(self):
+        upload = self.criar(sha256=hashlib.sha256(DIGITALIZACAO).hexdigest())
+        self.assertEqual(upload['recebido'], 0)
+
+        self.assertEqual(self.enviar(upload['id'], 0, 4096).json()['recebido'], 4096)
+
+        # Bloco corrompido: descartado, o servidor continua em 4096
+        resposta = self.enviar(upload['id'], 4096, 8192, soma=checksum(b'outro'))
+        self.assertEqual((resposta.status_code, resposta.json()['recebido']), (422, 4096))
+        # Bloco repetido (offset antigo): 409 com o offset certo para retomar
+        resposta = self.enviar(upload['id'], 0, 4096)
+        self.assertEqual((resposta.status_code, resposta.json()['recebido']), (409, 4096))
+
+        self.assertEqual(self.client.get(reverse('upload_parcial', args=[upload['id']])).json()['recebido'], 4096)
+        self.enviar(upload['id'], 4096, 8192)
+        final = self.enviar(upload['id'], 8192, len(DIGITALIZACAO)).json()
+        self.assertEqual(final['estado'], EstadoUpload.CONCLUIDO)
+
+        registo = UploadParcial.objects.get()
+        with default_storage.open(registo.ficheiro) as ficheiro:
+            self.assertEqual(ficheiro.read(), DIGITALIZACAO)
+        self.assertFalse(os.listdir(default_storage.path('conteudo/uploads')))
+
+    def test_sha256_do_ficheiro_errado(self):
+        upload = self.criar(sha256='0' * 64)
+        for inicio in range(0, len(DIGITALIZACAO), 4096):
+            resposta = self.enviar(upload['id'], inicio, min(inicio + 4096, len(DIGITALIZACAO)))
+        self.assertEqual(resposta.json()['estado'], EstadoUpload.FALHADO)
+        self.assertFalse(Conteudo.objects.exists())
+
+    def test_upload_de_outro_utilizador(self):
+        upload = self.criar()
+        outro = CustomUser.objects.create_user(
+            username="outro", password="p", administracao=self.admin, departamento=self.dept
+        )
+        self.client.force_login(outro)
+        self.assertEqual(self.enviar(upload['id'], 0, 4096).status_code, 404)
+
+    def test_documento_recebe_o_upload_sem_copia(self):
+        upload = self.criar()
+        for inicio in range(0, len(DIGITALIZACAO), 4096):
+            self.enviar(upload['id'], inicio, min(inicio + 4096, len(DIGITALIZACAO)))
+
+        tipo = TipoDocumento.objects.create(nome="Ofício", prazo_dias=10)
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.post(reverse('criar_documento'), {
+                'titulo': 'Requerimento', 'tipo_documento': tipo.pk, 'prioridade': 'Normal', 'telefone': '923000000',
+                'utente': 'João', 'email': 'joao@example.com', 'origem': 'Pessoa Singular',
+                'niveis': 'Público', 'arquivo_digitalizado_upload': upload['id'],
+            })
+        self.assertEqual(resposta.status_code, 302)
+
+        documento = Documento.objects.get()
+        self.assertTrue(documento.arquivo_digitalizado.name.startswith('digitalizados/'))
+        conteudo = Conteudo.objects.get()
+        self.assertTrue(os.path.samefile(
+            documento.arquivo_digitalizado.path, default_storage.path(nome_conteudo(conteudo.hash))
+        ))
+        # A referência do upload foi largada: só o documento aponta para o conteúdo
+        self.assertEqual(conteudo.referencias, 1)
+        self.assertEqual(UploadParcial.objects.get().estado, EstadoUpload.ANEXADO)
@@ -0,0 +1,93 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from ARQUIVOS.models import (
+    Administracao, Departamento, CustomUser, Documento, TipoDocumento,
+    MovimentacaoDocumento, Seccoes, VisibilidadeDocumento
+)
+
+
+class VisibilidadeDocumentoTestCase(TestCase):
+    def setUp(self):
+        self.tipo_doc = TipoDocumento.objects.create(nome="Ofício", prazo_dias=10)
+        self.admin = Administracao.objects.create(nome="Uíge", tipo_municipio="A")
+        self.dept_a = Departamento.objects.create(nome="Finanças", administracao=self.admin, tipo_municipio="A")
+        self.dept_b = Departamento.objects.create(nome="Saúde", administracao=self.admin, tipo_municipio="A")
+        self.seccao_a = Seccoes.objects.create(nome="Contabilidade", departamento=self.dept_a)
+        self.seccao_b = Seccoes.objects.create(nome="Farmácia", departamento=self.dept_b)
+
+        self.user_seccao_a = CustomUser.objects.create_user(
+            username="sec_a", password="password", administracao=self.admin,
+            departamento=self.dept_a, seccao=self.seccao_a
+        )
+        self.user_dept_b = CustomUser.objects.create_user(
+            username="dept_b", password="password", administracao=self.admin, departamento=self.dept_b
+        )
+
+    def _criar_documento(self):
+        doc = Documento.objects.create(
+            titulo="Requerimento",
+            departamento_origem=self.dept_a,
+            departamento_atual=self.dept_a,
+            seccao_atual=self.seccao_a,
+            criado_por=self.user_seccao_a,
+            tipo_documento=self.tipo_doc,
+            administracao=self.admin
+        )
+        MovimentacaoDocumento.objects.create(
+            documento=doc,
+            tipo_movimentacao='criacao',
+            departamento_origem=self.dept_a,
+            seccao_origem=self.seccao_a,
+            usuario=self.user_seccao_a
+        )
+        return doc
+
+    def _encaminhar_para_dept_b(self, doc):
+        MovimentacaoDocumento.objects.create(
+            documento=doc,
+            tipo_movimentacao='encaminhamento',
+            departamento_origem=self.dept_a,
+            seccao_origem=self.seccao_a,
+            departamento_destino=self.dept_b,
+            usuario=self.user_seccao_a
+        )
+        doc.seccao_atual = None
+        doc.departamento_atual = self.dept_b
+        doc.save()
+
+    def test_historico_continua_visivel(self):
+        """A secção continua a ver o documento depois de o encaminhar."""
+        doc = self._criar_documento()
+        self._encaminhar_para_dept_b(doc)
+
+        self.assertIn(doc, Documento.objects.para_usuario(self.user_seccao_a))
+        self.assertIn(doc, Documento.objects.para_usuario(self.user_dept_b))
+
+    def test_departamento_nao_ve_antes_de_receber(self):
+        """Um departamento que nunca teve o documento não o vê."""
+        doc = self._criar_documento()
+        self.assertNotIn(doc, Documento.objects.para_usuario(self.user_dept_b))
+
+    def test_sem_duplicados(self):
+        """Várias movimentações pela mesma unidade não duplicam resultados."""
+        doc = self._criar_documento()
+        self._encaminhar_para_dept_b(doc)
+        self._encaminhar_para_dept_b(doc)
+
+        self.assertEqual(Documento.objects.para_usuario(self.user_dept_b).count(), 1)
+        self.assertEqual(
+            VisibilidadeDocumento.objects.filter(documento=doc, departamento=self.dept_b).count(), 1
+        )
+
+    def test_reconstruir_indices(self):
+        """O comando de backfill reconstrói o mesmo índice."""
+        doc = self._criar_documento()
+        self._encaminhar_para_dept_b(doc)
+        antes = set(VisibilidadeDocumento.objects.values_list('documento_id', 'departamento_id', 'seccao_id'))
+
+        call_command('reconstruir_indices', '--limpar', stdout=StringIO())
+
+        depois = set(VisibilidadeDocumento.objects.values_list('documento_id', 'departamento_id', 'seccao_id'))
+        self.assertEqual(antes, depois)
@@ -0,0 +1,230 @@
+# ARQUIVOS/uploads.py
+"""
+Uploads por blocos, retomáveis, para digitalizações grandes.
+
+Um POST multipart de centenas de MB numa ligação fraca falha a meio e
+recomeça do zero (e o Django ainda o copia para um temporário). Aqui o
+ficheiro chega aos bocados:
+
+1. POST /api/uploads/ {"nome", "tamanho", "sha256"?} cria o upload.
+2. PUT /api/uploads/<id>/ com um bloco no corpo e os cabeçalhos
+   Upload-Offset (byte onde o bloco começa) e Upload-Checksum
+   ("sha256 <hex>" do bloco). O bloco é escrito em streaming no ficheiro
+   parcial; com checksum errado é descartado e o cliente repete-o.
+3. GET /api/uploads/<id>/ diz quantos bytes já chegaram: é daí que o
+   cliente retoma depois de uma falha (offset errado no PUT -> 409).
+
+Com o último bloco, o ficheiro parcial é verificado (sha256 declarado) e
+movido para o storage por conteúdo (ARQUIVOS/conteudo.py) sem cópia. O
+formulário envia depois o id em <campo>_upload e ficheiros_do_pedido()
+atribui o conteúdo ao FileField com uma simples ligação.
+"""
+
+import hashlib
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from .conteudo import PASTA_UPLOADS, TAMANHO_BLOCO, FicheiroArmazenado
+from .models import EstadoUpload, ReferenciaConteudo, UploadParcial
+
+
+BLOCO_MAXIMO_PADRAO = 8 * 1024 * 1024
+TAMANHO_MAXIMO_PADRAO = 2 * 1024 * 1024 * 1024
+VALIDADE_PADRAO = 48  # horas
+
+
+class ErroUpload(Exception):
+    """Pedido de upload recusado; `status` é o código HTTP da resposta."""
+
+    def __init__(self, mensagem, status=400):
+        super().__init__(mensagem)
+        self.status = status
+
+
+class _FicheiroParcial(File):
+    """O ficheiro parcial completo: o storage move-o em vez de o copiar."""
+
+    def __init__(self, caminho, nome):
+        super().__init__(None, nome)
+        self.caminho = caminho
+
+    def temporary_file_path(self):
+        return self.caminho
+
+
+def bloco_maximo():
+    return getattr(settings, 'SGA_UPLOAD_BLOCO', BLOCO_MAXIMO_PADRAO)
+
+
+def tamanho_maximo():
+    return getattr(settings, 'SGA_UPLOAD_MAXIMO', TAMANHO_MAXIMO_PADRAO)
+
+
+def validade():
+    return timedelta(hours=getattr(settings, 'SGA_UPLOAD_VALIDADE', VALIDADE_PADRAO))
+
+
+def caminho_parcial(upload):
+    return default_storage.path(f'{PASTA_UPLOADS}/{upload.pk}.part')
+
+
+def estado(upload):
+    """Resposta JSON da API."""
+    return {
+        'id': str(upload.pk),
+        'nome': upload.nome_ficheiro,
+        'tamanho': upload.tamanho,
+        'recebido': upload.recebido,
+        'estado': upload.estado,
+        'bloco_maximo': bloco_maximo(),
+        'erro': upload.erro,
+    }
+
+
+def _sha256_valido(valor):
+    return len(valor) == 64 and all(c in '0123456789abcdef' for c in valor)
+
+
+def criar(usuario, nome, tamanho, sha256=''):
+    """Novo upload de `tamanho` bytes; o ficheiro parcial começa vazio."""
+    nome = get_valid_filename(os.path.basename(nome or ''))[:255]
+    if not nome:
+        raise ErroUpload('Nome de ficheiro inválido.')
+    if not 0 < tamanho <= tamanho_maximo():
+        raise ErroUpload('Tamanho de ficheiro inválido ou acima do limite.', status=413)
+    sha256 = (sha256 or '').lower()
+    if sha256 and not _sha256_valido(sha256):
+        raise ErroUpload('SHA-256 inválido.')
+
+    upload = UploadParcial.objects.create(usuario=usuario, nome_ficheiro=nome, tamanho=tamanho, sha256=sha256)
+    caminho = caminho_parcial(upload)
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    open(caminho, 'wb').close()
+    return upload
+
+
+def receber_bloco(upload, offset, checksum, leitor, tamanho):
+    """
+    Escreve em `offset` os `tamanho` bytes lidos de `leitor` (o pedido, em
+    streaming). O bloco só conta se o SHA-256 coincidir com `checksum`.
+    """
+    algoritmo, _, esperado = (checksum or '').partition(' ')
+    esperado = esperado.strip().lower()
+    if algoritmo.lower() != 'sha256' or not _sha256_valido(esperado):
+        raise ErroUpload('Upload-Checksum em falta ou inválido (sha256 <hex>).')
+    if not 0 < tamanho <= bloco_maximo():
+        raise ErroUpload('Bloco vazio ou acima do limite.', status=413)
+
+    with transaction.atomic():
+        # Um bloco de cada vez por upload
+        upload = UploadParcial.objects.select_for_update().get(pk=upload.pk)
+        if upload.estado != EstadoUpload.ABERTO:
+            raise ErroUpload('O upload já não está a receber blocos.', status=409)
+        if offset != upload.recebido:
+            raise ErroUpload('Offset diferente dos bytes já recebidos.', status=409)
+        if offset + tamanho > upload.tamanho:
+            raise ErroUpload('O bloco ultrapassa o tamanho declarado.')
+
+        sha = hashlib.sha256()
+        lidos = 0
+        with open(caminho_parcial(upload), 'r+b') as parcial:
+            parcial.seek(offset)
+            while lidos < tamanho:
+                dados = leitor.read(min(TAMANHO_BLOCO, tamanho - lidos))
+                if not dados:
+                    break
+                sha.update(dados)
+                parcial.write(dados)
+                lidos += len(dados)
+            if lidos != tamanho or sha.hexdigest() != esperado:
+                # Bloco cortado ou corrompido: fica como se nunca tivesse chegado
+                parcial.truncate(offset)
+                raise ErroUpload('Bloco incompleto ou com checksum errado: repita-o.', status=422)
+            parcial.truncate(offset + tamanho)
+            parcial.flush()
+            os.fsync(parcial.fileno())
+
+        upload.recebido = offset + tamanho
+        upload.save(update_fields=['recebido', 'data_atualizacao'])
+        if upload.recebido == upload.tamanho:
+            concluir(upload)
+    return upload
+
+
+def concluir(upload):
+    """Passa o ficheiro completo para o storage por conteúdo (movido, não copiado)."""
+    nome = default_storage.save(
+        f'uploads/{upload.pk}/{upload.nome_ficheiro}',
+        _FicheiroParcial(caminho_parcial(upload), upload.nome_ficheiro),
+    )
+    hash_conteudo = ReferenciaConteudo.objects.select_related('conteudo').get(nome=nome).conteudo.hash
+    if upload.sha256 and hash_conteudo != upload.sha256:
+        default_storage.delete(nome)
+        upload.estado = EstadoUpload.FALHADO
+        upload.erro = 'O SHA-256 do ficheiro completo não coincide com o declarado.'
+    else:
+        upload.estado = EstadoUpload.CONCLUIDO
+        upload.ficheiro = nome
+    upload.save(update_fields=['estado', 'ficheiro', 'erro', 'data_atualizacao'])
+
+
+def ficheiros_do_pedido(request, campos):
+    """
+    request.FILES mais os uploads por blocos concluídos indicados em
+    <campo>_upload (como FicheiroArmazenado: o FileField recebe uma
+    ligação, não uma cópia). Devolve (ficheiros, uploads usados).
+    """
+    ficheiros = request.FILES.copy()
+    usados = []
+    for campo in campos:
+        upload_id = request.POST.get(f'{campo}_upload')
+        if not upload_id or campo in request.FILES:
+            continue
+        try:
+            upload = UploadParcial.objects.get(pk=upload_id, usuario=request.user, estado=EstadoUpload.CONCLUIDO)
+        except (UploadParcial.DoesNotExist, ValidationError):
+            continue
+        ficheiros[campo] = FicheiroArmazenado(upload.ficheiro, upload.nome_ficheiro)
+        usados.append(upload)
+    return ficheiros, usados
+
+
+def marcar_anexados(uploads):
+    """Depois de gravado o documento, os uploads usados largam a sua referência ao conteúdo."""
+    def libertar():
+        for upload in uploads:
+            default_storage.delete(upload.ficheiro)
+            upload.estado = EstadoUpload.ANEXADO
+            upload.ficheiro = ''
+            upload.save(update_fields=['estado', 'ficheiro', 'data_atualizacao'])
+
+    transaction.on_commit(libertar)
+
+
+def descartar(upload):
+    """Apaga o ficheiro parcial, o conteúdo ainda não anexado e o registo."""
+    caminho = caminho_parcial(upload)
+    if os.path.exists(caminho):
+        os.unlink(caminho)
+    if upload.ficheiro:
+        default_storage.delete(upload.ficheiro)
+    upload.delete()
+
+
+def limpar_expirados():
+    """Descarta os uploads sem atividade há mais de SGA_UPLOAD_VALIDADE horas (os anexados só perdem o registo)."""
+    limite = timezone.now() - validade()
+    expirados = UploadParcial.objects.filter(data_atualizacao__lt=limite)
+    total = 0
+    for upload in expirados.iterator():
+        descartar(upload)
+        total += 1
+    return total
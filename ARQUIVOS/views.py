@@ -4,19 +4,18 @@ from django.utils import timezone
 # Create your views here.
 # views.py
 
-from django.db.models import OuterRef, Exists, Q
+import os
+
+from django.db.models import Q
 
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Q
-from django.core.paginator import Paginator
 from django.views.decorators.http import require_http_methods
 from django.db import transaction
 from .formularios import *
 from django.db.models import Count, Case, When, IntegerField
-from django.core.mail import EmailMessage
-from ARQUIVOS.utils import gerar_pdf_despacho
 from django.urls import reverse
 from ARQUIVOS.decorators import requer_contexto_hierarquico
 from django.db.models.functions import TruncDate, Now
@@ -25,15 +24,21 @@ from django.db.models.functions import Now
 
 # Importações Locais
 from .models import (
-    Documento, MovimentacaoDocumento, Departamento, Seccoes, Anexo, StatusDocumento, Notificacao, CustomUser, Seccoes,
-    ArmazenamentoDocumento, LocalArmazenamento, Administracao
+    Documento, MovimentacaoDocumento, Departamento, Anexo, StatusDocumento, Notificacao, CustomUser,
+    ArmazenamentoDocumento, LocalArmazenamento, Administracao, PendenciaAberta, ContadorUnidade, UploadParcial
 )
+from .models.indices import chave_unidade, ESTADOS_FINAIS, CAMPOS_FICHEIROS_DOCUMENTO
 from .formularios import (
     DocumentoForm, EncaminharDocumentoForm, DespachoForm,
-    ArmazenamentoDocumentoForm
+    ArmazenamentoDocumentoForm, BuscaAvancadaForm
 )
 from .decorators import requer_contexto_hierarquico, requer_mesma_administracao
-from .consumers import send_notification_sync, send_pendencia_update_sync
+from .notificacoes import notificar, atualizar_pendencias, sincronizar
+from .org_snapshot import obter_snapshot, como_id
+from .paginacao import paginar
+from .fila import agendar
+from .busca import pesquisar, aproximados, contar_facetas, filtrar_facetas, CAMPOS_APROXIMADOS
+from . import downloads, normalizacao, previas, uploads
 
 @login_required
 @requer_mesma_administracao
@@ -42,7 +47,7 @@ def dashboard(request):
     Dashboard com estatísticas dinâmicas baseadas na hierarquia (Secção ou Departamento).
     """
     user = request.user
-    hoje = timezone.now().date()
+    hoje = timezone.localdate()
 
     # 1. Determinar o contexto exato do usuário
     seccao_usuario = getattr(user, 'seccao', None)
@@ -57,100 +62,43 @@ def dashboard(request):
         messages.error(request, 'Você não está associado a nenhum departamento.')
         return redirect('/')
 
-    # 2. Configurar filtros base (Dicionários de filtros dinâmicos)
-    # A lógica é: Se sou de Secção, filtro por Secção. Se sou de Depto, filtro por Depto.
-
-    # Filtro para Destino (O que chega para mim?)
-    if seccao_usuario:
-        filtro_destino = {'seccao_destino': seccao_usuario}
-        filtro_atual = {'seccao_atual': seccao_usuario}
-    else:
-        filtro_destino = {'departamento_destino': departamento_usuario}
-        filtro_atual = {'departamento_atual': departamento_usuario}
+    # 2. Unidades dos contadores: se sou de Secção, conto pela Secção; se sou de Depto, pelo Depto.
+    # Os registos (criação) só conhecem o departamento de origem.
+    unidade = chave_unidade(departamento_usuario.id, seccao_usuario.id if seccao_usuario else None)
+    unidade_departamento = chave_unidade(departamento_id=departamento_usuario.id)
+    unidade_visivel = ContadorUnidade.objects.unidade_de_visibilidade(user)
 
-    # Filtro para Origem (O que eu enviei/criei?)
-    if seccao_usuario:
-        filtro_origem = {'seccao_origem': seccao_usuario}
-    else:
-        filtro_origem = {'departamento_origem': departamento_usuario}
+    # --- LEITURA DOS CONTADORES (uma única consulta) ---
+    valores = ContadorUnidade.objects.valores([unidade, unidade_departamento, unidade_visivel], hoje)
 
-    # --- EXECUÇÃO DAS QUERIES ---
-
-    # 1. Pendentes (Encaminhados para MIM que ainda não confirmei)
-    documentos_pendentes = MovimentacaoDocumento.objects.filter(
-        tipo_movimentacao='encaminhamento',
-        confirmado_recebimento=False,
-        data_movimentacao__date=hoje,
-        **filtro_destino  # Desempacota: seccao_destino=X ou departamento_destino=Y
-    ).count()
+    # 1. Pendentes HOJE (Encaminhados para MIM que ainda não confirmei)
+    documentos_pendentes = valores.get((unidade, 'pendente'), 0)
+    documentos_recebidos_hoje = valores.get((unidade, 'recebido'), 0)
 
     # 2. Encaminhados HOJE (Enviados POR MIM)
-    documentos_encaminhados_hoje = MovimentacaoDocumento.objects.filter(
-        tipo_movimentacao='encaminhamento',
-        data_movimentacao__date=hoje,
-        **filtro_origem
-    ).count()
+    documentos_encaminhados_hoje = valores.get((unidade, 'encaminhado'), 0)
 
-    # 3. Registados (Criados) HOJE (Criados POR MIM/MINHA ÁREA)
-    # Nota: No model Documento, verifique se tem 'seccao_origem'.
-    # Se não tiver, filtramos pelo criador ou ajustamos a query.
-    # Assumindo que criamos a logica de salvar a secção na criação:
-    if seccao_usuario:
-        # Se o modelo Documento não tem 'seccao_origem', filtramos pelos docs onde a 1ª movimentação foi da secção
-        # Mas para simplificar, vamos filtrar pelo departamento E usuario se for secção, ou ajustar o model.
-        # Opção robusta:
-        documentos_registados_hoje = Documento.objects.filter(
-            departamento_origem=departamento_usuario,
-            data_criacao__date=hoje
-        )
-        if hasattr(Documento, 'seccao_origem'):  # Se existir no model
-            documentos_registados_hoje = documentos_registados_hoje.filter(seccao_origem=seccao_usuario)
-        documentos_registados_hoje = documentos_registados_hoje.count()
-    else:
-        documentos_registados_hoje = Documento.objects.filter(
-            departamento_origem=departamento_usuario,
-            data_criacao__date=hoje
-        ).count()
-
-    # 4. Total de documentos ATUALMENTE na minha posse (Secção ou Depto)
-    total_documentos_na_posse = Documento.objects.filter(
-        **filtro_atual
-    ).count()
+    # 3. Registados (Criados) HOJE no meu departamento
+    documentos_registados_hoje = valores.get((unidade_departamento, 'registado'), 0)
 
-    # 4b. Novos contadores refinados: POSSE vs HISTÓRICO
-    doc_posse = 0
-    doc_historico = 0
-    
-    if seccao_usuario:
-        # Tudo que está na secção agora
-        doc_posse = Documento.objects.filter(seccao_atual=seccao_usuario).count()
-        # Tudo que já passou mas está noutro lado
-        doc_todos_meus = Documento.objects.para_usuario(user).count()
-        doc_historico = doc_todos_meus - doc_posse
+    # 4. POSSE (na secção, ou no depto sem secção) vs HISTÓRICO (já passou, está noutro lado)
+    doc_posse = valores.get((unidade, 'posse'), 0)
+    if unidade_visivel:
+        doc_todos_meus = valores.get((unidade_visivel, 'visivel'), 0)
+        # 4c. Documentos finalizados (Arquivo Morto)
+        documentos_mortos = valores.get((unidade_visivel, 'finalizado'), 0)
     else:
-        # Tudo que está no depto sem secção agora
-        doc_posse = Documento.objects.filter(
-            departamento_atual=departamento_usuario, 
-            seccao_atual__isnull=True
-        ).count()
-        # Tudo que já passou mas está noutro lado
-        doc_todos_meus = Documento.objects.para_usuario(user).count()
-        doc_historico = doc_todos_meus - doc_posse
-
-    # 4c. Documentos finalizados (Arquivo Morto)
-    documentos_mortos = Documento.objects.para_usuario(user).filter(
-        status__in=[
-            StatusDocumento.DESPACHO,
-            StatusDocumento.APROVADO,
-            StatusDocumento.REPROVADO,
-            StatusDocumento.ARQUIVADO
-        ]
-    ).count()
+        # Fallback de para_usuario (apenas os criados pelo próprio): sem contador
+        meus = Documento.objects.para_usuario(user)
+        doc_todos_meus = meus.count()
+        documentos_mortos = meus.filter(status__in=ESTADOS_FINAIS).count()
+    doc_historico = doc_todos_meus - doc_posse
 
     context = {
         'departamento_nome': departamento_usuario.nome,
         'seccao_nome': seccao_usuario.nome if seccao_usuario else None,
         'documentos_pendentes': documentos_pendentes,
+        'documentos_recebidos_hoje': documentos_recebidos_hoje,
         'documentos_encaminhados_hoje': documentos_encaminhados_hoje,
         'documentos_registados_hoje': documentos_registados_hoje,
         'doc_posse': doc_posse,
@@ -290,16 +238,18 @@ def listar_documentos(request):
     if request.GET.get('filtro') == 'novos':
         documentos = documentos.filter(data_ultima_movimentacao__date=timezone.now())
 
-    # 4. ORDENAÇÃO ESTRATÉGICA
-    # Primeiro os mais recentes, depois por prioridade
-    documentos = documentos.order_by('-data_criacao', '-peso_prioridade')
+    # Busca avançada (texto integral + filtros do formulário)
+    form_busca = BuscaAvancadaForm(request.GET or None, user=user)
+    if form_busca.is_bound and form_busca.is_valid():
+        documentos = form_busca.filtrar(documentos)
 
-    # Paginação
-    paginator = Paginator(documentos, 20)
-    page_obj = paginator.get_page(request.GET.get('page'))
+    # 4. ORDENAÇÃO ESTRATÉGICA + Paginação por cursor
+    # Primeiro os mais recentes; o id desempata (data_criacao já é praticamente única)
+    page_obj = paginar(request, documentos, ordenacao=('-data_criacao', '-id'))
 
     context = {
         'documentos': page_obj,
+        'form_busca': form_busca,
         'filtros_atuais': request.GET,
         # ... outros contextos
     }
@@ -346,16 +296,11 @@ def listar_movimentações(request):
 
     if busca:
         documentos = documentos.filter(
-            Q(titulo__icontains=busca) |
-            Q(conteudo__icontains=busca) |
-            Q(numero_protocolo__icontains=busca) |
-            Q(tags__icontains=busca)
+            documento__in=pesquisar(Documento.objects.para_usuario(user), busca).values('pk')
         )
 
-    # Paginação
-    paginator = Paginator(documentos, 20)
-    page = request.GET.get('page')
-    documentos = paginator.get_page(page)
+    # Paginação por cursor (mais recentes primeiro)
+    documentos = paginar(request, documentos, ordenacao=('-data_movimentacao', '-id'))
 
     # Dados para filtros
     departamentos = Departamento.objects.filter(ativo=True)
@@ -483,54 +428,26 @@ def detalhe_documento(request, documento_id):
                                  provincia=request.user.administracao.provincia
                              ).exclude(tipo_municipio='G')
                              
-                             if not admins_destino.exists():
+                             total_destinos = admins_destino.count()
+                             if not total_destinos:
                                  messages.warning(request, "Nenhuma administração encontrada nesta província para enviar.")
                                  return redirect('detalhe_documento', documento_id=documento.id)
                                  
-                             # 2. Iterar e criar movimentação para a "Secretaria Geral" de cada uma
-                             contagem_envios = 0
-                             
-                             for admin_dest in admins_destino:
-                                 # Buscar Secretaria Geral desta administração
-                                 sec_geral = Departamento.objects.filter(
-                                     administracao=admin_dest,
-                                     nome__icontains="Secretaria Geral"
-                                 ).first()
-                                 
-                                 if sec_geral:
-                                     nova_mov = MovimentacaoDocumento(
-                                         documento=documento,
-                                         tipo_movimentacao='encaminhamento',
-                                         usuario=request.user,
-                                         departamento_destino=sec_geral,
-                                         seccao_destino=None,
-                                         observacoes=encaminhar_form.cleaned_data.get('observacoes', ''),
-                                         despacho=encaminhar_form.cleaned_data.get('despacho', '')
-                                     )
-                                     
-                                     # Definir Origem
-                                     if user_seccao:
-                                         nova_mov.seccao_origem = user_seccao
-                                         nova_mov.departamento_origem = user_seccao.departamento
-                                     elif user_departamento:
-                                         nova_mov.departamento_origem = user_departamento
-                                         
-                                     nova_mov.save()
-                                     contagem_envios += 1
-                                     
-                                     # Notificação (simplificada para não sobrecarregar)
-                                     # TODO: Implementar notificação assíncrona/Celery para broadcast grande
-                                     
-                             if contagem_envios > 0:
-                                 messages.success(request, f'Documento enviado para {contagem_envios} administrações municipais com sucesso!')
-                                 # Não muda a localização "atual" do documento original do governo,
-                                 # pois ele foi "distribuído". O original fica com o Governo.
-                                 # Mas podemos atualizar status para ENCAMINHAMENTO
-                                 documento.status = StatusDocumento.ENCAMINHAMENTO
-                                 documento.save()
-                             else:
-                                 messages.warning(request, "Não foi possível encontrar as Secretarias Gerais das administrações destino.")
-                                 
+                             # 2. A criação das movimentações (Secretaria Geral de cada uma)
+                             #    corre no worker: a difusão não pesa no pedido
+                             agendar('documento.difundir', {
+                                 'documento_id': documento.id,
+                                 'usuario_id': request.user.id,
+                                 'observacoes': encaminhar_form.cleaned_data.get('observacoes', ''),
+                                 'despacho': encaminhar_form.cleaned_data.get('despacho', ''),
+                                 'link_documento': request.build_absolute_uri(
+                                     reverse('detalhe_documento', args=[documento.id])
+                                 ),
+                             })
+                             messages.success(
+                                 request,
+                                 f'Difusão do documento para {total_destinos} administrações municipais em curso.'
+                             )
                              return redirect('detalhe_documento', documento_id=documento.id)
 
                         # ===== FLUXO NORMAL DE ENCAMINHAMENTO (Um destino) =====
@@ -569,52 +486,11 @@ def detalhe_documento(request, documento_id):
                             reverse('detalhe_documento', args=[documento.id])
                         )
                         
-                        # Determinar destinatários (FILTRO POR ADMINISTRAÇÃO DO DESTINO)
-                        # IMPORTANTE: Agora o destino pode ser de OUTRA administração (Governo <-> Admin)
-                        # Então devemos filtrar usuários da administração DO DESTINO
-                        
-                        admin_destino_obj = None
-                        if movimentacao.seccao_destino:
-                             admin_destino_obj = movimentacao.seccao_destino.departamento.administracao
-                        elif movimentacao.departamento_destino:
-                             admin_destino_obj = movimentacao.departamento_destino.administracao
-                        
-                        if movimentacao.seccao_destino:
-                            utilizadores = CustomUser.objects.filter(
-                                seccao=movimentacao.seccao_destino,
-                                administracao=admin_destino_obj, # Usa a admin do destino!
-                                is_active=True
-                            )
-                            destino_texto = f"secção {movimentacao.seccao_destino.nome}"
-                            group_name = f"seccao_{movimentacao.seccao_destino.id}"
-                        elif movimentacao.departamento_destino:
-                            utilizadores = CustomUser.objects.filter(
-                                departamento=movimentacao.departamento_destino,
-                                administracao=admin_destino_obj, # Usa a admin do destino!
-                                is_active=True
-                            )
-                            destino_texto = f"departamento {movimentacao.departamento_destino.nome}"
-                            group_name = f"departamento_{movimentacao.departamento_destino.id}"
-                        else:
-                            utilizadores = []
-                            group_name = None
-                        
-                        # Criar notificações no banco
-                        if utilizadores:
-                            notificacoes = [
-                                Notificacao(
-                                    usuario=u,
-                                    mensagem=f"Documento '{documento.numero_protocolo}' encaminhado para {destino_texto}.",
-                                    link=link_documento
-                                )
-                                for u in utilizadores
-                            ]
-                            Notificacao.objects.bulk_create(notificacoes)
-                            
-                            # Enviar via WebSocket em tempo real
-                            if group_name:
-                                mensagem_ws = f"Novo documento: {documento.numero_protocolo} - {documento.titulo}"
-                                send_notification_sync(group_name, mensagem_ws, link_documento)
+                        # Notificações (banco e WebSocket) dos utilizadores do destino: no worker
+                        agendar('notificacoes.encaminhamento', {
+                            'movimentacao_id': movimentacao.id,
+                            'link_documento': link_documento,
+                        })
 
                         messages.success(request, 'Documento encaminhado com sucesso!')
                         return redirect('detalhe_documento', documento_id=documento.id)
@@ -631,69 +507,38 @@ def detalhe_documento(request, documento_id):
 
             despacho_form = DespachoForm(request.POST)
             if despacho_form.is_valid():
-                # Cria movimentação de despacho
-                MovimentacaoDocumento.objects.create(
-                    documento=documento,
-                    tipo_movimentacao='despacho',
-                    seccao_origem=user_seccao,
-                    departamento_origem=user_departamento,
-                    usuario=request.user,
-                    despacho=despacho_form.cleaned_data['despacho']
-                )
+                with transaction.atomic():
+                    # Cria movimentação de despacho
+                    MovimentacaoDocumento.objects.create(
+                        documento=documento,
+                        tipo_movimentacao='despacho',
+                        seccao_origem=user_seccao,
+                        departamento_origem=user_departamento,
+                        usuario=request.user,
+                        despacho=despacho_form.cleaned_data['despacho']
+                    )
+
+                    # Atualiza status se fornecido
+                    novo_status = despacho_form.cleaned_data.get('novo_status')
+                    texto_despacho = despacho_form.cleaned_data['despacho']
+
+                    if novo_status:
+                        documento.status = novo_status
 
-                # Atualiza status se fornecido
-                novo_status = despacho_form.cleaned_data.get('novo_status')
-                texto_despacho = despacho_form.cleaned_data['despacho']
-                
-                if novo_status:
-                    documento.status = novo_status
-                
-                # --- GERAÇÃO DE PDF E ENVIO DE EMAIL ---
-                try:
-                    # 1. Gerar PDF
-                    pdf_content = gerar_pdf_despacho(documento, texto_despacho, request.user, novo_status)
-                    
-                    # 2. Salvar no campo 'arquivo_digitalizado'
-                    # Nota: Isso sobrescreve o arquivo anterior se existir, conforme solicitado
-                    documento.arquivo_digitalizado.save(pdf_content.name, pdf_content, save=False)
                     documento.save()
-                    
-                    # 3. Enviar Email se o documento tiver email associado
-                    if documento.email:
-                        assunto = f"Notificação de Despacho - Protocolo {documento.numero_protocolo}"
-                        mensagem = f"""
-                        Prezado(a) {documento.utente},
-                        
-                        O seu documento com número de protocolo {documento.numero_protocolo} recebeu um despacho.
-                        
-                        Estado Atual: {documento.get_status_display()}
-                        
-                        Segue em anexo o documento oficial com os detalhes do despacho.
-                        
-                        Atenciosamente,
-                        {request.user.administracao.nome if request.user.administracao else 'Sistema de Gestão de Arquivo'}
-                        """
-                        
-                        email = EmailMessage(
-                            assunto,
-                            mensagem,
-                            None, # De (usará o DEFAULT_FROM_EMAIL)
-                            [documento.email]
-                        )
-                        
-                        # Anexar o PDF gerado (ler do content file)
-                        pdf_content.seek(0)
-                        email.attach(pdf_content.name, pdf_content.read(), 'application/pdf')
-                        email.send(fail_silently=True)
-                        
-                        messages.success(request, f'Despacho registado e notificação enviada para {documento.email}.')
-                    else:
-                        messages.success(request, 'Despacho registado. (Documento sem email para notificação)')
-                        
-                except Exception as e:
-                    # Logar erro mas não impedir o fluxo principal
-                    print(f"Erro ao gerar PDF/Email: {e}")
-                    messages.warning(request, f'Despacho salvo, mas houve erro ao gerar PDF ou enviar email: {e}')
+
+                    # --- GERAÇÃO DE PDF E ENVIO DE EMAIL (worker, depois do commit) ---
+                    agendar('despacho.gerar_pdf', {
+                        'documento_id': documento.id,
+                        'texto_despacho': texto_despacho,
+                        'usuario_id': request.user.id,
+                        'novo_status': novo_status or None,
+                    })
+
+                if documento.email:
+                    messages.success(request, f'Despacho registado. A notificação será enviada para {documento.email}.')
+                else:
+                    messages.success(request, 'Despacho registado. (Documento sem email para notificação)')
 
                 if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                     return JsonResponse({'status': 'ok', 'message': 'Despacho registado com sucesso.', 'new_status': documento.get_status_display()})
@@ -754,7 +599,7 @@ def detalhe_documento(request, documento_id):
                     
                     # Enviar via WebSocket em tempo real
                     group_name = f"user_{remetente.id}"
-                    send_notification_sync(
+                    notificar(
                         group_name,
                         f"Documento {documento.numero_protocolo} recebido por {request.user.username}",
                         link_documento
@@ -766,9 +611,23 @@ def detalhe_documento(request, documento_id):
 
             return redirect('detalhe_documento', documento_id=documento.id)
 
+    # Ficheiros com miniatura (alguns KB) em vez do original
+    anexos = list(documento.anexos.order_by('data_upload'))
+    ficheiros = [
+        (rotulo, campo) for rotulo, campo in (
+            ('Original', documento.arquivo), ('Digitalização', documento.arquivo_digitalizado)
+        ) if campo
+    ] + [(anexo.nome, anexo.arquivo) for anexo in anexos if anexo.arquivo]
+    miniaturas = previas.previas_de([campo.name for _, campo in ficheiros])
+    ficheiros = [
+        {'rotulo': rotulo, 'url': campo.url, 'nome': os.path.basename(campo.name), 'previa': miniaturas.get(campo.name)}
+        for rotulo, campo in ficheiros
+    ]
+
     # Contexto para o Template
     context = {
         'documento': documento,
+        'ficheiros': ficheiros,
         'movimentacoes': movimentacoes,
         'movimentacoes_pendentes': movimentacoes_pendentes,
         'pode_encaminhar': pode_encaminhar,
@@ -779,6 +638,17 @@ def detalhe_documento(request, documento_id):
     }
 
     return render(request, 'Paginasdetalhe.html', context)
+
+
+def _juntar_paginas(request, documento):
+    """Digitalização enviada como várias imagens: as páginas seguintes vão para o PDF (fora do pedido)."""
+    paginas = request.FILES.getlist('arquivo_digitalizado')[1:]
+    if paginas and normalizacao.registar_paginas(documento, paginas) is None:
+        messages.warning(
+            request, 'Só imagens (JPG/PNG) podem ser juntadas num PDF: ficou apenas o primeiro ficheiro digitalizado.'
+        )
+
+
 @login_required
 @requer_mesma_administracao
 def criar_documento(request):
@@ -798,7 +668,9 @@ def criar_documento(request):
     dados = estatisticas_aggregate(departamento_usuario) if departamento_usuario else {}
 
     if request.method == 'POST':
-        form = DocumentoForm(request.POST, request.FILES)
+        # Ficheiros grandes podem ter chegado antes, por blocos (api/uploads/)
+        ficheiros, uploads_usados = uploads.ficheiros_do_pedido(request, CAMPOS_FICHEIROS_DOCUMENTO)
+        form = DocumentoForm(request.POST, ficheiros)
         if form.is_valid():
             documento = form.save(commit=False)
             documento.criado_por = request.user
@@ -821,6 +693,8 @@ def criar_documento(request):
             documento.administracao = request.user.administracao
             
             documento.save()
+            uploads.marcar_anexados(uploads_usados)
+            _juntar_paginas(request, documento)
 
             # Criar movimentação de criação (SEM destino - é permitido!)
             mv = MovimentacaoDocumento.objects.create(
@@ -866,7 +740,7 @@ def criar_documento(request):
                 
                 # Enviar via WebSocket
                 mensagem_ws = f"Novo documento criado: {documento.numero_protocolo}"
-                send_notification_sync(group_name, mensagem_ws, link_documento)
+                notificar(group_name, mensagem_ws, link_documento)
 
             messages.success(request, f'Documento {documento.numero_protocolo} criado com sucesso!')
             return redirect('Encaminhar', documento_id=mv.id)
@@ -906,10 +780,13 @@ def Editar_documento(request, id):
 
     # 3. Lógica para submissão do formulário (método POST)
     if request.method == 'POST':
-        form = DocumentoForm(request.POST, request.FILES, instance=documento)
+        ficheiros, uploads_usados = uploads.ficheiros_do_pedido(request, CAMPOS_FICHEIROS_DOCUMENTO)
+        form = DocumentoForm(request.POST, ficheiros, instance=documento)
 
         if form.is_valid():
             form.save()
+            uploads.marcar_anexados(uploads_usados)
+            _juntar_paginas(request, documento)
             messages.success(request, f'Documento "{documento.titulo}" atualizado com sucesso!')
             return redirect('editar_documento', id=documento.id)
         else:
@@ -1101,8 +978,11 @@ def encaminhar_documento(request, documento_id):
                             # Enviar via WebSocket em tempo real
                             if group_name:
                                 mensagem_ws = f"Novo documento: {documento_a_atualizar.numero_protocolo} - {documento_a_atualizar.titulo}"
-                                send_notification_sync(group_name, mensagem_ws, link_documento)
-                                send_pendencia_update_sync(group_name, f"Novo documento pendente: {documento_a_atualizar.numero_protocolo}")
+                                notificar(group_name, mensagem_ws, link_documento)
+                                atualizar_pendencias(
+                                    group_name, f"Novo documento pendente: {documento_a_atualizar.numero_protocolo}",
+                                    movimentacoes=[movimentacao_atualizada.pk]
+                                )
 
                 messages.success(request, 'Movimentação do documento atualizada com sucesso!')
                 return redirect('listar_movimento')
@@ -1144,33 +1024,12 @@ def pendencias(request):
     """
     ctx = request.contexto_usuario
 
-    # 1. Definir quem é o destino (Eu sou Secção ou Departamento?)
-    if ctx['is_seccao']:
-        filtro_destino = Q(seccao_destino=ctx['seccao'])
-    else:
-        # Se sou depto, vejo o que chegou pro Depto E que não tem secção específica definida
-        # (Ou vejo tudo do depto, depende da sua regra. Aqui deixei ver tudo do Depto)
-        filtro_destino = Q(departamento_destino=ctx['departamento'])
-
-    # 2. SUBQUERY MÁGICA: Verificar Obsolescência
-    # Procura se existe QUALQUER movimentação (encaminhamento, despacho, arquivo)
-    # criada DEPOIS da movimentação atual para o mesmo documento.
-    movimentacoes_futuras = MovimentacaoDocumento.objects.filter(
-        documento=OuterRef('documento'),
-        id__gt=OuterRef('id')  # ID maior = criado depois
-    )
-
-    # 3. Query Principal
-    movimentacoes_pendentes = MovimentacaoDocumento.objects.filter(
-        filtro_destino,
-        confirmado_recebimento=False,
-        tipo_movimentacao='encaminhamento'
-    ).annotate(
-        # Cria um campo temporário true/false se existir mov. futura
-        ja_teve_andamento=Exists(movimentacoes_futuras)
-    ).filter(
-        # Só mostra se NÃO teve andamento posterior
-        ja_teve_andamento=False
+    # 1. Destino: Secção (se sou de secção) ou Departamento (vejo tudo o que chegou ao Depto)
+    # 2. Obsolescência: PendenciaAberta só guarda encaminhamentos sem andamento
+    #    posterior, por isso basta uma consulta indexada por unidade.
+    movimentacoes_pendentes = PendenciaAberta.objects.movimentacoes_da_unidade(
+        seccao=ctx['seccao'] if ctx['is_seccao'] else None,
+        departamento=ctx['departamento']
     ).select_related(
         'documento',
         'departamento_origem',
@@ -1249,10 +1108,10 @@ def confirmar_recebimento(request, movimentacao_id):
             # Para que outros utilizadores vejam a tabela atualizada em tempo real
             if mov.seccao_destino:
                 group_name = f"seccao_{mov.seccao_destino.id}"
-                send_pendencia_update_sync(group_name, f"Documento {doc.numero_protocolo} foi recebido")
+                atualizar_pendencias(group_name, f"Documento {doc.numero_protocolo} foi recebido", movimentacoes=[mov.pk])
             elif mov.departamento_destino:
                 group_name = f"departamento_{mov.departamento_destino.id}"
-                send_pendencia_update_sync(group_name, f"Documento {doc.numero_protocolo} foi recebido")
+                atualizar_pendencias(group_name, f"Documento {doc.numero_protocolo} foi recebido", movimentacoes=[mov.pk])
 
             # 3. NOTIFICAR A ORIGEM (REMETENTE) QUE O DOCUMENTO FOI RECEBIDO
             if mov.usuario:
@@ -1269,13 +1128,8 @@ def confirmar_recebimento(request, movimentacao_id):
                         link=link_doc
                     )
                     
-                    # Notificação em tempo real (opcional, se o sistema suportar envio direto para user)
-                    try:
-                        # Tenta enviar socket se a função suportar user channel ou se tivermos canal do user
-                        # Assumindo padrão 'user_{id}'
-                        send_notification_sync(f"user_{mov.usuario.id}", mensagem_confirmacao, link_doc)
-                    except:
-                        pass # Ignora erro de socket para não quebrar o request
+                    # Notificação em tempo real (grupo 'user_{id}'), enviada depois do commit
+                    notificar(f"user_{mov.usuario.id}", mensagem_confirmacao, link_doc)
                         
                 except Exception as e:
                     print(f"Erro ao criar notificação de confirmação: {e}")
@@ -1346,21 +1200,9 @@ def arquivo_morto(request):
             StatusDocumento.ARQUIVADO
         ]
     )
-    print('------------------------------------')
-    print(documentos_arquivados.filter(
-            Q(departamento_atual=user.departamento) |
-            Q(departamento_origem=user.departamento) |
-            Q(criado_por=user)
-        ))
-    print('------------------------------------')
-
-    # Lógica de busca (reutilizada da sua view de listar)
 
-
-    # Paginação
-    paginator = Paginator(documentos_arquivados.order_by('-data_conclusao'), 20)
-    page = request.GET.get('page')
-    documentos = paginator.get_page(page)
+    # Paginação por cursor (concluídos mais recentes primeiro; sem data de conclusão no fim)
+    documentos = paginar(request, documentos_arquivados, ordenacao=('-data_conclusao', '-id'))
 
     context = {
         'documentos': documentos,
@@ -1370,7 +1212,7 @@ def arquivo_morto(request):
     return render(request, 'Paginasarquivo_morto.html', context)
 
 # Em ARQUIVOS/views.py
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse, HttpResponse, HttpResponseNotModified
 
 @login_required
 def marcar_notificacoes_como_lidas(request):
@@ -1393,41 +1235,35 @@ def marcar_notificacoes_como_lidas(request):
 
 @login_required
 def verificar_notificacoes(request):
+    """
+    Sincronização das notificações por HTTP (alternativa ao WebSocket).
+
+    ?desde=<id>: só as não lidas posteriores a esse cursor. A resposta leva
+    um ETag com o estado (não lidas + última id): se o cliente o reenviar em
+    If-None-Match e nada tiver mudado, responde 304 com uma só consulta.
+    """
     if not request.user.is_authenticated:
         return JsonResponse({'unread_notifications_count': 0})
 
-    user = request.user
-
-    # Filtro simplificado: apenas notificações diretas do usuário
-    notificacoes = Notificacao.objects.filter(
-        usuario=user, 
-        lida=False
-    ).order_by('-data_criacao')[:20]
-    
-    count = notificacoes.count()
-
-    # Retornar no formato esperado pelo JavaScript
-    notificacoes_lista = [
-        {
-            'id': n.id,
-            'mensagem': n.mensagem,
-            'link': n.link or '#',
-            'data': n.data_criacao.strftime('%d/%m/%Y %H:%M') if n.data_criacao else ''
-        }
-        for n in notificacoes
-    ]
+    try:
+        desde = int(request.GET['desde'])
+    except (KeyError, ValueError):
+        desde = None
+
+    estado = Notificacao.objects.estado(request.user)
+    etag = f'"{estado[0]}-{estado[1]}-{desde if desde is not None else ""}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        dados = sincronizar(request.user, desde, estado)
+        response = JsonResponse({
+            **dados,
+            'unread_notifications_count': dados['count'],  # Compatibilidade
+        })
 
-    response = JsonResponse({
-        'count': count,
-        'unread_notifications_count': count,  # Compatibilidade
-        'notificacoes': notificacoes_lista
-    })
-    
-    # Evitar cache para garantir dados frescos
-    response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-    response['Pragma'] = 'no-cache'
-    response['Expires'] = '0'
-    
+    # Pode guardar, mas tem de revalidar sempre (ETag)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
     return response
 
 # Em ARQUIVOS/views.py
@@ -1439,11 +1275,12 @@ def listar_pendencias_parcial(request):
     para ser usada pelo AJAX.
     """
     user = request.user
-    movimentacoes_pendentes = MovimentacaoDocumento.objects.filter(
-        departamento_destino=user.departamento,
-        confirmado_recebimento=False,
-        tipo_movimentacao='encaminhamento'
-    ).select_related('documento', 'departamento_origem', 'usuario')
+    movimentacoes_pendentes = PendenciaAberta.objects.movimentacoes_da_unidade(
+        seccao=getattr(user, 'seccao', None),
+        departamento=user.departamento
+    ).select_related(
+        'documento', 'departamento_origem', 'seccao_origem', 'usuario'
+    ).order_by('-data_movimentacao')
 
     context = {
         'movimentacoes_pendentes': movimentacoes_pendentes,
@@ -1462,20 +1299,9 @@ def busca_ajax(request):
     if len(termo) < 3:
         return JsonResponse({'resultados': []})
 
-    user = request.user
-    documentos = Documento.objects.filter(
-        Q(titulo__icontains=termo) |
-        Q(conteudo__icontains=termo) |
-        Q(numero_protocolo__icontains=termo)
-    )
-
-    # Filtrar por permissão
-    if user.nivel_acesso not in ['admin', 'diretor']:
-        documentos = documentos.filter(
-            Q(departamento_atual=user.departamento) |
-            Q(departamento_origem=user.departamento) |
-            Q(criado_por=user)
-        )
+    # Índice de texto integral, dentro do que o usuário pode ver (administração e hierarquia)
+    documentos = pesquisar(Documento.objects.para_usuario(request.user), termo)
+    documentos = documentos.order_by('-relevancia', '-data_criacao')
 
     resultados = []
     for doc in documentos[:10]:  # Limitar a 10 resultados
@@ -1488,6 +1314,112 @@ def busca_ajax(request):
         })
 
     return JsonResponse({'resultados': resultados})
+
+
+def _rotulos_facetas(contagens):
+    """Rótulos de cada valor das facetas (departamentos vêm do snapshot, sem consulta)."""
+    snapshot = obter_snapshot()
+    tipos = dict(
+        TipoDocumento.objects.filter(pk__in=list(contagens['tipo_documento'])).values_list('pk', 'nome')
+    )
+    return {
+        'status': dict(StatusDocumento.choices),
+        'tipo_documento': tipos,
+        'departamento': {
+            dept_id: snapshot.departamentos[dept_id].nome
+            for dept_id in contagens['departamento'] if dept_id in snapshot.departamentos
+        },
+        'prioridade': dict(Documento.PRIORIDADE_CHOICES),
+    }
+
+
+@login_required
+def busca_avancada(request):
+    """
+    Busca avançada (JSON): resultados paginados por cursor e contagens por
+    status, tipo, departamento atual e prioridade, todas de uma só consulta
+    agrupada e dentro da visibilidade do usuário.
+    """
+    form = BuscaAvancadaForm(request.GET, user=request.user)
+    if not form.is_valid():
+        return JsonResponse({'erros': form.errors}, status=400)
+
+    base = form.filtrar(Documento.objects.para_usuario(request.user), facetas=False)
+    selecionadas = form.facetas_selecionadas()
+    contagens, total = contar_facetas(base, selecionadas)
+
+    pagina = paginar(
+        request, filtrar_facetas(base, selecionadas),
+        ordenacao=('-data_criacao', '-id'), contagem=None, classico=False
+    )
+
+    rotulos = _rotulos_facetas(contagens)
+    facetas = {
+        faceta: [
+            {
+                'valor': valor,
+                'rotulo': rotulos[faceta].get(valor, valor),
+                'total': quantidade,
+                'selecionado': selecionadas.get(faceta) == valor,
+            }
+            for valor, quantidade in valores.most_common()
+        ]
+        for faceta, valores in contagens.items()
+    }
+
+    resultados = [{
+        'id': str(doc.id),
+        'numero_protocolo': doc.numero_protocolo,
+        'titulo': doc.titulo,
+        'status': doc.get_status_display(),
+        'tipo_documento': doc.tipo_documento.nome,
+        'departamento': doc.departamento_atual.nome,
+        'prioridade': doc.prioridade,
+        'data_criacao': doc.data_criacao.isoformat(),
+    } for doc in pagina]
+
+    return JsonResponse({
+        'resultados': resultados,
+        'total': total,
+        'facetas': facetas,
+        'seguinte': pagina.query_seguinte if pagina.has_next() else None,
+        'anterior': pagina.query_anterior if pagina.has_previous() else None,
+    })
+
+
+@login_required
+def localizar_ajax(request):
+    """
+    Localização aproximada para o balcão: protocolo parcial, nome do utente
+    mal escrito ou referência (índice de trigramas). `campo` restringe a um
+    dos três.
+    """
+    termo = request.GET.get('q', '').strip()
+    campo = request.GET.get('campo')
+
+    if len(termo) < 3:
+        return JsonResponse({'resultados': []})
+    if campo and campo not in CAMPOS_APROXIMADOS:
+        return JsonResponse({'erro': 'Campo inválido.'}, status=400)
+
+    documentos = aproximados(
+        Documento.objects.para_usuario(request.user),
+        termo,
+        campos=(campo,) if campo else CAMPOS_APROXIMADOS,
+    )
+
+    resultados = [{
+        'id': str(doc.id),
+        'numero_protocolo': doc.numero_protocolo,
+        'titulo': doc.titulo,
+        'utente': doc.utente,
+        'referencia': doc.referencia,
+        'status': doc.get_status_display(),
+        'campo': doc.campo_semelhante,
+        'semelhanca': round(doc.semelhanca, 2),
+    } for doc in documentos]
+
+    return JsonResponse({'resultados': resultados})
 # ==============================================================================
 #  AJAX VIEWS FOR DEPENDENT DROPDOWNS (ADMIN)
 # ==============================================================================
@@ -1496,11 +1428,11 @@ def load_departamentos(request):
     """
     Retorna os departamentos de uma determinada administração (AJAX).
     """
-    administracao_id = request.GET.get('administracao')
+    administracao_id = como_id(request.GET.get('administracao'))
     if administracao_id:
-        departamentos = Departamento.objects.filter(administracao_id=administracao_id, ativo=True).order_by('nome')
+        departamentos = obter_snapshot().departamentos_da_administracao(administracao_id, apenas_ativos=True)
     else:
-        departamentos = Departamento.objects.none()
+        departamentos = []
     
     return render(request, 'ARQUIVOS/hr/dropdown_list_options.html', {'obj_list': departamentos})
 
@@ -1508,15 +1440,16 @@ def load_seccoes(request):
     """
     Retorna as secções de um determinado departamento (AJAX).
     """
-    departamento_id = request.GET.get('departamento')
-    if departamento_id:
-        seccoes = Seccoes.objects.filter(
-            departamento_id=departamento_id, 
-            departamento__administracao=request.user.administracao, # SEGURANÇA: Apenas da própria ADMIN
-            ativo=True
-        ).order_by('nome')
+    departamento_id = como_id(request.GET.get('departamento'))
+    snapshot = obter_snapshot()
+    if (
+        departamento_id and
+        # SEGURANÇA: Apenas da própria ADMIN
+        snapshot.administracao_do_departamento(departamento_id) == request.user.administracao_id
+    ):
+        seccoes = snapshot.seccoes_do_departamento(departamento_id, apenas_ativas=True)
     else:
-        seccoes = Seccoes.objects.none()
+        seccoes = []
     
     return render(request, 'ARQUIVOS/hr/dropdown_list_options.html', {'obj_list': seccoes})
 
@@ -1651,10 +1584,8 @@ def listar_armazenamentos(request, documento_id=None):
         documento = None
         titulo = 'Documentos Armazenados'
     
-    # Paginação
-    paginator = Paginator(armazenamentos, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Paginação por cursor
+    page_obj = paginar(request, armazenamentos, ordenacao=('-data_armazenamento', '-id'))
     
     context = {
         'armazenamentos': page_obj,
@@ -1720,16 +1651,93 @@ def ajax_seccoes_departamento(request):
     Retorna as secções de um departamento em JSON.
     Usado para preencher dinamicamente o select de secções.
     """
-    departamento_id = request.GET.get('departamento_id')
+    departamento_id = como_id(request.GET.get('departamento_id'))
     seccoes = []
+    snapshot = obter_snapshot()
     
-    if departamento_id:
-        try:
-            seccoes = list(Seccoes.objects.filter(
-                departamento_id=int(departamento_id),
-                departamento__administracao=request.user.administracao # SEGURANÇA: Apenas da própria ADMIN
-            ).values('id', 'nome').order_by('nome'))
-        except (ValueError, TypeError):
-            pass
+    # SEGURANÇA: Apenas da própria ADMIN
+    if departamento_id and snapshot.administracao_do_departamento(departamento_id) == request.user.administracao_id:
+        seccoes = [
+            {'id': s.id, 'nome': s.nome}
+            for s in snapshot.seccoes_do_departamento(departamento_id)
+        ]
     
     return JsonResponse({'seccoes': seccoes})
+
+
+@login_required
+@require_http_methods(['POST'])
+def criar_upload(request):
+    """
+    Inicia um upload por blocos (ver ARQUIVOS/uploads.py).
+    Corpo JSON: {"nome": ..., "tamanho": bytes, "sha256": opcional}.
+    """
+    import json
+    try:
+        dados = json.loads(request.body)
+        upload = uploads.criar(request.user, dados.get('nome'), int(dados.get('tamanho')), dados.get('sha256', ''))
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'erro': 'Pedido inválido.'}, status=400)
+    except uploads.ErroUpload as erro:
+        return JsonResponse({'erro': str(erro)}, status=erro.status)
+    return JsonResponse(uploads.estado(upload), status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'HEAD', 'PUT', 'DELETE'])
+def upload_parcial(request, upload_id):
+    """
+    GET: estado do upload (quantos bytes já chegaram, para retomar).
+    PUT: um bloco no corpo, com Upload-Offset e Upload-Checksum ("sha256 <hex>").
+    DELETE: cancela o upload.
+    """
+    upload = get_object_or_404(UploadParcial, pk=upload_id, usuario=request.user)
+
+    if request.method == 'DELETE':
+        uploads.descartar(upload)
+        return HttpResponse(status=204)
+
+    if request.method == 'PUT':
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            tamanho = int(request.headers.get('Content-Length') or 0)
+        except (KeyError, ValueError):
+            return JsonResponse({'erro': 'Upload-Offset em falta ou inválido.', **uploads.estado(upload)}, status=400)
+        try:
+            # O bloco é lido do pedido em streaming (sem request.body)
+            upload = uploads.receber_bloco(upload, offset, request.headers.get('Upload-Checksum'), request, tamanho)
+        except uploads.ErroUpload as erro:
+            upload.refresh_from_db()
+            return JsonResponse({**uploads.estado(upload), 'erro': str(erro)}, status=erro.status)
+
+    response = JsonResponse(uploads.estado(upload))
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+@login_required
+def ficheiro_protegido(request, caminho):
+    """
+    /media/<caminho>: só ficheiros de documentos e anexos que o utilizador
+    pode ver. A transferência fica com o nginx (X-Accel-Redirect), o
+    servidor (X-Sendfile) ou o Django com Range, ver ARQUIVOS/downloads.py.
+    ?download=1 força o download em vez de abrir no browser.
+    """
+    if not downloads.pode_descarregar(request.user, caminho):
+        raise Http404('Ficheiro não encontrado')
+    return downloads.responder_ficheiro(request, caminho, como_anexo='download' in request.GET)
+
+
+@login_required
+def previa_ficheiro(request, hash_conteudo):
+    """
+    /previas/<sha256>.jpg: miniatura de um conteúdo de um documento ou anexo
+    que o utilizador pode ver. O conteúdo de um hash nunca muda: cache de um
+    ano no browser (nunca em caches partilhadas).
+    """
+    if not downloads.pode_ver_conteudo(request.user, hash_conteudo):
+        raise Http404('Pré-visualização não encontrada')
+    return downloads.responder_ficheiro(
+        request, previas.nome_previa(hash_conteudo), hash_conteudo=hash_conteudo,
+        cache='private, max-age=31536000, immutable',
+    )
@@ -17,15 +17,23 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from channels.security.websocket import AllowedHostsOriginValidator
 
+from django.urls import re_path
+
 # Import WebSocket URL patterns (will be created)
 try:
-    from ARQUIVOS.routing import websocket_urlpatterns
+    from ARQUIVOS.routing import http_urlpatterns, websocket_urlpatterns
 except ImportError:
+    http_urlpatterns = []
     websocket_urlpatterns = []
 
 application = ProtocolTypeRouter({
-    # HTTP requests are handled by Django's ASGI application
-    "http": django_asgi_app,
+    # HTTP requests are handled by Django's ASGI application, except the
+    # notification long-poll, which waits on the channel layer without
+    # holding a Django worker thread
+    "http": URLRouter([
+        *http_urlpatterns,
+        re_path(r'', django_asgi_app),
+    ]),
     
     # WebSocket requests are handled by Channels
     "websocket": AllowedHostsOriginValidator(
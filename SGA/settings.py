@@ -70,6 +70,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'ARQUIVOS.middleware.SecurityAuditMiddleware',
+    'ARQUIVOS.middleware.NotificacoesMiddleware',
 ]
 
 ROOT_URLCONF = 'SGA.urls'
@@ -119,6 +120,92 @@ CHANNEL_LAYERS = {
 # CACHE CONFIGURATION
 # =============================================================================
 
+# Com REDIS_URL (Docker/Produção) a cache é partilhada por todos os workers,
+# para que a invalidação (ex.: versão da estrutura organizacional) chegue a todos.
+# Sem Redis usa-se memória local (desenvolvimento, um só processo).
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'sga',
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            },
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'sga-cache',
+        }
+    }
+
+
+# =============================================================================
+# FILA DE TAREFAS (manage.py sga_worker)
+# =============================================================================
+
+# Máximo de tarefas de cada fila em execução ao mesmo tempo, somando todos
+# os processos do worker. Filas ausentes não têm limite.
+SGA_FILAS = {
+    'pdf': 2,           # renderização dos PDFs de despacho (CPU)
+    'email': 2,         # ligações SMTP
+    'difusao': 1,       # difusões do Governo Provincial
+}
+
+# Emails da caixa de saída enviados por cada ligação SMTP (ARQUIVOS/correio.py)
+SGA_EMAIL_LOTE = 50
+
+# PDFs de despacho (ARQUIVOS/pdf.py): processos do pool de renderização em
+# cada processo do worker (0 = renderiza no próprio processo) e tempo
+# máximo, em segundos, de cada PDF
+SGA_PDF_PROCESSOS = 2
+SGA_PDF_TIMEOUT = 30
+
+# Uploads por blocos (ARQUIVOS/uploads.py): tamanho máximo de cada bloco e
+# do ficheiro, e horas sem atividade até um upload não anexado ser apagado
+# (manage.py limpar_uploads)
+SGA_UPLOAD_BLOCO = 8 * 1024 * 1024
+SGA_UPLOAD_MAXIMO = 2 * 1024 * 1024 * 1024
+SGA_UPLOAD_VALIDADE = 48
+
+# Entrega dos ficheiros de media depois da verificação de acesso
+# (ARQUIVOS/downloads.py): 'nginx' (X-Accel-Redirect para a location interna
+# SGA_ACCEL_PREFIXO), 'sendfile' (X-Sendfile) ou 'python' (o próprio Django,
+# com Range)
+SGA_ENTREGA_FICHEIROS = os.environ.get('SGA_ENTREGA_FICHEIROS', 'python')
+SGA_ACCEL_PREFIXO = '/protegido/'
+
+# Maior lado (px) das miniaturas da primeira página das digitalizações e
+# anexos (ARQUIVOS/previas.py, tarefa do worker na fila 'previas')
+SGA_PREVIA_LADO = 480
+
+# Normalização das imagens carregadas (ARQUIVOS/normalizacao.py, manage.py
+# normalizar_ficheiros): reamostragem para SGA_NORMALIZAR_DPI, JPEG com
+# SGA_NORMALIZAR_QUALIDADE e sem metadados. O original é substituído, por
+# isso é opcional
+SGA_NORMALIZAR_IMAGENS = os.environ.get('SGA_NORMALIZAR_IMAGENS', 'False').lower() in ('true', '1', 'yes')
+SGA_NORMALIZAR_DPI = 300
+SGA_NORMALIZAR_QUALIDADE = 80
+
+# Arquivo frio (ARQUIVOS/arquivo_frio.py, manage.py arquivar_frio): ficheiros
+# dos documentos finalizados há mais de SGA_ARQUIVO_FRIO_DIAS vão para
+# pacotes ZIP por administração e mês, em SGA_ARQUIVO_FRIO_PASTA (por
+# omissão MEDIA_ROOT/arquivo_frio; pode ser um disco mais barato)
+SGA_ARQUIVO_FRIO_DIAS = 365
+SGA_ARQUIVO_FRIO_PASTA = os.environ.get('SGA_ARQUIVO_FRIO_PASTA') or None
+
+# Janela (segundos) em que as atualizações de pendências de um grupo são
+# juntadas numa só mensagem WebSocket (ARQUIVOS/consumers.py)
+SGA_JANELA_PENDENCIAS = 0.3
+
+# Segundos que um pedido de long-poll (/api/aguardar-notificacoes/) espera
+# por eventos antes de responder 204; abaixo do timeout do proxy
+SGA_ESPERA_NOTIFICACOES = 25
 
 
 # =============================================================================
@@ -204,8 +291,16 @@ STATICFILES_DIRS = [
     BASE_DIR / 'ARQUIVOS' / 'static',
 ]
 
-# WhiteNoise: Compressão e Cache de Arquivos Estáticos
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedStaticFilesStorage'
+STORAGES = {
+    # Uploads guardados uma só vez por conteúdo (SHA-256), ver ARQUIVOS/conteudo.py
+    'default': {
+        'BACKEND': 'ARQUIVOS.conteudo.ArmazenamentoConteudo',
+    },
+    # WhiteNoise: Compressão e Cache de Arquivos Estáticos
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedStaticFilesStorage',
+    },
+}
 WHITENOISE_USE_FINDERS = True       # Ajuda a encontrar arquivos em desenvolvimento
 
 MEDIA_URL = 'media/'
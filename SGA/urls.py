@@ -34,6 +34,8 @@ urlpatterns = [
     path('movimentacao/<int:movimentacao_id>/confirmar/', views.confirmar_recebimento, name='confirmar_recebimento'),
     path('api/verificar-notificacoes/', views.verificar_notificacoes, name='verificar_notificacoes'),
     path('api/lista-pendencias-parcial/', views.listar_pendencias_parcial,name='lista_pendencias_parcial'),
+    path('api/uploads/', views.criar_upload, name='criar_upload'),
+    path('api/uploads/<uuid:upload_id>/', views.upload_parcial, name='upload_parcial'),
 
                   # Em ARQUIVOS/urls.py
 path('notificacoes/marcar-como-lidas/', views.marcar_notificacoes_como_lidas, name='marcar_notificacoes_lidas'),
@@ -49,6 +51,8 @@ path('notificacoes/marcar-como-lidas/', views.marcar_notificacoes_como_lidas, na
     path('ajax/load-departamentos/', views.load_departamentos, name='ajax_load_departamentos'),
     path('ajax/load-seccoes/', views.load_seccoes, name='ajax_load_seccoes'),
     path('ajax/busca/', views.busca_ajax, name='busca_ajax'),
+    path('ajax/localizar/', views.localizar_ajax, name='localizar_ajax'),
+    path('ajax/busca-avancada/', views.busca_avancada, name='busca_avancada'),
 #    path('ajax/confirmar-recebimento/', views.confirmar_recebimento_ajax, name='confirmar_recebimento_ajax'),
 
     # Armazenamento de Documentos
@@ -64,7 +68,10 @@ path('notificacoes/marcar-como-lidas/', views.marcar_notificacoes_como_lidas, na
 
 # Servir arquivos media e static
 # Nota: Habilitado manualmente para funcionar na porta 8000 mesmo com DEBUG=False
+# Os ficheiros de media só são entregues depois da verificação de acesso
+# (com nginx, por X-Accel-Redirect: ver ARQUIVOS/downloads.py)
 urlpatterns += [
-    re_path(r'^media/(?P<path>.*)$', serve, {'document_root': settings.MEDIA_ROOT}),
+    re_path(r'^media/(?P<caminho>.+)$', views.ficheiro_protegido, name='ficheiro_protegido'),
+    re_path(r'^previas/(?P<hash_conteudo>[0-9a-f]{64})\.jpg$', views.previa_ficheiro, name='previa_ficheiro'),
     re_path(r'^static/(?P<path>.*)$', serve, {'document_root': settings.STATIC_ROOT}),
 ]
\ No newline at end of file